@@ -0,0 +1,560 @@
+"""
+Assistant Agent - Agente conversazionale dell'assistente vocale
+
+Estende il ChatGPTAgent di Vocode con le ottimizzazioni dell'assistente
+(risposte immediate per gli scenari, metriche di latenza per turno, invio
+al TTS a livello di proposizione, VAD locale per barge-in e fine turno,
+risposta speculativa sui parziali dello STT, riempitivi audio quando la
+risposta tarda, registrazione della chiamata, risorse usate per chiamata)
+e viene creato dalla
+AssistantAgentFactory passata al TelephonyServer.
+"""
+
+import asyncio
+import logging
+import time
+from typing import Any, AsyncGenerator, Dict, List, Optional, Set
+
+from openai import AsyncOpenAI
+from prometheus_client import Counter
+from vocode.streaming.agent.abstract_factory import AbstractAgentFactory
+from vocode.streaming.agent.base_agent import BaseAgent, GeneratedResponse
+from vocode.streaming.agent.chat_gpt_agent import ChatGPTAgent
+from vocode.streaming.agent.openai_utils import (
+    get_openai_chat_messages_from_transcript,
+    merge_event_logs,
+    openai_get_tokens,
+)
+from vocode.streaming.models.actions import FunctionCall
+from vocode.streaming.models.agent import AgentConfig, ChatGPTAgentConfig
+from vocode.streaming.models.message import BaseMessage
+from vocode.streaming.models.events import Sender
+from vocode.streaming.models.transcript import Message
+
+from config.assistant_config import DEFAULT_TENANT
+from monitoring.latency import TurnLatencyTracker, instrument_conversation, provider_label
+from monitoring.profiling import CallProfile, CallProfiler, enter_call
+from services.admission import AdmissionController
+from services.call_recorder import CallRecorder, CallRecording
+from services.call_store import CallStore
+from services.conversation_context import ConversationContext, HistoryConfig, openai_summarizer
+from services.drain import DrainController
+from services.filler import FillerClipBank, FillerConfig, FillerScheduler
+from services.llm_dispatch import LlmDispatcher
+from services.response_cache import CachedResponse, ResponseCache
+from services.scenario_matcher import ScenarioMatcher
+from services.speculation import Speculation, SpeculationConfig, SpeculativeTurns
+from services.tenants import TenantAgentConfig, TenantRouter
+from services.text_chunker import ClauseChunker, collate_clauses_async
+from services.turn_detection import LocalTurnDetector, TurnDetectionConfig
+
+logger = logging.getLogger(__name__)
+
+SCENARIO_FAST_PATH_TOTAL = Counter(
+    'voice_assistant_scenario_fast_path_total',
+    'Turns answered with a canned scenario response instead of the LLM',
+    ['scenario'],
+)
+LLM_TTS_CHUNKS_TOTAL = Counter(
+    'voice_assistant_llm_tts_chunks_total',
+    'LLM reply chunks sent to TTS, by the boundary that closed them',
+    ['boundary'],  # sentence, clause, forced, final
+)
+
+
+class AssistantAgent(ChatGPTAgent):
+    """ChatGPTAgent con fast-path per gli scenari predefiniti"""
+
+    def __init__(
+        self,
+        agent_config: ChatGPTAgentConfig,
+        scenario_matcher: Optional[ScenarioMatcher] = None,
+        scenario_min_confidence: float = 0.75,
+        latency_metrics_enabled: bool = True,
+        openai_base_url: Optional[str] = None,
+        openai_client: Optional[AsyncOpenAI] = None,
+        clause_streaming_enabled: bool = True,
+        first_chunk_min_words: int = 4,
+        clause_split_chars: int = 80,
+        chunk_max_chars: int = 200,
+        turn_detection: Optional[TurnDetectionConfig] = None,
+        admission: Optional[AdmissionController] = None,
+        call_store: Optional[CallStore] = None,
+        response_cache: Optional[ResponseCache] = None,
+        history: Optional[HistoryConfig] = None,
+        llm_dispatcher: Optional[LlmDispatcher] = None,
+        drain: Optional[DrainController] = None,
+        speculation: Optional[SpeculationConfig] = None,
+        filler: Optional[FillerConfig] = None,
+        filler_clips: Optional[FillerClipBank] = None,
+        recorder: Optional[CallRecorder] = None,
+        call_profiler: Optional[CallProfiler] = None,
+        **kwargs,
+    ):
+        super().__init__(agent_config=agent_config, **kwargs)
+        if openai_client is not None:
+            # Shared client of the provider pool: connections stay warm across calls
+            self.openai_client = openai_client
+        elif openai_base_url:
+            self.openai_client = AsyncOpenAI(api_key=agent_config.openai_api_key, base_url=openai_base_url)
+        self.scenario_matcher = scenario_matcher
+        self.scenario_min_confidence = scenario_min_confidence
+        self.scenarios_used: Set[str] = set()
+        self.latency_metrics_enabled = latency_metrics_enabled
+        self.latency_tracker: Optional[TurnLatencyTracker] = None
+        self.clause_streaming_enabled = clause_streaming_enabled
+        self.first_chunk_min_words = first_chunk_min_words
+        self.clause_split_chars = clause_split_chars
+        self.chunk_max_chars = chunk_max_chars
+        self.turn_detection = turn_detection
+        self.turn_detector: Optional[LocalTurnDetector] = None
+        self.admission = admission
+        self.admitted_call_id: Optional[str] = None
+        self.call_store = call_store
+        self.response_cache = response_cache
+        self.llm_dispatcher = llm_dispatcher
+        self.drain = drain
+        self.drain_call_id: Optional[str] = None
+        self.speculation = speculation if speculation is not None and speculation.enabled else None
+        self.speculative_turns: Optional[SpeculativeTurns] = None
+        self._synthesizer = None
+        self.filler = filler
+        self.filler_clips = filler_clips
+        self.filler_scheduler: Optional[FillerScheduler] = None
+        self.recorder = recorder
+        self.recording: Optional[CallRecording] = None
+        self.call_profiler = call_profiler
+        self.call_profile: Optional[CallProfile] = None
+        self.context: Optional[ConversationContext] = None
+        if history is not None:
+            self.context = ConversationContext(
+                model=self.get_model_name_for_tokenizer(),
+                summarize=openai_summarizer(self.openai_client, history.summary_model, history.summary_max_tokens),
+                config=history,
+            )
+
+    def attach_conversation_state_manager(self, conversation_state_manager):
+        super().attach_conversation_state_manager(conversation_state_manager)
+        # Called by StreamingConversation once transcriber, synthesizer and output device exist
+        conversation = getattr(conversation_state_manager, "_conversation", None)
+        call_id = getattr(conversation, "twilio_sid", None) or getattr(conversation, "call_id", None)
+        if self.call_profiler is not None and conversation is not None:
+            self.call_profile = self.call_profiler.start_call(call_id or conversation.id, conversation)
+            self._profile_conversation_start(conversation)
+        if self.recorder is not None and conversation is not None:
+            # First: the filler scheduler sends its clips through the recorded output device
+            self.recording = self.recorder.attach(conversation, call_id)
+        if self.latency_metrics_enabled and conversation is not None:
+            transcriber_config = conversation.transcriber.get_transcriber_config()
+            synthesizer_config = conversation.synthesizer.get_synthesizer_config()
+            self.latency_tracker = TurnLatencyTracker(
+                conversation_id=conversation.id,
+                stt_labels={
+                    "provider": provider_label(transcriber_config),
+                    "model": str(getattr(transcriber_config, "model", None) or "default"),
+                },
+                llm_labels={"provider": "openai", "model": self.agent_config.model_name},
+                tts_labels={
+                    "provider": provider_label(synthesizer_config),
+                    "model": str(getattr(synthesizer_config, "model_id", None) or "default"),
+                },
+                telephony_provider=getattr(conversation, "telephony_provider", "unknown"),
+            )
+            if self.filler is not None and self.filler_clips is not None:
+                # Before the latency hooks: clip audio goes to the device unwrapped and is not a reply frame
+                self.filler_scheduler = FillerScheduler(
+                    conversation,
+                    self.filler,
+                    self.filler_clips,
+                    self.latency_tracker,
+                    caller_speaking=lambda: self.turn_detector is not None and self.turn_detector.vad.is_speech,
+                )
+                self.filler_scheduler.attach()
+            instrument_conversation(conversation, self.latency_tracker)
+        if self.speculation is not None and conversation is not None:
+            # Attached before the turn detector: sees its locally committed turns as finals
+            self._synthesizer = conversation.synthesizer
+            self.speculative_turns = SpeculativeTurns(
+                self.speculation,
+                self._run_speculation,
+                tenant=getattr(self.agent_config, "tenant", DEFAULT_TENANT),
+                allowed=self._can_speculate,
+                on_discard=self._discard_prefetch,
+            )
+            self.speculative_turns.attach(conversation)
+        if self.turn_detection is not None and conversation is not None:
+            # Attached after the latency hooks so locally committed turns are measured too
+            self.turn_detector = LocalTurnDetector(conversation, self.turn_detection, self.latency_tracker)
+            self.turn_detector.attach()
+        if self.drain is not None and conversation is not None:
+            # A rollout waits for this conversation before shutting the pod down
+            self.drain_call_id = conversation.id
+            self.drain.call_started(conversation.id)
+
+    def start(self) -> asyncio.Task:
+        # Twilio media reached this pod: confirm the slot reserved by the webhook (SIP calls hold theirs).
+        # TwilioPhoneConversation sets twilio_sid only after attaching the agent, so not in attach_conversation_state_manager
+        conversation = getattr(self.conversation_state_manager, "_conversation", None)
+        call_sid = getattr(conversation, "twilio_sid", None)
+        if self.admission is not None and call_sid:
+            self.admitted_call_id = call_sid
+            self.admission.connected(call_sid)
+        return super().start()
+
+    def _profile_conversation_start(self, conversation) -> None:
+        # Twilio starts the conversation in the task that built it, SIP in the one handling the ACK:
+        # entering the call there attributes the media loop and Vocode's workers to it
+        start = conversation.start
+        profile = self.call_profile
+
+        async def start_profiled(*args, **kwargs):
+            enter_call(profile)
+            return await start(*args, **kwargs)
+
+        conversation.start = start_profiled
+
+    async def _create_openai_stream(self, chat_parameters: Dict[str, Any], timed: bool = True) -> AsyncGenerator:
+        provider, model = None, chat_parameters.get("model")
+        if self.llm_dispatcher is not None:
+            # Hedged across backends: the stream comes from whichever answered first
+            stream = await self.llm_dispatcher.stream(chat_parameters)
+            provider, model = stream.backend.provider, stream.model
+        else:
+            stream = await super()._create_openai_stream(chat_parameters)
+        if self.latency_tracker is None or not timed:
+            return stream
+        return self._timed_stream(stream, model, provider)
+
+    async def _timed_stream(
+        self, stream: AsyncGenerator, model: Optional[str], provider: Optional[str] = None
+    ) -> AsyncGenerator:
+        first = True
+        async for chunk in stream:
+            if first:
+                self.latency_tracker.mark_first_llm_token(provider=provider, model=model)
+                first = False
+            yield chunk
+
+    def get_chat_parameters(self, messages: Optional[List] = None, use_functions: bool = True):
+        if messages is None and self.context is not None and self.transcript is not None:
+            # Replaces Vocode's full-history formatting, which re-tokenizes the whole call every turn
+            messages = self.context.build(
+                get_openai_chat_messages_from_transcript(
+                    merged_event_logs=merge_event_logs(event_logs=self.transcript.event_logs),
+                    prompt_preamble=self.agent_config.prompt_preamble,
+                )
+            )
+        return super().get_chat_parameters(messages, use_functions)
+
+    def terminate(self):
+        if self.speculative_turns is not None:
+            self.speculative_turns.close()
+        if self.filler_scheduler is not None:
+            self.filler_scheduler.close()
+        if self.recording is not None:
+            self.recording.close()
+        if self.call_profile is not None:
+            self.call_profiler.end_call(self.call_profile)
+        if self.context is not None:
+            self.context.close()
+        if self.latency_tracker is not None:
+            self.latency_tracker.log_summary()
+        if self.admitted_call_id is not None:
+            self.admission.release(self.admitted_call_id)
+        if self.drain_call_id is not None:
+            self.drain.call_ended(self.drain_call_id)
+        if self.call_store is not None:
+            self._store_transcript()
+        return super().terminate()
+
+    def _store_transcript(self) -> None:
+        conversation = getattr(self.conversation_state_manager, "_conversation", None)
+        if conversation is None:
+            return
+        turns = [
+            (log.sender.value, log.text, log.timestamp)
+            for log in conversation.transcript.event_logs
+            if isinstance(log, Message) and log.text.strip()
+        ]
+        call_id = getattr(conversation, "twilio_sid", None) or getattr(conversation, "call_id", None)
+        self.call_store.record_turns(conversation.id, call_id, turns)
+
+    async def generate_response(
+        self,
+        human_input: str,
+        conversation_id: str,
+        is_interrupt: bool = False,
+        bot_was_in_medias_res: bool = False,
+    ) -> AsyncGenerator[GeneratedResponse, None]:
+        if self.scenario_matcher is not None:
+            match = self.scenario_matcher.match(human_input)
+            # Once per conversation: the caller's answers to the canned response repeat its keywords
+            if (
+                match is not None
+                and match.confidence >= self.scenario_min_confidence
+                and match.name not in self.scenarios_used
+            ):
+                self.scenarios_used.add(match.name)
+                logger.info(
+                    f"Scenario fast-path {match.name} (confidence {match.confidence}) "
+                    f"for conversation {conversation_id}"
+                )
+                SCENARIO_FAST_PATH_TOTAL.labels(scenario=match.name).inc()
+                if self.speculative_turns is not None:
+                    self.speculative_turns.discard("unused")
+                if self.latency_tracker is not None:
+                    self.latency_tracker.mark_first_llm_token(provider="scenario", model="fast_path")
+                yield GeneratedResponse(
+                    message=BaseMessage(text=match.response),
+                    is_interruptible=True,
+                )
+                return
+
+        if self._can_stream_clauses():
+            cache_key = None
+            # An interrupted bot message changes what the LLM sees: those turns are not cached
+            if self.response_cache is not None and not is_interrupt and not bot_was_in_medias_res:
+                cache_key = self.response_cache.key(
+                    self.agent_config.prompt_preamble,
+                    self.agent_config.model_name,
+                    human_input,
+                    context=self._last_bot_message(),
+                )
+                cached = await self.response_cache.get(cache_key) if cache_key is not None else None
+                if cached is not None:
+                    if self.speculative_turns is not None:
+                        self.speculative_turns.discard("unused")
+                    if self.latency_tracker is not None:
+                        self.latency_tracker.mark_first_llm_token(provider="cache", model=self.agent_config.model_name)
+                    for text in cached.chunks:
+                        yield GeneratedResponse(message=BaseMessage(text=text), is_interruptible=True)
+                    return
+            speculation = None
+            if self.speculative_turns is not None:
+                if is_interrupt or bot_was_in_medias_res:
+                    # The bot message the speculation saw was cut short by the caller
+                    self.speculative_turns.discard("stale")
+                else:
+                    speculation = self.speculative_turns.take(human_input)
+            async for response in self._generate_clause_response(conversation_id, cache_key, speculation):
+                yield response
+            return
+
+        async for response in super().generate_response(
+            human_input,
+            conversation_id,
+            is_interrupt=is_interrupt,
+            bot_was_in_medias_res=bot_was_in_medias_res,
+        ):
+            yield response
+
+
+    def _can_stream_clauses(self) -> bool:
+        # Vector DB lookups, backchannels, filler messages and input-streaming synthesizers
+        # are handled by Vocode's own generate_response
+        return (
+            self.clause_streaming_enabled
+            and not self.agent_config.vector_db_config
+            and not self.agent_config.use_backchannels
+            and not self.agent_config.first_response_filler_message
+            and not self.conversation_state_manager.using_input_streaming_synthesizer()
+        )
+
+    def _can_speculate(self) -> bool:
+        conversation = getattr(self.conversation_state_manager, "_conversation", None)
+        if conversation is None or not self._can_stream_clauses():
+            return False
+        # While the bot talks an interim is more likely a barge-in than a question
+        if not conversation.initial_message_tracker.is_set():
+            return False
+        return not conversation.transcriptions_worker.is_bot_still_speaking()
+
+    async def _run_speculation(self, speculation: Speculation) -> None:
+        """Genera la risposta al parziale come se fosse già la trascrizione finale"""
+        chat_parameters = self.get_chat_parameters()
+        chat_parameters["messages"] = [*chat_parameters["messages"], {"role": "user", "content": speculation.text}]
+        chat_parameters["stream"] = True
+        # Not timed here: the turn's first token is marked when the final transcript uses the response
+        stream = await self._create_openai_stream(chat_parameters, timed=False)
+        tokens = speculation.count_tokens(openai_get_tokens(stream))
+        async for item in collate_clauses_async(tokens, self._clause_chunker(), get_functions=True):
+            speculation.append(item)
+            if (
+                self.speculation.prefetch_tts
+                and speculation.prefetched_text is None
+                and not isinstance(item, FunctionCall)
+                and hasattr(self._synthesizer, "prefetch")
+            ):
+                # Audio of the first chunk is ready when the final transcript confirms the response
+                speculation.prefetched_text = item.text
+                self._synthesizer.prefetch(item.text)
+
+    def _discard_prefetch(self, speculation: Speculation) -> None:
+        if speculation.prefetched_text is not None:
+            self._synthesizer.discard_prefetch(speculation.prefetched_text)
+
+    def _clause_chunker(self) -> ClauseChunker:
+        return ClauseChunker(
+            first_chunk_min_words=self.first_chunk_min_words,
+            clause_split_chars=self.clause_split_chars,
+            max_chars=self.chunk_max_chars,
+        )
+
+    def _last_bot_message(self) -> Optional[str]:
+        if self.transcript is None:
+            return None
+        for event_log in reversed(self.transcript.event_logs):
+            if isinstance(event_log, Message) and event_log.sender == Sender.BOT:
+                return event_log.text
+        return None
+
+    async def _generate_clause_response(
+        self,
+        conversation_id: str,
+        cache_key: Optional[str] = None,
+        speculation: Optional[Speculation] = None,
+    ) -> AsyncGenerator[GeneratedResponse, None]:
+        """
+        Come ChatGPTAgent.generate_response, ma divide lo stream in proposizioni
+
+        Ogni chunk è un messaggio separato: Vocode sintetizza il successivo
+        mentre riproduce il corrente e li riproduce nell'ordine di emissione.
+        Con una speculazione i chunk sono quelli già generati sul parziale.
+        """
+        if speculation is not None:
+            try:
+                async for response in self._replay_speculation(speculation, cache_key):
+                    yield response
+            finally:
+                self.speculative_turns.used(speculation)
+            return
+        started = time.perf_counter()
+        chat_parameters = self.get_chat_parameters()
+        chat_parameters["stream"] = True
+        stream = await self._create_openai_stream(chat_parameters)
+        items = collate_clauses_async(openai_get_tokens(stream), self._clause_chunker(), get_functions=True)
+        async for response in self._emit_clauses(items, cache_key, started):
+            yield response
+
+    async def _replay_speculation(
+        self, speculation: Speculation, cache_key: Optional[str]
+    ) -> AsyncGenerator[GeneratedResponse, None]:
+        first = True
+        async for response in self._emit_clauses(speculation.replay(), cache_key, speculation.started_at):
+            if first and self.latency_tracker is not None:
+                self.latency_tracker.mark_first_llm_token(provider="speculation", model=self.agent_config.model_name)
+            first = False
+            yield response
+
+    async def _emit_clauses(
+        self, items: AsyncGenerator, cache_key: Optional[str], started: float
+    ) -> AsyncGenerator[GeneratedResponse, None]:
+        chunks = []
+        async for item in items:
+            if isinstance(item, FunctionCall):
+                cache_key = None  # Actions depend on the caller's request, never replayed
+                yield GeneratedResponse(message=item, is_interruptible=True)
+                continue
+            LLM_TTS_CHUNKS_TOTAL.labels(boundary=item.boundary).inc()
+            chunks.append(item.text)
+            yield GeneratedResponse(message=BaseMessage(text=item.text), is_interruptible=True)
+        # Only complete replies get here: an interrupt closes the generator before the end
+        if cache_key is not None and chunks:
+            await self.response_cache.put(
+                cache_key, CachedResponse(chunks=chunks, generation_seconds=time.perf_counter() - started)
+            )
+
+
+class AssistantAgentFactory(AbstractAgentFactory):
+    """
+    Agent factory che crea AssistantAgent per le config ChatGPT
+
+    Le altre config passano alla DefaultAgentFactory di Vocode, importata solo
+    allora: si porta dietro gli SDK di tutti gli agenti (Anthropic, Groq...).
+    """
+
+    def __init__(
+        self,
+        scenario_matcher: Optional[ScenarioMatcher] = None,
+        scenario_min_confidence: float = 0.75,
+        latency_metrics_enabled: bool = True,
+        openai_base_url: Optional[str] = None,
+        openai_client: Optional[AsyncOpenAI] = None,
+        clause_streaming_enabled: bool = True,
+        first_chunk_min_words: int = 4,
+        clause_split_chars: int = 80,
+        chunk_max_chars: int = 200,
+        turn_detection: Optional[TurnDetectionConfig] = None,
+        admission: Optional[AdmissionController] = None,
+        call_store: Optional[CallStore] = None,
+        response_cache: Optional[ResponseCache] = None,
+        history: Optional[HistoryConfig] = None,
+        llm_dispatcher: Optional[LlmDispatcher] = None,
+        tenants: Optional[TenantRouter] = None,
+        drain: Optional[DrainController] = None,
+        speculation: Optional[SpeculationConfig] = None,
+        filler: Optional[FillerConfig] = None,
+        filler_clips: Optional[FillerClipBank] = None,
+        recorder: Optional[CallRecorder] = None,
+        call_profiler: Optional[CallProfiler] = None,
+    ):
+        self.scenario_matcher = scenario_matcher
+        self.scenario_min_confidence = scenario_min_confidence
+        self.latency_metrics_enabled = latency_metrics_enabled
+        self.openai_base_url = openai_base_url
+        self.openai_client = openai_client
+        self.clause_streaming_enabled = clause_streaming_enabled
+        self.first_chunk_min_words = first_chunk_min_words
+        self.clause_split_chars = clause_split_chars
+        self.chunk_max_chars = chunk_max_chars
+        self.turn_detection = turn_detection
+        self.admission = admission
+        self.call_store = call_store
+        self.response_cache = response_cache
+        self.history = history
+        self.llm_dispatcher = llm_dispatcher
+        self.tenants = tenants
+        self.drain = drain
+        self.speculation = speculation
+        self.filler = filler
+        self.filler_clips = filler_clips
+        self.recorder = recorder
+        self.call_profiler = call_profiler
+
+    def create_agent(self, agent_config: AgentConfig) -> BaseAgent:
+        if isinstance(agent_config, ChatGPTAgentConfig):
+            scenario_matcher = self.scenario_matcher
+            speculation = self.speculation
+            if self.tenants is not None and isinstance(agent_config, TenantAgentConfig):
+                # Prompt, greeting and model were set for the tenant when the call was routed
+                pipeline = self.tenants.pipeline(agent_config.tenant)
+                scenario_matcher = pipeline.scenario_matcher
+                if speculation is not None:
+                    speculation = speculation.with_overrides(pipeline.tenant.speculation)
+            return AssistantAgent(
+                agent_config=agent_config,
+                scenario_matcher=scenario_matcher,
+                scenario_min_confidence=self.scenario_min_confidence,
+                latency_metrics_enabled=self.latency_metrics_enabled,
+                openai_base_url=self.openai_base_url,
+                openai_client=self.openai_client,
+                clause_streaming_enabled=self.clause_streaming_enabled,
+                first_chunk_min_words=self.first_chunk_min_words,
+                clause_split_chars=self.clause_split_chars,
+                chunk_max_chars=self.chunk_max_chars,
+                turn_detection=self.turn_detection,
+                admission=self.admission,
+                call_store=self.call_store,
+                response_cache=self.response_cache,
+                history=self.history,
+                llm_dispatcher=self.llm_dispatcher,
+                drain=self.drain,
+                speculation=speculation,
+                filler=self.filler,
+                filler_clips=self.filler_clips,
+                recorder=self.recorder,
+                call_profiler=self.call_profiler,
+            )
+        from vocode.streaming.agent.default_factory import DefaultAgentFactory
+
+        return DefaultAgentFactory().create_agent(agent_config)
@@ -0,0 +1,100 @@
+"""
+Buffer audio - Ring buffer a capacità fissa senza allocazioni per frame
+
+Un bytearray preallocato usato in modo circolare tramite memoryview:
+scrittura e lettura copiano solo i byte del frame (al più due memcpy) e la
+lettura avviene in un buffer del chiamante, quindi il percorso per frame
+non crea oggetti né sposta il contenuto già accodato. La memoria resta
+limitata anche se il produttore (TTS) è molto più veloce del consumatore.
+"""
+
+from typing import Union
+
+BufferLike = Union[bytes, bytearray, memoryview]
+
+
+class AudioRingBuffer:
+    """
+    Coda FIFO circolare di byte audio (mu-law, o PCM a 16 bit come byte)
+
+    Se una scrittura supera la capacità vengono scartati i dati più vecchi.
+
+    Args:
+        capacity: Numero massimo di byte accodati
+    """
+
+    def __init__(self, capacity: int):
+        self.capacity = capacity
+        self._data = bytearray(capacity)
+        self._view = memoryview(self._data)
+        self._start = 0
+        self._size = 0
+
+    def __len__(self) -> int:
+        return self._size
+
+    @property
+    def free(self) -> int:
+        return self.capacity - self._size
+
+    def clear(self) -> None:
+        self._start = 0
+        self._size = 0
+
+    def write(self, data: BufferLike) -> int:
+        """
+        Accoda dati
+
+        Returns:
+            Byte più vecchi scartati per fare spazio (0 se nessuno)
+        """
+        count = len(data)
+        dropped = self._size + count - self.capacity
+        if dropped > 0:
+            if count > self.capacity:
+                data = memoryview(data)[count - self.capacity:]
+                count = self.capacity
+            self.skip(dropped)
+        else:
+            dropped = 0
+
+        end = self._start + self._size
+        if end >= self.capacity:
+            end -= self.capacity
+        first = self.capacity - end
+        if first >= count:
+            self._view[end:end + count] = data
+        else:
+            data = memoryview(data)
+            self._view[end:end + first] = data[:first]
+            self._view[:count - first] = data[first:]
+        self._size += count
+        return dropped
+
+    def peek_into(self, out: Union[bytearray, memoryview]) -> int:
+        """Copia in `out` i byte più vecchi senza consumarli; ritorna quanti"""
+        count = len(out)
+        if count > self._size:
+            count = self._size
+        first = self.capacity - self._start
+        if first >= count:
+            out[:count] = self._view[self._start:self._start + count]
+        else:
+            target = memoryview(out)
+            target[:first] = self._view[self._start:]
+            target[first:count] = self._view[:count - first]
+        return count
+
+    def read_into(self, out: Union[bytearray, memoryview]) -> int:
+        """Consuma fino a len(out) byte copiandoli in `out` (bytearray o memoryview preallocati)"""
+        count = self.peek_into(out)
+        self._size -= count
+        self._start = 0 if self._size == 0 else (self._start + count) % self.capacity
+        return count
+
+    def skip(self, count: int) -> int:
+        """Scarta i `count` byte più vecchi"""
+        count = min(count, self._size)
+        self._size -= count
+        self._start = 0 if self._size == 0 else (self._start + count) % self.capacity
+        return count
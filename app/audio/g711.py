@@ -0,0 +1,125 @@
+"""
+G.711 - Codifica/decodifica mu-law e A-law con tabelle di lookup NumPy
+
+Le tabelle (256 valori per la decodifica, 65536 per la codifica) vengono
+calcolate una sola volta all'import con gli stessi arrotondamenti di
+audioop (ITU-T G.711), così ogni frame costa una singola take (mode="clip"
+salta il controllo dei limiti: gli indici uint8/uint16 sono sempre validi).
+La conversione diretta mu-law <-> A-law usa bytes.translate, senza
+passare dal lineare.
+"""
+
+from typing import Optional
+
+import numpy as np
+
+MULAW_BIAS = 0x84
+MULAW_CLIP = 8159
+MULAW_SEGMENT_ENDS = np.array([0x3F, 0x7F, 0xFF, 0x1FF, 0x3FF, 0x7FF, 0xFFF, 0x1FFF])
+ALAW_SEGMENT_ENDS = np.array([0x1F, 0x3F, 0x7F, 0xFF, 0x1FF, 0x3FF, 0x7FF, 0xFFF])
+
+
+def _build_ulaw_decode_table() -> np.ndarray:
+    code = ~np.arange(256, dtype=np.int32) & 0xFF
+    magnitude = (((code & 0x0F) << 3) + MULAW_BIAS) << ((code & 0x70) >> 4)
+    return np.where(code & 0x80, MULAW_BIAS - magnitude, magnitude - MULAW_BIAS).astype(np.int16)
+
+
+def _build_alaw_decode_table() -> np.ndarray:
+    code = np.arange(256, dtype=np.int32) ^ 0x55
+    segment = (code & 0x70) >> 4
+    magnitude = (code & 0x0F) << 4
+    magnitude = np.where(segment == 0, magnitude + 8, magnitude + 0x108)
+    magnitude = np.where(segment > 1, magnitude << np.maximum(segment - 1, 0), magnitude)
+    return np.where(code & 0x80, magnitude, -magnitude).astype(np.int16)
+
+
+def _build_ulaw_encode_table() -> np.ndarray:
+    # Indexed by the int16 sample reinterpreted as uint16
+    sample = np.arange(65536, dtype=np.int32).astype(np.uint16).view(np.int16).astype(np.int32) >> 2
+    mask = np.where(sample < 0, 0x7F, 0xFF)
+    value = np.minimum(np.abs(sample), MULAW_CLIP) + (MULAW_BIAS >> 2)
+    segment = np.searchsorted(MULAW_SEGMENT_ENDS, value)
+    code = (segment << 4) | ((value >> (np.minimum(segment, 7) + 1)) & 0x0F)
+    code = np.where(segment >= 8, 0x7F, code)
+    return (code ^ mask).astype(np.uint8)
+
+
+def _build_alaw_encode_table() -> np.ndarray:
+    sample = np.arange(65536, dtype=np.int32).astype(np.uint16).view(np.int16).astype(np.int32) >> 3
+    mask = np.where(sample >= 0, 0xD5, 0x55)
+    value = np.where(sample >= 0, sample, -sample - 1)
+    segment = np.searchsorted(ALAW_SEGMENT_ENDS, value)
+    mantissa = np.where(segment < 2, value >> 1, value >> np.minimum(segment, 7)) & 0x0F
+    code = np.where(segment >= 8, 0x7F, (segment << 4) | mantissa)
+    return (code ^ mask).astype(np.uint8)
+
+
+ULAW_TO_LINEAR = _build_ulaw_decode_table()
+ALAW_TO_LINEAR = _build_alaw_decode_table()
+LINEAR_TO_ULAW = _build_ulaw_encode_table()
+LINEAR_TO_ALAW = _build_alaw_encode_table()
+
+# bytes.translate tables for the direct G.711 <-> G.711 conversions
+ULAW_TO_ALAW = LINEAR_TO_ALAW[ULAW_TO_LINEAR.view(np.uint16)].tobytes()
+ALAW_TO_ULAW = LINEAR_TO_ULAW[ALAW_TO_LINEAR.view(np.uint16)].tobytes()
+
+
+def _as_codes(data) -> np.ndarray:
+    return data if isinstance(data, np.ndarray) else np.frombuffer(data, dtype=np.uint8)
+
+
+def _as_samples(samples) -> np.ndarray:
+    return samples if isinstance(samples, np.ndarray) else np.frombuffer(samples, dtype=np.int16)
+
+
+def ulaw_decode(data, out: Optional[np.ndarray] = None) -> np.ndarray:
+    """
+    Decodifica mu-law in PCM lineare a 16 bit
+
+    Args:
+        data: Byte mu-law (bytes, bytearray, memoryview o array uint8)
+        out: Array int16 di destinazione già allocato (len(data) campioni)
+
+    Returns:
+        Array int16 (out, se fornito)
+    """
+    return ULAW_TO_LINEAR.take(_as_codes(data), out=out, mode="clip")
+
+
+def alaw_decode(data, out: Optional[np.ndarray] = None) -> np.ndarray:
+    """Decodifica A-law in PCM lineare a 16 bit (vedi ulaw_decode)"""
+    return ALAW_TO_LINEAR.take(_as_codes(data), out=out, mode="clip")
+
+
+def ulaw_encode(samples, out: Optional[np.ndarray] = None) -> np.ndarray:
+    """
+    Codifica PCM lineare a 16 bit in mu-law
+
+    Args:
+        samples: Campioni int16 (array o byte little-endian)
+        out: Array uint8 di destinazione già allocato
+
+    Returns:
+        Array uint8 (out, se fornito); .tobytes() per il payload
+    """
+    return LINEAR_TO_ULAW.take(_as_samples(samples).view(np.uint16), out=out, mode="clip")
+
+
+def alaw_encode(samples, out: Optional[np.ndarray] = None) -> np.ndarray:
+    """Codifica PCM lineare a 16 bit in A-law (vedi ulaw_encode)"""
+    return LINEAR_TO_ALAW.take(_as_samples(samples).view(np.uint16), out=out, mode="clip")
+
+
+def ulaw_to_alaw(data: bytes) -> bytes:
+    return data.translate(ULAW_TO_ALAW)
+
+
+def alaw_to_ulaw(data: bytes) -> bytes:
+    return data.translate(ALAW_TO_ULAW)
+
+
+def ulaw_gain_table(gain: float) -> bytes:
+    """Tabella translate che scala di `gain` un segnale mu-law (es. fade della PLC)"""
+    scaled = np.clip(np.round(ULAW_TO_LINEAR.astype(np.float32) * gain), -32768, 32767).astype(np.int16)
+    return LINEAR_TO_ULAW[scaled.view(np.uint16)].tobytes()
@@ -0,0 +1,137 @@
+#!/usr/bin/env python3
+"""
+Benchmark - Frame al secondo per core del layer di conversione audio
+
+Misura, su frame da 20 ms, le operazioni che il media path ripete per
+ogni chiamata: codifica/decodifica G.711, transcodifica mu-law <-> A-law
+e accodamento nel ring buffer. Dove esiste un equivalente in audioop
+(rimosso in Python 3.13) viene misurato anche quello come riferimento.
+
+Una chiamata scambia 50 frame al secondo per direzione: la colonna
+"calls/core" è frames/s / 50 per la singola operazione.
+
+Uso (dalla cartella app/):
+    python benchmarks/bench_audio_codec.py --seconds 1.0
+"""
+
+import argparse
+import os
+import sys
+import time
+import warnings
+
+import numpy as np
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from audio.buffers import AudioRingBuffer  # noqa: E402
+from audio.g711 import alaw_to_ulaw, ulaw_decode, ulaw_encode, ulaw_to_alaw  # noqa: E402
+
+with warnings.catch_warnings():
+    warnings.simplefilter("ignore", DeprecationWarning)
+    try:
+        import audioop
+    except ImportError:  # Python >= 3.13
+        audioop = None
+
+FRAME_MS = 20
+FRAMES_PER_CALL_SECOND = 1000 // FRAME_MS
+
+
+def tone(rate: int, seconds: float = 1.0) -> np.ndarray:
+    t = np.arange(int(rate * seconds)) / rate
+    signal = 6000 * np.sin(2 * np.pi * 440 * t) + 2000 * np.sin(2 * np.pi * 1700 * t)
+    return signal.astype(np.int16)
+
+
+def frames_per_second(operation, frames, seconds: float) -> float:
+    """Esegue operation(frame) ciclando sui frame per circa `seconds` secondi"""
+    count = len(frames)
+    done = 0
+    start = time.perf_counter()
+    deadline = start + seconds
+    while True:
+        for i in range(1000):
+            operation(frames[(done + i) % count])
+        done += 1000
+        now = time.perf_counter()
+        if now >= deadline:
+            return done / (now - start)
+
+
+def split(data, frame: int):
+    return [data[i:i + frame] for i in range(0, len(data) - frame + 1, frame)]
+
+
+def print_row(name: str, rate: float, reference: float = None) -> None:
+    vs = f"{rate / reference:>8.2f}x" if reference else f"{'-':>9}"
+    ref = f"{reference:>14,.0f}" if reference else f"{'-':>14}"
+    print(f"{name:<28} {rate:>14,.0f} {rate / FRAMES_PER_CALL_SECOND:>11,.0f} {ref} {vs}")
+
+
+def run(seconds: float) -> None:
+    pcm8 = tone(8000)
+    mulaw = ulaw_encode(pcm8).tobytes()
+    alaw = ulaw_to_alaw(mulaw)
+    mulaw_frames = split(mulaw, 160)
+    alaw_frames = split(alaw, 160)
+    pcm8_bytes_frames = split(pcm8.tobytes(), 320)
+    pcm8_frames = [np.frombuffer(f, dtype=np.int16) for f in pcm8_bytes_frames]
+
+    print(f"{'operation (20 ms frame)':<28} {'frames/s':>14} {'calls/core':>11} {'audioop fr/s':>14} {'vs audioop':>9}")
+
+    decoded = np.empty(160, dtype=np.int16)
+    encoded = np.empty(160, dtype=np.uint8)
+    print_row(
+        "mu-law decode (LUT)",
+        frames_per_second(lambda f: ulaw_decode(f, out=decoded), mulaw_frames, seconds),
+        frames_per_second(lambda f: audioop.ulaw2lin(f, 2), mulaw_frames, seconds) if audioop else None,
+    )
+    print_row(
+        "mu-law encode (LUT)",
+        frames_per_second(lambda f: ulaw_encode(f, out=encoded), pcm8_frames, seconds),
+        frames_per_second(lambda f: audioop.lin2ulaw(f, 2), pcm8_bytes_frames, seconds) if audioop else None,
+    )
+    print_row(
+        "A-law -> mu-law (translate)",
+        frames_per_second(alaw_to_ulaw, alaw_frames, seconds),
+        frames_per_second(lambda f: audioop.lin2ulaw(audioop.alaw2lin(f, 2), 2), alaw_frames, seconds) if audioop else None,
+    )
+    print_row(
+        "mu-law -> A-law (translate)",
+        frames_per_second(ulaw_to_alaw, mulaw_frames, seconds),
+        frames_per_second(lambda f: audioop.lin2alaw(audioop.ulaw2lin(f, 2), 2), mulaw_frames, seconds) if audioop else None,
+    )
+
+    ring = AudioRingBuffer(8000 * 30)
+    out = bytearray(160)
+    outbound = bytearray()
+
+    def ring_cycle(f):
+        ring.write(f)
+        ring.read_into(out)
+
+    def bytearray_cycle(f):
+        outbound.extend(f)
+        frame_bytes = bytes(outbound[:160])
+        del outbound[:160]
+        return frame_bytes
+
+    # Keep a few seconds queued, like a TTS reply buffered ahead of the RTP clock
+    backlog = mulaw * 3
+    ring.write(backlog)
+    outbound.extend(backlog)
+    print(f"\n{'queue (3 s backlog)':<28} {'frames/s':>14}")
+    print(f"{'AudioRingBuffer':<28} {frames_per_second(ring_cycle, mulaw_frames, seconds):>14,.0f}")
+    print(f"{'bytearray extend/del':<28} {frames_per_second(bytearray_cycle, mulaw_frames, seconds):>14,.0f}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Audio conversion throughput benchmark")
+    parser.add_argument("--seconds", type=float, default=1.0, help="Measurement time per operation")
+    args = parser.parse_args()
+    run(args.seconds)
+
+
+if __name__ == "__main__":
+    main()
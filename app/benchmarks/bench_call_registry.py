@@ -0,0 +1,244 @@
+#!/usr/bin/env python3
+"""
+Benchmark - Registro delle chiamate condiviso tra repliche
+
+Due CallRegistry sullo stesso Redis fanno da due repliche. Verifica:
+
+- put/get/update/remove, anche da una replica diversa da quella che ha
+  registrato la chiamata;
+- list_active e count vedono le chiamate di entrambe le repliche;
+- le chiamate mai chiuse scadono dopo ttl_seconds;
+- con Redis che non risponde le operazioni ripiegano sulla copia locale
+  senza sollevare eccezioni.
+
+Poi misura la latenza di put/get/update/remove/list_active. Senza
+--redis-url usa fakeredis (pip install fakeredis), quindi le latenze
+misurano solo il costo lato client; con un Redis locale includono il
+round-trip.
+
+Uso (dalla cartella app/):
+    python benchmarks/bench_call_registry.py
+    docker run -d --rm -p 6379:6379 redis:7
+    python benchmarks/bench_call_registry.py --redis-url redis://localhost:6379/15
+"""
+
+import argparse
+import asyncio
+import os
+import statistics
+import sys
+import time
+import uuid
+from datetime import datetime
+from typing import Callable, List, Optional, Tuple
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from services.call_registry import CallRegistry  # noqa: E402
+
+
+class UnreachablePipeline:
+    """Pipeline che accoda i comandi e fallisce in execute(), come con la connessione persa"""
+
+    def __getattr__(self, name):
+        return lambda *args, **kwargs: self
+
+    async def execute(self):
+        raise ConnectionError("Redis unreachable")
+
+
+class UnreachableRedis:
+    """Client Redis i cui comandi falliscono come con la connessione persa"""
+
+    def pipeline(self, *args, **kwargs) -> UnreachablePipeline:
+        return UnreachablePipeline()
+
+    def __getattr__(self, name):
+        async def fail(*args, **kwargs):
+            raise ConnectionError("Redis unreachable")
+
+        return fail
+
+
+def make_clients(redis_url: Optional[str]) -> Tuple[Callable, Callable]:
+    """(nuovo client, chiusura) per --redis-url o per un server fakeredis condiviso"""
+    if redis_url:
+        from redis.asyncio import Redis
+
+        return lambda: Redis.from_url(redis_url, decode_responses=True), lambda client: client.aclose()
+    try:
+        import fakeredis
+    except ImportError:
+        sys.exit("fakeredis not installed: pip install fakeredis, or pass --redis-url")
+    server = fakeredis.FakeServer()
+
+    async def close(client) -> None:
+        await client.aclose()
+
+    return lambda: fakeredis.FakeAsyncRedis(server=server, decode_responses=True), close
+
+
+def call_info(call_id: str) -> dict:
+    return {
+        "call_sid": call_id,
+        "from_number": "+390212345678",
+        "to_number": "+390287654321",
+        "start_time": datetime.utcnow().replace(microsecond=0),
+        "status": "in-progress",
+    }
+
+
+def report(name: str, passed: bool, detail: str = "") -> bool:
+    print(f"  {name:<44} {'ok' if passed else 'FAILED'} {detail}")
+    return passed
+
+
+async def check_operations(replica_a: CallRegistry, replica_b: CallRegistry) -> List[bool]:
+    call_id = "CA" + uuid.uuid4().hex
+    info = call_info(call_id)
+    await replica_a.put(call_id, info)
+    results = [
+        report("put on A, get on A", await replica_a.get(call_id) == info),
+        report("put on A, get on B", await replica_b.get(call_id) == info),
+    ]
+    updated = await replica_b.update(call_id, status="completed", duration=12.5)
+    results.append(report("update on B", updated == {**info, "status": "completed", "duration": 12.5}))
+    # A's local copy is stale until local_cache_ttl
+    await asyncio.sleep(replica_a.local_cache_ttl)
+    seen = await replica_a.get(call_id)
+    results.append(report("update on B seen by A", seen is not None and seen.get("status") == "completed"))
+    removed = await replica_a.remove(call_id)
+    results.append(report("remove on A returns the last state", removed is not None and removed.get("duration") == 12.5))
+    await asyncio.sleep(replica_b.local_cache_ttl)
+    results.append(report("remove on A seen by B", await replica_b.get(call_id) is None))
+    results.append(report("update of a removed call", await replica_b.update(call_id, status="x") is None))
+    return results
+
+
+async def check_listing(replica_a: CallRegistry, replica_b: CallRegistry) -> List[bool]:
+    ids_a = ["CA" + uuid.uuid4().hex for _ in range(3)]
+    ids_b = ["CA" + uuid.uuid4().hex for _ in range(2)]
+    for call_id in ids_a:
+        await replica_a.put(call_id, call_info(call_id))
+    for call_id in ids_b:
+        await replica_b.put(call_id, call_info(call_id))
+    expected = set(ids_a + ids_b)
+    listed_a = set(await replica_a.list_active())
+    listed_b = set(await replica_b.list_active())
+    results = [
+        report("list_active on A and B", listed_a == listed_b == expected, f"({len(listed_a)}/{len(listed_b)} of {len(expected)})"),
+        report("count on A and B", await replica_a.count() == await replica_b.count() == len(expected)),
+    ]
+    for call_id in ids_a:
+        await replica_a.remove(call_id)
+    for call_id in ids_b:
+        await replica_b.remove(call_id)
+    results.append(report("all removed", await replica_a.count() == 0 and not await replica_b.list_active()))
+    return results
+
+
+async def check_expiry(new_client: Callable, close: Callable, namespace: str) -> List[bool]:
+    client_a, client_b = new_client(), new_client()
+    replica_a = CallRegistry(client_a, namespace=namespace, ttl_seconds=1, local_cache_ttl=0.1)
+    replica_b = CallRegistry(client_b, namespace=namespace, ttl_seconds=1, local_cache_ttl=0.1)
+    call_id = "CA" + uuid.uuid4().hex
+    try:
+        await replica_a.put(call_id, call_info(call_id))
+        before = await replica_b.count()
+        await asyncio.sleep(1.5)
+        return [
+            report("call counted before the TTL", before == 1),
+            report("never-closed call expired (count)", await replica_b.count() == 0),
+            report("never-closed call expired (list_active)", call_id not in await replica_b.list_active()),
+            report("never-closed call expired (get)", await replica_b.get(call_id) is None),
+        ]
+    finally:
+        await close(client_a)
+        await close(client_b)
+
+
+async def check_fallback() -> List[bool]:
+    registry = CallRegistry(UnreachableRedis(), namespace="bench-fallback", local_cache_ttl=0.1)
+    call_id = "CA" + uuid.uuid4().hex
+    info = call_info(call_id)
+    try:
+        await registry.put(call_id, info)
+        await asyncio.sleep(0.15)  # past local_cache_ttl: get must try Redis and fall back
+        got = await registry.get(call_id)
+        updated = await registry.update(call_id, status="completed")
+        listed = await registry.list_active()
+        counted = await registry.count()
+        removed = await registry.remove(call_id)
+    except Exception as e:
+        return [report("operations without Redis", False, f"raised {type(e).__name__}: {e}")]
+    return [
+        report("get without Redis serves the local copy", got == info),
+        report("update without Redis", updated is not None and updated["status"] == "completed"),
+        report("list_active/count without Redis", call_id in listed and counted == 1),
+        report("remove without Redis returns the local copy", removed is not None and removed["status"] == "completed"),
+    ]
+
+
+async def measure(replica_a: CallRegistry, replica_b: CallRegistry, calls: int) -> None:
+    timings = {"put": [], "get (other replica)": [], "update": [], "remove": [], "list_active": []}
+    ids = ["CA" + uuid.uuid4().hex for _ in range(calls)]
+    for call_id in ids:
+        start = time.perf_counter()
+        await replica_a.put(call_id, call_info(call_id))
+        timings["put"].append(time.perf_counter() - start)
+    for call_id in ids:
+        start = time.perf_counter()
+        await replica_b.get(call_id)
+        timings["get (other replica)"].append(time.perf_counter() - start)
+    for call_id in ids:
+        start = time.perf_counter()
+        await replica_a.update(call_id, status="completed")
+        timings["update"].append(time.perf_counter() - start)
+    for _ in range(20):
+        start = time.perf_counter()
+        await replica_b.list_active()
+        timings["list_active"].append(time.perf_counter() - start)
+    for call_id in ids:
+        start = time.perf_counter()
+        await replica_a.remove(call_id)
+        timings["remove"].append(time.perf_counter() - start)
+
+    print(f"\n{calls} calls")
+    print(f"{'operation':<22} {'p50 us':>10} {'max us':>10}")
+    for operation, values in timings.items():
+        print(f"{operation:<22} {statistics.median(values) * 1e6:>10.1f} {max(values) * 1e6:>10.1f}")
+
+
+async def run(redis_url: Optional[str], calls: int) -> bool:
+    new_client, close = make_clients(redis_url)
+    namespace = f"bench-{uuid.uuid4().hex[:8]}"
+    client_a, client_b = new_client(), new_client()
+    replica_a = CallRegistry(client_a, namespace=namespace, local_cache_ttl=0.2)
+    replica_b = CallRegistry(client_b, namespace=namespace, local_cache_ttl=0.2)
+    print(f"Redis: {redis_url or 'fakeredis'}")
+    try:
+        results = []
+        results += await check_operations(replica_a, replica_b)
+        results += await check_listing(replica_a, replica_b)
+        results += await check_expiry(new_client, close, f"{namespace}-expiry")
+        results += await check_fallback()
+        await measure(replica_a, replica_b, calls)
+    finally:
+        await close(client_a)
+        await close(client_b)
+    passed = all(results)
+    print(f"\n{sum(results)}/{len(results)} checks passed")
+    return passed
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Shared call registry checks and latency")
+    parser.add_argument("--redis-url", help="Disposable local Redis (default: fakeredis)")
+    parser.add_argument("--calls", type=int, default=2000, help="Calls to register for the latency run")
+    args = parser.parse_args()
+    if not asyncio.run(run(args.redis_url, args.calls)):
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,159 @@
+#!/usr/bin/env python3
+"""
+Benchmark - Prompt del LLM al crescere della chiamata: history completa vs budget
+
+Simula una chiamata turno per turno e, per ogni lunghezza, confronta:
+
+- history completa: il prompt che Vocode costruisce di default
+  (format_openai_chat_messages_from_transcript, ritokenizza tutto a ogni turno);
+- history a budget: ultimi turni alla lettera + riassunto in background
+  (ConversationContext), con il riassunto prodotto da un summarizer finto
+  che impiega --summary-delay secondi mentre "parla" l'assistente.
+
+Per ogni lunghezza riporta token del prompt, tempo CPU di costruzione del
+prompt e tempo al primo token misurato sul finto OpenAI dei load test, con
+un costo di prefill proporzionale alla lunghezza del prompt
+(--prefill-per-1k-chars).
+
+Uso (dalla cartella app/):
+    python benchmarks/bench_conversation_context.py
+    python benchmarks/bench_conversation_context.py --checkpoints 10 50 100 200 --prefill-per-1k-chars 0.08
+"""
+
+import argparse
+import asyncio
+import os
+import sys
+import time
+
+import aiohttp
+from vocode.streaming.agent.openai_utils import (
+    format_openai_chat_messages_from_transcript,
+    get_openai_chat_messages_from_transcript,
+    merge_event_logs,
+)
+from vocode.streaming.agent.token_utils import num_tokens_from_messages
+from vocode.streaming.models.events import Sender
+from vocode.streaming.models.transcript import Message, Transcript
+
+APP_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, APP_DIR)
+sys.path.insert(0, os.path.join(APP_DIR, "benchmarks", "loadtest"))
+
+from fake_providers import FakeProviderConfig, FakeProviders  # noqa: E402
+from services.conversation_context import ConversationContext, HistoryConfig  # noqa: E402
+
+MODEL = "gpt-4o"
+PREAMBLE = (
+    "Sei l'assistente vocale di Technacy. Rispondi in italiano, in modo cordiale e "
+    "conciso, con frasi brevi adatte alla sintesi vocale. Technacy offre SIM ed eSIM "
+    "aziendali gestite dalla piattaforma Netmon. Se non conosci la risposta, proponi "
+    "di inoltrare la richiesta al supporto."
+)
+CALLER_TURNS = (
+    "Vorrei sapere quali piani avete per una flotta di venti SIM aziendali.",
+    "E il roaming in Europa è incluso oppure si paga a parte?",
+    "Posso gestire le soglie di traffico dalla piattaforma Netmon?",
+    "Quanto tempo serve per attivare le eSIM sui telefoni dei dipendenti?",
+    "Ho un problema con una SIM che non si registra in rete da ieri sera.",
+)
+BOT_REPLY = (
+    "Certo. Con Netmon puoi vedere il traffico di ogni SIM, impostare soglie e "
+    "ricevere un avviso quando vengono superate. Il roaming europeo è incluso nei "
+    "piani business, mentre per le altre zone si applica il listino dedicato. "
+    "Vuoi che ti invii la documentazione via email?"
+)
+SUMMARY = (
+    "Il cliente gestisce una flotta di circa venti SIM aziendali e ha chiesto piani, "
+    "roaming europeo (incluso nei piani business), soglie di traffico su Netmon e "
+    "tempi di attivazione delle eSIM. Ha segnalato una SIM che non si registra in "
+    "rete; l'assistente ha proposto l'invio della documentazione via email."
+)
+
+
+def fake_summarizer(delay: float):
+    async def summarize(previous_summary, messages):
+        await asyncio.sleep(delay)
+        return SUMMARY
+
+    return summarize
+
+
+def prompt_tokens(messages) -> int:
+    return num_tokens_from_messages(messages, model=MODEL)
+
+
+async def first_token_seconds(session: aiohttp.ClientSession, url: str, messages) -> float:
+    start = time.perf_counter()
+    async with session.post(f"{url}/v1/chat/completions", json={"model": MODEL, "messages": messages, "stream": True}) as response:
+        async for line in response.content:
+            if line.startswith(b"data: ") and b'"content": "' in line and b'"content": ""' not in line:
+                return time.perf_counter() - start
+    return time.perf_counter() - start
+
+
+async def run(checkpoints, history: HistoryConfig, prefill_per_1k_chars: float, summary_delay: float, turn_gap: float) -> None:
+    providers = FakeProviders(FakeProviderConfig(llm_first_token=0.3, llm_prefill_per_1k_chars=prefill_per_1k_chars))
+    port = await providers.start()
+    url = f"http://127.0.0.1:{port}"
+
+    transcript = Transcript()
+    context = ConversationContext(MODEL, summarize=fake_summarizer(summary_delay), config=history)
+    print(
+        f"keep_turns={history.keep_turns} max_history_tokens={history.max_history_tokens} "
+        f"prefill={prefill_per_1k_chars}s/1k chars\n"
+    )
+    print(f"{'turns':>6} {'tokens full':>12} {'tokens ctx':>11} {'build full ms':>14} {'build ctx ms':>13} {'TTFT full ms':>13} {'TTFT ctx ms':>12}")
+    async with aiohttp.ClientSession() as session:
+        for turn in range(1, max(checkpoints) + 1):
+            transcript.event_logs.append(Message(sender=Sender.HUMAN, text=CALLER_TURNS[turn % len(CALLER_TURNS)], is_final=True))
+
+            start = time.perf_counter()
+            full = format_openai_chat_messages_from_transcript(transcript, MODEL, None, PREAMBLE)
+            build_full = time.perf_counter() - start
+            start = time.perf_counter()
+            budgeted = context.build(
+                get_openai_chat_messages_from_transcript(
+                    merged_event_logs=merge_event_logs(event_logs=transcript.event_logs),
+                    prompt_preamble=PREAMBLE,
+                )
+            )
+            build_ctx = time.perf_counter() - start
+
+            if turn in checkpoints:
+                ttft_full = await first_token_seconds(session, url, full)
+                ttft_ctx = await first_token_seconds(session, url, budgeted)
+                print(
+                    f"{turn:>6} {prompt_tokens(full):>12} {prompt_tokens(budgeted):>11} "
+                    f"{build_full * 1000:>14.2f} {build_ctx * 1000:>13.2f} "
+                    f"{ttft_full * 1000:>13.0f} {ttft_ctx * 1000:>12.0f}"
+                )
+
+            transcript.event_logs.append(Message(sender=Sender.BOT, text=BOT_REPLY, is_final=True))
+            # The assistant is speaking: background summaries complete here
+            await asyncio.sleep(turn_gap)
+
+    context.close()
+    await providers.stop()
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Token-budgeted conversation history benchmark")
+    parser.add_argument("--checkpoints", type=int, nargs="+", default=[5, 10, 20, 40, 80], help="Call lengths (caller turns) to report")
+    parser.add_argument("--keep-turns", type=int, default=6)
+    parser.add_argument("--max-history-tokens", type=int, default=1500)
+    parser.add_argument("--summary-trigger-tokens", type=int, default=400)
+    parser.add_argument("--prefill-per-1k-chars", type=float, default=0.05, help="Simulated prefill seconds per 1000 prompt characters")
+    parser.add_argument("--summary-delay", type=float, default=0.02, help="Seconds the fake summarizer takes")
+    parser.add_argument("--turn-gap", type=float, default=0.03, help="Seconds between turns (assistant speaking)")
+    args = parser.parse_args()
+    history = HistoryConfig(
+        keep_turns=args.keep_turns,
+        max_history_tokens=args.max_history_tokens,
+        summary_trigger_tokens=args.summary_trigger_tokens,
+    )
+    asyncio.run(run(set(args.checkpoints), history, args.prefill_per_1k_chars, args.summary_delay, args.turn_gap))
+
+
+if __name__ == "__main__":
+    main()
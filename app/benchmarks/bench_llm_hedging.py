@@ -0,0 +1,161 @@
+#!/usr/bin/env python3
+"""
+Benchmark - Tempo al primo token del LLM con e senza hedging
+
+Avvia due provider finti del load test: il primario ha una coda lunga
+(una quota di richieste con il primo token molto in ritardo, ed
+eventualmente errori), il secondo risponde normalmente. Esegue le stesse
+richieste attraverso l'LlmDispatcher senza hedge (solo il primario) e con
+l'hedge sul secondo provider (OpenAI o Anthropic), e riporta il tempo al
+primo token p50/p95/p99, la percentuale di hedge e di richieste vinte
+dall'hedge e lo stato dei circuit breaker.
+
+Uso (dalla cartella app/):
+    python benchmarks/bench_llm_hedging.py
+    python benchmarks/bench_llm_hedging.py --hedge anthropic --tail-probability 0.1 --requests 500
+    python benchmarks/bench_llm_hedging.py --error-probability 0.5 --concurrency 10
+"""
+
+import argparse
+import asyncio
+import os
+import statistics
+import sys
+import time
+from typing import List
+
+from openai import AsyncOpenAI
+
+APP_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, APP_DIR)
+sys.path.insert(0, os.path.join(APP_DIR, "benchmarks", "loadtest"))
+
+from fake_providers import FakeProviderConfig, FakeProviders  # noqa: E402
+from services.llm_dispatch import (  # noqa: E402
+    LLM_DISPATCH_TOTAL,
+    LLM_HEDGES_TOTAL,
+    AnthropicBackend,
+    LlmBackend,
+    LlmDispatcher,
+    OpenAIBackend,
+)
+
+CHAT_PARAMETERS = {
+    "model": "gpt-4o",
+    "messages": [
+        {"role": "system", "content": "Sei l'assistente vocale di Technacy. Rispondi in modo breve."},
+        {"role": "assistant", "content": "Buongiorno, come posso aiutarti?"},
+        {"role": "user", "content": "Vorrei sapere quali servizi offrite per le aziende"},
+    ],
+    "max_tokens": 200,
+    "temperature": 0.7,
+}
+
+
+def percentile(values: List[float], fraction: float) -> float:
+    ordered = sorted(values)
+    return ordered[min(len(ordered) - 1, int(len(ordered) * fraction))]
+
+
+def counter_value(counter, **labels) -> float:
+    return counter.labels(**labels)._value.get()
+
+
+async def run_scenario(name: str, dispatcher: LlmDispatcher, requests: int, concurrency: int) -> None:
+    semaphore = asyncio.Semaphore(concurrency)
+    first_tokens: List[float] = []
+    failures = 0
+    hedges_before = sum(counter_value(LLM_HEDGES_TOTAL, reason=r) for r in ("deadline", "error"))
+    hedge_wins_before = counter_value(LLM_DISPATCH_TOTAL, winner="hedge")
+
+    async def one_request():
+        nonlocal failures
+        async with semaphore:
+            started = time.perf_counter()
+            try:
+                stream = await dispatcher.stream(dict(CHAT_PARAMETERS))
+            except Exception:
+                failures += 1
+                return
+            first_tokens.append(time.perf_counter() - started)
+            async for _ in stream:
+                pass
+
+    await asyncio.gather(*(one_request() for _ in range(requests)))
+    hedges = sum(counter_value(LLM_HEDGES_TOTAL, reason=r) for r in ("deadline", "error")) - hedges_before
+    hedge_wins = counter_value(LLM_DISPATCH_TOTAL, winner="hedge") - hedge_wins_before
+    circuits = " ".join(f"{backend.name}={backend.breaker.state}" for backend in dispatcher.backends)
+    print(
+        f"{name:<10} {statistics.median(first_tokens) * 1000:>8.0f} {percentile(first_tokens, 0.95) * 1000:>8.0f} "
+        f"{percentile(first_tokens, 0.99) * 1000:>8.0f} {100 * hedges / requests:>8.1f} "
+        f"{100 * hedge_wins / requests:>8.1f} {failures:>6}  {circuits}"
+    )
+
+
+async def run(args: argparse.Namespace) -> None:
+    primary_server = FakeProviders(FakeProviderConfig(
+        llm_first_token=args.first_token,
+        llm_tokens_per_second=args.tokens_per_second,
+        llm_tail_probability=args.tail_probability,
+        llm_tail_delay=args.tail_delay,
+        llm_error_probability=args.error_probability,
+    ))
+    hedge_server = FakeProviders(FakeProviderConfig(
+        llm_first_token=args.first_token,
+        llm_tokens_per_second=args.tokens_per_second,
+    ))
+    primary_url = f"http://127.0.0.1:{await primary_server.start()}"
+    hedge_url = f"http://127.0.0.1:{await hedge_server.start()}"
+    try:
+        primary_client = AsyncOpenAI(api_key="sk-bench", base_url=f"{primary_url}/v1")
+        if args.hedge == "anthropic":
+            hedge: LlmBackend = AnthropicBackend("anthropic", "bench", "claude-bench", base_url=hedge_url)
+        else:
+            hedge = OpenAIBackend("openai_hedge", AsyncOpenAI(api_key="sk-bench", base_url=f"{hedge_url}/v1"))
+
+        print(
+            f"first token {args.first_token * 1000:.0f} ms, tail {args.tail_probability:.0%} +{args.tail_delay:.1f}s, "
+            f"errors {args.error_probability:.0%}, {args.requests} requests x {args.concurrency} concurrent\n"
+        )
+        print(f"{'scenario':<10} {'p50 ms':>8} {'p95 ms':>8} {'p99 ms':>8} {'hedge %':>8} {'won %':>8} {'failed':>6}  circuits")
+        settings = dict(
+            hedge_percentile=args.hedge_percentile,
+            min_hedge_delay=args.min_hedge_delay,
+            max_hedge_delay=args.max_hedge_delay,
+        )
+        await run_scenario(
+            "no hedge",
+            LlmDispatcher([OpenAIBackend("openai", primary_client)], **settings),
+            args.requests,
+            args.concurrency,
+        )
+        await run_scenario(
+            "hedged",
+            LlmDispatcher([OpenAIBackend("openai", primary_client), hedge], **settings),
+            args.requests,
+            args.concurrency,
+        )
+    finally:
+        await primary_server.stop()
+        await hedge_server.stop()
+
+
+def main():
+    parser = argparse.ArgumentParser(description="LLM first-token latency with and without hedged requests")
+    parser.add_argument("--hedge", choices=["openai", "anthropic"], default="openai", help="Provider of the hedge request")
+    parser.add_argument("--requests", type=int, default=300)
+    parser.add_argument("--concurrency", type=int, default=5)
+    parser.add_argument("--first-token", type=float, default=0.3, help="Normal first-token delay of both providers")
+    parser.add_argument("--tokens-per-second", type=float, default=200.0)
+    parser.add_argument("--tail-probability", type=float, default=0.05, help="Share of primary requests in the slow tail")
+    parser.add_argument("--tail-delay", type=float, default=3.0, help="Extra first-token delay of the slow tail")
+    parser.add_argument("--error-probability", type=float, default=0.0, help="Share of primary requests failing with a 500")
+    parser.add_argument("--hedge-percentile", type=float, default=0.9, help="LLM_HEDGE_PERCENTILE")
+    parser.add_argument("--min-hedge-delay", type=float, default=0.3, help="LLM_HEDGE_MIN_DELAY")
+    parser.add_argument("--max-hedge-delay", type=float, default=1.5, help="LLM_HEDGE_MAX_DELAY")
+    args = parser.parse_args()
+    asyncio.run(run(args))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,93 @@
+#!/usr/bin/env python3
+"""
+Benchmark - Throughput dello ScenarioMatcher
+
+Confronta l'automa Aho-Corasick con una scansione ingenua (una ricerca per
+ogni parola chiave) su insiemi di parole chiave di dimensione crescente.
+
+Uso (dalla cartella app/):
+    python benchmarks/bench_scenario_matcher.py --sizes 10 100 1000 10000
+"""
+
+import argparse
+import os
+import random
+import string
+import sys
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from services.scenario_matcher import ScenarioMatcher, normalize_text  # noqa: E402
+
+UTTERANCES = [
+    "Buongiorno, ho un problema con la SIM aziendale, non funziona da ieri",
+    "Vorrei un preventivo per venti eSIM con la piattaforma Netmon",
+    "Quali servizi offrite per la gestione delle flotte?",
+    "Mi può dire l'indirizzo email del supporto?",
+    "Perché la fattura di questo mese è più alta del solito?",
+    "Grazie, arrivederci",
+]
+
+
+def random_word(rng: random.Random) -> str:
+    return "".join(rng.choice(string.ascii_lowercase) for _ in range(rng.randint(4, 10)))
+
+
+def build_scenarios(n_keywords: int, rng: random.Random, keywords_per_scenario: int = 10):
+    scenarios = []
+    for i in range(0, n_keywords, keywords_per_scenario):
+        keywords = [
+            " ".join(random_word(rng) for _ in range(rng.randint(1, 3)))
+            for _ in range(min(keywords_per_scenario, n_keywords - i))
+        ]
+        scenarios.append({"name": f"scenario_{i}", "trigger_keywords": keywords, "response": "ok"})
+    # Keep the real-looking intents so some utterances actually match
+    scenarios.append({"name": "supporto_tecnico", "trigger_keywords": ["problema", "non funziona"], "response": "ok"})
+    scenarios.append({"name": "richiesta_commerciale", "trigger_keywords": ["preventivo", "prezzo"], "response": "ok"})
+    return scenarios
+
+
+def naive_match(keywords, utterance: str) -> int:
+    normalized = normalize_text(utterance)
+    return sum(1 for kw in keywords if kw in normalized)
+
+
+def run(sizes, iterations: int, seed: int) -> None:
+    rng = random.Random(seed)
+    print(f"{'keywords':>10} {'build ms':>10} {'aho-corasick/s':>16} {'naive/s':>12} {'speedup':>8}")
+    for size in sizes:
+        scenarios = build_scenarios(size, rng)
+
+        start = time.perf_counter()
+        matcher = ScenarioMatcher(scenarios)
+        build_ms = (time.perf_counter() - start) * 1000
+
+        start = time.perf_counter()
+        for i in range(iterations):
+            matcher.match(UTTERANCES[i % len(UTTERANCES)])
+        ac_rate = iterations / (time.perf_counter() - start)
+
+        naive_keywords = [
+            normalize_text(kw) for s in scenarios for kw in s["trigger_keywords"]
+        ]
+        naive_iterations = max(1, iterations // max(1, size // 100))
+        start = time.perf_counter()
+        for i in range(naive_iterations):
+            naive_match(naive_keywords, UTTERANCES[i % len(UTTERANCES)])
+        naive_rate = naive_iterations / (time.perf_counter() - start)
+
+        print(f"{size:>10} {build_ms:>10.1f} {ac_rate:>16,.0f} {naive_rate:>12,.0f} {ac_rate / naive_rate:>7.1f}x")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="ScenarioMatcher throughput benchmark")
+    parser.add_argument("--sizes", type=int, nargs="+", default=[10, 100, 1000, 10000, 50000])
+    parser.add_argument("--iterations", type=int, default=20000)
+    parser.add_argument("--seed", type=int, default=42)
+    args = parser.parse_args()
+    run(args.sizes, args.iterations, args.seed)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,190 @@
+#!/usr/bin/env python3
+"""
+Benchmark - Cold start del pod
+
+Due misure, ognuna in un processo Python nuovo:
+
+- tempo di import: esegue "import main" (più i moduli che la lifespan
+  carica per il provider scelto) con python -X importtime e riporta il
+  totale e i moduli di primo livello più lenti;
+- time-to-ready: avvia l'applicazione con uvicorn puntata sui provider finti
+  del load test (senza ritardi) e misura il tempo fino al primo 200 di
+  /health e di /ready.
+
+Il time-to-ready si misura con il provider Twilio: con SIP include anche
+la registrazione verso il server SIP, che qui non c'è.
+
+Uso (dalla cartella app/):
+    python benchmarks/bench_startup.py
+    python benchmarks/bench_startup.py --provider sip --top 30 --runs 5
+"""
+
+import argparse
+import asyncio
+import os
+import re
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+from typing import Dict, List, Tuple
+
+import aiohttp
+
+APP_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, APP_DIR)
+sys.path.insert(0, os.path.join(APP_DIR, "benchmarks", "loadtest"))
+
+from fake_providers import FakeProviderConfig, FakeProviders  # noqa: E402
+from run_loadtest import free_port, stop_app  # noqa: E402
+
+# Modules the lifespan imports for each provider, on top of "import main"
+PROVIDER_MODULES = {
+    "twilio": [
+        "handlers.call_handler",
+        "agents.assistant_agent",
+        "services.tts_cache",
+        "vocode.streaming.telephony.server.base",
+        "vocode.streaming.telephony.config_manager.in_memory_config_manager",
+    ],
+    "sip": [
+        "handlers.call_handler",
+        "agents.assistant_agent",
+        "services.tts_cache",
+        "handlers.sip_handler",
+    ],
+}
+IMPORTTIME_PATTERN = re.compile(r"import time:\s+(\d+) \|\s+(\d+) \|( *)(\S+)")
+
+
+def app_env(provider: str, providers_url: str = "http://127.0.0.1:9", cache_dir: str = "") -> Dict[str, str]:
+    return dict(
+        os.environ,
+        TELEPHONY_PROVIDER=provider,
+        BASE_URL="127.0.0.1:8000",
+        TWILIO_ACCOUNT_SID="ACstartup",
+        TWILIO_AUTH_TOKEN="startup",
+        OPENAI_API_KEY="sk-startup",
+        OPENAI_BASE_URL=f"{providers_url}/v1",
+        DEEPGRAM_API_KEY="startup",
+        DEEPGRAM_WS_URL=providers_url.replace("http://", "ws://"),
+        ELEVENLABS_API_KEY="startup",
+        ELEVENLABS_BASE_URL=f"{providers_url}/v1/",
+        TTS_CACHE_DIR=cache_dir or tempfile.gettempdir(),
+        REDIS_URL="",
+        LOG_LEVEL="WARNING",
+    )
+
+
+def measure_imports(provider: str) -> Tuple[float, List[Tuple[float, str]]]:
+    """
+    Importa main e i moduli del provider in un interprete nuovo
+
+    Returns:
+        (secondi totali, [(secondi cumulativi, modulo)] dei moduli di primo livello)
+    """
+    statement = "; ".join(f"import {module}" for module in ["main", *PROVIDER_MODULES[provider]])
+    result = subprocess.run(
+        [sys.executable, "-X", "importtime", "-c", statement],
+        cwd=APP_DIR,
+        env=app_env(provider),
+        capture_output=True,
+        text=True,
+    )
+    if result.returncode != 0:
+        raise RuntimeError(f"import failed:\n{result.stderr[-2000:]}")
+    top_level = []
+    for line in result.stderr.splitlines():
+        match = IMPORTTIME_PATTERN.match(line)
+        # One leading space marks a module imported by the statement itself, not by another module
+        if match and len(match.group(3)) == 1:
+            top_level.append((int(match.group(2)) / 1e6, match.group(4)))
+    return sum(seconds for seconds, _ in top_level), sorted(top_level, reverse=True)
+
+
+async def measure_ready(providers_url: str, timeout: float) -> Tuple[float, float]:
+    """
+    Avvia l'applicazione e misura i secondi fino a /health e /ready in 200
+
+    Returns:
+        (secondi a /health, secondi a /ready)
+    """
+    port = free_port()
+    app_url = f"http://127.0.0.1:{port}"
+    with tempfile.TemporaryDirectory(prefix="startup-tts-") as cache_dir:
+        env = dict(app_env("twilio", providers_url, cache_dir), BASE_URL=f"127.0.0.1:{port}", PORT=str(port))
+        started = time.perf_counter()
+        process = subprocess.Popen(
+            [sys.executable, "-m", "uvicorn", "main:app", "--host", "127.0.0.1", "--port", str(port), "--log-level", "warning"],
+            cwd=APP_DIR,
+            env=env,
+            start_new_session=True,
+        )
+        healthy = None
+        try:
+            async with aiohttp.ClientSession() as session:
+                while time.perf_counter() - started < timeout:
+                    if process.poll() is not None:
+                        raise RuntimeError(f"application exited with code {process.returncode}")
+                    path = "/ready" if healthy is not None else "/health"
+                    try:
+                        async with session.get(f"{app_url}{path}") as response:
+                            if response.status == 200:
+                                now = time.perf_counter() - started
+                                if healthy is not None:
+                                    return healthy, now
+                                healthy = now
+                                continue
+                    except aiohttp.ClientError:
+                        pass
+                    await asyncio.sleep(0.005)
+            raise RuntimeError(f"application at {app_url} not ready after {timeout}s")
+        finally:
+            # Not a blocking wait: the shutdown talks to the fake providers served by this event loop
+            await stop_app(process, 10)
+
+
+async def run(provider: str, runs: int, top: int, timeout: float) -> None:
+    totals = []
+    slowest: List[Tuple[float, str]] = []
+    for _ in range(runs):
+        total, modules = measure_imports(provider)
+        totals.append(total)
+        slowest = modules
+    print(f"Import time ({provider}): median {statistics.median(totals) * 1000:.0f} ms over {runs} runs")
+    print("Slowest top-level imports (last run):")
+    for seconds, module in slowest[:top]:
+        print(f"  {seconds * 1000:>8.1f} ms  {module}")
+
+    providers = FakeProviders(FakeProviderConfig(
+        stt_final_delay=0.0, llm_first_token=0.0, llm_tokens_per_second=1e6, tts_first_byte=0.0,
+    ))
+    providers_url = f"http://127.0.0.1:{await providers.start()}"
+    try:
+        health, ready = [], []
+        for _ in range(runs):
+            to_health, to_ready = await measure_ready(providers_url, timeout)
+            health.append(to_health)
+            ready.append(to_ready)
+    finally:
+        await providers.stop()
+    print(
+        f"\nTime to /health (twilio): median {statistics.median(health) * 1000:.0f} ms, "
+        f"max {max(health) * 1000:.0f} ms"
+    )
+    print(f"Time to /ready  (twilio): median {statistics.median(ready) * 1000:.0f} ms, max {max(ready) * 1000:.0f} ms")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Cold start benchmark: import time and time-to-ready")
+    parser.add_argument("--provider", choices=sorted(PROVIDER_MODULES), default="twilio", help="TELEPHONY_PROVIDER for the import time")
+    parser.add_argument("--runs", type=int, default=3)
+    parser.add_argument("--top", type=int, default=20, help="Slowest top-level imports to list")
+    parser.add_argument("--timeout", type=float, default=60.0, help="Seconds to wait for /ready")
+    args = parser.parse_args()
+    asyncio.run(run(args.provider, args.runs, args.top, args.timeout))
+
+
+if __name__ == "__main__":
+    main()
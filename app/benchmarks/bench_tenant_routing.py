@@ -0,0 +1,137 @@
+#!/usr/bin/env python3
+"""
+Benchmark - Setup della chiamata al crescere del numero di tenant
+
+Per ogni numero di tenant genera una config con un numero chiamato e
+qualche scenario per tenant, la compila e simula le chiamate in arrivo su
+numeri casuali: riporta il tempo di compilazione della config, il tempo di
+setup per chiamata (numero -> tenant -> config Vocode della chiamata,
+p50/p99), la percentuale di hit della LRU e la memoria occupata dalle
+pipeline compilate, che resta limitata da --cache-size.
+
+Uso (dalla cartella app/):
+    python benchmarks/bench_tenant_routing.py
+    python benchmarks/bench_tenant_routing.py --tenants 1 50 200 1000 --cache-size 32 --calls 20000
+"""
+
+import argparse
+import os
+import random
+import statistics
+import sys
+import tempfile
+import time
+import tracemalloc
+
+import yaml
+from vocode.streaming.models.message import BaseMessage
+from vocode.streaming.models.synthesizer import ElevenLabsSynthesizerConfig
+from vocode.streaming.models.transcriber import DeepgramTranscriberConfig
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from config.assistant_config import AssistantConfigStore, TenantProfile  # noqa: E402
+from services.scenario_matcher import ScenarioMatcher  # noqa: E402
+from services.tenants import TenantAgentConfig, TenantPipeline, TenantRouter  # noqa: E402
+
+
+def tenant_number(index: int) -> str:
+    return f"+39 02 {index:07d}"
+
+
+def build_config(n_tenants: int) -> dict:
+    tenants = []
+    for i in range(n_tenants):
+        tenants.append({
+            "name": f"tenant-{i}",
+            "numbers": [tenant_number(i)],
+            "system_prompt": f"Sei l'assistente vocale dell'azienda {i}. Rispondi in modo breve.",
+            "greeting": {"default": f"Buongiorno, azienda {i}, come posso aiutarti?"},
+            "voice_id": f"voice-{i % 7}",
+            "scenarios": [
+                {"name": "orari", "trigger_keywords": ["orari", "quando siete aperti"], "response": f"Orari azienda {i}"},
+                {"name": "supporto", "trigger_keywords": ["problema", "non funziona"], "response": "Apro un ticket"},
+                {"name": "commerciale", "trigger_keywords": ["preventivo", "prezzo"], "response": "Ti passo le vendite"},
+            ],
+        })
+    return {"assistant": {"system_prompt": "Sei l'assistente vocale di Technacy."}, "tenants": tenants}
+
+
+def build_pipeline(tenant: TenantProfile) -> TenantPipeline:
+    # Same shape as the builder in main.py
+    return TenantPipeline(
+        tenant=tenant,
+        agent_config=TenantAgentConfig(
+            openai_api_key="sk-bench",
+            initial_message=BaseMessage(text="Ciao!"),
+            prompt_preamble=tenant.system_prompt or "",
+            model_name=tenant.model or "gpt-4o",
+            tenant=tenant.name,
+        ),
+        transcriber_config=DeepgramTranscriberConfig.from_telephone_input_device(
+            api_key="bench", language=tenant.language or "it", model="nova-2"
+        ),
+        synthesizer_config=ElevenLabsSynthesizerConfig.from_telephone_output_device(
+            api_key="bench", voice_id=tenant.voice_id or "bench", model_id="eleven_multilingual_v2"
+        ),
+        scenario_matcher=ScenarioMatcher(list(tenant.scenarios)),
+    )
+
+
+def run(tenant_counts, cache_size: int, calls: int, seed: int) -> None:
+    rng = random.Random(seed)
+    print(f"cache_size={cache_size} calls={calls}\n")
+    print(f"{'tenants':>8} {'compile ms':>11} {'setup p50 us':>13} {'setup p99 us':>13} {'hit %':>6} {'pipelines':>10} {'pipelines MB':>13}")
+    with tempfile.TemporaryDirectory() as directory:
+        for count in tenant_counts:
+            path = os.path.join(directory, f"tenants-{count}.yaml")
+            with open(path, "w") as f:
+                yaml.safe_dump(build_config(count), f, allow_unicode=True)
+            store = AssistantConfigStore(path, reload_interval=0)
+            start = time.perf_counter()
+            store.load()
+            compile_ms = (time.perf_counter() - start) * 1000
+
+            builds = []
+
+            def counted_build(tenant: TenantProfile) -> TenantPipeline:
+                builds.append(tenant.name)
+                return build_pipeline(tenant)
+
+            router = TenantRouter(store, counted_build, max_pipelines=cache_size)
+            durations = []
+            for _ in range(calls):
+                number = tenant_number(rng.randrange(count))
+                start = time.perf_counter()
+                router.route(number).call_configs()
+                durations.append(time.perf_counter() - start)
+            durations.sort()
+            p50 = statistics.median(durations) * 1e6
+            p99 = durations[int(len(durations) * 0.99)] * 1e6
+
+            # Memory in a separate pass: tracemalloc would inflate the timings above
+            tracemalloc.start()
+            filled = TenantRouter(store, build_pipeline, max_pipelines=cache_size)
+            for index in range(count):
+                filled.route(tenant_number(index)).call_configs()
+            current, _ = tracemalloc.get_traced_memory()
+            tracemalloc.stop()
+            hits = 100 * (1 - len(builds) / calls)
+            print(
+                f"{count:>8} {compile_ms:>11.1f} {p50:>13.1f} {p99:>13.1f} {hits:>6.1f} "
+                f"{router.status()['pipelines']:>10} {current / 1e6:>13.2f}"
+            )
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Tenant routing and call setup benchmark")
+    parser.add_argument("--tenants", type=int, nargs="+", default=[1, 10, 50, 200, 1000])
+    parser.add_argument("--cache-size", type=int, default=32, help="TENANT_PIPELINE_CACHE_SIZE")
+    parser.add_argument("--calls", type=int, default=20000)
+    parser.add_argument("--seed", type=int, default=42)
+    args = parser.parse_args()
+    run(args.tenants, args.cache_size, args.calls, args.seed)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,157 @@
+#!/usr/bin/env python3
+"""
+Benchmark - Webhook Twilio sotto raffica
+
+Avvia l'applicazione con uvicorn puntata sui provider finti del load test
+e invia raffiche di richieste concorrenti come farebbe Twilio all'inizio
+di un picco:
+
+- voice: webhook di chiamata firmato (X-Twilio-Signature), fino al TwiML
+  con lo <Stream>;
+- status: callback "completed" firmate, ognuna inviata due volte come
+  quando Twilio ripete una callback (la ripetizione viene scartata);
+- spam: webhook di chiamata senza firma, da rifiutare con 403 senza
+  occupare posti né creare call config.
+
+Per ogni tipo riporta latenza p50/p95/p99 vista dal client e i codici di
+risposta, poi gli esiti contati dall'applicazione
+(voice_assistant_twilio_webhooks_total).
+
+Uso (dalla cartella app/):
+    python benchmarks/bench_twilio_webhooks.py
+    python benchmarks/bench_twilio_webhooks.py --requests 500 --concurrency 100
+"""
+
+import argparse
+import asyncio
+import os
+import re
+import sys
+import tempfile
+import time
+import uuid
+from collections import Counter
+from typing import Dict, List, Optional, Tuple
+
+import aiohttp
+
+APP_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, APP_DIR)
+sys.path.insert(0, os.path.join(APP_DIR, "benchmarks", "loadtest"))
+
+from fake_providers import FakeProviderConfig, FakeProviders  # noqa: E402
+from run_loadtest import free_port, percentile, start_app, stop_app, wait_ready  # noqa: E402
+from synthetic_caller import twilio_signature  # noqa: E402
+
+AUTH_TOKEN = "loadtest"  # TWILIO_AUTH_TOKEN set by start_app
+WEBHOOK_PATTERN = re.compile(r'voice_assistant_twilio_webhooks_total\{endpoint="([^"]+)",result="([^"]+)"\} ([0-9.e+]+)')
+
+
+def call_form(call_sid: str, status: str = "ringing") -> Dict[str, str]:
+    form = {
+        "CallSid": call_sid,
+        "AccountSid": "ACloadtest",
+        "From": "+390200000001",
+        "To": "+390200000000",
+        "CallStatus": status,
+    }
+    if status == "completed":
+        form["CallDuration"] = "12"
+    return form
+
+
+async def post(
+    session: aiohttp.ClientSession,
+    url: str,
+    form: Dict[str, str],
+    auth_token: Optional[str],
+) -> Tuple[float, int]:
+    headers = {"X-Twilio-Signature": twilio_signature(auth_token, url, form)} if auth_token else None
+    started = time.perf_counter()
+    async with session.post(url, data=form, headers=headers) as response:
+        await response.read()
+        return time.perf_counter() - started, response.status
+
+
+async def burst(
+    session: aiohttp.ClientSession,
+    requests: List[Tuple[str, Dict[str, str], Optional[str]]],
+    concurrency: int,
+) -> Tuple[List[float], Counter]:
+    semaphore = asyncio.Semaphore(concurrency)
+
+    async def one(url: str, form: Dict[str, str], auth_token: Optional[str]):
+        async with semaphore:
+            return await post(session, url, form, auth_token)
+
+    results = await asyncio.gather(*(one(*request) for request in requests))
+    return [seconds for seconds, _ in results], Counter(status for _, status in results)
+
+
+async def scrape_outcomes(session: aiohttp.ClientSession, app_url: str) -> Dict[Tuple[str, str], float]:
+    async with session.get(f"{app_url}/metrics") as response:
+        text = await response.text()
+    return {(endpoint, result): float(value) for endpoint, result, value in WEBHOOK_PATTERN.findall(text)}
+
+
+def print_row(kind: str, latencies: List[float], statuses: Counter) -> None:
+    codes = ", ".join(f"{status}: {count}" for status, count in sorted(statuses.items()))
+    print(
+        f"{kind:<8} {len(latencies):>6} {percentile(latencies, 0.50) * 1000:>8.2f} "
+        f"{percentile(latencies, 0.95) * 1000:>8.2f} {percentile(latencies, 0.99) * 1000:>8.2f}   {codes}"
+    )
+
+
+async def run(requests: int, concurrency: int, timeout: float) -> None:
+    providers = FakeProviders(FakeProviderConfig(
+        stt_final_delay=0.0, llm_first_token=0.0, llm_tokens_per_second=1e6, tts_first_byte=0.0,
+    ))
+    providers_url = f"http://127.0.0.1:{await providers.start()}"
+    port = free_port()
+    app_url = f"http://127.0.0.1:{port}"
+    voice_url = f"{app_url}/webhooks/twilio/voice"
+    status_url = f"{app_url}/webhooks/twilio/status"
+    with tempfile.TemporaryDirectory(prefix="webhooks-tts-") as cache_dir:
+        process = start_app(port, providers_url, cache_dir)
+        try:
+            connector = aiohttp.TCPConnector(limit=concurrency)
+            async with aiohttp.ClientSession(connector=connector) as session:
+                await wait_ready(session, app_url, timeout)
+                call_sids = ["CA" + uuid.uuid4().hex for _ in range(requests)]
+                bursts = {
+                    "voice": [(voice_url, call_form(call_sid), AUTH_TOKEN) for call_sid in call_sids],
+                    # Each callback twice, as Twilio does when the first answer is late
+                    "status": [
+                        (status_url, call_form(call_sid, "completed"), AUTH_TOKEN)
+                        for call_sid in call_sids[: requests // 2]
+                        for _ in range(2)
+                    ],
+                    "spam": [(voice_url, call_form("CA" + uuid.uuid4().hex), None) for _ in range(requests)],
+                }
+                print(f"{requests} requests per burst, {concurrency} concurrent\n")
+                print(f"{'kind':<8} {'sent':>6} {'p50_ms':>8} {'p95_ms':>8} {'p99_ms':>8}   responses")
+                for kind, batch in bursts.items():
+                    latencies, statuses = await burst(session, batch, concurrency)
+                    print_row(kind, latencies, statuses)
+
+                outcomes = await scrape_outcomes(session, app_url)
+                print("\nOutcomes counted by the application:")
+                for (endpoint, result), count in sorted(outcomes.items()):
+                    print(f"  {endpoint:<8} {result:<18} {count:.0f}")
+        finally:
+            if not await stop_app(process, 10):
+                print("application still running 10s after SIGTERM, killed", file=sys.stderr)
+            await providers.stop()
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Twilio webhook burst benchmark: signed, duplicated and unsigned requests")
+    parser.add_argument("--requests", type=int, default=200, help="Requests per burst")
+    parser.add_argument("--concurrency", type=int, default=50, help="Requests in flight at once")
+    parser.add_argument("--timeout", type=float, default=60.0, help="Seconds to wait for the application")
+    args = parser.parse_args()
+    asyncio.run(run(args.requests, args.concurrency, args.timeout))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,144 @@
+#!/usr/bin/env python3
+"""
+Benchmark - Costo per stream del VAD locale
+
+Misura il VoiceActivityDetector su frame mu-law da 20 ms:
+
+- frame/s su silenzio, parlato e una chiamata sintetica mista, e il numero
+  di stream gestibili da un core (ogni stream produce 50 frame/s);
+- N stream concorrenti (un detector per stream, un frame per stream a ogni
+  tick da 20 ms come arrivano da Twilio/RTP): quota di un core consumata;
+- ritardo di rilevamento su parlato sintetico con inizio e fine noti.
+
+Uso (dalla cartella app/):
+    python benchmarks/bench_vad.py --streams 500 --seconds 2.0
+"""
+
+import argparse
+import os
+import sys
+import time
+
+import numpy as np
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from audio.g711 import ulaw_encode  # noqa: E402
+from audio.vad import SPEECH_END, SPEECH_START, VAD_MODES, VoiceActivityDetector  # noqa: E402
+
+SAMPLE_RATE = 8000
+FRAME_BYTES = 160  # 20 ms of mu-law
+FRAMES_PER_CALL_SECOND = 50
+
+
+def line_noise(rng: np.random.Generator, seconds: float, amplitude: float = 60.0) -> np.ndarray:
+    return rng.normal(0, amplitude, int(SAMPLE_RATE * seconds))
+
+
+def synthetic_speech(rng: np.random.Generator, seconds: float) -> np.ndarray:
+    # Voiced harmonics with a 4 Hz syllabic envelope, over line noise
+    t = np.arange(int(SAMPLE_RATE * seconds)) / SAMPLE_RATE
+    pitch = 140 + 30 * np.sin(2 * np.pi * 0.7 * t)
+    phase = 2 * np.pi * np.cumsum(pitch) / SAMPLE_RATE
+    voiced = 3000 * np.sin(phase) + 1500 * np.sin(4 * phase) + 700 * np.sin(9 * phase)
+    envelope = 0.55 + 0.45 * np.sin(2 * np.pi * 4 * t)
+    return envelope * voiced + line_noise(rng, seconds)
+
+
+def to_frames(signal: np.ndarray) -> list:
+    mulaw = ulaw_encode(np.clip(signal, -32768, 32767).astype(np.int16)).tobytes()
+    return [mulaw[i:i + FRAME_BYTES] for i in range(0, len(mulaw) - FRAME_BYTES + 1, FRAME_BYTES)]
+
+
+def frames_per_second(frames: list, seconds: float, mode: int) -> float:
+    vad = VoiceActivityDetector(mode=mode)
+    process = vad.process
+    count = len(frames)
+    done = 0
+    start = time.perf_counter()
+    deadline = start + seconds
+    while True:
+        for i in range(count):
+            process(frames[i])
+        done += count
+        now = time.perf_counter()
+        if now >= deadline:
+            return done / (now - start)
+
+
+def concurrent_streams(call_frames: list, streams: int, seconds: float, mode: int) -> float:
+    """Ritorna la quota di un core usata da `streams` stream in tempo reale"""
+    detectors = [VoiceActivityDetector(mode=mode) for _ in range(streams)]
+    # Each stream starts at a different point of the call so speech and silence are mixed
+    offsets = [(i * 37) % len(call_frames) for i in range(streams)]
+    ticks = int(seconds * FRAMES_PER_CALL_SECOND)
+    busy = 0.0
+    for tick in range(ticks):
+        start = time.perf_counter()
+        for vad, offset in zip(detectors, offsets):
+            vad.process(call_frames[(offset + tick) % len(call_frames)])
+        busy += time.perf_counter() - start
+    return busy / (ticks / FRAMES_PER_CALL_SECOND)
+
+
+def detection_delays(rng: np.random.Generator, mode: int, utterances: int = 20):
+    """Ritardo medio di SPEECH_START dall'inizio del parlato e di SPEECH_END dalla fine"""
+    segments = []
+    truth = []
+    position = 0.0
+    for _ in range(utterances):
+        pause = rng.uniform(0.8, 2.0)
+        talk = rng.uniform(0.6, 2.5)
+        segments += [line_noise(rng, pause), synthetic_speech(rng, talk)]
+        truth.append((position + pause, position + pause + talk))
+        position += pause + talk
+    segments.append(line_noise(rng, 1.5))
+
+    vad = VoiceActivityDetector(mode=mode)
+    events = []
+    for frame in to_frames(np.concatenate(segments)):
+        event = vad.process(frame)
+        if event is not None:
+            events.append((event, vad.position_ms / 1000))
+
+    starts = [t for e, t in events if e == SPEECH_START]
+    ends = [t for e, t in events if e == SPEECH_END]
+    start_delays = [min((s - begin for s in starts if s >= begin), default=np.nan) for begin, _ in truth]
+    end_delays = [min((e - end for e in ends if e >= end), default=np.nan) for _, end in truth]
+    return len(starts), float(np.nanmean(start_delays)), float(np.nanmean(end_delays))
+
+
+def run(streams: int, seconds: float) -> None:
+    rng = np.random.default_rng(7)
+    silence = to_frames(line_noise(rng, 2.0))
+    speech = to_frames(synthetic_speech(rng, 2.0))
+    call = to_frames(np.concatenate([
+        line_noise(rng, 1.0), synthetic_speech(rng, 2.0), line_noise(rng, 3.0), synthetic_speech(rng, 1.5),
+    ]))
+
+    print(f"{'frames (mode 2)':<20} {'frames/s':>12} {'streams/core':>13} {'us/frame':>9}")
+    for name, frames in (("silence", silence), ("speech", speech), ("mixed call", call)):
+        rate = frames_per_second(frames, seconds, mode=2)
+        print(f"{name:<20} {rate:>12,.0f} {rate / FRAMES_PER_CALL_SECOND:>13,.0f} {1e6 / rate:>9.2f}")
+
+    print(f"\n{'concurrent streams':<20} {'core usage':>12}")
+    for count in sorted({streams // 5, streams, streams * 2}):
+        load = concurrent_streams(call, count, seconds, mode=2)
+        print(f"{count:<20} {load * 100:>11.1f}%")
+
+    print(f"\n{'mode':<6} {'detected':>9} {'start delay':>12} {'end delay':>10}  (20 utterances)")
+    for mode in VAD_MODES:
+        detected, start_delay, end_delay = detection_delays(np.random.default_rng(11), mode)
+        print(f"{mode:<6} {detected:>9} {start_delay * 1000:>10.0f}ms {end_delay * 1000:>8.0f}ms")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Local VAD cost benchmark")
+    parser.add_argument("--streams", type=int, default=500, help="Concurrent streams to simulate")
+    parser.add_argument("--seconds", type=float, default=2.0, help="Measurement time per scenario")
+    args = parser.parse_args()
+    run(args.streams, args.seconds)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,299 @@
+"""
+Fake Providers - Server locali che simulano Deepgram, OpenAI ed ElevenLabs
+
+Un solo server aiohttp espone:
+    WS   /v1/listen                          Deepgram streaming STT
+    POST /v1/chat/completions                OpenAI chat completions (stream SSE)
+    POST /v1/messages                        Anthropic messages (stream SSE)
+    POST /v1/text-to-speech/{voice}/stream   ElevenLabs streaming TTS (ulaw_8000 / pcm)
+    GET  /v1/models, /v1/user                keepalive probe del provider pool
+
+Le latenze sono configurabili, così il load test misura solo il costo del
+pod e non quello della rete o dei provider reali.
+
+Il TTS finto genera un tono a REPLY_TONE_HZ per il testo della risposta
+(REPLY_TEXT dell'LLM o una delle reply_phrases, le risposte degli scenari)
+e a PROMPT_TONE_HZ per tutto il resto (saluto, riempitivi, solleciti):
+il chiamante simulato misura così solo l'arrivo della risposta vera.
+"""
+
+import asyncio
+import audioop
+import json
+import math
+import random
+import re
+import time
+import uuid
+from dataclasses import dataclass
+from typing import Tuple
+
+from aiohttp import WSMsgType, web
+
+# Mu-law silence byte; anything louder than this threshold counts as speech
+MULAW_SILENCE = 0xFF
+SPEECH_RMS_THRESHOLD = 500
+
+REPLY_TEXT = (
+    "Certo, posso aiutarti. Technacy offre soluzioni SIM ed eSIM aziendali "
+    "con la piattaforma Netmon. Vuoi che ti invii la documentazione via email?"
+)
+UTTERANCE_TEXT = "Vorrei sapere quali servizi offrite per le aziende"
+
+# Tone of the synthesized audio: reply text vs greeting, fillers and reprompts
+PROMPT_TONE_HZ = 220
+REPLY_TONE_HZ = 660
+
+
+def query_sample_rate(value: str) -> int:
+    """sample_rate della query: "8000", o "SamplingRate.RATE_8000" come lo scrive vocode su Python >= 3.11"""
+    match = re.search(r"(\d+)$", value)
+    if not match:
+        raise web.HTTPBadRequest(text=f"invalid sample_rate {value!r}")
+    return int(match.group(1))
+
+
+def _normalize(text: str) -> str:
+    return " ".join(re.sub(r"[^\w\s]", " ", text.lower()).split())
+
+
+@dataclass
+class FakeProviderConfig:
+    """Latenze simulate dei provider (secondi)"""
+
+    stt_final_delay: float = 0.3  # silence after speech before the final transcript
+    stt_interim_interval: float = 0.2
+    llm_first_token: float = 0.6
+    llm_tokens_per_second: float = 40.0
+    llm_prefill_per_1k_chars: float = 0.0  # extra first-token delay per 1000 prompt characters
+    llm_tail_probability: float = 0.0  # share of LLM requests whose first token is llm_tail_delay later
+    llm_tail_delay: float = 3.0
+    llm_error_probability: float = 0.0  # share of LLM requests answered with a 500
+    tts_first_byte: float = 0.25
+    tts_realtime_factor: float = 4.0  # audio is streamed this many times faster than real time
+    tts_seconds_per_char: float = 0.06
+    reply_phrases: Tuple[str, ...] = ()  # scenario responses the app may answer with instead of the LLM
+
+
+class FakeProviders:
+    """Applicazione aiohttp con gli endpoint finti dei provider"""
+
+    def __init__(self, config: FakeProviderConfig):
+        self.config = config
+        self.app = web.Application()
+        self.app.router.add_get("/v1/listen", self.deepgram_listen)
+        self.app.router.add_post("/v1/chat/completions", self.openai_chat)
+        self.app.router.add_post("/v1/messages", self.anthropic_messages)
+        self.app.router.add_post("/v1/text-to-speech/{voice_id}/stream", self.elevenlabs_stream)
+        # Keepalive probes of the provider pool
+        self.app.router.add_get("/v1/models", self.openai_models)
+        self.app.router.add_get("/v1/user", self.elevenlabs_user)
+        self._runner = None
+        self._reply_texts = [_normalize(text) for text in (REPLY_TEXT,) + tuple(config.reply_phrases)]
+
+    def is_reply_text(self, text: str) -> bool:
+        """True se text è (un pezzo di) REPLY_TEXT o di una reply_phrase: l'app sintetizza per frasi"""
+        normalized = _normalize(text)
+        return bool(normalized) and any(f" {normalized} " in f" {reply} " for reply in self._reply_texts)
+
+    async def start(self, host: str = "127.0.0.1", port: int = 0) -> int:
+        self._runner = web.AppRunner(self.app, access_log=None)
+        await self._runner.setup()
+        site = web.TCPSite(self._runner, host, port)
+        await site.start()
+        return site._server.sockets[0].getsockname()[1]
+
+    async def stop(self) -> None:
+        if self._runner is not None:
+            await self._runner.cleanup()
+
+    # --- Deepgram -----------------------------------------------------------
+
+    async def deepgram_listen(self, request: web.Request) -> web.WebSocketResponse:
+        encoding = request.query.get("encoding", "mulaw")
+        sample_rate = query_sample_rate(request.query.get("sample_rate", "8000"))
+        ws = web.WebSocketResponse()
+        await ws.prepare(request)
+        sample_width = 1 if encoding == "mulaw" else 2
+        byte_rate = sample_rate * sample_width
+
+        audio_cursor = 0.0
+        speech_started = None
+        last_speech = None
+        last_interim = 0.0
+        words_sent = 0
+        words = UTTERANCE_TEXT.split()
+
+        def result(transcript: str, is_final: bool, speech_final: bool, start: float, duration: float) -> str:
+            return json.dumps({
+                "type": "Results",
+                "is_final": is_final,
+                "speech_final": speech_final,
+                "start": start,
+                "duration": duration,
+                "channel": {"alternatives": [{
+                    "transcript": transcript,
+                    "confidence": 0.98 if transcript else 0.0,
+                    "words": [
+                        {"word": w, "start": start, "end": start + duration} for w in transcript.split()
+                    ],
+                }]},
+            })
+
+        async for msg in ws:
+            if msg.type == WSMsgType.TEXT:
+                if json.loads(msg.data).get("type") == "CloseStream":
+                    break
+                continue
+            if msg.type != WSMsgType.BINARY:
+                continue
+
+            chunk = msg.data
+            duration = len(chunk) / byte_rate
+            linear = audioop.ulaw2lin(chunk, 2) if encoding == "mulaw" else chunk
+            is_speech = audioop.rms(linear, 2) > SPEECH_RMS_THRESHOLD
+            now = audio_cursor + duration
+
+            if is_speech:
+                if speech_started is None:
+                    speech_started = audio_cursor
+                    words_sent = 0
+                last_speech = now
+                if now - last_interim >= self.config.stt_interim_interval:
+                    last_interim = now
+                    words_sent = min(len(words), words_sent + 2)
+                    await ws.send_str(result(" ".join(words[:words_sent]), False, False, speech_started, now - speech_started))
+            elif last_speech is not None and now - last_speech >= self.config.stt_final_delay:
+                await ws.send_str(result(UTTERANCE_TEXT + ".", True, True, speech_started, last_speech - speech_started))
+                await ws.send_str(result("", True, False, last_speech, now - last_speech + 1.0))
+                await ws.send_str(json.dumps({"type": "UtteranceEnd", "last_word_end": last_speech}))
+                speech_started = None
+                last_speech = None
+            audio_cursor = now
+
+        await ws.close()
+        return ws
+
+    # --- OpenAI -------------------------------------------------------------
+
+    async def openai_models(self, request: web.Request) -> web.Response:
+        return web.json_response({"object": "list", "data": []})
+
+    async def openai_chat(self, request: web.Request) -> web.StreamResponse:
+        body = await request.json()
+        model = body.get("model", "gpt-4")
+        completion_id = f"chatcmpl-{uuid.uuid4().hex[:12]}"
+
+        def chunk(delta: dict, finish_reason=None) -> bytes:
+            payload = {
+                "id": completion_id,
+                "object": "chat.completion.chunk",
+                "created": int(time.time()),
+                "model": model,
+                "choices": [{"index": 0, "delta": delta, "finish_reason": finish_reason}],
+            }
+            return f"data: {json.dumps(payload)}\n\n".encode("utf-8")
+
+        error = await self._llm_first_token_wait(body)
+        if error is not None:
+            return error
+
+        if not body.get("stream"):
+            return web.json_response({
+                "id": completion_id,
+                "object": "chat.completion",
+                "created": int(time.time()),
+                "model": model,
+                "choices": [{"index": 0, "message": {"role": "assistant", "content": REPLY_TEXT}, "finish_reason": "stop"}],
+                "usage": {"prompt_tokens": 0, "completion_tokens": 0, "total_tokens": 0},
+            })
+
+        response = web.StreamResponse(headers={"Content-Type": "text/event-stream"})
+        await response.prepare(request)
+        await response.write(chunk({"role": "assistant", "content": ""}))
+        token_interval = 1.0 / self.config.llm_tokens_per_second
+        for token in REPLY_TEXT.split(" "):
+            await response.write(chunk({"content": token + " "}))
+            await asyncio.sleep(token_interval)
+        await response.write(chunk({}, finish_reason="stop"))
+        await response.write(b"data: [DONE]\n\n")
+        await response.write_eof()
+        return response
+
+    async def _llm_first_token_wait(self, body: dict):
+        prompt_chars = sum(len(message.get("content") or "") for message in body.get("messages", []))
+        delay = self.config.llm_first_token + prompt_chars / 1000 * self.config.llm_prefill_per_1k_chars
+        if random.random() < self.config.llm_tail_probability:
+            delay += self.config.llm_tail_delay
+        await asyncio.sleep(delay)
+        if random.random() < self.config.llm_error_probability:
+            return web.json_response({"error": {"message": "fake provider error", "type": "server_error"}}, status=500)
+        return None
+
+    # --- Anthropic ----------------------------------------------------------
+
+    async def anthropic_messages(self, request: web.Request) -> web.StreamResponse:
+        body = await request.json()
+        model = body.get("model", "claude")
+        message_id = f"msg_{uuid.uuid4().hex[:12]}"
+        error = await self._llm_first_token_wait(body)
+        if error is not None:
+            return error
+
+        def event(name: str, payload: dict) -> bytes:
+            return f"event: {name}\ndata: {json.dumps(dict(payload, type=name))}\n\n".encode("utf-8")
+
+        response = web.StreamResponse(headers={"Content-Type": "text/event-stream"})
+        await response.prepare(request)
+        await response.write(event("message_start", {"message": {
+            "id": message_id, "type": "message", "role": "assistant", "content": [], "model": model,
+            "stop_reason": None, "stop_sequence": None, "usage": {"input_tokens": 0, "output_tokens": 0},
+        }}))
+        await response.write(event("content_block_start", {"index": 0, "content_block": {"type": "text", "text": ""}}))
+        token_interval = 1.0 / self.config.llm_tokens_per_second
+        for token in REPLY_TEXT.split(" "):
+            await response.write(event("content_block_delta", {"index": 0, "delta": {"type": "text_delta", "text": token + " "}}))
+            await asyncio.sleep(token_interval)
+        await response.write(event("content_block_stop", {"index": 0}))
+        await response.write(event("message_delta", {
+            "delta": {"stop_reason": "end_turn", "stop_sequence": None}, "usage": {"output_tokens": 0},
+        }))
+        await response.write(event("message_stop", {}))
+        await response.write_eof()
+        return response
+
+    # --- ElevenLabs ---------------------------------------------------------
+
+    async def elevenlabs_user(self, request: web.Request) -> web.Response:
+        return web.json_response({})
+
+    async def elevenlabs_stream(self, request: web.Request) -> web.StreamResponse:
+        body = await request.json()
+        text = body.get("text", "")
+        output_format = request.query.get("output_format", "ulaw_8000")
+        encoding, _, rate = output_format.partition("_")
+        sample_rate = int(rate or 8000)
+
+        await asyncio.sleep(self.config.tts_first_byte)
+
+        response = web.StreamResponse(headers={"Content-Type": "application/octet-stream"})
+        await response.prepare(request)
+
+        tone_hz = REPLY_TONE_HZ if self.is_reply_text(text) else PROMPT_TONE_HZ
+        total_seconds = max(0.5, len(text) * self.config.tts_seconds_per_char)
+        chunk_seconds = 0.1
+        samples_per_chunk = int(sample_rate * chunk_seconds)
+        phase = 0
+        sent = 0.0
+        while sent < total_seconds:
+            # Steady tone, loud enough for the caller to detect
+            linear = b"".join(
+                int(8000 * math.sin(2 * math.pi * tone_hz * (phase + i) / sample_rate)).to_bytes(2, "little", signed=True)
+                for i in range(samples_per_chunk)
+            )
+            phase += samples_per_chunk
+            await response.write(audioop.lin2ulaw(linear, 2) if encoding == "ulaw" else linear)
+            sent += chunk_seconds
+            await asyncio.sleep(chunk_seconds / self.config.tts_realtime_factor)
+        await response.write_eof()
+        return response
@@ -0,0 +1,391 @@
+#!/usr/bin/env python3
+"""
+Load Test - Quante chiamate concorrenti regge un pod
+
+Avvia i provider finti (Deepgram/OpenAI/ElevenLabs) e l'applicazione con
+uvicorn puntata su di essi, poi esegue N chiamate simulate in parallelo per
+ogni livello della rampa. Per ogni livello riporta latenza di turno
+p50/p95/p99, ritardo dell'event loop, CPU e RSS per chiamata (sommati su
+tutti i worker) e la CPU del processo del load test stesso.
+Non serve rete: tutto gira in locale.
+
+Con --workers ripete la rampa per ogni numero di worker (WORKERS) e
+riassume la capacità del pod: il livello più alto senza chiamate fallite
+e con p95 entro --slo-p95-ms, e quanto scala rispetto a un worker. Se la
+CPU del load test si avvicina al 100% il collo di bottiglia è il driver:
+usare --url con l'applicazione su un'altra macchina.
+
+Dopo ogni rampa l'applicazione riceve SIGTERM e deve chiudere entro
+--drain-timeout: se non ci riesce (chiamate rimaste aperte) viene
+terminata e il load test esce con errore.
+
+Uso (dalla cartella app/):
+    python benchmarks/loadtest/run_loadtest.py --levels 1 5 10 25 50 --turns 3
+    python benchmarks/loadtest/run_loadtest.py --audio caller.wav --llm-first-token 1.2
+    python benchmarks/loadtest/run_loadtest.py --workers 1 2 4 --levels 20 40 80 160
+"""
+
+import argparse
+import asyncio
+import os
+import re
+import signal
+import socket
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+from typing import Dict, List, Optional, Tuple
+
+import aiohttp
+
+APP_DIR = os.path.dirname(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+sys.path.insert(0, APP_DIR)
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+from config.assistant_config import load_assistant_config  # noqa: E402
+from fake_providers import FakeProviderConfig, FakeProviders  # noqa: E402
+from synthetic_caller import SyntheticCaller, load_caller_audio  # noqa: E402
+
+LAG_BUCKET_PATTERN = re.compile(r'voice_assistant_event_loop_lag_seconds_bucket\{le="([^"]+)"\} ([0-9.e+]+)')
+CLOCK_TICKS = os.sysconf("SC_CLK_TCK") if hasattr(os, "sysconf") else 100
+
+
+def free_port() -> int:
+    with socket.socket() as s:
+        s.bind(("127.0.0.1", 0))
+        return s.getsockname()[1]
+
+
+def percentile(values: List[float], fraction: float) -> float:
+    if not values:
+        return float("nan")
+    ordered = sorted(values)
+    return ordered[min(len(ordered) - 1, int(round(fraction * (len(ordered) - 1))))]
+
+
+class ProcessStats:
+    """CPU e RSS di un processo e dei suoi figli (i worker), con psutil se disponibile, altrimenti /proc"""
+
+    def __init__(self, pid: int):
+        self.pid = pid
+        try:
+            import psutil
+            self._psutil = psutil
+        except ImportError:
+            self._psutil = None
+
+    def _pids(self) -> List[int]:
+        if self._psutil is not None:
+            return [self.pid] + [child.pid for child in self._psutil.Process(self.pid).children(recursive=True)]
+        try:
+            with open(f"/proc/{self.pid}/task/{self.pid}/children") as f:
+                return [self.pid] + [int(pid) for pid in f.read().split()]
+        except OSError:
+            return [self.pid]
+
+    def _cpu_seconds(self, pid: int) -> float:
+        if self._psutil is not None:
+            times = self._psutil.Process(pid).cpu_times()
+            return times.user + times.system
+        with open(f"/proc/{pid}/stat") as f:
+            fields = f.read().rsplit(")", 1)[1].split()
+        return (int(fields[11]) + int(fields[12])) / CLOCK_TICKS
+
+    def _rss_bytes(self, pid: int) -> int:
+        if self._psutil is not None:
+            return self._psutil.Process(pid).memory_info().rss
+        with open(f"/proc/{pid}/status") as f:
+            for line in f:
+                if line.startswith("VmRSS:"):
+                    return int(line.split()[1]) * 1024
+        return 0
+
+    def _sum(self, measure) -> float:
+        total = 0
+        for pid in self._pids():
+            try:
+                total += measure(pid)
+            except Exception:
+                continue  # Worker exited between listing and reading
+        return total
+
+    def cpu_seconds(self) -> float:
+        return self._sum(self._cpu_seconds)
+
+    def rss_bytes(self) -> int:
+        return int(self._sum(self._rss_bytes))
+
+
+async def scrape_lag_buckets(session: aiohttp.ClientSession, app_url: str) -> Dict[float, float]:
+    async with session.get(f"{app_url}/metrics") as response:
+        text = await response.text()
+    return {float(le): float(count) for le, count in LAG_BUCKET_PATTERN.findall(text)}
+
+
+def lag_percentile(before: Dict[float, float], after: Dict[float, float], fraction: float) -> Optional[float]:
+    """Percentile approssimato (limite superiore del bucket) dalla differenza di due scrape"""
+    deltas = sorted((le, after.get(le, 0.0) - before.get(le, 0.0)) for le in after)
+    if not deltas or deltas[-1][1] <= 0:
+        return None
+    target = fraction * deltas[-1][1]
+    for le, cumulative in deltas:
+        if cumulative >= target:
+            return le
+    return deltas[-1][0]
+
+
+def scenario_replies(path: Optional[str] = None) -> Tuple[str, ...]:
+    """Risposte degli scenari dell'applicazione, che il TTS finto deve marcare come risposta"""
+    config = load_assistant_config(path)
+    return tuple(s["response"] for s in config.get("scenarios") or [] if s.get("response"))
+
+
+def start_app(port: int, providers_url: str, cache_dir: str, workers: int = 1) -> subprocess.Popen:
+    env = dict(
+        os.environ,
+        BASE_URL=f"127.0.0.1:{port}",
+        PORT=str(port),
+        TELEPHONY_PROVIDER="twilio",
+        TWILIO_ACCOUNT_SID="ACloadtest",
+        TWILIO_AUTH_TOKEN="loadtest",
+        OPENAI_API_KEY="sk-loadtest",
+        OPENAI_BASE_URL=f"{providers_url}/v1",
+        DEEPGRAM_API_KEY="loadtest",
+        DEEPGRAM_WS_URL=providers_url.replace("http://", "ws://"),
+        ELEVENLABS_API_KEY="loadtest",
+        ELEVENLABS_BASE_URL=f"{providers_url}/v1/",
+        TTS_CACHE_DIR=cache_dir,
+        REDIS_URL="",
+        LOG_LEVEL="WARNING",
+        WORKERS=str(workers),
+    )
+    if workers > 1:
+        # The supervisor is started by main.py, as in the container
+        command = [sys.executable, "main.py"]
+    else:
+        command = [sys.executable, "-m", "uvicorn", "main:app", "--host", "127.0.0.1", "--port", str(port), "--log-level", "warning"]
+    # Own process group, so a stuck supervisor can be killed together with its workers
+    return subprocess.Popen(command, cwd=APP_DIR, env=env, start_new_session=True)
+
+
+async def stop_app(process: subprocess.Popen, timeout: float) -> bool:
+    """
+    SIGTERM all'applicazione e attesa del drain
+
+    L'attesa non blocca l'event loop: i provider finti girano nello stesso
+    processo e l'applicazione li chiama ancora mentre si chiude.
+
+    Returns:
+        False se non è uscita entro timeout: viene uccisa con tutti i worker
+    """
+    process.terminate()
+    try:
+        await asyncio.to_thread(process.wait, timeout)
+        return True
+    except subprocess.TimeoutExpired:
+        os.killpg(process.pid, signal.SIGKILL)
+        process.wait()
+        return False
+
+
+async def wait_ready(session: aiohttp.ClientSession, app_url: str, timeout: float = 60.0) -> None:
+    deadline = time.monotonic() + timeout
+    while time.monotonic() < deadline:
+        try:
+            async with session.get(f"{app_url}/health") as response:
+                if response.status == 200:
+                    return
+        except aiohttp.ClientError:
+            pass
+        await asyncio.sleep(0.2)
+    raise RuntimeError(f"application at {app_url} not healthy after {timeout}s")
+
+
+async def run_level(
+    session: aiohttp.ClientSession,
+    app_url: str,
+    n_calls: int,
+    args: argparse.Namespace,
+    caller_audio: bytes,
+    stats: Optional[ProcessStats],
+) -> Tuple[dict, List[float]]:
+    lag_before = await scrape_lag_buckets(session, app_url)
+    cpu_before = stats.cpu_seconds() if stats else None
+    rss_before = stats.rss_bytes() if stats else None
+    peak_rss = rss_before or 0
+
+    async def sample_rss():
+        nonlocal peak_rss
+        while True:
+            peak_rss = max(peak_rss, stats.rss_bytes())
+            await asyncio.sleep(0.25)
+
+    sampler = asyncio.create_task(sample_rss()) if stats else None
+    started = time.perf_counter()
+    driver_cpu_before = time.process_time()
+
+    async def one_call(i: int):
+        # Spread call arrivals over the ramp window instead of a thundering herd
+        await asyncio.sleep(args.ramp_seconds * i / max(1, n_calls))
+        caller = SyntheticCaller(
+            session, app_url, caller_audio, turns=args.turns, reply_timeout=args.reply_timeout,
+            auth_token=args.auth_token,
+        )
+        return await caller.run()
+
+    results = await asyncio.gather(*(one_call(i) for i in range(n_calls)))
+    elapsed = time.perf_counter() - started
+    driver_cpu = time.process_time() - driver_cpu_before
+    if sampler:
+        sampler.cancel()
+
+    lag_after = await scrape_lag_buckets(session, app_url)
+    latencies = [latency for r in results for latency in r.turn_latencies]
+    failed = [r for r in results if r.error]
+
+    row = {
+        "calls": n_calls,
+        "failed": len(failed),
+        "turns": len(latencies),
+        "p50_ms": percentile(latencies, 0.50) * 1000,
+        "p95_ms": percentile(latencies, 0.95) * 1000,
+        "p99_ms": percentile(latencies, 0.99) * 1000,
+        "lag_p99_ms": (lag_percentile(lag_before, lag_after, 0.99) or float("nan")) * 1000,
+        "setup_ms": statistics.mean([r.setup_seconds for r in results if r.setup_seconds] or [float("nan")]) * 1000,
+        "elapsed_s": elapsed,
+        "driver_cpu_pct": 100 * driver_cpu / elapsed,
+    }
+    if stats:
+        cpu = stats.cpu_seconds() - cpu_before
+        row["cpu_pct"] = 100 * cpu / elapsed
+        row["cpu_s_per_call"] = cpu / n_calls
+        row["rss_mb"] = peak_rss / 2**20
+        row["rss_mb_per_call"] = max(0, peak_rss - rss_before) / 2**20 / n_calls
+    for r in failed[:3]:
+        print(f"  call {r.call_sid} failed: {r.error}", file=sys.stderr)
+    return row, latencies
+
+
+def print_row(row: dict, header: bool = False) -> None:
+    columns = [
+        ("calls", 6, ".0f"), ("failed", 6, ".0f"), ("turns", 6, ".0f"),
+        ("p50_ms", 8, ".0f"), ("p95_ms", 8, ".0f"), ("p99_ms", 8, ".0f"),
+        ("lag_p99_ms", 10, ".1f"), ("setup_ms", 8, ".0f"),
+        ("cpu_pct", 7, ".0f"), ("cpu_s_per_call", 14, ".3f"),
+        ("rss_mb", 7, ".0f"), ("rss_mb_per_call", 15, ".2f"),
+        ("driver_cpu_pct", 14, ".0f"),
+    ]
+    if header:
+        print(" ".join(f"{name:>{width}}" for name, width, _ in columns))
+    print(" ".join(f"{float(row.get(name, float('nan'))):>{width}{spec}}" for name, width, spec in columns))
+
+
+def capacity(rows: List[dict], slo_p95_ms: float) -> int:
+    """Livello più alto senza chiamate fallite e con p95 entro lo SLO (0 se nessuno)"""
+    passing = [row["calls"] for row in rows if row["failed"] == 0 and row["p95_ms"] <= slo_p95_ms]
+    return max(passing, default=0)
+
+
+def print_scaling(capacities: Dict[int, int], slo_p95_ms: float) -> None:
+    print(f"\nCalls per pod within p95 {slo_p95_ms:.0f} ms:")
+    print(f"{'workers':>7} {'calls':>6} {'per_worker':>10} {'scaling':>8}")
+    base_workers = min(capacities)
+    base = capacities[base_workers] / base_workers
+    for workers, calls in sorted(capacities.items()):
+        # 1.00 = linear: each worker adds as many calls as the smallest configuration per worker
+        scaling = calls / (base * workers) if base else float("nan")
+        print(f"{workers:>7} {calls:>6} {calls / workers:>10.1f} {scaling:>8.2f}")
+
+
+async def run_ramp(
+    session: aiohttp.ClientSession,
+    app_url: str,
+    args: argparse.Namespace,
+    caller_audio: bytes,
+    stats: Optional[ProcessStats],
+) -> List[dict]:
+    rows = []
+    for i, level in enumerate(args.levels):
+        row, _ = await run_level(session, app_url, level, args, caller_audio, stats)
+        print_row(row, header=(i == 0))
+        rows.append(row)
+        await asyncio.sleep(args.cooldown)
+    return rows
+
+
+async def main_async(args: argparse.Namespace) -> bool:
+    providers = FakeProviders(FakeProviderConfig(
+        stt_final_delay=args.stt_final_delay,
+        llm_first_token=args.llm_first_token,
+        llm_tokens_per_second=args.llm_tokens_per_second,
+        tts_first_byte=args.tts_first_byte,
+        reply_phrases=scenario_replies(os.environ.get("ASSISTANT_CONFIG_PATH")),
+    ))
+    providers_port = await providers.start()
+    providers_url = f"http://127.0.0.1:{providers_port}"
+
+    caller_audio = load_caller_audio(args.audio)
+    connector = aiohttp.TCPConnector(limit=0)
+    capacities: Dict[int, int] = {}
+    drained = True
+    try:
+        async with aiohttp.ClientSession(connector=connector) as session:
+            if args.url:
+                app_url = args.url.rstrip("/")
+                await wait_ready(session, app_url)
+                print(f"Application at {app_url}, fake providers at {providers_url}")
+                await run_ramp(session, app_url, args, caller_audio, ProcessStats(args.pid) if args.pid else None)
+                return True
+
+            for workers in args.workers:
+                port = free_port()
+                cache_dir = tempfile.mkdtemp(prefix="loadtest-tts-")
+                app_process = start_app(port, providers_url, cache_dir, workers)
+                app_url = f"http://127.0.0.1:{port}"
+                try:
+                    await wait_ready(session, app_url)
+                    print(f"\nApplication at {app_url} with {workers} worker(s), fake providers at {providers_url}")
+                    rows = await run_ramp(session, app_url, args, caller_audio, ProcessStats(app_process.pid))
+                    capacities[workers] = capacity(rows, args.slo_p95_ms)
+                finally:
+                    if not await stop_app(app_process, args.drain_timeout):
+                        drained = False
+                        print(
+                            f"harness error: application with {workers} worker(s) still running "
+                            f"{args.drain_timeout:.0f}s after SIGTERM (calls left open), killed",
+                            file=sys.stderr,
+                        )
+            if len(capacities) > 1:
+                print_scaling(capacities, args.slo_p95_ms)
+    finally:
+        await providers.stop()
+    return drained
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Offline load test for the voice assistant pod")
+    parser.add_argument("--levels", type=int, nargs="+", default=[1, 5, 10, 20, 40], help="Concurrent calls per ramp step")
+    parser.add_argument("--turns", type=int, default=3, help="Caller turns per call")
+    parser.add_argument("--ramp-seconds", type=float, default=2.0, help="Window over which calls of a step arrive")
+    parser.add_argument("--cooldown", type=float, default=2.0, help="Pause between ramp steps")
+    parser.add_argument("--reply-timeout", type=float, default=15.0)
+    parser.add_argument("--audio", help="Recorded caller utterance (WAV); default is a synthetic signal")
+    parser.add_argument("--url", help="Use an already running application instead of spawning one")
+    parser.add_argument("--pid", type=int, help="PID of the application given with --url, for CPU/RSS")
+    parser.add_argument("--auth-token", default="loadtest", help="TWILIO_AUTH_TOKEN of the application, to sign the webhooks")
+    parser.add_argument("--workers", type=int, nargs="+", default=[1], help="Worker counts (WORKERS) to run the ramp with")
+    parser.add_argument("--slo-p95-ms", type=float, default=1500.0, help="p95 turn latency a level must meet to count as capacity")
+    parser.add_argument("--drain-timeout", type=float, default=30.0, help="Seconds the application may take to exit after SIGTERM")
+    parser.add_argument("--stt-final-delay", type=float, default=0.3)
+    parser.add_argument("--llm-first-token", type=float, default=0.6)
+    parser.add_argument("--llm-tokens-per-second", type=float, default=40.0)
+    parser.add_argument("--tts-first-byte", type=float, default=0.25)
+    args = parser.parse_args()
+    if not asyncio.run(main_async(args)):
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
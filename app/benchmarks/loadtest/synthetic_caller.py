@@ -0,0 +1,264 @@
+"""
+Synthetic Caller - Chiamante simulato che parla con il pod come farebbe Twilio
+
+Per ogni chiamata:
+    1. POST /webhooks/twilio/voice e lettura dello <Stream url> dal TwiML
+    2. apertura del media WebSocket ed eventi "connected" / "start"
+    3. invio continuo di frame mu-law da 20 ms (parlato o silenzio), parlando
+       solo dopo la fine del saluto iniziale
+    4. per ogni turno misura fine parlato -> primo frame della risposta
+       (tono REPLY_TONE_HZ del TTS finto: riempitivi e solleciti non contano)
+    5. eco dei "mark" come se l'audio fosse stato riprodotto
+    6. evento "stop" a fine chiamata, anche quando un turno fallisce
+
+Il webhook è firmato (X-Twilio-Signature) con l'auth token del pod.
+"""
+
+import asyncio
+import audioop
+import base64
+import hashlib
+import hmac
+import json
+import math
+import random
+import re
+import time
+import uuid
+import wave
+from dataclasses import dataclass, field
+from typing import Dict, List, Optional
+
+import aiohttp
+
+from fake_providers import PROMPT_TONE_HZ, REPLY_TONE_HZ
+
+FRAME_SECONDS = 0.02
+FRAME_BYTES = 160  # 20 ms of 8 kHz mu-law
+MULAW_SILENCE_FRAME = b"\xff" * FRAME_BYTES
+SPEECH_RMS_THRESHOLD = 500
+STREAM_URL_PATTERN = re.compile(r'<Stream url="([^"]+)"')
+
+
+def load_caller_audio(path: Optional[str] = None, seconds: float = 2.0) -> bytes:
+    """
+    Carica l'audio del chiamante come mu-law 8 kHz
+
+    Args:
+        path: File WAV registrato (qualsiasi sample rate, mono o stereo);
+            se None viene generato un segnale sintetico simile al parlato
+        seconds: Durata del segnale sintetico
+    """
+    if path:
+        with wave.open(path, "rb") as wav:
+            frames = wav.readframes(wav.getnframes())
+            width = wav.getsampwidth()
+            if wav.getnchannels() == 2:
+                frames = audioop.tomono(frames, width, 0.5, 0.5)
+            if width != 2:
+                frames = audioop.lin2lin(frames, width, 2)
+            if wav.getframerate() != 8000:
+                frames, _ = audioop.ratecv(frames, 2, 1, wav.getframerate(), 8000, None)
+        return audioop.lin2ulaw(frames, 2)
+
+    rng = random.Random(7)
+    samples = []
+    for i in range(int(8000 * seconds)):
+        t = i / 8000
+        # Syllable-rate envelope over a few formant-like tones plus noise
+        envelope = 0.55 + 0.45 * math.sin(2 * math.pi * 4 * t)
+        value = sum(math.sin(2 * math.pi * f * t) for f in (180, 720, 1250)) / 3
+        samples.append(int(9000 * envelope * value + rng.uniform(-300, 300)))
+    linear = b"".join(s.to_bytes(2, "little", signed=True) for s in samples)
+    return audioop.lin2ulaw(linear, 2)
+
+
+def twilio_signature(auth_token: str, url: str, form: Dict[str, str]) -> str:
+    """X-Twilio-Signature di una richiesta POST: HMAC-SHA1 di URL + parametri ordinati"""
+    payload = url + "".join(name + value for name, value in sorted(form.items()))
+    digest = hmac.new(auth_token.encode(), payload.encode(), hashlib.sha1).digest()
+    return base64.b64encode(digest).decode()
+
+
+def is_reply_audio(audio: bytes) -> bool:
+    """True se il frame mu-law è il tono della risposta del TTS finto (frequenza stimata dagli zero crossing)"""
+    linear = audioop.ulaw2lin(audio, 2)
+    if audioop.rms(linear, 2) < SPEECH_RMS_THRESHOLD:
+        return False
+    frequency = audioop.cross(linear, 2) * 8000 / (2 * len(audio))
+    return frequency >= (PROMPT_TONE_HZ + REPLY_TONE_HZ) / 2
+
+
+@dataclass
+class CallResult:
+    """Risultato di una chiamata simulata"""
+
+    call_sid: str
+    turn_latencies: List[float] = field(default_factory=list)
+    setup_seconds: Optional[float] = None
+    error: Optional[str] = None
+
+
+class SyntheticCaller:
+    """Simula un chiamante Twilio su webhook + media WebSocket"""
+
+    def __init__(
+        self,
+        session: aiohttp.ClientSession,
+        base_url: str,
+        caller_audio: bytes,
+        turns: int = 3,
+        reply_timeout: float = 15.0,
+        quiet_gap: float = 0.6,
+        auth_token: Optional[str] = "loadtest",
+    ):
+        self.session = session
+        self.base_url = base_url.rstrip("/")
+        self.caller_audio = caller_audio
+        self.turns = turns
+        self.reply_timeout = reply_timeout
+        self.quiet_gap = quiet_gap
+        self.auth_token = auth_token
+
+    async def run(self) -> CallResult:
+        result = CallResult(call_sid="CA" + uuid.uuid4().hex)
+        start = time.perf_counter()
+        try:
+            stream_url = await self._start_call(result.call_sid)
+            async with self.session.ws_connect(stream_url) as ws:
+                result.setup_seconds = time.perf_counter() - start
+                await self._converse(ws, result)
+        except Exception as e:
+            result.error = f"{type(e).__name__}: {e}"
+        return result
+
+    async def _start_call(self, call_sid: str) -> str:
+        form = {
+            "CallSid": call_sid,
+            "AccountSid": "ACloadtest",
+            "From": "+390200000001",
+            "To": "+390200000000",
+            "CallStatus": "ringing",
+        }
+        url = f"{self.base_url}/webhooks/twilio/voice"
+        headers = {"X-Twilio-Signature": twilio_signature(self.auth_token, url, form)} if self.auth_token else None
+        async with self.session.post(url, data=form, headers=headers) as response:
+            twiml = await response.text()
+            if response.status != 200:
+                raise RuntimeError(f"webhook returned {response.status}")
+        match = STREAM_URL_PATTERN.search(twiml)
+        if not match:
+            raise RuntimeError("no <Stream> in TwiML response")
+        # The pod advertises wss:// (TLS is terminated by the ingress); locally we talk plain ws://
+        return match.group(1).replace("wss://", "ws://", 1)
+
+    async def _converse(self, ws: aiohttp.ClientWebSocketResponse, result: CallResult) -> None:
+        loop = asyncio.get_running_loop()
+        stream_sid = "MZ" + uuid.uuid4().hex
+        await ws.send_str(json.dumps({"event": "connected", "protocol": "Call", "version": "1.0.0"}))
+        await ws.send_str(json.dumps({
+            "event": "start",
+            "streamSid": stream_sid,
+            "start": {"streamSid": stream_sid, "callSid": result.call_sid, "tracks": ["inbound"],
+                      "mediaFormat": {"encoding": "audio/x-mulaw", "sampleRate": 8000, "channels": 1}},
+        }))
+
+        state = {"speech": None, "speech_end": None, "first_reply": None, "playing_until": loop.time(), "last_media": 0.0}
+        reply_event = asyncio.Event()
+        greeting_event = asyncio.Event()
+        mark_echoes: List[asyncio.TimerHandle] = []
+
+        def echo_mark(mark: dict) -> None:
+            if ws.closed:
+                return
+            task = asyncio.ensure_future(ws.send_str(json.dumps(mark)))
+            # The call may hang up while the echo is in flight
+            task.add_done_callback(lambda t: t.cancelled() or t.exception())
+
+        async def sender():
+            sequence = 0
+            next_frame = loop.time()
+            while True:
+                speech = state["speech"]
+                if speech:
+                    frame, state["speech"] = speech[:FRAME_BYTES], speech[FRAME_BYTES:]
+                    if not state["speech"]:
+                        state["speech"] = None
+                        state["speech_end"] = loop.time()
+                    frame = frame.ljust(FRAME_BYTES, b"\xff")
+                else:
+                    frame = MULAW_SILENCE_FRAME
+                sequence += 1
+                await ws.send_str(json.dumps({
+                    "event": "media",
+                    "streamSid": stream_sid,
+                    "sequenceNumber": str(sequence),
+                    "media": {"track": "inbound", "payload": base64.b64encode(frame).decode("ascii")},
+                }))
+                next_frame += FRAME_SECONDS
+                await asyncio.sleep(max(0.0, next_frame - loop.time()))
+
+        async def receiver():
+            async for msg in ws:
+                if msg.type != aiohttp.WSMsgType.TEXT:
+                    continue
+                data = json.loads(msg.data)
+                event = data.get("event")
+                now = loop.time()
+                if event == "media":
+                    audio = base64.b64decode(data["media"]["payload"])
+                    state["playing_until"] = max(now, state["playing_until"]) + len(audio) / 8000
+                    state["last_media"] = now
+                    greeting_event.set()
+                    if state["speech_end"] is not None and state["first_reply"] is None and is_reply_audio(audio):
+                        state["first_reply"] = now
+                        reply_event.set()
+                elif event == "mark":
+                    # Twilio echoes a mark once the audio queued before it has been played
+                    delay = max(0.0, state["playing_until"] - now)
+                    mark_echoes.append(loop.call_later(delay, echo_mark, data))
+                elif event == "clear":
+                    state["playing_until"] = now
+
+        async def wait_until_quiet():
+            while True:
+                now = loop.time()
+                quiet_since = max(state["playing_until"], state["last_media"])
+                if now - quiet_since >= self.quiet_gap:
+                    return
+                await asyncio.sleep(0.05)
+
+        sender_task = asyncio.create_task(sender())
+        receiver_task = asyncio.create_task(receiver())
+        try:
+            # Under load the greeting may start well after the WebSocket opens: speaking over it
+            # would be ignored by the pod like a caller talking during the initial message
+            try:
+                await asyncio.wait_for(greeting_event.wait(), self.reply_timeout)
+            except asyncio.TimeoutError:
+                raise RuntimeError(f"no greeting within {self.reply_timeout:.1f}s") from None
+            await asyncio.wait_for(wait_until_quiet(), self.reply_timeout)
+            for turn in range(1, self.turns + 1):
+                reply_event.clear()
+                state.update(speech_end=None, first_reply=None, speech=self.caller_audio)
+                timeout = self.reply_timeout + len(self.caller_audio) / 8000
+                try:
+                    await asyncio.wait_for(reply_event.wait(), timeout)
+                except asyncio.TimeoutError:
+                    # Fillers and silence reprompts may have played, but no LLM or scenario reply
+                    raise RuntimeError(f"turn {turn}: no reply within {timeout:.1f}s") from None
+                result.turn_latencies.append(state["first_reply"] - state["speech_end"])
+                await asyncio.wait_for(wait_until_quiet(), self.reply_timeout)
+        finally:
+            sender_task.cancel()
+            await asyncio.gather(sender_task, return_exceptions=True)
+            for echo in mark_echoes:
+                echo.cancel()
+            # Hang up like Twilio: without "stop" the pod keeps the conversation open until its drain
+            if not ws.closed:
+                try:
+                    await ws.send_str(json.dumps({"event": "stop", "streamSid": stream_sid, "stop": {"callSid": result.call_sid}}))
+                except (aiohttp.ClientError, ConnectionError):
+                    pass
+            receiver_task.cancel()
+            await asyncio.gather(receiver_task, return_exceptions=True)
@@ -0,0 +1,380 @@
+#!/usr/bin/env python3
+"""
+Benchmark - Media path SIP/RTP in loopback
+
+Un finto PBX (registrar con digest auth + chiamante) e lo user agent SIP
+dell'assistente girano nello stesso processo su 127.0.0.1. Ogni chiamata
+invia un tono PCMU con jitter, perdite e riordino simulati; l'assistente
+risponde rimandando indietro l'audio uscito dal jitter buffer (eco, niente
+Vocode né provider esterni).
+
+Misura: tempo di registrazione, INVITE -> 200 OK, ritardo del primo eco e
+statistiche del jitter buffer.
+
+Uso (dalla cartella app/):
+    python benchmarks/sip_loopback.py --calls 20 --seconds 5 --jitter-ms 30 --loss 0.02
+"""
+
+import argparse
+import asyncio
+import os
+import random
+import statistics
+import sys
+import time
+from typing import Dict, List, Optional
+
+import numpy as np
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from audio.g711 import ulaw_encode  # noqa: E402
+from sip.message import (  # noqa: E402
+    SipMessage,
+    build_digest_authorization,
+    make_response,
+    new_branch,
+    new_tag,
+    parse_digest_challenge,
+)
+from sip.rtp import RtpPacket, RtpPortAllocator, RtpSession  # noqa: E402
+from sip.sdp import Codec, build_answer, build_offer, negotiate, parse_sdp  # noqa: E402
+from sip.user_agent import SipDialog, SipUserAgent  # noqa: E402
+
+USERNAME = "assistant"
+PASSWORD = "loopback-secret"
+REALM = "loopback.test"
+FRAME_MS = 20
+FRAME_SAMPLES = 8000 * FRAME_MS // 1000
+
+OFFER_CODECS = [
+    Codec("PCMU", 0, 8000),
+    Codec("PCMA", 8, 8000),
+    Codec("opus", 111, 48000, 2, "minptime=10;useinbandfec=1"),
+    Codec("telephone-event", 101, 8000, 1, "0-16"),
+]
+
+
+def percentile(values: List[float], q: float) -> float:
+    if not values:
+        return float("nan")
+    ordered = sorted(values)
+    return ordered[min(len(ordered) - 1, int(q * len(ordered)))]
+
+
+def tone_frames(seconds: float, frequency: float = 440.0) -> List[bytes]:
+    count = int(seconds * 1000 / FRAME_MS)
+    t = np.arange(count * FRAME_SAMPLES) / 8000
+    mulaw = ulaw_encode((8000 * np.sin(2 * np.pi * frequency * t)).astype(np.int16)).tobytes()
+    return [mulaw[i * FRAME_SAMPLES:(i + 1) * FRAME_SAMPLES] for i in range(count)]
+
+
+class FakePbx(asyncio.DatagramProtocol):
+    """Registrar con sfida digest e lato chiamante delle chiamate di prova"""
+
+    def __init__(self):
+        self.transport: Optional[asyncio.DatagramTransport] = None
+        self.nonce = new_tag()
+        self.contact: Optional[str] = None
+        self.auth_failures = 0
+        self._waiters: Dict[str, asyncio.Queue] = {}
+        self.byes_received = 0
+
+    def connection_made(self, transport):
+        self.transport = transport
+
+    @property
+    def address(self):
+        return self.transport.get_extra_info("sockname")[:2]
+
+    def datagram_received(self, data: bytes, addr):
+        if not data.strip():
+            return
+        message = SipMessage.parse(data)
+        if message.is_request:
+            if message.method == "REGISTER":
+                self._handle_register(message, addr)
+            elif message.method == "BYE":
+                self.byes_received += 1
+                self.transport.sendto(make_response(message, 200, "OK").to_bytes(), addr)
+            return
+        queue = self._waiters.get(message.branch)
+        if queue is not None:
+            queue.put_nowait(message)
+
+    def _handle_register(self, request: SipMessage, addr) -> None:
+        authorization = request.get("Authorization")
+        if authorization is None:
+            challenge = f'Digest realm="{REALM}", nonce="{self.nonce}", algorithm=MD5, qop="auth"'
+            response = make_response(request, 401, "Unauthorized", to_tag=new_tag(), headers=[("WWW-Authenticate", challenge)])
+        else:
+            params = parse_digest_challenge(authorization)
+            expected = parse_digest_challenge(build_digest_authorization(
+                {"realm": REALM, "nonce": self.nonce, "algorithm": "MD5", "qop": "auth"},
+                "REGISTER",
+                params["uri"],
+                USERNAME,
+                PASSWORD,
+                nonce_count=int(params["nc"], 16),
+                cnonce=params["cnonce"],
+            ))
+            if params["response"] != expected["response"]:
+                self.auth_failures += 1
+                response = make_response(request, 403, "Forbidden", to_tag=new_tag())
+            else:
+                self.contact = request.get("Contact")
+                expires = request.get("Expires") or "300"
+                response = make_response(
+                    request, 200, "OK", to_tag=new_tag(), headers=[("Contact", f"{self.contact};expires={expires}")]
+                )
+        self.transport.sendto(response.to_bytes(), addr)
+
+    async def transaction(self, request: SipMessage, addr, timeout: float = 5.0) -> SipMessage:
+        """Invia una richiesta e ritorna la risposta finale"""
+        queue: asyncio.Queue = asyncio.Queue()
+        self._waiters[request.branch] = queue
+        try:
+            self.transport.sendto(request.to_bytes(), addr)
+            loop = asyncio.get_running_loop()
+            deadline = loop.time() + timeout
+            while True:
+                response = await asyncio.wait_for(queue.get(), max(0.0, deadline - loop.time()))
+                if response.status_code >= 200:
+                    return response
+        finally:
+            self._waiters.pop(request.branch, None)
+
+
+class CallerMedia(asyncio.DatagramProtocol):
+    """RTP del chiamante: invia il tono degradato e cronometra l'eco"""
+
+    def __init__(self):
+        self.transport: Optional[asyncio.DatagramTransport] = None
+        self.first_echo: Optional[float] = None
+        self.echo_packets = 0
+
+    def connection_made(self, transport):
+        self.transport = transport
+
+    def datagram_received(self, data: bytes, addr):
+        try:
+            RtpPacket.parse(data)
+        except ValueError:
+            return
+        self.echo_packets += 1
+        if self.first_echo is None:
+            self.first_echo = time.perf_counter()
+
+    async def stream(self, frames: List[bytes], addr, jitter_ms: float, loss: float, reorder: float, rng: random.Random) -> float:
+        """Invia i frame con il ritmo di ptime; ritorna l'istante del primo invio"""
+        loop = asyncio.get_running_loop()
+        ssrc = rng.getrandbits(32)
+        sequence = rng.getrandbits(16)
+        timestamp = rng.getrandbits(32)
+        started = time.perf_counter()
+        start = loop.time()
+        held: Optional[bytes] = None
+        for index, frame in enumerate(frames):
+            packet = RtpPacket(0, (sequence + index) & 0xFFFF, (timestamp + index * FRAME_SAMPLES) & 0xFFFFFFFF, ssrc, frame, index == 0)
+            data = packet.serialize()
+            if rng.random() >= loss:
+                if held is None and rng.random() < reorder:
+                    held = data  # sent after the next packet
+                else:
+                    delay = rng.uniform(0, jitter_ms / 1000)
+                    loop.call_later(delay, self.transport.sendto, data, addr)
+                    if held is not None:
+                        loop.call_later(delay, self.transport.sendto, held, addr)
+                        held = None
+            await asyncio.sleep(max(0.0, start + (index + 1) * FRAME_MS / 1000 - loop.time()))
+        return started
+
+
+class EchoAssistant:
+    """Lato assistente: SipUserAgent + una RtpSession in eco per chiamata"""
+
+    def __init__(self, pbx_address, jitter_min_ms: int, jitter_max_ms: int):
+        self.sessions: Dict[str, RtpSession] = {}
+        self.finished: List[dict] = []
+        self.rtp_ports = RtpPortAllocator(30000, 40000)
+        self.jitter_min_ms = jitter_min_ms
+        self.jitter_max_ms = jitter_max_ms
+        self.user_agent = SipUserAgent(
+            server=pbx_address[0],
+            port=pbx_address[1],
+            username=USERNAME,
+            password=PASSWORD,
+            domain=REALM,
+            local_ip="127.0.0.1",
+            local_port=0,
+            keepalive_interval=0,
+            on_invite=self.on_invite,
+            on_established=self.on_established,
+            on_terminated=self.on_terminated,
+        )
+
+    async def on_invite(self, dialog: SipDialog, sdp_offer: str) -> str:
+        media = negotiate(parse_sdp(sdp_offer), ["PCMU", "PCMA"])
+        session: Optional[RtpSession] = None
+
+        def echo(chunk: bytes) -> None:
+            session.send_audio(chunk)
+
+        session = RtpSession(
+            codec=media.codec,
+            remote_addr=(media.remote_address, media.remote_port),
+            on_audio=echo,
+            telephone_event=media.telephone_event,
+            ptime_ms=media.ptime_ms,
+            jitter_min_delay=self.jitter_min_ms / 1000,
+            jitter_max_delay=self.jitter_max_ms / 1000,
+        )
+        port = await self.rtp_ports.open(session, "127.0.0.1")
+        self.sessions[dialog.call_id] = session
+        return build_answer(media, "127.0.0.1", port)
+
+    async def on_established(self, dialog: SipDialog) -> None:
+        self.sessions[dialog.call_id].start()
+
+    async def on_terminated(self, dialog: SipDialog, reason: str) -> None:
+        session = self.sessions.pop(dialog.call_id, None)
+        if session is not None:
+            buffer = session.jitter_buffer
+            self.finished.append(dict(buffer.stats, jitter=buffer.jitter, target_delay=buffer.target_delay))
+            await session.close()
+
+
+async def run_call(pbx: FakePbx, assistant: EchoAssistant, frames: List[bytes], args, rng: random.Random) -> dict:
+    loop = asyncio.get_running_loop()
+    media = CallerMedia()
+    transport, _ = await loop.create_datagram_endpoint(lambda: media, local_addr=("127.0.0.1", 0))
+    try:
+        ua_addr = assistant.user_agent.contact_addr
+        call_id = f"{new_tag()}@loopback"
+        from_tag = new_tag()
+        pbx_host, pbx_port = pbx.address
+        base_headers = [
+            ("Max-Forwards", "70"),
+            ("From", f"<sip:caller@{REALM}>;tag={from_tag}"),
+            ("To", f"<sip:{USERNAME}@{REALM}>"),
+            ("Call-ID", call_id),
+        ]
+        offer = build_offer("127.0.0.1", transport.get_extra_info("sockname")[1], OFFER_CODECS)
+        invite = SipMessage.request(
+            "INVITE",
+            f"sip:{USERNAME}@{ua_addr[0]}:{ua_addr[1]}",
+            [("Via", f"SIP/2.0/UDP {pbx_host}:{pbx_port};branch={new_branch()}")] + base_headers + [
+                ("CSeq", "1 INVITE"),
+                ("Contact", f"<sip:caller@{pbx_host}:{pbx_port}>"),
+                ("Content-Type", "application/sdp"),
+            ],
+            offer.encode(),
+        )
+        invite_sent = time.perf_counter()
+        ok = await pbx.transaction(invite, ua_addr)
+        invite_time = time.perf_counter() - invite_sent
+        if ok.status_code != 200:
+            return {"error": f"INVITE answered {ok.status_code}"}
+
+        to_value = ok.get("To")
+        answer = parse_sdp(ok.body.decode())
+        ack = SipMessage.request(
+            "ACK",
+            f"sip:{USERNAME}@{ua_addr[0]}:{ua_addr[1]}",
+            [("Via", f"SIP/2.0/UDP {pbx_host}:{pbx_port};branch={new_branch()}")] + base_headers[:1] + [
+                ("From", f"<sip:caller@{REALM}>;tag={from_tag}"),
+                ("To", to_value),
+                ("Call-ID", call_id),
+                ("CSeq", "1 ACK"),
+            ],
+        )
+        pbx.transport.sendto(ack.to_bytes(), ua_addr)
+
+        started = await media.stream(frames, (answer.address, answer.port), args.jitter_ms, args.loss, args.reorder, rng)
+        await asyncio.sleep(args.jitter_max_ms / 1000 + 0.1)  # let the echo drain
+
+        bye = SipMessage.request(
+            "BYE",
+            f"sip:{USERNAME}@{ua_addr[0]}:{ua_addr[1]}",
+            [("Via", f"SIP/2.0/UDP {pbx_host}:{pbx_port};branch={new_branch()}")] + base_headers[:1] + [
+                ("From", f"<sip:caller@{REALM}>;tag={from_tag}"),
+                ("To", to_value),
+                ("Call-ID", call_id),
+                ("CSeq", "2 BYE"),
+            ],
+        )
+        await pbx.transaction(bye, ua_addr)
+        return {
+            "invite_time": invite_time,
+            "codec": answer.codecs[0].name,
+            "first_echo": media.first_echo - started if media.first_echo else None,
+            "echo_packets": media.echo_packets,
+            "sent_frames": len(frames),
+        }
+    finally:
+        transport.close()
+
+
+async def main_async(args) -> None:
+    loop = asyncio.get_running_loop()
+    rng = random.Random(args.seed)
+    pbx = FakePbx()
+    await loop.create_datagram_endpoint(lambda: pbx, local_addr=("127.0.0.1", 0))
+    assistant = EchoAssistant(pbx.address, args.jitter_min_ms, args.jitter_max_ms)
+    await assistant.user_agent.start()
+
+    register_started = time.perf_counter()
+    registered = await assistant.user_agent.register()
+    register_time = time.perf_counter() - register_started
+    print(f"REGISTER (401 challenge + digest): {'ok' if registered else 'FAILED'} in {register_time * 1000:.1f} ms")
+    if not registered:
+        return
+
+    frames = tone_frames(args.seconds)
+    results = await asyncio.gather(*(
+        run_call(pbx, assistant, frames, args, random.Random(rng.random())) for _ in range(args.calls)
+    ))
+    await asyncio.sleep(0.1)
+    await assistant.user_agent.close()
+
+    errors = [r["error"] for r in results if "error" in r]
+    completed = [r for r in results if "error" not in r]
+    print(f"Calls: {len(completed)}/{args.calls} completed, codec {completed[0]['codec'] if completed else '-'}")
+    for error in errors[:5]:
+        print(f"  error: {error}")
+    if not completed:
+        return
+
+    invite_ms = [r["invite_time"] * 1000 for r in completed]
+    echo_ms = [r["first_echo"] * 1000 for r in completed if r["first_echo"] is not None]
+    print(f"INVITE -> 200 OK   p50 {percentile(invite_ms, 0.5):7.1f} ms   p95 {percentile(invite_ms, 0.95):7.1f} ms")
+    print(f"First echo         p50 {percentile(echo_ms, 0.5):7.1f} ms   p95 {percentile(echo_ms, 0.95):7.1f} ms")
+
+    stats = assistant.finished
+    totals = {key: sum(s[key] for s in stats) for key in ("played", "lost", "late", "duplicate", "dropped", "underruns")}
+    sent = sum(r["sent_frames"] for r in completed)
+    echoed = sum(r["echo_packets"] for r in completed)
+    print(f"Jitter buffer: {totals}")
+    print(f"  estimated jitter   mean {statistics.mean(s['jitter'] for s in stats) * 1000:6.1f} ms")
+    print(f"  target delay       mean {statistics.mean(s['target_delay'] for s in stats) * 1000:6.1f} ms")
+    print(f"  concealed          {totals['lost'] / max(1, totals['played'] + totals['lost']):6.2%} of played frames")
+    print(f"Echoed frames: {echoed}/{sent}")
+    print(f"Registrar auth failures: {pbx.auth_failures}, BYEs from assistant: {pbx.byes_received}")
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description="SIP/RTP loopback benchmark")
+    parser.add_argument("--calls", type=int, default=10, help="Concurrent calls")
+    parser.add_argument("--seconds", type=float, default=3.0, help="Audio per call")
+    parser.add_argument("--jitter-ms", type=float, default=30.0, help="Max random network delay per packet")
+    parser.add_argument("--loss", type=float, default=0.01, help="Packet loss probability")
+    parser.add_argument("--reorder", type=float, default=0.02, help="Probability of swapping two packets")
+    parser.add_argument("--jitter-min-ms", type=int, default=20)
+    parser.add_argument("--jitter-max-ms", type=int, default=200)
+    parser.add_argument("--seed", type=int, default=7)
+    args = parser.parse_args()
+    asyncio.run(main_async(args))
+
+
+if __name__ == "__main__":
+    main()
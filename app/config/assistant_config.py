@@ -0,0 +1,641 @@
+"""
+Assistant Config - Caricamento di config/assistant-config.yaml
+
+Il file YAML viene validato e compilato in una CompiledAssistantConfig
+immutabile (orari di apertura come tabella settimanale al minuto, saluti,
+numeri di trasferimento, frasi fisse, profili dei tenant con la tabella
+numero chiamato -> tenant). L'AssistantConfigStore controlla
+periodicamente il file montato dalla ConfigMap e sostituisce la config
+compilata in un solo passo: le nuove chiamate vedono la versione nuova,
+quelle in corso tengono quella con cui sono partite. Un file non valido
+viene scartato e resta attiva la versione precedente.
+"""
+
+import asyncio
+import hashlib
+import logging
+import os
+import re
+import time
+from dataclasses import dataclass, field, replace
+from datetime import datetime, timezone
+from pathlib import Path
+from types import MappingProxyType
+from typing import Any, Callable, Dict, List, Mapping, Optional, Tuple
+from zoneinfo import ZoneInfo, ZoneInfoNotFoundError
+
+import yaml
+from prometheus_client import Counter, Gauge
+
+logger = logging.getLogger(__name__)
+
+CONFIG_RELOADS_TOTAL = Counter(
+    'voice_assistant_config_reloads_total',
+    'Assistant config changes picked up from disk',
+    ['result'],  # applied, invalid
+)
+CONFIG_LOADED_TIMESTAMP = Gauge(
+    'voice_assistant_config_loaded_timestamp_seconds',
+    'Unix time the active assistant config was loaded',
+    multiprocess_mode='livemin',
+)
+
+# Repository layout: <root>/app/config/assistant_config.py -> <root>/config/assistant-config.yaml
+DEFAULT_ASSISTANT_CONFIG_PATH = Path(__file__).resolve().parents[2] / "config" / "assistant-config.yaml"
+
+DEFAULT_TIMEZONE = "Europe/Rome"
+WEEKDAYS = ("monday", "tuesday", "wednesday", "thursday", "friday", "saturday", "sunday")
+MINUTES_PER_DAY = 24 * 60
+_TIME_OF_DAY = re.compile(r"^([01]?\d|2[0-4]):([0-5]\d)$")
+_NUMBER_SEPARATORS = re.compile(r"[\s\-().]")
+DEFAULT_TENANT = "default"
+# libyaml parses a file with hundreds of tenants ~10x faster than the pure Python loader
+_YAML_LOADER = getattr(yaml, "CSafeLoader", yaml.SafeLoader)
+# Fields of services.speculation.SpeculationConfig a tenant may override
+_SPECULATION_OPTIONS = {
+    "enabled": bool,
+    "prefetch_tts": bool,
+    "stable_ms": int,
+    "min_words": int,
+    "max_per_turn": int,
+    "similarity_threshold": float,
+}
+
+
+class AssistantConfigError(ValueError):
+    """Config dell'assistente non valida"""
+
+
+def resolve_assistant_config_path(path: Optional[str] = None) -> Path:
+    """Ritorna il path del file di configurazione dell'assistente"""
+    return Path(path) if path else DEFAULT_ASSISTANT_CONFIG_PATH
+
+
+def read_assistant_config(path: Path) -> Tuple[Dict[str, Any], str]:
+    """
+    Legge il file YAML dell'assistente
+
+    Args:
+        path: Path del file YAML
+
+    Returns:
+        (configurazione, versione) dove la versione è l'hash del contenuto
+
+    Raises:
+        AssistantConfigError: File illeggibile o YAML non valido
+    """
+    try:
+        content = path.read_bytes()
+    except OSError as e:
+        raise AssistantConfigError(f"cannot read {path}: {e}") from e
+    try:
+        data = yaml.load(content, Loader=_YAML_LOADER) or {}
+    except yaml.YAMLError as e:
+        raise AssistantConfigError(f"invalid YAML in {path}: {e}") from e
+    if not isinstance(data, dict):
+        raise AssistantConfigError(f"invalid assistant config {path}: top level must be a mapping")
+    return data, hashlib.sha256(content).hexdigest()[:12]
+
+
+def load_assistant_config(path: Optional[str] = None) -> Dict[str, Any]:
+    """
+    Carica il file YAML di configurazione dell'assistente
+
+    Args:
+        path: Path del file YAML (default: config/assistant-config.yaml del repository)
+
+    Returns:
+        Dict con la configurazione, vuoto se il file non esiste o non è valido
+    """
+    config_path = resolve_assistant_config_path(path)
+    if not config_path.exists():
+        logger.warning(f"Assistant config not found at {config_path}")
+        return {}
+    try:
+        data, _ = read_assistant_config(config_path)
+    except AssistantConfigError as e:
+        logger.error(f"Invalid assistant config: {e}")
+        return {}
+    return data
+
+
+def get_fixed_phrases(config: Mapping[str, Any]) -> List[str]:
+    """
+    Estrae le frasi fisse (saluti, risposte degli scenari, fallback)
+
+    Args:
+        config: Configurazione caricata con load_assistant_config
+
+    Returns:
+        Lista di frasi senza duplicati, nell'ordine in cui compaiono
+    """
+    assistant = config.get("assistant") or {}
+    phrases: List[str] = []
+
+    greeting = assistant.get("greeting") or {}
+    phrases.extend(greeting.values())
+
+    for scenario in config.get("scenarios") or []:
+        phrases.append(scenario.get("response"))
+
+    call_handling = assistant.get("call_handling") or {}
+    phrases.append(call_handling.get("fallback_message"))
+    phrases.append(call_handling.get("silence_message"))
+    phrases.extend(get_filler_phrases(config))
+
+    return list(dict.fromkeys(p.strip() for p in phrases if isinstance(p, str) and p.strip()))
+
+
+def get_filler_phrases(config: Mapping[str, Any]) -> List[str]:
+    """Frasi brevi riprodotte quando la risposta tarda (call_handling.filler_phrases)"""
+    call_handling = (config.get("assistant") or {}).get("call_handling") or {}
+    phrases = call_handling.get("filler_phrases") or []
+    if not isinstance(phrases, (list, tuple)):
+        return []
+    return [p.strip() for p in phrases if isinstance(p, str) and p.strip()]
+
+
+def _freeze(value: Any) -> Any:
+    if isinstance(value, dict):
+        return MappingProxyType({key: _freeze(item) for key, item in value.items()})
+    if isinstance(value, list):
+        return tuple(_freeze(item) for item in value)
+    return value
+
+
+def _minute_of_day(value: Any, where: str, errors: List[str]) -> Optional[int]:
+    match = _TIME_OF_DAY.match(str(value))
+    if match is None or (match.group(1) == "24" and match.group(2) != "00"):
+        errors.append(f"{where}: expected HH:MM, got {value!r}")
+        return None
+    return int(match.group(1)) * 60 + int(match.group(2))
+
+
+@dataclass(frozen=True)
+class BusinessHours:
+    """Orari di apertura come tabella della settimana, un byte per minuto"""
+
+    open_minutes: bytes  # Monday 00:00 first, 1 = open
+    timezone: ZoneInfo
+
+    @classmethod
+    def compile(cls, hours: Mapping[str, Any], tz_name: str, errors: List[str]) -> Optional["BusinessHours"]:
+        try:
+            tz = ZoneInfo(tz_name)
+        except (ZoneInfoNotFoundError, ValueError):
+            errors.append(f"assistant.timezone: unknown time zone {tz_name!r}")
+            return None
+        table = bytearray(7 * MINUTES_PER_DAY)
+        for day, spec in hours.items():
+            if day not in WEEKDAYS:
+                errors.append(f"business_hours.{day}: unknown day (expected {', '.join(WEEKDAYS)})")
+                continue
+            if not isinstance(spec, Mapping):
+                errors.append(f"business_hours.{day}: expected start/end or closed")
+                continue
+            if spec.get("closed"):
+                continue
+            start = _minute_of_day(spec.get("start"), f"business_hours.{day}.start", errors)
+            end = _minute_of_day(spec.get("end"), f"business_hours.{day}.end", errors)
+            if start is None or end is None:
+                continue
+            if start >= end:
+                errors.append(f"business_hours.{day}: start must be before end")
+                continue
+            offset = WEEKDAYS.index(day) * MINUTES_PER_DAY
+            table[offset + start:offset + end] = b"\x01" * (end - start)
+        return cls(open_minutes=bytes(table), timezone=tz)
+
+    def is_open(self, when: Optional[datetime] = None) -> bool:
+        local = (when or datetime.now(timezone.utc)).astimezone(self.timezone)
+        return self.open_minutes[local.weekday() * MINUTES_PER_DAY + local.hour * 60 + local.minute] == 1
+
+
+@dataclass(frozen=True)
+class TenantProfile:
+    """
+    Profilo di un'azienda servita dal deployment, scelto dal numero chiamato
+
+    Prompt, saluti, orari, scenari e parametri della speculazione non indicati
+    nel profilo sono quelli della sezione assistant; voce, modello e lingua a
+    None restano quelli dei Settings.
+    """
+
+    name: str
+    numbers: Tuple[str, ...]  # Normalized with normalize_number
+    system_prompt: Optional[str]
+    greetings: Mapping[str, str]
+    business_hours: Optional[BusinessHours]
+    scenarios: Tuple[Mapping[str, Any], ...]
+    fixed_phrases: Tuple[str, ...]
+    voice_id: Optional[str] = None
+    model: Optional[str] = None
+    language: Optional[str] = None
+    # Overrides of the LLM_SPECULATION_* settings
+    speculation: Mapping[str, Any] = field(default_factory=lambda: MappingProxyType({}))
+
+    def greeting(self, when: Optional[datetime] = None) -> Optional[str]:
+        """Saluto iniziale per l'ora della chiamata (orari di apertura o chiusura)"""
+        if self.business_hours is not None:
+            key = "business_hours" if self.business_hours.is_open(when) else "after_hours"
+            if self.greetings.get(key):
+                return self.greetings[key]
+        return self.greetings.get("default")
+
+    def is_open(self, when: Optional[datetime] = None) -> bool:
+        return self.business_hours is None or self.business_hours.is_open(when)
+
+
+@dataclass(frozen=True)
+class CompiledAssistantConfig:
+    """Config dell'assistente validata, immutabile e pronta per le chiamate"""
+
+    raw: Mapping[str, Any]  # Read-only view of the YAML for the from_assistant_config helpers
+    version: str
+    loaded_at: float
+    default_tenant: TenantProfile  # The assistant section: numbers without a tenant of their own
+    tenants: Mapping[str, TenantProfile]  # By name, default tenant included
+    routes: Mapping[str, str]  # Normalized called number -> tenant name
+    transfer_numbers: Mapping[str, str]
+    fixed_phrases: Tuple[str, ...]  # Default tenant only: each tenant has its own
+
+    @property
+    def system_prompt(self) -> Optional[str]:
+        return self.default_tenant.system_prompt
+
+    @property
+    def greetings(self) -> Mapping[str, str]:
+        return self.default_tenant.greetings
+
+    @property
+    def business_hours(self) -> Optional[BusinessHours]:
+        return self.default_tenant.business_hours
+
+    def greeting(self, when: Optional[datetime] = None) -> Optional[str]:
+        """Saluto iniziale del tenant di default per l'ora della chiamata"""
+        return self.default_tenant.greeting(when)
+
+    def is_open(self, when: Optional[datetime] = None) -> bool:
+        return self.default_tenant.is_open(when)
+
+    def tenant_for(self, number: Optional[str]) -> TenantProfile:
+        """
+        Tenant del numero chiamato
+
+        Args:
+            number: To di Twilio o to_uri SIP, in qualsiasi forma accettata da normalize_number
+
+        Returns:
+            Il tenant del numero, o quello di default se il numero non è assegnato
+        """
+        name = self.routes.get(normalize_number(number))
+        return self.tenants[name] if name is not None else self.default_tenant
+
+
+def normalize_number(value: Optional[str]) -> str:
+    """
+    Forma confrontabile di un numero chiamato
+
+    "Ufficio <sip:+39 02-1234@pbx.example.com;user=phone>" -> "+39021234",
+    "0039021234" -> "+39021234"; le extension SIP restano come sono ("100").
+    """
+    if not value:
+        return ""
+    value = str(value).strip()
+    if "<" in value and ">" in value:
+        value = value[value.index("<") + 1:value.index(">")]
+    scheme, separator, rest = value.partition(":")
+    if separator and scheme.lower() in ("sip", "sips", "tel"):
+        value = rest
+    value = _NUMBER_SEPARATORS.sub("", value.split("@", 1)[0].split(";", 1)[0])
+    if value.startswith("00"):
+        value = "+" + value[2:]
+    return value.lower()
+
+
+def _validate_scenarios(scenarios: Any, where: str, errors: List[str]) -> List[Dict[str, Any]]:
+    if not isinstance(scenarios, list):
+        errors.append(f"{where}: expected a list")
+        return []
+    for index, scenario in enumerate(scenarios):
+        if not isinstance(scenario, dict) or not scenario.get("name") or not isinstance(scenario.get("response"), str):
+            errors.append(f"{where}[{index}]: name and response are required")
+        elif not isinstance(scenario.get("trigger_keywords") or [], list):
+            errors.append(f"{where}[{index}].trigger_keywords: expected a list")
+    return scenarios
+
+
+def _validate_speculation(section: Any, where: str, errors: List[str]) -> Dict[str, Any]:
+    if not isinstance(section, dict):
+        errors.append(f"{where}: expected a mapping")
+        return {}
+    options: Dict[str, Any] = {}
+    for key, value in section.items():
+        kind = _SPECULATION_OPTIONS.get(key)
+        if kind is None:
+            errors.append(f"{where}.{key}: unknown option (expected one of {', '.join(_SPECULATION_OPTIONS)})")
+        elif kind is bool and not isinstance(value, bool):
+            errors.append(f"{where}.{key}: expected true or false")
+        elif kind is int and (isinstance(value, bool) or not isinstance(value, int) or value < 0):
+            errors.append(f"{where}.{key}: expected a non-negative integer")
+        elif kind is float and (isinstance(value, bool) or not isinstance(value, (int, float)) or not 0 <= value <= 1):
+            errors.append(f"{where}.{key}: expected a number between 0 and 1")
+        else:
+            options[key] = kind(value)
+    return options
+
+
+def _compile_profile(
+    name: str,
+    section: Dict[str, Any],
+    where: str,
+    scenarios: List[Dict[str, Any]],
+    timezone_name: str,
+    call_handling: Mapping[str, Any],
+    errors: List[str],
+    inherit: Optional[TenantProfile] = None,
+) -> TenantProfile:
+    system_prompt = section.get("system_prompt")
+    if system_prompt is not None and not isinstance(system_prompt, str):
+        errors.append(f"{where}.system_prompt: expected a string")
+        system_prompt = None
+
+    greetings = section.get("greeting")
+    if greetings is None and inherit is not None:
+        greetings = dict(inherit.greetings)
+    greetings = greetings or {}
+    if not isinstance(greetings, dict) or not all(isinstance(v, str) for v in greetings.values()):
+        errors.append(f"{where}.greeting: expected a mapping of strings")
+        greetings = {}
+    greetings = {k: v.strip() for k, v in greetings.items() if v.strip()}
+
+    business_hours = inherit.business_hours if inherit is not None else None
+    hours = section.get("business_hours")
+    if hours:
+        if isinstance(hours, dict):
+            business_hours = BusinessHours.compile(hours, timezone_name, errors)
+        else:
+            errors.append(f"{where}.business_hours: expected a mapping of days")
+
+    options: Dict[str, Optional[str]] = {}
+    for key in ("voice_id", "model", "language"):
+        value = section.get(key)
+        if value is not None and (not isinstance(value, str) or not value.strip()):
+            errors.append(f"{where}.{key}: expected a non-empty string")
+            value = None
+        options[key] = value.strip() if value else None
+
+    speculation = dict(inherit.speculation) if inherit is not None else {}
+    if section.get("speculation") is not None:
+        speculation.update(_validate_speculation(section["speculation"], f"{where}.speculation", errors))
+
+    frozen_scenarios = _freeze(list(scenarios))
+    phrases = get_fixed_phrases({
+        "assistant": {"greeting": greetings, "call_handling": call_handling},
+        "scenarios": frozen_scenarios,
+    })
+    if system_prompt:
+        system_prompt = system_prompt.strip()
+    elif inherit is not None:
+        system_prompt = inherit.system_prompt
+    return TenantProfile(
+        name=name,
+        numbers=(),
+        system_prompt=system_prompt or None,
+        greetings=MappingProxyType(greetings),
+        business_hours=business_hours,
+        scenarios=frozen_scenarios,
+        fixed_phrases=tuple(phrases),
+        speculation=MappingProxyType(speculation),
+        **options,
+    )
+
+
+def _compile_tenants(
+    entries: Any,
+    default: TenantProfile,
+    timezone_name: str,
+    call_handling: Mapping[str, Any],
+    errors: List[str],
+) -> Tuple[Dict[str, TenantProfile], Dict[str, str]]:
+    tenants: Dict[str, TenantProfile] = {default.name: default}
+    routes: Dict[str, str] = {}
+    if not isinstance(entries, list):
+        errors.append("tenants: expected a list")
+        return tenants, routes
+    for index, entry in enumerate(entries):
+        where = f"tenants[{index}]"
+        if not isinstance(entry, dict) or not isinstance(entry.get("name"), str) or not entry["name"].strip():
+            errors.append(f"{where}: name is required")
+            continue
+        name = entry["name"].strip()
+        if name in tenants:
+            errors.append(f"{where}: duplicate tenant name {name!r}")
+            continue
+        numbers = entry.get("numbers")
+        if not isinstance(numbers, list) or not numbers:
+            errors.append(f"{where}.numbers: expected a non-empty list")
+            continue
+        normalized: List[str] = []
+        for number in numbers:
+            key = normalize_number(number) if isinstance(number, (str, int)) else ""
+            if not key:
+                errors.append(f"{where}.numbers: invalid number {number!r}")
+            elif key in routes:
+                errors.append(f"{where}.numbers: {number!r} already belongs to tenant {routes[key]!r}")
+            else:
+                routes[key] = name
+                normalized.append(key)
+        if "scenarios" in entry:
+            scenarios = _validate_scenarios(entry["scenarios"] or [], f"{where}.scenarios", errors)
+        else:
+            scenarios = [dict(s) for s in default.scenarios]
+        profile = _compile_profile(
+            name,
+            entry,
+            where,
+            scenarios,
+            entry.get("timezone") or timezone_name,
+            call_handling,
+            errors,
+            inherit=default,
+        )
+        tenants[name] = replace(profile, numbers=tuple(normalized))
+    return tenants, routes
+
+
+def compile_assistant_config(data: Dict[str, Any], version: str = "empty") -> CompiledAssistantConfig:
+    """
+    Valida e compila la configurazione dell'assistente
+
+    Args:
+        data: Configurazione letta dal YAML
+        version: Versione (hash del file)
+
+    Returns:
+        CompiledAssistantConfig
+
+    Raises:
+        AssistantConfigError: Con l'elenco di tutti i campi non validi
+    """
+    errors: List[str] = []
+    assistant = data.get("assistant") or {}
+    if not isinstance(assistant, dict):
+        raise AssistantConfigError("assistant: expected a mapping")
+
+    call_handling = assistant.get("call_handling") or {}
+    for key in ("silence_timeout", "max_duration"):
+        value = call_handling.get(key)
+        if value is not None and (not isinstance(value, (int, float)) or value <= 0):
+            errors.append(f"assistant.call_handling.{key}: expected a positive number")
+    max_prompts = call_handling.get("max_silence_prompts")
+    if max_prompts is not None and (not isinstance(max_prompts, int) or max_prompts < 0):
+        errors.append("assistant.call_handling.max_silence_prompts: expected a non-negative integer")
+    filler_phrases = call_handling.get("filler_phrases")
+    if filler_phrases is not None and (
+        not isinstance(filler_phrases, list) or not all(isinstance(p, str) for p in filler_phrases)
+    ):
+        errors.append("assistant.call_handling.filler_phrases: expected a list of strings")
+    transfer_numbers = ((call_handling.get("transfer_options") or {}).get("phone_numbers")) or {}
+    if not isinstance(transfer_numbers, dict) or not all(isinstance(v, str) for v in transfer_numbers.values()):
+        errors.append("assistant.call_handling.transfer_options.phone_numbers: expected a mapping of strings")
+        transfer_numbers = {}
+
+    timezone_name = assistant.get("timezone") or DEFAULT_TIMEZONE
+    scenarios = _validate_scenarios(data.get("scenarios") or [], "scenarios", errors)
+    # Voice, model and language of the default tenant stay those of the Settings
+    default_section = {k: v for k, v in assistant.items() if k not in ("voice_id", "model", "language")}
+    default_tenant = _compile_profile(
+        DEFAULT_TENANT, default_section, "assistant", scenarios, timezone_name, call_handling, errors
+    )
+    tenants, routes = _compile_tenants(data.get("tenants") or [], default_tenant, timezone_name, call_handling, errors)
+
+    for pattern in (data.get("response_cache") or {}).get("exclude_patterns") or []:
+        try:
+            re.compile(pattern)
+        except (re.error, TypeError) as e:
+            errors.append(f"response_cache.exclude_patterns: {pattern!r}: {e}")
+
+    if errors:
+        raise AssistantConfigError("; ".join(errors))
+
+    frozen = _freeze(data)
+    return CompiledAssistantConfig(
+        raw=frozen,
+        version=version,
+        loaded_at=time.time(),
+        default_tenant=default_tenant,
+        tenants=MappingProxyType(tenants),
+        routes=MappingProxyType(routes),
+        transfer_numbers=MappingProxyType(dict(transfer_numbers)),
+        fixed_phrases=tuple(get_fixed_phrases(frozen)),
+    )
+
+
+class AssistantConfigStore:
+    """
+    Config compilata corrente, ricaricata quando il file cambia
+
+    Args:
+        path: Path del file YAML (default: config/assistant-config.yaml del repository)
+        reload_interval: Secondi tra due controlli del file (0 = nessun ricaricamento)
+    """
+
+    def __init__(self, path: Optional[str] = None, reload_interval: float = 10.0):
+        self.path = resolve_assistant_config_path(path)
+        self.reload_interval = reload_interval
+        self.current = compile_assistant_config({})
+        self._listeners: List[Callable[[CompiledAssistantConfig], None]] = []
+        self._file_id: Optional[Tuple[int, int, int]] = None
+        self._task: Optional[asyncio.Task] = None
+
+    def load(self) -> CompiledAssistantConfig:
+        """Caricamento iniziale: senza file o con un file non valido resta la config vuota"""
+        compiled = self._read_if_changed()
+        if compiled is not None:
+            self._swap(compiled)
+        return self.current
+
+    def subscribe(self, listener: Callable[[CompiledAssistantConfig], None]) -> None:
+        """Registra una funzione chiamata (sul loop, subito dopo lo swap) a ogni nuova versione"""
+        self._listeners.append(listener)
+
+    async def reload(self) -> bool:
+        """
+        Ricarica il file se è cambiato
+
+        Returns:
+            True se una nuova versione è diventata attiva
+        """
+        # Reading and compiling stay off the event loop; only the swap runs on it
+        compiled = await asyncio.to_thread(self._read_if_changed)
+        if compiled is None:
+            return False
+        self._swap(compiled)
+        return True
+
+    async def start(self) -> None:
+        if self.reload_interval > 0 and self._task is None:
+            self._task = asyncio.create_task(self._watch())
+
+    async def stop(self) -> None:
+        if self._task is not None:
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+            self._task = None
+
+    def status(self) -> Dict[str, Any]:
+        return {
+            "path": str(self.path),
+            "version": self.current.version,
+            "loaded_at": self.current.loaded_at,
+            "tenants": len(self.current.tenants),
+            "routed_numbers": len(self.current.routes),
+        }
+
+    async def _watch(self) -> None:
+        while True:
+            await asyncio.sleep(self.reload_interval)
+            try:
+                await self.reload()
+            except Exception as e:
+                logger.error(f"Assistant config reload failed: {e}", exc_info=True)
+
+    def _read_if_changed(self) -> Optional[CompiledAssistantConfig]:
+        try:
+            # ConfigMap volumes swap a symlink: the resolved file gets a new inode
+            stat = os.stat(self.path)
+        except OSError:
+            if self._file_id is None:
+                logger.warning(f"Assistant config not found at {self.path}")
+            self._file_id = (0, 0, 0)
+            return None
+        file_id = (stat.st_ino, stat.st_mtime_ns, stat.st_size)
+        if file_id == self._file_id:
+            return None
+        self._file_id = file_id
+        try:
+            data, version = read_assistant_config(self.path)
+            if version == self.current.version:
+                return None
+            return compile_assistant_config(data, version)
+        except AssistantConfigError as e:
+            # Retried only when the file changes again
+            CONFIG_RELOADS_TOTAL.labels(result="invalid").inc()
+            logger.error(f"Invalid assistant config, keeping version {self.current.version}: {e}")
+            return None
+
+    def _swap(self, compiled: CompiledAssistantConfig) -> None:
+        previous = self.current.version
+        self.current = compiled
+        for listener in self._listeners:
+            try:
+                listener(compiled)
+            except Exception as e:
+                logger.error(f"Assistant config listener failed for version {compiled.version}: {e}", exc_info=True)
+        CONFIG_RELOADS_TOTAL.labels(result="applied").inc()
+        CONFIG_LOADED_TIMESTAMP.set(compiled.loaded_at)
+        logger.info(f"Assistant config version {compiled.version} active (was {previous})")
@@ -16,6 +16,8 @@ class Settings(BaseSettings):
     # Server configuration
     base_url: str
     port: int = 8080
+    workers: int = 1  # Processes per pod (one per core); above 1 `python main.py` starts a supervisor
+    worker_state_dir: Optional[str] = None  # Prometheus multiprocess files and per-worker call tables (default: a temp dir)
     
     # Telephony provider selection
     telephony_provider: str = "twilio"  # Options: "twilio" or "sip"
@@ -24,6 +26,9 @@ class Settings(BaseSettings):
     twilio_account_sid: Optional[str] = None
     twilio_auth_token: Optional[str] = None
     twilio_phone_number: Optional[str] = None
+    twilio_auth_token_secondary: Optional[str] = None  # Previous/next auth token, accepted during a rotation
+    twilio_validate_signature: bool = True  # Reject webhooks without a valid X-Twilio-Signature
+    twilio_status_dedup_ttl: int = 3600  # Seconds a status callback is remembered to drop Twilio's retries
     
     # SIP configuration (when telephony_provider="sip")
     sip_server: Optional[str] = None  # SIP server address (e.g., sip.provider.com)
@@ -35,17 +40,29 @@ class Settings(BaseSettings):
     sip_transport: str = "udp"  # Options: "udp", "tcp", "tls"
     sip_stun_server: Optional[str] = None  # STUN server for NAT traversal
     sip_turn_server: Optional[str] = None  # TURN server for media relay
+    sip_local_ip: Optional[str] = None  # IP advertised in Contact/SDP (default: interface towards the SIP server)
+    sip_local_port: int = 5060
+    sip_rtp_port_min: int = 10000
+    sip_rtp_port_max: int = 20000
+    sip_register_expires: int = 300  # Seconds, refreshed at 80%
+    sip_codecs: str = "PCMU,PCMA,opus"  # Accepted codecs, the caller's order of preference wins
+    sip_jitter_min_ms: int = 20  # Adaptive jitter buffer bounds
+    sip_jitter_max_ms: int = 200
     
     # OpenAI configuration
     openai_api_key: str
     openai_model: str = "gpt-4"
     
+    openai_base_url: Optional[str] = None  # Override for proxies / local load tests
+    
     # Deepgram configuration (Speech-to-Text)
     deepgram_api_key: str
+    deepgram_ws_url: Optional[str] = None  # Override, default wss://api.deepgram.com
     
     # ElevenLabs configuration (Text-to-Speech)
     elevenlabs_api_key: str
     elevenlabs_voice_id: str = "21m00Tcm4TlvDq8ikWAM"  # Default: Rachel voice
+    elevenlabs_base_url: Optional[str] = None  # Override, default https://api.elevenlabs.io/v1/
     
     # Vocode configuration (optional)
     vocode_api_key: Optional[str] = None
@@ -53,6 +70,8 @@ class Settings(BaseSettings):
     # Redis configuration (optional but recommended)
     redis_url: Optional[str] = None
     redis_password: Optional[str] = None
+    call_registry_ttl_seconds: int = 4 * 3600  # Calls never closed (lost callback, dead pod) expire after this
+    call_registry_local_cache_ttl: float = 1.0  # Seconds a locally cached call state is served without Redis
     
     # PostgreSQL configuration (optional)
     postgres_host: Optional[str] = None
@@ -60,6 +79,19 @@ class Settings(BaseSettings):
     postgres_db: Optional[str] = None
     postgres_user: Optional[str] = None
     postgres_password: Optional[str] = None
+    db_batch_size: int = 500  # Rows per COPY
+    db_flush_interval: float = 1.0  # Seconds a record may wait before being written
+    db_queue_max: int = 10000  # Records kept in memory while the database is slow or down
+    db_pool_size: int = 2
+    
+    # Call recording (enabled by assistant.logging.record_calls in the assistant config)
+    recording_dir: str = "/tmp/voice-assistant/recordings"  # One folder per UTC day, one per call
+    recording_codec: str = "opus"  # opus (Ogg Opus, needs aiortc, else mu-law WAV) or pcmu
+    recording_segment_seconds: float = 30.0  # Audio per segment file
+    recording_batch_ms: int = 500  # Audio collected per track before it is handed to a writer thread
+    recording_queue_batches: int = 200  # Batches waiting per writer thread; more are dropped, never the call audio
+    recording_fsync_interval: float = 5.0  # Seconds between fsyncs of the open segments
+    recording_writer_threads: int = 2
     
     # Assistant behavior
     initial_message: str = "Ciao! Sono il tuo assistente vocale. Come posso aiutarti?"
@@ -67,10 +99,106 @@ class Settings(BaseSettings):
 Rispondi in modo conciso e naturale. 
 Se non sai rispondere a qualcosa, sii onesto e chiedi se puoi aiutare in altro modo.
 Mantieni sempre un tono amichevole ma professionale."""
+    assistant_config_path: Optional[str] = None  # Default: config/assistant-config.yaml
+    assistant_config_reload_interval: float = 10.0  # Seconds between checks of the file, 0 disables reloads
+    tenant_pipeline_cache_size: int = 32  # Tenants whose compiled pipeline stays in memory (LRU)
+    
+    # Scenario fast-path (canned responses without an LLM round-trip)
+    scenario_fast_path_enabled: bool = True
+    scenario_min_confidence: float = 0.75
+    
+    # TTS phrase cache (greetings, scenario responses, fallback)
+    tts_cache_enabled: bool = True
+    tts_cache_dir: Optional[str] = "/tmp/voice-assistant/tts-cache"  # None disables the disk tier
+    tts_cache_max_memory_mb: int = 64
+    tts_cache_warmup_timeout: float = 30.0  # Seconds, startup is never blocked longer than this
+    
+    # LLM -> TTS streaming at sentence/clause boundaries
+    llm_clause_streaming_enabled: bool = True
+    llm_first_chunk_min_words: int = 4  # First chunk may close at a comma after this many words
+    llm_clause_split_chars: int = 80  # Later chunks close at a comma only once this long
+    llm_chunk_max_chars: int = 200  # Split at a space when no boundary shows up
+    tts_context_stitching: bool = True  # Send previous_text to ElevenLabs for continuous prosody
+    
+    # LLM response cache for repeated questions (exclusion rules in the assistant config)
+    llm_response_cache_enabled: bool = True
+    llm_response_cache_ttl: float = 3600.0
+    llm_response_cache_max_entries: int = 1000
+    llm_response_cache_redis: bool = True  # Share cached responses across replicas when Redis is configured
+    
+    # Token-budgeted conversation history (older turns folded into a background summary)
+    llm_history_enabled: bool = True
+    llm_history_keep_turns: int = 6  # Caller turns always sent verbatim
+    llm_history_max_tokens: int = 1500  # History budget per turn, system prompt excluded
+    llm_history_summary_trigger_tokens: int = 400  # Older turns are summarized past this size
+    llm_summary_model: str = "gpt-4o-mini"
+    llm_summary_max_tokens: int = 200
+    
+    # Hedged LLM requests: a second request when the first token is late, per-backend circuit breakers
+    llm_hedging_enabled: bool = False
+    llm_hedge_backends: str = "openai"  # Hedge targets in order of preference: openai (same provider), anthropic
+    llm_hedge_openai_model: Optional[str] = None  # Model of the OpenAI hedge (default: the call's model)
+    llm_hedge_percentile: float = 0.9  # Primary's recent first-token percentile used as the hedge deadline
+    llm_hedge_min_delay: float = 0.3
+    llm_hedge_max_delay: float = 1.5  # Also the deadline until enough first-token samples are collected
+    llm_breaker_failures: int = 3  # Consecutive errors before a backend is taken out
+    llm_breaker_cooldown: float = 30.0  # Seconds before a single probe request is let through
+    anthropic_api_key: Optional[str] = None
+    anthropic_model: str = "claude-3-5-haiku-latest"
+    anthropic_base_url: Optional[str] = None  # Override for proxies / local load tests
+    
+    # Speculative LLM responses on stable interim transcripts (per-tenant overrides in the assistant config)
+    llm_speculation_enabled: bool = False
+    llm_speculation_stable_ms: int = 250  # Interim unchanged this long starts a speculative response
+    llm_speculation_min_words: int = 3
+    llm_speculation_similarity: float = 0.85  # Word-level similarity interim/final needed to use the response
+    llm_speculation_prefetch_tts: bool = True  # Synthesize the first chunk before the final transcript
+    llm_speculation_max_per_turn: int = 2
+    
+    # Filler clips when a reply is late (phrases in call_handling.filler_phrases, needs latency metrics)
+    filler_enabled: bool = True
+    filler_first_ms: int = 800  # From the end of caller speech to the first clip
+    filler_repeat_ms: int = 2500  # Silence after a clip before the next one
+    filler_max_per_turn: int = 2
+    
+    # Local VAD on inbound audio (barge-in, end of turn, silence_timeout from the assistant config)
+    local_vad_enabled: bool = True
+    vad_mode: int = 2  # 0 (permissive) - 3 (aggressive), WebRTC-style
+    vad_end_of_speech_ms: int = 500
+    barge_in_enabled: bool = True
+    barge_in_min_speech_ms: int = 400  # Caller speech needed to cut the assistant off
+    local_endpointing_enabled: bool = True  # Commit the turn on local end of speech
+    
+    # Provider connections opened at startup and kept warm (reported by /ready)
+    provider_pool_enabled: bool = True
+    provider_keepalive_interval: float = 20.0  # Seconds between OpenAI/ElevenLabs keepalive probes
+    stt_pool_size: int = 2  # Pre-opened Deepgram sockets handed to new calls (0 = off)
+    provider_pool_warmup_timeout: float = 10.0
+    
+    # Admission control: per-pod call limit with a short wait queue
+    max_live_calls: int = 50  # 0 = unlimited
+    admission_queue_size: int = 5
+    admission_queue_timeout: float = 3.0  # Seconds a call may wait for a free slot
+    admission_reservation_ttl: float = 15.0  # Seconds for the Twilio media stream to reach the pod
+    overflow_redirect_url: Optional[str] = None  # TwiML <Redirect> target for overflow calls
+    overflow_message: str = "Al momento tutte le linee sono occupate. Ti preghiamo di richiamare tra qualche minuto."
+    
+    # Graceful drain on SIGTERM or POST /admin/drain
+    drain_timeout: float = 25.0  # Seconds to wait for running calls, keep below terminationGracePeriodSeconds
+    admin_token: Optional[str] = None  # Bearer token of the /admin endpoints (unset = endpoints disabled)
     
     # Logging
     log_level: str = "INFO"
     
+    # Per-turn latency breakdown (STT, LLM, TTS, audio send)
+    latency_metrics_enabled: bool = True
+    event_loop_monitor_interval: float = 0.1  # Seconds between event loop lag probes
+    
+    # Event loop stalls and per-call resources (GET /debug/profile needs ADMIN_TOKEN)
+    event_loop_stall_threshold: float = 0.1  # Blocked loop longer than this logs the stack that blocked it (0 = off)
+    call_profiling_enabled: bool = True  # Loop CPU time, audio bytes and asyncio tasks per call
+    debug_profile_max_seconds: float = 30.0  # Longest sampling profile /debug/profile may run
+    
     model_config = SettingsConfigDict(
         env_file=".env",
         env_file_encoding="utf-8",
@@ -6,14 +6,20 @@ import logging
 from typing import Dict, Any, Optional
 from datetime import datetime
 
+from services.call_registry import CallRegistry
+from services.call_store import CallStore
+
 logger = logging.getLogger(__name__)
 
 
 class CallHandler:
     """Gestisce la logica delle chiamate telefoniche"""
     
-    def __init__(self):
-        self.active_calls: Dict[str, Dict[str, Any]] = {}
+    def __init__(self, registry: Optional[CallRegistry] = None, call_store: Optional[CallStore] = None):
+        # Shared across replicas when backed by Redis, in-process otherwise
+        self.registry = registry or CallRegistry(namespace="twilio")
+        # Completed calls are queued for the PostgreSQL writer (never awaited)
+        self.call_store = call_store
     
     async def start_call(self, call_sid: str, from_number: str, to_number: str) -> Dict[str, Any]:
         """
@@ -35,7 +41,7 @@ class CallHandler:
             "status": "active",
         }
         
-        self.active_calls[call_sid] = call_info
+        await self.registry.put(call_sid, call_info)
         logger.info(f"Started call {call_sid} from {from_number}")
         
         return call_info
@@ -51,8 +57,8 @@ class CallHandler:
         Returns:
             Dict con informazioni della chiamata completata
         """
-        if call_sid in self.active_calls:
-            call_info = self.active_calls[call_sid]
+        call_info = await self.registry.remove(call_sid)
+        if call_info is not None:
             call_info["end_time"] = datetime.utcnow()
             call_info["status"] = status
             
@@ -61,9 +67,8 @@ class CallHandler:
             call_info["duration"] = duration
             
             logger.info(f"Ended call {call_sid} with status {status}, duration: {duration}s")
-            
-            # Remove from active calls
-            del self.active_calls[call_sid]
+            if self.call_store is not None:
+                self.call_store.record_call(call_info, provider="twilio")
             
             return call_info
         
@@ -79,12 +84,12 @@ class CallHandler:
         Returns:
             Dict con informazioni della chiamata o None
         """
-        return self.active_calls.get(call_sid)
+        return await self.registry.get(call_sid)
     
-    def get_active_calls_count(self) -> int:
-        """Ritorna il numero di chiamate attive"""
-        return len(self.active_calls)
-
+    async def get_active_calls_count(self) -> int:
+        """
+        Ritorna il numero di chiamate attive (su tutte le repliche se Redis è configurato)
 
-# Singleton instance
-call_handler = CallHandler()
+        Coroutine: il conteggio può richiedere un round-trip a Redis.
+        """
+        return await self.registry.count()
@@ -1,26 +1,45 @@
 """
-SIP Handler - Gestione chiamate SIP con WebRTC
+SIP Handler - Gestione chiamate SIP con media RTP diretto
 Supporta chiamate VoIP tramite account SIP standard
+
+Il pod si registra presso il server SIP (sip/user_agent.py), negozia
+PCMU/PCMA/Opus dall'offerta SDP (sip/sdp.py) e scambia l'audio via RTP
+(sip/rtp.py) direttamente con la pipeline Vocode, senza il media hop di Twilio.
 """
 
 import logging
 import asyncio
-from typing import Dict, Any, Optional
+from dataclasses import dataclass
+from typing import Dict, Any, Optional, Sequence, Set
 from datetime import datetime
-import uuid
 
-import vocode
-from vocode.streaming.models.agent import ChatGPTAgentConfig
-from vocode.streaming.models.message import BaseMessage
-from vocode.streaming.models.synthesizer import ElevenLabsSynthesizerConfig
-from vocode.streaming.models.transcriber import DeepgramTranscriberConfig
+from monitoring.profiling import enter_call
+from services.admission import AdmissionController
+from services.call_registry import CallRegistry
+from services.call_store import CallStore
+from services.drain import DrainController
+from sip.conversation import SipPhoneConversation, SipPipelineConfig
+from sip.rtp import RtpPortAllocator, RtpSession, opus_available
+from sip.sdp import build_answer, negotiate, parse_sdp
+from sip.user_agent import SipDialog, SipUserAgent
 
 logger = logging.getLogger(__name__)
 
 
+@dataclass
+class SipCall:
+    """Stato locale (media) di una chiamata SIP servita da questo pod"""
+
+    call_id: str
+    rtp_session: RtpSession
+    conversation: Optional[SipPhoneConversation] = None
+    started: bool = False
+    watcher: Optional[asyncio.Task] = None
+
+
 class SIPHandler:
-    """Gestisce le chiamate SIP con WebRTC"""
-    
+    """Gestisce le chiamate SIP con media RTP"""
+
     def __init__(
         self,
         sip_server: str,
@@ -31,6 +50,20 @@ class SIPHandler:
         sip_transport: str = "udp",
         stun_server: Optional[str] = None,
         turn_server: Optional[str] = None,
+        registry: Optional[CallRegistry] = None,
+        pipeline: Optional[SipPipelineConfig] = None,
+        local_ip: Optional[str] = None,
+        local_port: int = 5060,
+        rtp_port_min: int = 10000,
+        rtp_port_max: int = 20000,
+        register_expires: int = 300,
+        codecs: Sequence[str] = ("PCMU", "PCMA", "opus"),
+        jitter_min_ms: int = 20,
+        jitter_max_ms: int = 200,
+        admission: Optional[AdmissionController] = None,
+        call_store: Optional[CallStore] = None,
+        drain: Optional[DrainController] = None,
+        signaling: bool = True,  # False on the workers that do not own the SIP port (WebRTC webhook calls only)
     ):
         self.sip_server = sip_server
         self.sip_username = sip_username
@@ -40,32 +73,78 @@ class SIPHandler:
         self.sip_transport = sip_transport
         self.stun_server = stun_server or "stun:stun.l.google.com:19302"
         self.turn_server = turn_server
-        
-        self.active_calls: Dict[str, Dict[str, Any]] = {}
+
+        # Shared across replicas when backed by Redis, in-process otherwise
+        self.registry = registry or CallRegistry(namespace="sip")
+        self.pipeline = pipeline
+        self.admission = admission
+        self.call_store = call_store
+        self.drain = drain
+        self.signaling = signaling
+        self.local_ip = local_ip
+        self.jitter_min_delay = jitter_min_ms / 1000
+        self.jitter_max_delay = jitter_max_ms / 1000
+        self.codecs = [c for c in codecs if c.lower() != "opus" or opus_available()]
+        if len(self.codecs) < len(codecs):
+            logger.warning("Opus disabled: libopus binding (aiortc) not available")
+        if sip_transport.lower() != "udp":
+            logger.warning(f"SIP transport {sip_transport} not supported, using UDP")
+
+        self.user_agent = SipUserAgent(
+            server=sip_server,
+            username=sip_username,
+            password=sip_password,
+            domain=sip_domain,
+            port=sip_port,
+            local_ip=local_ip,
+            local_port=local_port,
+            expires=register_expires,
+            on_invite=self._on_invite,
+            on_established=self._on_established,
+            on_terminated=self._on_terminated,
+        )
+        self.rtp_ports = RtpPortAllocator(rtp_port_min, rtp_port_max)
+        self.calls: Dict[str, SipCall] = {}
+        self._hangups: Set[asyncio.Task] = set()  # BYE transactions still waiting for an answer
         self.registered = False
-        
+
         logger.info(f"SIPHandler initialized for {sip_username}@{sip_server}")
-    
+
     async def register(self) -> bool:
         """
         Registra l'account SIP con il server
+
+        La registrazione viene poi rinnovata automaticamente dallo user agent.
+        Senza segnalazione (un altro worker ha la porta SIP) risolve solo
+        l'indirizzo da mettere nelle risposte SDP e ritorna False.
         """
         try:
-            # Simula registrazione SIP
-            # In produzione, usare una libreria SIP come pjsua o aiortc
+            if not self.signaling:
+                await self.user_agent.resolve()
+                return False
             logger.info(f"Attempting SIP registration: {self.sip_username}@{self.sip_server}")
-            
-            # TODO: Implementare registrazione SIP reale
-            # Per ora, simuliamo successo
-            self.registered = True
-            logger.info("SIP registration successful")
-            return True
-            
+            if self.user_agent.transport is None:
+                await self.user_agent.start()
+            self.registered = await self.user_agent.register()
+            if self.registered:
+                logger.info("SIP registration successful")
+            return self.registered
+
         except Exception as e:
             logger.error(f"SIP registration failed: {e}", exc_info=True)
             self.registered = False
             return False
-    
+
+    async def close(self) -> None:
+        """Chiude tutte le chiamate e cancella la registrazione"""
+        for call_id in list(self.calls):
+            await self.end_call(call_id)
+        if self._hangups:
+            # Let the BYEs go out before the transport closes
+            await asyncio.wait(list(self._hangups), timeout=2.0)
+        await self.user_agent.close()
+        self.registered = False
+
     async def handle_incoming_call(
         self,
         call_id: str,
@@ -74,103 +153,210 @@ class SIPHandler:
         sdp_offer: str,
     ) -> Dict[str, Any]:
         """
-        Gestisce una chiamata SIP in entrata
-        
+        Gestisce una chiamata segnalata via HTTP (senza INVITE SIP)
+
         Args:
             call_id: ID univoco della chiamata
             from_uri: SIP URI del chiamante
             to_uri: SIP URI del chiamato
-            sdp_offer: SDP offer per negoziazione media
-            
+            sdp_offer: SDP offer per negoziazione media (RTP/AVP)
+
         Returns:
             Dict con SDP answer e dettagli chiamata
         """
-        try:
-            logger.info(f"Handling incoming SIP call {call_id} from {from_uri}")
-            
-            # Crea info chiamata
-            call_info = {
+        if not await self._admit(call_id):
+            return {
+                "status": "busy",
                 "call_id": call_id,
-                "from_uri": from_uri,
-                "to_uri": to_uri,
-                "start_time": datetime.utcnow(),
-                "status": "active",
+                "message": "Node draining" if self.drain is not None and self.drain.draining else "Too many active calls on this node",
             }
-            
-            self.active_calls[call_id] = call_info
-            
-            # TODO: Implementare negoziazione WebRTC reale con aiortc
-            # Per ora, restituiamo un SDP answer di esempio
-            sdp_answer = self._generate_sdp_answer(sdp_offer)
-            
+        try:
+            logger.info(f"Handling incoming SIP call {call_id} from {from_uri}")
+            sdp_answer = await self._setup_call(call_id, from_uri, to_uri, sdp_offer)
+            # No ACK will follow on this signaling path: start the media right away
+            await self._start_call(call_id)
+
             return {
                 "status": "success",
                 "call_id": call_id,
                 "sdp_answer": sdp_answer,
                 "message": "Call accepted",
             }
-            
+
         except Exception as e:
             logger.error(f"Error handling SIP call {call_id}: {e}", exc_info=True)
+            await self.end_call(call_id)
             return {
                 "status": "error",
                 "call_id": call_id,
                 "error": str(e),
             }
-    
-    def _generate_sdp_answer(self, sdp_offer: str) -> str:
+
+    async def _on_invite(self, dialog: SipDialog, sdp_offer: str) -> Optional[str]:
         """
-        Genera un SDP answer basato sull'offer ricevuto
-        
-        In produzione, questo dovrebbe usare aiortc o simili per
-        gestire correttamente la negoziazione WebRTC
+        SDP answer per un INVITE (InviteHandler dello user agent)
+
+        Returns:
+            SDP answer, o None per rifiutare con 486 (nessun posto, pod in drain)
+            o per una chiamata cancellata durante il setup
         """
-        # Placeholder SDP answer
-        sdp_answer = """v=0
-o=- 0 0 IN IP4 0.0.0.0
-s=Voice Assistant
-c=IN IP4 0.0.0.0
-t=0 0
-m=audio 9 UDP/TLS/RTP/SAVPF 111 103 104
-a=rtpmap:111 opus/48000/2
-a=fmtp:111 minptime=10;useinbandfec=1
-a=rtcp-fb:111 transport-cc
-a=sendrecv
-a=ice-ufrag:{}
-a=ice-pwd:{}
-a=fingerprint:sha-256 {}
-a=setup:active
-a=mid:0
-""".format(
-            uuid.uuid4().hex[:8],
-            uuid.uuid4().hex,
-            ":".join([uuid.uuid4().hex[i:i+2].upper() for i in range(0, 64, 2)])
+        logger.info(f"Incoming SIP INVITE {dialog.call_id} from {dialog.from_uri}")
+        if not await self._admit(dialog.call_id):
+            return None  # 486 Busy Here: the proxy can route the call to another node
+        if dialog.state == "terminated":
+            # CANCEL while waiting for a slot: end_call already ran and found nothing to release
+            self._release(dialog.call_id)
+            return None
+        try:
+            answer = await self._setup_call(dialog.call_id, dialog.from_uri, dialog.to_uri, sdp_offer)
+        except Exception:
+            self._release(dialog.call_id)
+            raise
+        if dialog.state == "terminated":
+            # CANCEL during the media setup: undo it (RTP port, conversation, registry, slot)
+            await self.end_call(dialog.call_id)
+            return None
+        return answer
+
+    async def _on_established(self, dialog: SipDialog) -> None:
+        await self._start_call(dialog.call_id)
+
+    async def _on_terminated(self, dialog: SipDialog, reason: str) -> None:
+        await self.end_call(dialog.call_id)
+
+    async def _admit(self, call_id: str) -> bool:
+        if self.drain is not None and self.drain.draining:
+            self.drain.reject("sip")
+            return False
+        return self.admission is None or await self.admission.acquire(call_id)
+
+    def _release(self, call_id: str) -> None:
+        if self.admission is not None:
+            self.admission.release(call_id)
+
+    async def _setup_call(self, call_id: str, from_uri: str, to_uri: str, sdp_offer: str) -> str:
+        """
+        Negozia l'SDP e apre la sessione RTP (la conversazione parte all'ACK)
+
+        Raises:
+            SdpNegotiationError: se l'offerta non ha codec supportati
+        """
+        media = negotiate(parse_sdp(sdp_offer), self.codecs)
+
+        call: Optional[SipCall] = None
+
+        def on_audio(chunk: bytes) -> None:
+            if call is not None and call.conversation is not None and call.started:
+                call.conversation.receive_audio(chunk)
+
+        rtp_session = RtpSession(
+            codec=media.codec,
+            remote_addr=(media.remote_address, media.remote_port),
+            on_audio=on_audio,
+            telephone_event=media.telephone_event,
+            on_dtmf=lambda digit: logger.info(f"DTMF {digit} on SIP call {call_id}"),
+            ptime_ms=media.ptime_ms,
+            jitter_min_delay=self.jitter_min_delay,
+            jitter_max_delay=self.jitter_max_delay,
+        )
+        local_port = await self.rtp_ports.open(rtp_session)
+        call = SipCall(call_id=call_id, rtp_session=rtp_session)
+        try:
+            if self.pipeline is not None:
+                call.conversation = SipPhoneConversation(self.pipeline, rtp_session, call_id=call_id, to_uri=to_uri)
+            else:
+                logger.warning(f"SIP call {call_id}: no conversation pipeline configured, media only")
+        except Exception:
+            await rtp_session.close()
+            raise
+        self.calls[call_id] = call
+
+        media_ip = self.media_ip
+        logger.info(
+            f"SIP call {call_id}: {media.codec.rtpmap} with {media.remote_address}:{media.remote_port}, "
+            f"local RTP {media_ip}:{local_port}"
         )
-        return sdp_answer
-    
+
+        await self.registry.put(call_id, {
+            "call_id": call_id,
+            "from_uri": from_uri,
+            "to_uri": to_uri,
+            "codec": media.codec.name,
+            "start_time": datetime.utcnow(),
+            "status": "active",
+        })
+        return build_answer(media, media_ip, local_port)
+
+    @property
+    def media_ip(self) -> str:
+        """Indirizzo RTP annunciato nell'SDP (dietro NAT quello pubblico appreso dalla registrazione)"""
+        if self.local_ip:
+            return self.local_ip
+        contact_addr = self.user_agent.contact_addr
+        return contact_addr[0] if contact_addr is not None else self.user_agent.local_ip
+
+    async def _start_call(self, call_id: str) -> None:
+        call = self.calls.get(call_id)
+        if call is None or call.started:
+            return
+        call.started = True
+        if call.conversation is not None:
+            # The RTP task created below belongs to the call's profile (CPU time per call)
+            enter_call(getattr(call.conversation.agent, "call_profile", None))
+        call.rtp_session.start()
+        if call.conversation is not None:
+            await call.conversation.start()
+            call.watcher = asyncio.create_task(self._watch_conversation(call))
+
+    async def _watch_conversation(self, call: SipCall) -> None:
+        # The agent may end the call itself (goodbye, idle timeout): hang up the SIP leg
+        await call.conversation.ended.wait()
+        await self.end_call(call.call_id)
+
     async def end_call(self, call_id: str) -> bool:
         """
         Termina una chiamata SIP
         """
-        if call_id in self.active_calls:
-            call_info = self.active_calls[call_id]
+        call = self.calls.pop(call_id, None)
+        self._release(call_id)
+        if call is not None:
+            if call.watcher is not None and call.watcher is not asyncio.current_task():
+                call.watcher.cancel()
+            if call.conversation is not None and call.started:
+                await call.conversation.terminate()
+            await call.rtp_session.close()
+            # The BYE transaction can retransmit for up to 32 s: the agent and the RTP port are already freed
+            task = asyncio.create_task(self._hangup(call_id))
+            self._hangups.add(task)
+            task.add_done_callback(self._hangups.discard)
+
+        call_info = await self.registry.remove(call_id)
+        if call_info is not None:
             call_info["end_time"] = datetime.utcnow()
             call_info["status"] = "completed"
-            
+
             duration = (call_info["end_time"] - call_info["start_time"]).total_seconds()
             call_info["duration"] = duration
-            
+
             logger.info(f"Ended SIP call {call_id}, duration: {duration}s")
-            del self.active_calls[call_id]
+            if self.call_store is not None:
+                self.call_store.record_call(call_info, provider="sip")
             return True
-        
-        return False
-    
+
+        return call is not None
+
+    async def _hangup(self, call_id: str) -> None:
+        try:
+            await self.user_agent.hangup(call_id)
+        except Exception as e:
+            logger.warning(f"SIP call {call_id}: hangup failed: {e}")
+
     async def get_active_calls(self) -> Dict[str, Dict[str, Any]]:
         """
-        Ritorna tutte le chiamate attive
+        Ritorna tutte le chiamate attive (su tutte le repliche se Redis è configurato,
+        altrimenti su tutti i worker del pod)
         """
-        return self.active_calls
+        return await self.registry.list_active()
 
 
 # Global SIP handler instance
@@ -5,29 +5,50 @@ Gestisce chiamate telefoniche in entrata tramite Twilio o SIP con Vocode
 """
 
 import os
+import hmac
 import logging
 import asyncio
-from typing import Optional
+import threading
+import time
+from typing import TYPE_CHECKING, Optional
 from contextlib import asynccontextmanager
 
 from fastapi import FastAPI, Request, Response, HTTPException
 from fastapi.responses import PlainTextResponse, JSONResponse
-import uvicorn
 from prometheus_client import Counter, Histogram, generate_latest, CONTENT_TYPE_LATEST
-from twilio.twiml.voice_response import VoiceResponse
 
+# Only what both providers need is imported here: the Twilio server, the SIP stack,
+# PostgreSQL, the response cache and the provider pool load inside the lifespan branch
+# that enables them, so a pod pays the import time of its own configuration only.
+# The agent, the call handler and the per-call services load in the lifespan too:
+# "import main" (the multi-worker supervisor, tools) stays free of the Vocode agent stack
 import vocode
-from vocode.streaming.telephony.server.base import TelephonyServer
-from vocode.streaming.telephony.config_manager.redis_config_manager import RedisConfigManager
-from vocode.streaming.models.telephony import TwilioConfig
-from vocode.streaming.models.agent import ChatGPTAgentConfig
 from vocode.streaming.models.message import BaseMessage
-from vocode.streaming.models.synthesizer import ElevenLabsSynthesizerConfig
-from vocode.streaming.models.transcriber import DeepgramTranscriberConfig
 
 from config.settings import Settings
-from handlers.call_handler import CallHandler
-from handlers.sip_handler import initialize_sip_handler, get_sip_handler
+from config.assistant_config import (
+    DEFAULT_TENANT,
+    AssistantConfigStore,
+    CompiledAssistantConfig,
+    TenantProfile,
+    get_filler_phrases,
+)
+from monitoring.event_loop import EventLoopLagMonitor
+from monitoring.profiling import CallProfiler, sample_stacks, summarize_stacks
+from services.admission import AdmissionController
+from services.drain import DrainController
+from services.twilio_webhooks import (
+    TWILIO_WEBHOOK_SECONDS,
+    TWILIO_WEBHOOKS_TOTAL,
+    StatusCallbackDedup,
+    TwilioSignatureValidator,
+    TwilioWebhookGuard,
+    TwimlReplies,
+)
+from services.workers import CloseAfterResponse, collect_metrics, get_worker
+
+if TYPE_CHECKING:
+    from services.turn_detection import TurnDetectionConfig
 
 # Setup logging
 logging.basicConfig(
@@ -44,6 +65,9 @@ ERRORS_TOTAL = Counter('voice_assistant_errors_total', 'Total number of errors',
 # Load settings
 settings = Settings()
 
+# Set when this process is one of the pod's workers (WORKERS > 1, see services/workers.py)
+worker = get_worker()
+
 # Configure Vocode with API keys
 vocode.api_key = settings.vocode_api_key if hasattr(settings, 'vocode_api_key') else None
 
@@ -54,43 +78,420 @@ async def lifespan(app: FastAPI):
     logger.info("Starting AI Voice Assistant...")
     logger.info(f"Environment: {settings.environment}")
     logger.info(f"Telephony Provider: {settings.telephony_provider}")
+    if worker is not None:
+        logger.info(f"Worker {worker.index + 1} of {worker.count}")
     
-    # Initialize Redis config manager if Redis is configured
+    app.state.loop_monitor = EventLoopLagMonitor(
+        interval=settings.event_loop_monitor_interval,
+        stall_threshold=settings.event_loop_stall_threshold,
+    )
+    app.state.loop_monitor.start()
+    
+    # Installed before any call: every task created afterwards is metered
+    app.state.call_profiler = None
+    if settings.call_profiling_enabled:
+        app.state.call_profiler = CallProfiler()
+        app.state.call_profiler.install()
+    app.state.profile_lock = asyncio.Lock()
+    
+    # Shared Redis client (call registry, Vocode call configs, response cache) if Redis is configured
+    app.state.redis = None
     if settings.redis_url:
-        app.state.config_manager = RedisConfigManager(redis_url=settings.redis_url)
-        logger.info("Redis config manager initialized")
+        from redis.asyncio import Redis
+        
+        app.state.redis = Redis.from_url(
+            settings.redis_url,
+            password=settings.redis_password,
+            decode_responses=True,
+        )
+        logger.info("Redis client initialized")
     
-    # Initialize telephony based on provider selection
-    if settings.telephony_provider == "twilio":
-        # Initialize Twilio telephony server
-        app.state.telephony_server = TelephonyServer(
-            base_url=settings.base_url,
-            config_manager=app.state.config_manager if hasattr(app.state, 'config_manager') else None,
-            twilio_config=TwilioConfig(
-                account_sid=settings.twilio_account_sid,
-                auth_token=settings.twilio_auth_token,
-            ),
-            agent_config=ChatGPTAgentConfig(
+    from services.call_registry import CallRegistry
+    
+    def call_registry(namespace: str) -> CallRegistry:
+        return CallRegistry(
+            redis_client=app.state.redis,
+            namespace=namespace,
+            ttl_seconds=settings.call_registry_ttl_seconds,
+            local_cache_ttl=settings.call_registry_local_cache_ttl,
+            shared_dir=worker.calls_dir if worker is not None else None,
+        )
+    
+    # Prompt, greetings, scenarios... from the mounted YAML, reloaded without restarting the pod
+    app.state.assistant_config = AssistantConfigStore(
+        settings.assistant_config_path,
+        reload_interval=settings.assistant_config_reload_interval,
+    )
+    assistant_config = app.state.assistant_config.load()
+    logging_config = (assistant_config.raw.get("assistant") or {}).get("logging") or {}
+    
+    # Calls and transcripts go to PostgreSQL through a batched background writer
+    app.state.call_store = None
+    if settings.postgres_url and logging_config.get("save_to_db"):
+        from services.call_store import CallStore, asyncpg_dsn
+        
+        call_store = CallStore(
+            dsn=asyncpg_dsn(settings.postgres_url),
+            retention_days=logging_config.get("retention_days", 90),
+            batch_size=settings.db_batch_size,
+            flush_interval=settings.db_flush_interval,
+            max_queue=settings.db_queue_max,
+            pool_size=settings.db_pool_size,
+        )
+        try:
+            await call_store.start()
+            app.state.call_store = call_store
+        except Exception as e:
+            logger.error(f"PostgreSQL not available, calls will not be stored: {e}")
+    
+    # Call audio is encoded and written by threads, off the event loop
+    app.state.call_recorder = None
+    if logging_config.get("record_calls"):
+        from services.call_recorder import CallRecorder
+        
+        call_recorder = CallRecorder(
+            directory=settings.recording_dir,
+            retention_days=logging_config.get("retention_days", 90),
+            codec=settings.recording_codec,
+            segment_seconds=settings.recording_segment_seconds,
+            batch_ms=settings.recording_batch_ms,
+            max_queue_batches=settings.recording_queue_batches,
+            fsync_interval=settings.recording_fsync_interval,
+            threads=settings.recording_writer_threads,
+        )
+        try:
+            await call_recorder.start()
+            app.state.call_recorder = call_recorder
+        except OSError as e:
+            logger.error(f"Recording directory not available, calls will not be recorded: {e}")
+    
+    from handlers.call_handler import CallHandler
+    
+    app.state.call_handler = CallHandler(registry=call_registry("twilio"), call_store=app.state.call_store)
+    
+    # SIGTERM drains the running calls before uvicorn shuts down
+    app.state.drain = DrainController(timeout=settings.drain_timeout)
+    app.state.drain.install_signal_handler()
+    
+    # Per-pod call limit, split between the workers; Twilio overflow calls get a TwiML rendered once
+    # with the Twilio server
+    app.state.admission = None
+    if settings.max_live_calls > 0:
+        app.state.admission = AdmissionController(
+            max_live_calls=worker.share(settings.max_live_calls) if worker is not None else settings.max_live_calls,
+            max_queue=worker.share(settings.admission_queue_size) if worker is not None else settings.admission_queue_size,
+            queue_timeout=settings.admission_queue_timeout,
+            reservation_ttl=settings.admission_reservation_ttl,
+        )
+    
+    if worker is not None:
+        # Live calls steer the supervisor's routing; an admin drain reaches every worker of the pod
+        admission, drain = app.state.admission, app.state.drain
+        worker.load = (lambda: admission.live_calls) if admission is not None else (lambda: drain.active_calls)
+        worker.on_drain = lambda draining: drain.start("admin") if draining else drain.resume()
+    
+    # The synthesizer module loads the ElevenLabs SDK: imported here, not by "import main"
+    from vocode.streaming.models.synthesizer import ElevenLabsSynthesizerConfig
+    from vocode.streaming.models.transcriber import DeepgramTranscriberConfig, DEEPGRAM_API_WS_URL
+    from vocode.streaming.synthesizer import eleven_labs_synthesizer
+    from vocode.streaming.transcriber.deepgram_transcriber import DeepgramEndpointingConfig
+    from services.tts_cache import PhraseAudioCache, CachingSynthesizerFactory, warm_up_phrase_cache
+    from services.scenario_matcher import ScenarioMatcher
+    from services.tenants import TenantAgentConfig, TenantPipeline, TenantRouter
+    
+    # Provider endpoint overrides (HTTP proxies, offline load tests)
+    if settings.elevenlabs_base_url:
+        eleven_labs_synthesizer.ELEVEN_LABS_BASE_URL = settings.elevenlabs_base_url.rstrip("/") + "/"
+    
+    # Conversation pipeline of each tenant, shared by Twilio and SIP calls (both mu-law 8 kHz)
+    def build_tenant_pipeline(tenant: TenantProfile) -> TenantPipeline:
+        return TenantPipeline(
+            tenant=tenant,
+            agent_config=TenantAgentConfig(
                 openai_api_key=settings.openai_api_key,
                 initial_message=BaseMessage(text=settings.initial_message),
-                prompt_preamble=settings.system_prompt,
-                model_name=settings.openai_model,
+                prompt_preamble=tenant.system_prompt or settings.system_prompt,
+                model_name=tenant.model or settings.openai_model,
+                tenant=tenant.name,
             ),
-            transcriber_config=DeepgramTranscriberConfig(
+            transcriber_config=DeepgramTranscriberConfig.from_telephone_input_device(
                 api_key=settings.deepgram_api_key,
-                language="it",  # Italiano
+                language=tenant.language or "it",  # Italiano
                 model="nova-2",
+                ws_url=settings.deepgram_ws_url or DEEPGRAM_API_WS_URL,
+                # Without an endpointing config vocode's Deepgram receiver fails on the first final
+                endpointing_config=DeepgramEndpointingConfig(),
             ),
-            synthesizer_config=ElevenLabsSynthesizerConfig(
+            synthesizer_config=ElevenLabsSynthesizerConfig.from_telephone_output_device(
                 api_key=settings.elevenlabs_api_key,
-                voice_id=settings.elevenlabs_voice_id,
+                voice_id=tenant.voice_id or settings.elevenlabs_voice_id,
                 model_id="eleven_multilingual_v2",
             ),
+            scenario_matcher=ScenarioMatcher(list(tenant.scenarios)) if settings.scenario_fast_path_enabled else None,
+        )
+    
+    # Pre-synthesized audio for the fixed phrases (greetings, scenarios, fallback)
+    phrase_cache = PhraseAudioCache(
+        cache_dir=settings.tts_cache_dir,
+        max_memory_bytes=settings.tts_cache_max_memory_mb * 1024 * 1024,
+    )
+    app.state.phrase_cache = phrase_cache
+    
+    async def warm_up_tenant(pipeline: TenantPipeline) -> None:
+        # The default tenant is warmed at startup and on reload; the others with their own voice
+        if pipeline.tenant.name != DEFAULT_TENANT:
+            await warm_up_phrase_cache(phrase_cache, pipeline.synthesizer_config, list(pipeline.tenant.fixed_phrases))
+    
+    # Called number -> tenant; compiled pipelines stay in a bounded LRU
+    app.state.tenants = TenantRouter(
+        app.state.assistant_config,
+        build_tenant_pipeline,
+        max_pipelines=settings.tenant_pipeline_cache_size,
+        warm_up=warm_up_tenant if settings.tts_cache_enabled else None,
+    )
+    default_pipeline = app.state.tenants.pipeline(DEFAULT_TENANT)
+    agent_config = default_pipeline.agent_config
+    transcriber_config = default_pipeline.transcriber_config
+    synthesizer_config = default_pipeline.synthesizer_config
+    if default_pipeline.scenario_matcher is not None:
+        logger.info(f"Scenario fast-path enabled with {len(default_pipeline.scenario_matcher.matcher.patterns)} keywords")
+    logger.info(f"{len(assistant_config.tenants)} tenants, {len(assistant_config.routes)} routed numbers")
+    
+    # Long-lived provider connections, warm before the pod reports ready
+    app.state.provider_pool = None
+    openai_client = None
+    if settings.provider_pool_enabled:
+        from services.provider_pool import OPENAI_API_BASE_URL, DeepgramSocketPool, PooledHttpProvider, ProviderPool
+        
+        app.state.provider_pool = ProviderPool(
+            openai=PooledHttpProvider(
+                "openai",
+                settings.openai_base_url or OPENAI_API_BASE_URL,
+                "models",
+                {"Authorization": f"Bearer {settings.openai_api_key}"},
+            ),
+            elevenlabs=PooledHttpProvider(
+                "elevenlabs",
+                eleven_labs_synthesizer.ELEVEN_LABS_BASE_URL,
+                "user",
+                {"xi-api-key": settings.elevenlabs_api_key},
+            ),
+            deepgram=(
+                DeepgramSocketPool.for_transcriber_config(transcriber_config, size=settings.stt_pool_size)
+                if settings.stt_pool_size > 0 else None
+            ),
+            keepalive_interval=settings.provider_keepalive_interval,
+        )
+        try:
+            await asyncio.wait_for(app.state.provider_pool.start(), timeout=settings.provider_pool_warmup_timeout)
+        except asyncio.TimeoutError:
+            logger.warning("Provider pool warm-up timed out, /ready stays not_ready until connections are up")
+        openai_client = app.state.provider_pool.create_openai_client(settings.openai_api_key, settings.openai_base_url)
+    
+    def turn_detection_for(config: CompiledAssistantConfig) -> Optional["TurnDetectionConfig"]:
+        if not settings.local_vad_enabled:
+            return None
+        from services.turn_detection import TurnDetectionConfig
+        
+        return TurnDetectionConfig.from_assistant_config(
+            config.raw,
+            vad_mode=settings.vad_mode,
+            end_of_speech_ms=settings.vad_end_of_speech_ms,
+            barge_in_enabled=settings.barge_in_enabled,
+            barge_in_min_speech_ms=settings.barge_in_min_speech_ms,
+            local_endpointing_enabled=settings.local_endpointing_enabled,
+        )
+    
+    response_cache = None
+    if settings.llm_response_cache_enabled:
+        from services.response_cache import ResponseCache
+        
+        response_cache = ResponseCache.from_assistant_config(
+            assistant_config.raw,
+            ttl=settings.llm_response_cache_ttl,
+            max_entries=settings.llm_response_cache_max_entries,
+            redis_client=app.state.redis if settings.llm_response_cache_redis else None,
+        )
+    history = None
+    if settings.llm_history_enabled:
+        from services.conversation_context import HistoryConfig
+        
+        history = HistoryConfig(
+            keep_turns=settings.llm_history_keep_turns,
+            max_history_tokens=settings.llm_history_max_tokens,
+            summary_trigger_tokens=settings.llm_history_summary_trigger_tokens,
+            summary_model=settings.llm_summary_model,
+            summary_max_tokens=settings.llm_summary_max_tokens,
+        )
+    
+    # Hedged LLM requests: a late first token starts a second request on the next backend
+    app.state.llm_dispatcher = None
+    if settings.llm_hedging_enabled:
+        from openai import AsyncOpenAI
+        from services.llm_dispatch import AnthropicBackend, LlmDispatcher, OpenAIBackend
+        
+        dispatch_client = openai_client or AsyncOpenAI(api_key=settings.openai_api_key, base_url=settings.openai_base_url)
+        breaker = {"breaker_failures": settings.llm_breaker_failures, "breaker_cooldown": settings.llm_breaker_cooldown}
+        backends = [OpenAIBackend("openai", dispatch_client, **breaker)]
+        for name in [b.strip() for b in settings.llm_hedge_backends.split(",") if b.strip()]:
+            if name == "openai":
+                backends.append(OpenAIBackend("openai_hedge", dispatch_client, model=settings.llm_hedge_openai_model, **breaker))
+            elif name == "anthropic" and settings.anthropic_api_key:
+                backends.append(AnthropicBackend(
+                    "anthropic",
+                    settings.anthropic_api_key,
+                    settings.anthropic_model,
+                    base_url=settings.anthropic_base_url,
+                    **breaker,
+                ))
+            else:
+                logger.warning(f"LLM hedge backend {name} ignored (unknown, or no API key)")
+        app.state.llm_dispatcher = LlmDispatcher(
+            backends,
+            hedge_percentile=settings.llm_hedge_percentile,
+            min_hedge_delay=settings.llm_hedge_min_delay,
+            max_hedge_delay=settings.llm_hedge_max_delay,
+        )
+        logger.info(f"LLM hedging enabled: {', '.join(backend.name for backend in backends)}")
+    
+    # Filler clips come from the phrase cache, so they need its warm-up
+    filler_clips = None
+    if settings.filler_enabled and settings.tts_cache_enabled and settings.latency_metrics_enabled:
+        from services.filler import FillerClipBank
+        
+        filler_clips = FillerClipBank(phrase_cache, get_filler_phrases(assistant_config.raw))
+    
+    from agents.assistant_agent import AssistantAgentFactory
+    from services.filler import FillerConfig
+    from services.speculation import SpeculationConfig
+    
+    agent_factory = AssistantAgentFactory(
+        scenario_matcher=default_pipeline.scenario_matcher,
+        scenario_min_confidence=settings.scenario_min_confidence,
+        latency_metrics_enabled=settings.latency_metrics_enabled,
+        openai_base_url=settings.openai_base_url,
+        openai_client=openai_client,
+        clause_streaming_enabled=settings.llm_clause_streaming_enabled,
+        first_chunk_min_words=settings.llm_first_chunk_min_words,
+        clause_split_chars=settings.llm_clause_split_chars,
+        chunk_max_chars=settings.llm_chunk_max_chars,
+        turn_detection=turn_detection_for(assistant_config),
+        admission=app.state.admission,
+        call_store=app.state.call_store if logging_config.get("transcribe_calls") else None,
+        response_cache=response_cache,
+        history=history,
+        llm_dispatcher=app.state.llm_dispatcher,
+        tenants=app.state.tenants,
+        drain=app.state.drain,
+        speculation=SpeculationConfig(
+            enabled=settings.llm_speculation_enabled,
+            stable_ms=settings.llm_speculation_stable_ms,
+            min_words=settings.llm_speculation_min_words,
+            similarity_threshold=settings.llm_speculation_similarity,
+            prefetch_tts=settings.llm_speculation_prefetch_tts,
+            max_per_turn=settings.llm_speculation_max_per_turn,
+        ),
+        filler=FillerConfig(
+            first_ms=settings.filler_first_ms,
+            repeat_ms=settings.filler_repeat_ms,
+            max_per_turn=settings.filler_max_per_turn,
+        ),
+        filler_clips=filler_clips,
+        recorder=app.state.call_recorder,
+        call_profiler=app.state.call_profiler,
+    )
+    
+    if settings.tts_cache_enabled:
+        phrases = [settings.initial_message] + list(assistant_config.fixed_phrases)
+        try:
+            await asyncio.wait_for(
+                warm_up_phrase_cache(phrase_cache, synthesizer_config, phrases),
+                timeout=settings.tts_cache_warmup_timeout,
+            )
+        except asyncio.TimeoutError:
+            logger.warning("TTS phrase cache warm-up timed out, remaining phrases are cached on first use")
+    synthesizer_factory = CachingSynthesizerFactory(
+        phrase_cache,
+        context_stitching=settings.tts_context_stitching,
+    )
+    
+    def on_assistant_config_reload(config: CompiledAssistantConfig) -> None:
+        # Runs right after the swap: calls created from now on see the new version,
+        # running calls keep the matcher and settings they were created with
+        # The tenant router subscribed first: its default pipeline is already rebuilt
+        agent_factory.scenario_matcher = app.state.tenants.pipeline(DEFAULT_TENANT).scenario_matcher
+        agent_factory.turn_detection = turn_detection_for(config)
+        if response_cache is not None:
+            response_cache.apply_assistant_config(config.raw)
+        if filler_clips is not None:
+            filler_clips.set_phrases(get_filler_phrases(config.raw))
+        if settings.tts_cache_enabled:
+            # New greetings and scenario answers are synthesized before the first call needs them
+            app.state.phrase_cache_warmup = asyncio.create_task(
+                warm_up_phrase_cache(phrase_cache, synthesizer_config, list(config.fixed_phrases))
+            )
+    
+    app.state.assistant_config.subscribe(on_assistant_config_reload)
+    await app.state.assistant_config.start()
+    
+    # Fixed webhook answers as bytes; signed requests only when the auth token is known
+    app.state.twiml = TwimlReplies.render(
+        base_url=settings.base_url,
+        overflow_message=settings.overflow_message,
+        overflow_redirect_url=settings.overflow_redirect_url,
+    )
+    validator = None
+    if settings.twilio_validate_signature:
+        validator = TwilioSignatureValidator([settings.twilio_auth_token, settings.twilio_auth_token_secondary])
+        if not validator.enabled and settings.telephony_provider == "twilio":
+            logger.warning("TWILIO_AUTH_TOKEN not set: Twilio webhook signatures are not verified")
+    app.state.twilio_guard = TwilioWebhookGuard(validator, settings.base_url)
+    app.state.status_dedup = StatusCallbackDedup(
+        ttl_seconds=settings.twilio_status_dedup_ttl,
+        redis_client=app.state.redis,
+    )
+    
+    # Initialize telephony based on provider selection
+    if settings.telephony_provider == "twilio":
+        from vocode.streaming.models.telephony import TwilioConfig
+        from vocode.streaming.telephony.config_manager.in_memory_config_manager import InMemoryConfigManager
+        from vocode.streaming.telephony.config_manager.redis_config_manager import RedisConfigManager
+        from vocode.streaming.telephony.server.base import TelephonyServer
+        
+        app.state.twilio_config = TwilioConfig(
+            account_sid=settings.twilio_account_sid,
+            auth_token=settings.twilio_auth_token,
         )
+        
+        config_manager = InMemoryConfigManager()
+        if app.state.redis is not None:
+            # Vocode's manager reads REDISHOST & co. from the environment; share our client instead
+            config_manager = RedisConfigManager()
+            config_manager.redis = app.state.redis
+            logger.info("Redis config manager initialized")
+        
+        # Initialize Twilio telephony server
+        app.state.telephony_server = TelephonyServer(
+            # Vocode builds wss://<base_url>/connect_call/<id>, so it wants the bare host
+            base_url=settings.base_url.split("://", 1)[-1].rstrip("/"),
+            config_manager=config_manager,
+            agent_factory=agent_factory,
+            synthesizer_factory=synthesizer_factory,
+        )
+        # The inbound webhook stays ours (it picks the tenant); Vocode serves the media WebSocket (/connect_call/{id})
+        app.include_router(app.state.telephony_server.get_router())
         logger.info("Twilio telephony server initialized")
         logger.info(f"Twilio Webhook URL: {settings.base_url}/webhooks/twilio/voice")
         
     elif settings.telephony_provider == "sip":
+        from handlers.sip_handler import initialize_sip_handler
+        from sip.conversation import SipPipelineConfig
+        
+        # With several workers only the first one owns the SIP port; each worker gets its own RTP ports
+        rtp_port_min, rtp_port_max = settings.sip_rtp_port_min, settings.sip_rtp_port_max
+        if worker is not None:
+            rtp_port_min, rtp_port_max = worker.port_range(rtp_port_min, rtp_port_max)
+        
         # Initialize SIP handler
         app.state.sip_handler = initialize_sip_handler(
             sip_server=settings.sip_server,
@@ -101,10 +502,34 @@ async def lifespan(app: FastAPI):
             sip_transport=settings.sip_transport,
             stun_server=settings.sip_stun_server,
             turn_server=settings.sip_turn_server,
+            registry=call_registry("sip"),
+            pipeline=SipPipelineConfig(
+                agent_config=agent_config,
+                transcriber_config=transcriber_config,
+                synthesizer_config=synthesizer_config,
+                agent_factory=agent_factory,
+                synthesizer_factory=synthesizer_factory,
+                tenants=app.state.tenants,
+            ),
+            local_ip=settings.sip_local_ip,
+            local_port=settings.sip_local_port,
+            rtp_port_min=rtp_port_min,
+            rtp_port_max=rtp_port_max,
+            register_expires=settings.sip_register_expires,
+            codecs=[c.strip() for c in settings.sip_codecs.split(",") if c.strip()],
+            jitter_min_ms=settings.sip_jitter_min_ms,
+            jitter_max_ms=settings.sip_jitter_max_ms,
+            admission=app.state.admission,
+            call_store=app.state.call_store,
+            drain=app.state.drain,
+            signaling=worker is None or worker.signaling,
         )
         
         # Register with SIP server
-        if await app.state.sip_handler.register():
+        if worker is not None and not worker.signaling:
+            await app.state.sip_handler.register()
+            logger.info(f"SIP handler initialized for WebRTC calls (signaling on worker 0), RTP {rtp_port_min}-{rtp_port_max}")
+        elif await app.state.sip_handler.register():
             logger.info("SIP handler initialized and registered")
             logger.info(f"SIP Server: {settings.sip_server}:{settings.sip_port}")
             logger.info(f"SIP WebRTC endpoint: {settings.base_url}/webhooks/sip/webrtc")
@@ -118,6 +543,20 @@ async def lifespan(app: FastAPI):
     yield
     
     logger.info("Shutting down AI Voice Assistant...")
+    await app.state.assistant_config.stop()
+    if hasattr(app.state, 'sip_handler'):
+        await app.state.sip_handler.close()
+    if app.state.provider_pool is not None:
+        await app.state.provider_pool.close()
+    if app.state.call_store is not None:
+        await app.state.call_store.close()
+    if app.state.call_recorder is not None:
+        await app.state.call_recorder.close()
+    if app.state.call_profiler is not None:
+        await app.state.call_profiler.stop()
+    await app.state.loop_monitor.stop()
+    if app.state.redis is not None:
+        await app.state.redis.aclose()
 
 
 # Create FastAPI app
@@ -127,6 +566,9 @@ app = FastAPI(
     version="1.0.0",
     lifespan=lifespan,
 )
+if worker is not None:
+    # Every request goes back through the supervisor, which picks the worker owning its call
+    app.add_middleware(CloseAfterResponse)
 
 
 @app.get("/")
@@ -158,67 +600,126 @@ async def readiness_check():
     }
     
     all_ready = all(checks.values())
+    body = {"checks": checks}
     
-    return {
-        "status": "ready" if all_ready else "not_ready",
-        "checks": checks
-    }
+    # Draining pods leave the Service endpoints while their calls finish
+    drain = getattr(app.state, "drain", None)
+    if drain is not None and drain.draining:
+        body["drain"] = drain.status()
+        all_ready = False
+    if app.state.admission is not None:
+        body["admission"] = app.state.admission.status()
+    
+    # A pod takes calls only once its provider connections are open
+    provider_pool = getattr(app.state, "provider_pool", None)
+    if provider_pool is not None:
+        body["provider_pool"] = provider_pool.status()
+        all_ready = all_ready and provider_pool.ready
+    
+    body["status"] = "draining" if drain is not None and drain.draining else "ready" if all_ready else "not_ready"
+    return JSONResponse(content=body, status_code=200 if all_ready else 503)
 
 
 @app.get("/metrics")
 async def metrics():
-    """Prometheus metrics endpoint"""
+    """Prometheus metrics endpoint (totals of all the workers of the pod)"""
     return Response(
-        content=generate_latest(),
+        content=generate_latest() if worker is None else await asyncio.to_thread(collect_metrics),
         media_type=CONTENT_TYPE_LATEST
     )
 
 
+def twiml_response(twiml: bytes) -> Response:
+    """Risposta con un TwiML già renderizzato"""
+    return Response(content=twiml, media_type="text/xml")
+
+
+async def connect_twilio_call(call_sid: str, from_number: str, to_number: str) -> Response:
+    """
+    Salva la call config del tenant del numero chiamato e risponde con il TwiML
+    che apre il media stream verso /connect_call/{id}
+    """
+    from vocode.streaming.models.telephony import TwilioCallConfig
+    from vocode.streaming.telephony.templater import get_connection_twiml
+    from vocode.streaming.utils import create_conversation_id
+    
+    telephony_server = app.state.telephony_server
+    agent_config, transcriber_config, synthesizer_config = app.state.tenants.route(to_number).call_configs()
+    conversation_id = create_conversation_id()
+    if worker is not None:
+        # The media WebSocket (/connect_call/{id}) must reach the worker holding this call config
+        conversation_id = worker.tag_conversation_id(conversation_id)
+    await telephony_server.config_manager.save_config(
+        conversation_id,
+        TwilioCallConfig(
+            transcriber_config=transcriber_config,
+            agent_config=agent_config,
+            synthesizer_config=synthesizer_config,
+            twilio_config=app.state.twilio_config,
+            twilio_sid=call_sid,
+            from_phone=from_number,
+            to_phone=to_number,
+            direction="inbound",
+        ),
+    )
+    return get_connection_twiml(base_url=telephony_server.base_url, call_id=conversation_id)
+
+
 @app.post("/webhooks/twilio/voice")
 async def handle_twilio_voice(request: Request):
     """
     Webhook handler for Twilio voice calls
     Questo endpoint viene chiamato da Twilio quando arriva una chiamata
     """
+    started = time.perf_counter()
     try:
+        # Unsigned requests are turned away before they count as calls or take a slot
+        form_data, rejected = await app.state.twilio_guard.read(request, "voice")
+        if rejected is not None:
+            return Response(status_code=rejected)
+        TWILIO_WEBHOOKS_TOTAL.labels(endpoint="voice", result="accepted").inc()
         CALLS_TOTAL.inc()
-        logger.info("Received incoming call from Twilio")
-        
-        # Get form data from Twilio
-        form_data = await request.form()
         from_number = form_data.get("From", "Unknown")
         to_number = form_data.get("To", "Unknown")
         call_sid = form_data.get("CallSid", "Unknown")
         
-        logger.info(f"Call details - From: {from_number}, To: {to_number}, SID: {call_sid}")
+        if not hasattr(app.state, 'telephony_server'):
+            # Fallback if telephony server not initialized
+            logger.error("Telephony server not initialized")
+            return twiml_response(app.state.twiml.unavailable)
+        
+        logger.info(f"Incoming Twilio call - From: {from_number}, To: {to_number}, SID: {call_sid}")
+        
+        if app.state.drain.draining:
+            app.state.drain.reject("twilio")
+            # Redirect once to another replica; if it lands here again the caller gets the overflow answer
+            twiml = app.state.twiml.overflow if request.query_params.get("drain_redirect") else app.state.twiml.drain_redirect
+            return twiml_response(twiml)
         
-        # Use Vocode's telephony server to handle the call
-        if hasattr(app.state, 'telephony_server'):
+        # Over capacity: answer with the pre-rendered overflow TwiML before touching the pipeline
+        admission = app.state.admission
+        if admission is not None and not await admission.acquire(call_sid, reserve=True):
+            return twiml_response(app.state.twiml.overflow)
+        
+        try:
+            await app.state.call_handler.start_call(call_sid, from_number, to_number)
+            
             # The telephony server will handle the WebSocket connection
             # and manage the conversation flow
-            response = await app.state.telephony_server.handle_inbound_call(request)
-            return response
-        else:
-            # Fallback if telephony server not initialized
-            logger.error("Telephony server not initialized")
-            response = VoiceResponse()
-            response.say(
-                "Mi dispiace, il servizio non è al momento disponibile. Riprova più tardi.",
-                language="it-IT"
-            )
-            return PlainTextResponse(str(response), media_type="text/xml")
+            return await connect_twilio_call(call_sid, from_number, to_number)
+        except Exception:
+            if admission is not None:
+                admission.release(call_sid)
+            raise
             
     except Exception as e:
         logger.error(f"Error handling Twilio call: {e}", exc_info=True)
         ERRORS_TOTAL.labels(error_type="twilio_handler").inc()
         
         # Return error response to Twilio
-        response = VoiceResponse()
-        response.say(
-            "Si è verificato un errore. Per favore riprova più tardi.",
-            language="it-IT"
-        )
-        return PlainTextResponse(str(response), media_type="text/xml")
+        return twiml_response(app.state.twiml.error)
+    finally:
+        TWILIO_WEBHOOK_SECONDS.labels(endpoint="voice").observe(time.perf_counter() - started)
 
 
 @app.post("/webhooks/twilio/status")
@@ -226,16 +727,39 @@ async def handle_twilio_status(request: Request):
     """
     Webhook handler for Twilio call status updates
     """
+    started = time.perf_counter()
+    call_sid = call_status = None
     try:
-        form_data = await request.form()
+        form_data, rejected = await app.state.twilio_guard.read(request, "status")
+        if rejected is not None:
+            return Response(status_code=rejected)
         call_sid = form_data.get("CallSid", "Unknown")
         call_status = form_data.get("CallStatus", "Unknown")
         
+        # Twilio retries a callback it got no timely answer for: the repeat only needs a 200
+        if not await app.state.status_dedup.first_delivery(call_sid, call_status):
+            TWILIO_WEBHOOKS_TOTAL.labels(endpoint="status", result="duplicate").inc()
+            return {"status": "ok"}
+        TWILIO_WEBHOOKS_TOTAL.labels(endpoint="status", result="accepted").inc()
+        
         logger.info(f"Call status update - SID: {call_sid}, Status: {call_status}")
         
         if call_status in ["completed", "failed", "busy", "no-answer"]:
             duration = form_data.get("CallDuration", "0")
             logger.info(f"Call {call_sid} ended with status {call_status}, duration: {duration}s")
+            # The callback may land on any replica; the registry is shared through Redis
+            call_info = await app.state.call_handler.end_call(call_sid, status=call_status)
+            if call_info is None and app.state.call_store is not None:
+                # Not in the registry (no Redis and another replica took the call): store what Twilio reports
+                app.state.call_store.record_call({
+                    "call_sid": call_sid,
+                    "from_number": form_data.get("From"),
+                    "to_number": form_data.get("To"),
+                    "status": call_status,
+                    "duration": float(duration) if duration and duration.isdigit() else None,
+                }, provider="twilio")
+            if app.state.admission is not None:
+                app.state.admission.release(call_sid)
             
             if duration and duration.isdigit():
                 CALLS_DURATION.observe(float(duration))
@@ -244,7 +768,12 @@ async def handle_twilio_status(request: Request):
         
     except Exception as e:
         logger.error(f"Error handling status callback: {e}", exc_info=True)
+        if call_sid is not None:
+            # Not processed: Twilio's retry must not be taken for a duplicate
+            await app.state.status_dedup.forget(call_sid, call_status)
         return {"status": "error", "message": str(e)}
+    finally:
+        TWILIO_WEBHOOK_SECONDS.labels(endpoint="status").observe(time.perf_counter() - started)
 
 
 @app.get("/config")
@@ -259,9 +788,85 @@ async def get_config():
         "initial_message": settings.initial_message,
         "openai_model": settings.openai_model,
         "elevenlabs_voice": settings.elevenlabs_voice_id,
+        "assistant_config": app.state.assistant_config.status(),
+        "tenants": app.state.tenants.status(),
+        "llm_dispatch": app.state.llm_dispatcher.status() if app.state.llm_dispatcher is not None else None,
     }
 
 
+def require_admin(request: Request) -> None:
+    """Verifica il bearer token degli endpoint /admin (disabilitati senza ADMIN_TOKEN)"""
+    if not settings.admin_token:
+        raise HTTPException(status_code=404, detail="Not Found")
+    supplied = request.headers.get("Authorization", "")
+    if not hmac.compare_digest(supplied.encode(), f"Bearer {settings.admin_token}".encode()):
+        raise HTTPException(status_code=401, detail="Invalid admin token")
+
+
+@app.get("/admin/drain")
+async def get_drain_status(request: Request):
+    """
+    Drain progress: calls still running on this pod and elapsed time
+    """
+    require_admin(request)
+    return app.state.drain.status()
+
+
+@app.post("/admin/drain")
+async def start_drain(request: Request):
+    """
+    Start draining: /ready turns 503 and new calls go to other replicas.
+    The process keeps running; SIGTERM still shuts it down after the drain
+    """
+    require_admin(request)
+    app.state.drain.start("admin")
+    if worker is not None:
+        worker.broadcast_drain(True)
+    return app.state.drain.status()
+
+
+@app.delete("/admin/drain")
+async def cancel_drain(request: Request):
+    """
+    Cancel an admin drain and accept calls again (a SIGTERM drain cannot be cancelled)
+    """
+    require_admin(request)
+    if not app.state.drain.resume():
+        raise HTTPException(status_code=409, detail="No admin drain in progress")
+    if worker is not None:
+        worker.broadcast_drain(False)
+    return app.state.drain.status()
+
+
+@app.get("/debug/profile")
+async def debug_profile(request: Request, seconds: float = 0, format: str = "json"):
+    """
+    Event loop health of this process: recent stalls with their stack,
+    resources of the running calls and, with seconds > 0, a sampling
+    profile of the event loop thread (format=folded for flame graphs)
+    """
+    require_admin(request)
+    seconds = min(max(seconds, 0.0), settings.debug_profile_max_seconds)
+    profiler = app.state.call_profiler
+    result = {
+        "worker": worker.index if worker is not None else 0,
+        "stalls": list(app.state.loop_monitor.stalls),
+        "tasks": len(asyncio.all_tasks()),
+        "calls": profiler.snapshot() if profiler is not None else None,
+    }
+    if seconds <= 0:
+        return result
+    if app.state.profile_lock.locked():
+        raise HTTPException(status_code=409, detail="A profile is already running")
+    async with app.state.profile_lock:
+        # Sampled from a thread: the loop keeps serving calls while it is observed
+        stacks = await asyncio.to_thread(sample_stacks, threading.get_ident(), seconds)
+    if format == "folded":
+        return PlainTextResponse("".join(f"{stack} {samples}\n" for stack, samples in stacks.most_common()))
+    result["profile"] = {"seconds": seconds, **summarize_stacks(stacks)}
+    return result
+
+
 @app.post("/webhooks/sip/webrtc")
 async def handle_sip_webrtc(request: Request):
     """
@@ -270,6 +875,9 @@ async def handle_sip_webrtc(request: Request):
     """
     if settings.telephony_provider != "sip":
         raise HTTPException(status_code=400, detail="SIP provider not configured")
+    if app.state.drain.draining:
+        app.state.drain.reject("sip")
+        raise HTTPException(status_code=503, detail="Node draining", headers={"Retry-After": "1"})
     
     try:
         CALLS_TOTAL.inc()
@@ -282,7 +890,7 @@ async def handle_sip_webrtc(request: Request):
         
         logger.info(f"SIP WebRTC call - ID: {call_id}, From: {from_uri}, To: {to_uri}")
         
-        sip_handler = get_sip_handler()
+        sip_handler = getattr(app.state, "sip_handler", None)
         if not sip_handler:
             raise HTTPException(status_code=500, detail="SIP handler not initialized")
         
@@ -310,14 +918,14 @@ async def get_sip_status():
     if settings.telephony_provider != "sip":
         return {"provider": settings.telephony_provider, "sip_enabled": False}
     
-    sip_handler = get_sip_handler()
+    sip_handler = getattr(app.state, "sip_handler", None)
     if not sip_handler:
         return {"status": "not_initialized"}
     
     active_calls = await sip_handler.get_active_calls()
     
     return {
-        "status": "connected",
+        "status": "connected" if sip_handler.registered else "not_registered",
         "sip_server": settings.sip_server,
         "sip_username": settings.sip_username,
         "active_calls": len(active_calls),
@@ -326,11 +934,28 @@ async def get_sip_status():
 
 
 if __name__ == "__main__":
-    # Run the application
-    uvicorn.run(
-        "main:app",
-        host="0.0.0.0",
-        port=int(os.getenv("PORT", "8080")),
-        log_level="info",
-        access_log=True,
-    )
+    port = int(os.getenv("PORT", "8080"))
+    if settings.workers > 1:
+        from services.workers import serve_workers
+        
+        # One process per core: the supervisor hands each connection to the worker owning its call
+        serve_workers(
+            "main:app",
+            host="0.0.0.0",
+            port=port,
+            workers=settings.workers,
+            state_dir=settings.worker_state_dir,
+            log_level="info",
+            access_log=True,
+        )
+    else:
+        import uvicorn
+        
+        # Run the application
+        uvicorn.run(
+            "main:app",
+            host="0.0.0.0",
+            port=port,
+            log_level="info",
+            access_log=True,
+        )
@@ -0,0 +1,116 @@
+"""
+Event Loop - Monitoraggio del ritardo dell'event loop asyncio
+
+Un task campiona periodicamente quanto in ritardo si risveglia rispetto al
+previsto: un ritardo alto significa che una callback sincrona sta
+bloccando il loop (e quindi i frame audio di tutte le chiamate del pod).
+
+Un thread di guardia controlla che il task si risvegli: se il loop resta
+bloccato oltre stall_threshold cattura lo stack del thread del loop
+mentre il blocco è in corso (quindi la funzione colpevole, non chi viene
+dopo) e la chiamata a cui apparteneva il passo in esecuzione. Gli ultimi
+blocchi restano in memoria per /debug/profile.
+"""
+
+import asyncio
+import logging
+import sys
+import threading
+import time
+from collections import deque
+from datetime import datetime, timezone
+from typing import Any, Deque, Dict, Optional
+
+from prometheus_client import Counter, Histogram
+
+from monitoring.profiling import format_stack, running_call
+
+logger = logging.getLogger(__name__)
+
+EVENT_LOOP_LAG_SECONDS = Histogram(
+    'voice_assistant_event_loop_lag_seconds',
+    'Delay of the asyncio event loop in waking up a periodic probe',
+    buckets=(0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5),
+)
+EVENT_LOOP_STALLS_TOTAL = Counter(
+    'voice_assistant_event_loop_stalls_total',
+    'Event loop blocked longer than the stall threshold (stack captured)',
+)
+
+
+class EventLoopLagMonitor:
+    """
+    Campiona il ritardo dell'event loop ed esporta l'istogramma
+
+    Args:
+        interval: Secondi tra due risvegli del task di misura
+        stall_threshold: Blocco oltre il quale viene catturato lo stack (0 = nessun thread di guardia)
+        max_stalls: Blocchi recenti conservati per /debug/profile
+    """
+
+    def __init__(self, interval: float = 0.1, stall_threshold: float = 0.1, max_stalls: int = 20):
+        self.interval = interval
+        self.stall_threshold = stall_threshold
+        self.stalls: Deque[Dict[str, Any]] = deque(maxlen=max_stalls)
+        self._task: Optional[asyncio.Task] = None
+        self._heartbeat = time.monotonic()
+        self._reported_beat: Optional[float] = None
+        self._loop_thread_id: Optional[int] = None
+        self._watchdog: Optional[threading.Thread] = None
+        self._stopped = threading.Event()
+
+    def start(self) -> None:
+        if self._task is None:
+            self._heartbeat = time.monotonic()
+            self._task = asyncio.create_task(self._run())
+            if self.stall_threshold > 0:
+                self._loop_thread_id = threading.get_ident()
+                self._stopped.clear()
+                self._watchdog = threading.Thread(target=self._watch, name="event-loop-watchdog", daemon=True)
+                self._watchdog.start()
+            logger.info(f"Event loop lag monitor started (interval {self.interval}s)")
+
+    async def stop(self) -> None:
+        self._stopped.set()
+        if self._task is not None:
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+            self._task = None
+
+    async def _run(self) -> None:
+        while True:
+            start = self._heartbeat = time.monotonic()
+            await asyncio.sleep(self.interval)
+            lag = max(0.0, time.monotonic() - start - self.interval)
+            EVENT_LOOP_LAG_SECONDS.observe(lag)
+            if self._reported_beat == start and self.stalls:
+                # The watchdog caught this one while it was blocked: record how long it lasted
+                self.stalls[-1]["lag_ms"] = round(lag * 1000, 1)
+
+    def _watch(self) -> None:
+        while not self._stopped.wait(self.stall_threshold / 2):
+            beat = self._heartbeat
+            blocked = time.monotonic() - beat - self.interval
+            if blocked < self.stall_threshold or beat == self._reported_beat:
+                continue
+            frame = sys._current_frames().get(self._loop_thread_id)
+            stack = format_stack(frame) if frame is not None else []
+            del frame
+            call = running_call()
+            self._reported_beat = beat
+            EVENT_LOOP_STALLS_TOTAL.inc()
+            self.stalls.append({
+                "at": datetime.now(timezone.utc).isoformat(),
+                "blocked_ms": round(blocked * 1000, 1),
+                "lag_ms": None,
+                "call_id": call.call_id if call is not None else None,
+                "stack": stack,
+            })
+            logger.warning(
+                f"Event loop blocked for {blocked * 1000:.0f}ms"
+                + (f" (call {call.call_id})" if call is not None else "")
+                + f", in: {' <- '.join(stack[:6])}"
+            )
@@ -0,0 +1,243 @@
+"""
+Latency - Metriche di latenza per turno della conversazione
+
+Ogni turno (utente parla -> assistente risponde) viene scomposto in quattro
+fasi, esportate come istogrammi Prometheus:
+
+    fine parlato -> trascrizione finale      (STT / endpointing)
+    trascrizione finale -> primo token LLM   (LLM)
+    primo token LLM -> primo byte TTS        (TTS)
+    primo byte TTS -> primo frame audio      (invio audio al chiamante)
+"""
+
+import logging
+import time
+from typing import Any, AsyncGenerator, Dict, List, Optional
+
+from prometheus_client import Histogram
+
+logger = logging.getLogger(__name__)
+
+LATENCY_BUCKETS = (0.025, 0.05, 0.1, 0.2, 0.3, 0.5, 0.75, 1.0, 1.5, 2.0, 3.0, 5.0, 10.0)
+
+STT_ENDPOINTING_SECONDS = Histogram(
+    'voice_assistant_stt_endpointing_seconds',
+    'End of caller speech to final transcript',
+    ['provider', 'model'],
+    buckets=LATENCY_BUCKETS,
+)
+LLM_FIRST_TOKEN_SECONDS = Histogram(
+    'voice_assistant_llm_first_token_seconds',
+    'Final transcript to first LLM token',
+    ['provider', 'model'],
+    buckets=LATENCY_BUCKETS,
+)
+TTS_FIRST_BYTE_SECONDS = Histogram(
+    'voice_assistant_tts_first_byte_seconds',
+    'First LLM token to first synthesized audio byte',
+    ['provider', 'model'],
+    buckets=LATENCY_BUCKETS,
+)
+AUDIO_FIRST_FRAME_SECONDS = Histogram(
+    'voice_assistant_audio_first_frame_seconds',
+    'First synthesized audio byte to first audio frame sent to the caller',
+    ['provider'],
+    buckets=LATENCY_BUCKETS,
+)
+TURN_LATENCY_SECONDS = Histogram(
+    'voice_assistant_turn_latency_seconds',
+    'End of caller speech to first audio frame sent to the caller',
+    buckets=LATENCY_BUCKETS,
+)
+
+STAGES = ("endpointing", "llm_first_token", "tts_first_byte", "audio_first_frame", "turn")
+
+
+def provider_label(config: Any) -> str:
+    """Ricava il nome del provider dal tipo della config Vocode (es. "transcriber_deepgram" -> "deepgram")"""
+    config_type = getattr(config, "type", None) or "unknown"
+    return str(config_type).split("_", 1)[-1]
+
+
+def _percentile(values: List[float], fraction: float) -> float:
+    ordered = sorted(values)
+    index = min(len(ordered) - 1, int(round(fraction * (len(ordered) - 1))))
+    return ordered[index]
+
+
+class TurnLatencyTracker:
+    """Misura le fasi di ogni turno di una chiamata"""
+
+    def __init__(
+        self,
+        conversation_id: str,
+        stt_labels: Dict[str, str],
+        llm_labels: Dict[str, str],
+        tts_labels: Dict[str, str],
+        telephony_provider: str,
+    ):
+        self.conversation_id = conversation_id
+        self.stt_labels = stt_labels
+        self.llm_labels = llm_labels
+        self.tts_labels = tts_labels
+        self.telephony_provider = telephony_provider
+
+        self.samples: Dict[str, List[float]] = {stage: [] for stage in STAGES}
+        self._last_interim = ""
+        self._end_of_speech_at: Optional[float] = None
+        self.uses_local_vad = False  # set when a local VAD reports end of speech
+        self._reset_turn()
+
+    def _reset_turn(self) -> None:
+        self._turn_speech_end: Optional[float] = None
+        self._final_at: Optional[float] = None
+        self._first_token_at: Optional[float] = None
+        self._first_tts_at: Optional[float] = None
+        self._first_frame_at: Optional[float] = None
+
+    def _record(self, stage: str, seconds: float) -> None:
+        self.samples[stage].append(seconds)
+
+    def mark_end_of_speech(self, at: Optional[float] = None) -> None:
+        """Segnala la fine del parlato del chiamante (es. da un VAD locale)"""
+        self._end_of_speech_at = at if at is not None else time.monotonic()
+
+    def on_transcription(self, message: str, is_final: bool) -> None:
+        """Da chiamare per ogni trascrizione (parziale o finale) del transcriber"""
+        now = time.monotonic()
+        if not is_final:
+            # Without a local VAD, the last time the interim text changed approximates end of speech
+            if not self.uses_local_vad and message.strip() and message != self._last_interim:
+                self._last_interim = message
+                self._end_of_speech_at = now
+            return
+
+        self._reset_turn()
+        self._final_at = now
+        self._turn_speech_end = self._end_of_speech_at or now
+        self._last_interim = ""
+        self._end_of_speech_at = None
+
+        seconds = now - self._turn_speech_end
+        STT_ENDPOINTING_SECONDS.labels(**self.stt_labels).observe(seconds)
+        self._record("endpointing", seconds)
+
+    def mark_first_llm_token(self, provider: Optional[str] = None, model: Optional[str] = None) -> None:
+        """Segnala il primo token dell'LLM (o la risposta immediata di uno scenario)"""
+        if self._final_at is None or self._first_token_at is not None:
+            return
+        self._first_token_at = time.monotonic()
+        labels = dict(self.llm_labels)
+        if provider:
+            labels["provider"] = provider
+        if model:
+            labels["model"] = model
+        seconds = self._first_token_at - self._final_at
+        LLM_FIRST_TOKEN_SECONDS.labels(**labels).observe(seconds)
+        self._record("llm_first_token", seconds)
+
+    def mark_first_tts_byte(self) -> None:
+        """Segnala il primo chunk audio prodotto dal synthesizer nel turno"""
+        if self._first_token_at is None or self._first_tts_at is not None:
+            return
+        self._first_tts_at = time.monotonic()
+        seconds = self._first_tts_at - self._first_token_at
+        TTS_FIRST_BYTE_SECONDS.labels(**self.tts_labels).observe(seconds)
+        self._record("tts_first_byte", seconds)
+
+    def mark_first_audio_frame(self) -> None:
+        """Segnala il primo frame audio consegnato al trasporto verso il chiamante"""
+        if self._first_tts_at is None or self._first_frame_at is not None:
+            return
+        self._first_frame_at = time.monotonic()
+        seconds = self._first_frame_at - self._first_tts_at
+        AUDIO_FIRST_FRAME_SECONDS.labels(provider=self.telephony_provider).observe(seconds)
+        self._record("audio_first_frame", seconds)
+
+        turn_seconds = self._first_frame_at - self._turn_speech_end
+        TURN_LATENCY_SECONDS.observe(turn_seconds)
+        self._record("turn", turn_seconds)
+
+    @property
+    def turn_speech_end(self) -> Optional[float]:
+        """Fine del parlato del chiamante nel turno in corso (time.monotonic), None senza turno aperto"""
+        return self._turn_speech_end
+
+    def pending_stage(self) -> Optional[str]:
+        """Fase del turno in corso non ancora conclusa (None se l'audio di risposta è già partito)"""
+        if self._final_at is None or self._first_frame_at is not None:
+            return None
+        if self._first_token_at is None:
+            return "llm_first_token"
+        if self._first_tts_at is None:
+            return "tts_first_byte"
+        return "audio_first_frame"
+
+    def summary(self) -> Dict[str, Dict[str, float]]:
+        """Ritorna count/p50/p95/max in millisecondi per ogni fase"""
+        result: Dict[str, Dict[str, float]] = {}
+        for stage, values in self.samples.items():
+            if not values:
+                continue
+            result[stage] = {
+                "count": len(values),
+                "p50_ms": round(_percentile(values, 0.5) * 1000, 1),
+                "p95_ms": round(_percentile(values, 0.95) * 1000, 1),
+                "max_ms": round(max(values) * 1000, 1),
+            }
+        return result
+
+    def log_summary(self) -> None:
+        summary = self.summary()
+        if not summary:
+            return
+        parts = [
+            f"{stage}=p50 {s['p50_ms']}ms/p95 {s['p95_ms']}ms (n={s['count']})"
+            for stage, s in summary.items()
+        ]
+        logger.info(f"Latency summary for conversation {self.conversation_id}: {', '.join(parts)}")
+
+
+def instrument_conversation(conversation: Any, tracker: TurnLatencyTracker) -> None:
+    """
+    Aggancia il tracker ai componenti di una StreamingConversation di Vocode
+
+    Vocode non espone hook per fase, quindi vengono avvolti sull'istanza:
+    la coda di output del transcriber, create_speech del synthesizer e
+    consume_nonblocking dell'output device.
+    """
+    transcription_queue = conversation.transcriber.output_queue
+    queue_put_nowait = transcription_queue.put_nowait
+
+    def put_transcription(transcription):
+        tracker.on_transcription(transcription.message, transcription.is_final)
+        queue_put_nowait(transcription)
+
+    transcription_queue.put_nowait = put_transcription
+
+    synthesizer = conversation.synthesizer
+    create_speech = synthesizer.create_speech
+
+    async def timed_chunks(chunk_generator: AsyncGenerator) -> AsyncGenerator:
+        first = True
+        async for chunk_result in chunk_generator:
+            if first:
+                tracker.mark_first_tts_byte()
+                first = False
+            yield chunk_result
+
+    async def create_speech_timed(*args, **kwargs):
+        result = await create_speech(*args, **kwargs)
+        result.chunk_generator = timed_chunks(result.chunk_generator)
+        return result
+
+    synthesizer.create_speech = create_speech_timed
+
+    output_device = conversation.output_device
+    consume_nonblocking = output_device.consume_nonblocking
+
+    def consume_timed(chunk):
+        consume_nonblocking(chunk)
+        tracker.mark_first_audio_frame()
+
+    output_device.consume_nonblocking = consume_timed
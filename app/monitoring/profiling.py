@@ -0,0 +1,295 @@
+"""
+Profiling - Costo per chiamata sull'event loop e profilo a campionamento
+
+Tutte le chiamate del pod condividono un solo event loop, quindi il tempo
+di CPU di una chiamata è la somma dei passi dei suoi task. Il CallProfiler
+installa una task factory che avvolge la coroutine di ogni task: a ogni
+passo, se il contesto del task appartiene a una chiamata (CURRENT_CALL,
+impostato da enter_call e ereditato dai task che crea), misura il tempo di
+CPU del thread e lo somma al CallProfile. Funziona anche con uvloop, dove
+gli Handle non sono in Python. Il CallProfile conta anche i byte audio
+ricevuti e inviati e i task vivi della chiamata.
+
+sample_stacks() campiona dallo stack del thread dell'event loop da un
+altro thread (nessun costo quando non è in uso) e produce gli stack in
+formato "folded", leggibile da flamegraph.pl e speedscope.
+"""
+
+import asyncio
+import collections.abc
+import logging
+import os
+import sys
+import threading
+import time
+import weakref
+from collections import Counter as StackCounter
+from contextvars import ContextVar
+from typing import Any, Dict, List, Optional
+
+from prometheus_client import Gauge, Histogram
+
+logger = logging.getLogger(__name__)
+
+ASYNCIO_TASKS = Gauge(
+    'voice_assistant_asyncio_tasks',
+    'Live asyncio tasks, by owner',
+    ['owner'],  # call, other
+    multiprocess_mode='livesum',
+)
+CALL_CPU_SECONDS = Histogram(
+    'voice_assistant_call_cpu_seconds',
+    'Event loop CPU time spent on one call',
+    buckets=(0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 25.0, 60.0),
+)
+CALL_AUDIO_BYTES = Histogram(
+    'voice_assistant_call_audio_bytes',
+    'Audio bytes moved by one call',
+    ['direction'],  # inbound, outbound
+    buckets=(1e4, 1e5, 5e5, 1e6, 2.5e6, 5e6, 1e7, 2.5e7),
+)
+CALL_TASKS_MAX = Histogram(
+    'voice_assistant_call_tasks_max',
+    'Peak number of live asyncio tasks of one call',
+    buckets=(5, 10, 15, 20, 30, 50, 100),
+)
+
+CURRENT_CALL: ContextVar[Optional["CallProfile"]] = ContextVar("current_call", default=None)
+
+# Call whose task step is running on the loop thread (read by the stall watchdog)
+_running: Optional["CallProfile"] = None
+
+
+def enter_call(profile: Optional["CallProfile"]) -> None:
+    """Attribuisce alla chiamata il task corrente e i task che creerà"""
+    if profile is not None:
+        CURRENT_CALL.set(profile)
+
+
+def running_call() -> Optional["CallProfile"]:
+    """Chiamata il cui task è in esecuzione sull'event loop (anche da un altro thread)"""
+    return _running
+
+
+class CallProfile:
+    """Risorse usate da una chiamata: CPU dell'event loop, byte audio, task"""
+
+    def __init__(self, call_id: str):
+        self.call_id = call_id
+        self.started_at = time.monotonic()
+        self.cpu_seconds = 0.0
+        self.bytes_in = 0
+        self.bytes_out = 0
+        self.tasks: "weakref.WeakSet[asyncio.Task]" = weakref.WeakSet()
+        self.max_tasks = 0
+
+    def live_tasks(self) -> int:
+        return sum(1 for task in list(self.tasks) if not task.done())
+
+    def attach(self, conversation: Any) -> None:
+        """Conta i byte di receive_audio e di consume_nonblocking dell'output device"""
+        receive_audio = conversation.receive_audio
+
+        def receive_audio_counted(chunk: bytes):
+            self.bytes_in += len(chunk)
+            receive_audio(chunk)
+
+        conversation.receive_audio = receive_audio_counted
+
+        output_device = conversation.output_device
+        consume_nonblocking = output_device.consume_nonblocking
+
+        def consume_counted(chunk: bytes):
+            self.bytes_out += len(chunk)
+            consume_nonblocking(chunk)
+
+        output_device.consume_nonblocking = consume_counted
+
+    def snapshot(self) -> Dict[str, Any]:
+        return {
+            "call_id": self.call_id,
+            "duration_s": round(time.monotonic() - self.started_at, 1),
+            "cpu_ms": round(self.cpu_seconds * 1000, 1),
+            "bytes_in": self.bytes_in,
+            "bytes_out": self.bytes_out,
+            "tasks": self.live_tasks(),
+            "max_tasks": self.max_tasks,
+        }
+
+
+class MeteredCoroutine(collections.abc.Coroutine):
+    """Coroutine di un task che somma il tempo di CPU di ogni passo alla chiamata del contesto"""
+
+    __slots__ = ("_coro",)
+
+    def __init__(self, coro):
+        self._coro = coro
+
+    def send(self, value):
+        profile = CURRENT_CALL.get()
+        if profile is None:
+            return self._coro.send(value)
+        return self._step(profile, self._coro.send, value)
+
+    def throw(self, *args):
+        profile = CURRENT_CALL.get()
+        if profile is None:
+            return self._coro.throw(*args)
+        return self._step(profile, self._coro.throw, *args)
+
+    @staticmethod
+    def _step(profile: CallProfile, method, *args):
+        global _running
+        previous, _running = _running, profile
+        started = time.thread_time()
+        try:
+            return method(*args)
+        finally:
+            profile.cpu_seconds += time.thread_time() - started
+            _running = previous
+
+    def close(self):
+        return self._coro.close()
+
+    def __await__(self):
+        return self._coro.__await__()
+
+    def __getattr__(self, name):
+        # cr_frame, cr_await, __qualname__...: Task.get_stack() and task reprs keep working
+        return getattr(self._coro, name)
+
+    def __repr__(self):
+        return repr(self._coro)
+
+
+class CallProfiler:
+    """
+    Profili delle chiamate in corso di un processo
+
+    Args:
+        sample_interval: Secondi tra due conteggi dei task asyncio
+    """
+
+    def __init__(self, sample_interval: float = 1.0):
+        self.sample_interval = sample_interval
+        self.calls: Dict[str, CallProfile] = {}
+        self.loop_thread_id: Optional[int] = None
+        self._previous_factory = None
+        self._task: Optional[asyncio.Task] = None
+
+    def install(self) -> None:
+        """Installa la task factory sul loop corrente e avvia il conteggio dei task"""
+        loop = asyncio.get_running_loop()
+        self.loop_thread_id = threading.get_ident()
+        self._previous_factory = loop.get_task_factory()
+        loop.set_task_factory(self._task_factory)
+        self._task = asyncio.create_task(self._sample())
+
+    async def stop(self) -> None:
+        if self._task is not None:
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+            self._task = None
+
+    def _task_factory(self, loop, coro, **kwargs):
+        metered = MeteredCoroutine(coro)
+        if self._previous_factory is not None:
+            task = self._previous_factory(loop, metered, **kwargs)
+        else:
+            task = asyncio.Task(metered, loop=loop, **kwargs)
+        profile = CURRENT_CALL.get()
+        if profile is not None:
+            profile.tasks.add(task)
+        return task
+
+    def start_call(self, call_id: str, conversation: Any) -> CallProfile:
+        """Crea il profilo di una chiamata e ne conta i byte audio"""
+        profile = CallProfile(call_id)
+        profile.attach(conversation)
+        self.calls[call_id] = profile
+        return profile
+
+    def end_call(self, profile: CallProfile) -> None:
+        if self.calls.pop(profile.call_id, None) is None:
+            return
+        CALL_CPU_SECONDS.observe(profile.cpu_seconds)
+        CALL_AUDIO_BYTES.labels(direction="inbound").observe(profile.bytes_in)
+        CALL_AUDIO_BYTES.labels(direction="outbound").observe(profile.bytes_out)
+        CALL_TASKS_MAX.observe(profile.max_tasks)
+        logger.info(
+            f"Resources of call {profile.call_id}: loop CPU {profile.cpu_seconds * 1000:.0f}ms, "
+            f"audio {profile.bytes_in} bytes in / {profile.bytes_out} out, peak {profile.max_tasks} tasks"
+        )
+
+    def snapshot(self) -> List[Dict[str, Any]]:
+        """Profili delle chiamate in corso, dalla più costosa"""
+        profiles = sorted(self.calls.values(), key=lambda profile: profile.cpu_seconds, reverse=True)
+        return [profile.snapshot() for profile in profiles]
+
+    async def _sample(self) -> None:
+        while True:
+            await asyncio.sleep(self.sample_interval)
+            total = len(asyncio.all_tasks())
+            owned = 0
+            for profile in list(self.calls.values()):
+                live = profile.live_tasks()
+                profile.max_tasks = max(profile.max_tasks, live)
+                owned += live
+            ASYNCIO_TASKS.labels(owner="call").set(owned)
+            ASYNCIO_TASKS.labels(owner="other").set(max(0, total - owned))
+
+
+# --- Sampling profiler ------------------------------------------------------
+
+def _frame_name(frame) -> str:
+    code = frame.f_code
+    return f"{os.path.basename(code.co_filename)}:{code.co_name}"
+
+
+def format_stack(frame, limit: int = 12) -> List[str]:
+    """Ultime `limit` funzioni di uno stack, dalla più interna ("file:funzione:riga")"""
+    lines = []
+    while frame is not None and len(lines) < limit:
+        lines.append(f"{_frame_name(frame)}:{frame.f_lineno}")
+        frame = frame.f_back
+    return lines
+
+
+def sample_stacks(thread_id: int, seconds: float, interval: float = 0.005) -> StackCounter:
+    """
+    Campiona lo stack di un thread (da un altro thread)
+
+    Returns:
+        Counter degli stack in formato folded ("radice;...;foglia" -> campioni)
+    """
+    stacks: StackCounter = StackCounter()
+    deadline = time.monotonic() + seconds
+    while time.monotonic() < deadline:
+        frame = sys._current_frames().get(thread_id)
+        names = []
+        while frame is not None:
+            names.append(_frame_name(frame))
+            frame = frame.f_back
+        if names:
+            stacks[";".join(reversed(names))] += 1
+        time.sleep(interval)
+    return stacks
+
+
+def summarize_stacks(stacks: StackCounter, top: int = 30) -> Dict[str, Any]:
+    """Funzioni con più campioni: self (in cima allo stack) e total (ovunque nello stack)"""
+    own: StackCounter = StackCounter()
+    total: StackCounter = StackCounter()
+    for stack, samples in stacks.items():
+        names = stack.split(";")
+        own[names[-1]] += samples
+        for name in set(names):
+            total[name] += samples
+    return {
+        "samples": sum(stacks.values()),
+        "self": [{"function": name, "samples": samples} for name, samples in own.most_common(top)],
+        "total": [{"function": name, "samples": samples} for name, samples in total.most_common(top)],
+    }
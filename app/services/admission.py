@@ -0,0 +1,209 @@
+"""
+Admission Control - Limite di chiamate contemporanee per pod
+
+Ogni pod accetta al massimo max_live_calls chiamate. Oltre il limite una
+nuova chiamata attende in una coda breve (max_queue posti, queue_timeout
+secondi) e, se nessun posto si libera, riceve la risposta di overflow
+(TwiML pre-renderizzato o 486 Busy per SIP) invece di rallentare tutte le
+chiamate già in corso sul pod.
+
+Per Twilio il posto viene prenotato al webhook e confermato quando lo
+stream media arriva al pod; se lo stream non arriva (il chiamante chiude,
+il WebSocket finisce su un'altra replica) la prenotazione scade dopo
+reservation_ttl secondi. Le chiamate SIP occupano il posto dall'INVITE
+alla chiusura del dialogo.
+
+Le gauge esportate (chiamate vive, coda, headroom) sono pensate per un
+HorizontalPodAutoscaler su metriche custom (kubernetes/hpa.yaml).
+"""
+
+import asyncio
+import logging
+import time
+from collections import deque
+from typing import Deque, Dict, Optional, Tuple
+
+from prometheus_client import Counter, Gauge
+
+logger = logging.getLogger(__name__)
+
+LIVE_CALLS = Gauge(
+    'voice_assistant_live_calls',
+    'Calls holding a slot on this pod (connected or reserved by the webhook)',
+    multiprocess_mode='livesum',
+)
+ADMISSION_QUEUE_DEPTH = Gauge(
+    'voice_assistant_admission_queue_depth',
+    'Calls waiting for a free slot on this pod',
+    multiprocess_mode='livesum',
+)
+CALL_HEADROOM = Gauge(
+    'voice_assistant_call_headroom',
+    'Free call slots on this pod',
+    multiprocess_mode='livesum',
+)
+MAX_LIVE_CALLS = Gauge(
+    'voice_assistant_max_live_calls',
+    'Configured call slots of this pod',
+    multiprocess_mode='livesum',
+)
+ADMISSIONS_TOTAL = Counter(
+    'voice_assistant_admissions_total',
+    'Admission decisions for new calls',
+    ['result'],  # admitted, queued (admitted after waiting), rejected
+)
+
+
+class AdmissionController:
+    """
+    Semaforo delle chiamate del pod con coda FIFO breve
+
+    Args:
+        max_live_calls: Chiamate contemporanee massime sul pod
+        max_queue: Chiamate che possono attendere un posto (0 = nessuna attesa)
+        queue_timeout: Secondi massimi di attesa in coda
+        reservation_ttl: Secondi dopo i quali una prenotazione mai confermata scade
+    """
+
+    def __init__(
+        self,
+        max_live_calls: int,
+        max_queue: int = 0,
+        queue_timeout: float = 2.0,
+        reservation_ttl: float = 15.0,
+    ):
+        self.max_live_calls = max_live_calls
+        self.max_queue = max_queue
+        self.queue_timeout = queue_timeout
+        self.reservation_ttl = reservation_ttl
+        # call id -> reservation deadline (monotonic), None once the call is connected
+        self._calls: Dict[str, Optional[float]] = {}
+        self._waiters: Deque[Tuple[asyncio.Future, str, Optional[float]]] = deque()
+        MAX_LIVE_CALLS.set(max_live_calls)
+        self._update_gauges()
+
+    @property
+    def live_calls(self) -> int:
+        self._expire_reservations()
+        return len(self._calls)
+
+    @property
+    def queue_depth(self) -> int:
+        return len(self._waiters)
+
+    @property
+    def headroom(self) -> int:
+        return max(0, self.max_live_calls - self.live_calls)
+
+    async def acquire(self, call_id: str, reserve: bool = False) -> bool:
+        """
+        Occupa un posto per la chiamata, attendendo in coda se il pod è pieno
+
+        Args:
+            call_id: ID della chiamata (CallSid Twilio, Call-ID SIP)
+            reserve: True se il posto è solo prenotato e va confermato con connected()
+                entro reservation_ttl; False se resta occupato fino a release()
+
+        Returns:
+            True se la chiamata è ammessa, False se va rifiutata
+        """
+        self._expire_reservations()
+        ttl = self.reservation_ttl if reserve else None
+        if call_id in self._calls:
+            return True  # Webhook retried by Twilio
+        if not self._waiters and len(self._calls) < self.max_live_calls:
+            self._hold(call_id, ttl)
+            ADMISSIONS_TOTAL.labels(result="admitted").inc()
+            return True
+        if len(self._waiters) >= self.max_queue:
+            return self._reject(call_id)
+
+        waiter = asyncio.get_running_loop().create_future()
+        entry = (waiter, call_id, ttl)
+        self._waiters.append(entry)
+        self._update_gauges()
+        deadline = time.monotonic() + self.queue_timeout
+        try:
+            while not waiter.done():
+                remaining = deadline - time.monotonic()
+                if remaining <= 0:
+                    break
+                # Wake up for released slots and for reservations that expire meanwhile
+                await asyncio.wait([waiter], timeout=min(remaining, self._next_expiry()))
+                self._expire_reservations()
+        finally:
+            if not waiter.done():
+                waiter.cancel()
+                self._waiters.remove(entry)
+                self._update_gauges()
+        if waiter.cancelled():
+            return self._reject(call_id)
+        ADMISSIONS_TOTAL.labels(result="queued").inc()
+        return True
+
+    def connected(self, call_id: str) -> None:
+        """Conferma la chiamata: lo stream media è arrivato su questo pod"""
+        if call_id not in self._calls and len(self._calls) >= self.max_live_calls:
+            # Admitted by another replica's webhook: the media is here already, it cannot be refused
+            logger.warning(f"Call {call_id} connected to a full pod ({len(self._calls)} live calls)")
+        self._calls[call_id] = None
+        self._update_gauges()
+
+    def release(self, call_id: str) -> None:
+        """Libera il posto della chiamata (idempotente)"""
+        if call_id not in self._calls:
+            return
+        del self._calls[call_id]
+        self._grant()
+        self._update_gauges()
+
+    def status(self) -> Dict[str, int]:
+        return {
+            "live_calls": self.live_calls,
+            "max_live_calls": self.max_live_calls,
+            "queue_depth": self.queue_depth,
+            "headroom": self.headroom,
+        }
+
+    def _hold(self, call_id: str, ttl: Optional[float]) -> None:
+        self._calls[call_id] = time.monotonic() + ttl if ttl is not None else None
+        self._update_gauges()
+
+    def _reject(self, call_id: str) -> bool:
+        ADMISSIONS_TOTAL.labels(result="rejected").inc()
+        logger.warning(
+            f"Call {call_id} rejected: {len(self._calls)}/{self.max_live_calls} live calls, "
+            f"{len(self._waiters)} queued"
+        )
+        return False
+
+    def _grant(self) -> None:
+        # Free slots go to the queue in arrival order
+        while self._waiters and len(self._calls) < self.max_live_calls:
+            waiter, call_id, ttl = self._waiters.popleft()
+            if waiter.done():
+                continue
+            self._hold(call_id, ttl)
+            waiter.set_result(True)
+
+    def _next_expiry(self) -> float:
+        deadlines = [deadline for deadline in self._calls.values() if deadline is not None]
+        if not deadlines:
+            return self.queue_timeout
+        return max(0.0, min(deadlines) - time.monotonic())
+
+    def _expire_reservations(self) -> None:
+        now = time.monotonic()
+        expired = [call_id for call_id, deadline in self._calls.items() if deadline is not None and deadline <= now]
+        if not expired:
+            return
+        for call_id in expired:
+            del self._calls[call_id]
+        logger.info(f"{len(expired)} call reservations expired without media on this pod")
+        self._grant()
+        self._update_gauges()
+
+    def _update_gauges(self) -> None:
+        LIVE_CALLS.set(len(self._calls))
+        ADMISSION_QUEUE_DEPTH.set(len(self._waiters))
+        CALL_HEADROOM.set(max(0, self.max_live_calls - len(self._calls)))
@@ -0,0 +1,632 @@
+"""
+Call Recorder - Registrazione delle chiamate fuori dall'event loop
+
+Con logging.record_calls attivo ogni chiamata viene registrata su due
+tracce allineate sulla durata della chiamata: "caller" (audio ricevuto,
+receive_audio della conversazione) e "assistant" (audio inviato,
+consume_nonblocking dell'output device, riempitivi inclusi).
+
+Sull'event loop il costo è solo un append: i chunk mu-law vengono tenuti
+per riferimento (nessuna copia) e ogni batch_ms consegnati, con l'istante
+di arrivo, a una coda limitata di un thread di scrittura (sempre lo stesso
+per la chiamata, così l'ordine è garantito). Se il disco è lento e la coda
+è piena il batch viene scartato e contato: la chiamata non aspetta mai la
+registrazione, che avrà un buco di silenzio al suo posto.
+
+Il thread codifica l'audio in segmenti da segment_seconds (Ogg Opus,
+circa 1/5 del mu-law; WAV mu-law se il binding Opus di aiortc manca),
+chiama fsync ogni fsync_interval secondi e aggiorna index.json con inizio
+e durata di ogni segmento, per riprodurre o saltare a un punto della
+chiamata senza leggere i segmenti precedenti:
+
+    {recording_dir}/{giorno UTC}/{call_id}/index.json
+                                          caller-0000.opus
+                                          assistant-0000.opus
+                                          ...
+
+Le cartelle dei giorni più vecchi di retention_days vengono eliminate
+all'avvio.
+"""
+
+import asyncio
+import json
+import logging
+import os
+import queue
+import re
+import shutil
+import struct
+import threading
+import time
+import zlib
+from datetime import date, datetime, timedelta, timezone
+from itertools import count
+from typing import Any, Callable, Dict, List, Optional
+
+from prometheus_client import Counter, Gauge, Histogram
+from vocode.streaming.models.audio import AudioEncoding
+
+logger = logging.getLogger(__name__)
+
+RECORDING_BYTES_TOTAL = Counter(
+    'voice_assistant_recording_bytes_total',
+    'Audio bytes handed to the call recorder',
+    ['track', 'result'],  # queued, dropped (writer queue full)
+)
+RECORDING_QUEUE_DEPTH = Gauge(
+    'voice_assistant_recording_queue_depth',
+    'Audio batches waiting for the recording writer threads',
+    multiprocess_mode='livesum',
+)
+RECORDING_WRITE_SECONDS = Histogram(
+    'voice_assistant_recording_write_seconds',
+    'Encoding and writing of one audio batch in a recording writer thread',
+    buckets=(0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 1.0),
+)
+RECORDING_FSYNC_SECONDS = Histogram(
+    'voice_assistant_recording_fsync_seconds',
+    'fsync of the open recording segments of a call',
+    buckets=(0.0005, 0.001, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5),
+)
+RECORDING_LOOP_SECONDS = Histogram(
+    'voice_assistant_recording_loop_seconds',
+    'Event loop time spent tapping the audio of one recorded call',
+    buckets=(0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25),
+)
+RECORDING_WRITER_SECONDS = Histogram(
+    'voice_assistant_recording_writer_seconds',
+    'Writer thread time (encoding, writes, fsync) spent on one recorded call',
+    buckets=(0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0),
+)
+RECORDINGS_TOTAL = Counter(
+    'voice_assistant_recordings_total',
+    'Finished call recordings',
+    ['result'],  # complete, partial (batches dropped), failed (disk error)
+)
+
+TRACKS = ("caller", "assistant")
+CALLER, ASSISTANT = 0, 1
+
+SAMPLE_RATE = 8000  # Vocode telephone devices: mu-law 8 kHz, one byte per sample
+FRAME_SAMPLES = 160  # 20 ms, one Opus packet
+MULAW_SILENCE = b"\xff"
+GAP_SECONDS = 0.1  # Later audio than this starts a new batch and is aligned with silence
+
+INDEX_FILE = "index.json"
+_CLOSE = object()
+_STOP = object()
+
+
+# --- Segment files ----------------------------------------------------------
+
+# Ogg uses the non-reflected CRC-32 (poly 0x04C11DB7, no init/xorout): zlib's
+# reflected one gives the same value on bit-reversed bytes, at C speed
+_BIT_REVERSE = bytes(int(f"{i:08b}"[::-1], 2) for i in range(256))
+OGG_PAGE_HEADER = struct.Struct("<4sBBqIII")
+OPUS_PRE_SKIP = 312  # libopus encoder lookahead, in 48 kHz samples
+OPUS_GRANULE_PER_FRAME = 960  # 20 ms at the 48 kHz Opus clock
+OGG_PAGE_FRAMES = 50  # One page per second of audio
+
+
+def ogg_crc(data: bytes) -> int:
+    crc = zlib.crc32(data.translate(_BIT_REVERSE), 0xFFFFFFFF) ^ 0xFFFFFFFF
+    return int(f"{crc:032b}"[::-1], 2)
+
+
+def opus_encoder_available() -> bool:
+    from sip.rtp import opus_available
+
+    return opus_available()
+
+
+class OggOpusSegment:
+    """
+    Segmento Ogg Opus (RFC 7845) mono a 8 kHz
+
+    Ogni segmento ha un encoder nuovo e le proprie pagine di intestazione,
+    quindi si decodifica da solo; le pagine (una al secondo) portano la
+    granule position per cercare un istante dentro il segmento.
+    """
+
+    extension = "opus"
+
+    def __init__(self, path: str, serial: int):
+        from sip.rtp import OpusCodec
+
+        self.codec = OpusCodec()
+        self.file = open(path, "wb")
+        self.serial = serial & 0xFFFFFFFF
+        self.sequence = 0
+        self.frames = 0
+        self.packets: List[bytes] = []
+        self.bytes = 0
+        head = b"OpusHead" + struct.pack("<BBHIhB", 1, 1, OPUS_PRE_SKIP, SAMPLE_RATE, 0, 0)
+        vendor = b"voice-assistant"
+        tags = b"OpusTags" + struct.pack("<I", len(vendor)) + vendor + struct.pack("<I", 0)
+        self._write_page([head], granule=0, flags=0x02)
+        self._write_page([tags], granule=0)
+
+    def write_frame(self, frame) -> None:
+        self.packets.append(self.codec.encode(frame))
+        self.frames += 1
+        if len(self.packets) >= OGG_PAGE_FRAMES:
+            self.flush()
+
+    def flush(self) -> None:
+        if self.packets:
+            self._write_page(self.packets, granule=self.frames * OPUS_GRANULE_PER_FRAME)
+            self.packets = []
+
+    def close(self) -> None:
+        # The last page carries the end-of-stream flag (empty if everything was already paged)
+        self._write_page(self.packets, granule=self.frames * OPUS_GRANULE_PER_FRAME, flags=0x04)
+        self.packets = []
+        self.file.close()
+
+    def _write_page(self, packets: List[bytes], granule: int, flags: int = 0) -> None:
+        lacing = bytearray()
+        for packet in packets:
+            # 20 ms packets at 8 kHz stay far below 255 bytes per lacing value
+            lacing.extend(b"\xff" * (len(packet) // 255))
+            lacing.append(len(packet) % 255)
+        header = OGG_PAGE_HEADER.pack(b"OggS", 0, flags, granule, self.serial, self.sequence, 0)
+        page = b"".join([header, bytes([len(lacing)]), lacing, *packets])
+        page = page[:22] + struct.pack("<I", ogg_crc(page)) + page[26:]
+        self.file.write(page)
+        self.sequence += 1
+        self.bytes += len(page)
+
+
+class MulawWavSegment:
+    """Segmento WAV mu-law a 8 kHz (WAVE_FORMAT_MULAW), usato senza encoder Opus"""
+
+    extension = "wav"
+    HEADER = struct.Struct("<4sI4s4sIHHIIHHH4sII4sI")
+
+    def __init__(self, path: str, serial: int):
+        self.file = open(path, "wb")
+        self.frames = 0
+        self.bytes = 0
+        self._write_header()
+
+    def _write_header(self) -> None:
+        data_size = self.frames * FRAME_SAMPLES
+        self.file.write(self.HEADER.pack(
+            b"RIFF", self.HEADER.size - 8 + data_size, b"WAVE",
+            b"fmt ", 18, 7, 1, SAMPLE_RATE, SAMPLE_RATE, 1, 8, 0,
+            b"fact", 4, data_size,
+            b"data", data_size,
+        ))
+
+    def write_frame(self, frame) -> None:
+        self.file.write(frame)
+        self.frames += 1
+        self.bytes += len(frame)
+
+    def flush(self) -> None:
+        # Keep the header sizes current so a crash leaves a playable file
+        position = self.file.tell()
+        self.file.seek(0)
+        self._write_header()
+        self.file.seek(position)
+
+    def close(self) -> None:
+        self.flush()
+        self.file.close()
+
+
+# --- Writer side ------------------------------------------------------------
+
+class TrackWriter:
+    """
+    Una traccia di una registrazione, usata solo dal thread di scrittura
+
+    Allinea i batch sulla durata della chiamata (silenzio nei buchi), li
+    divide in frame da 20 ms e ruota il segmento ogni segment_frames frame.
+    """
+
+    def __init__(self, directory: str, name: str, segment_factory: Callable, segment_frames: int, serial: int):
+        self.directory = directory
+        self.name = name
+        self.segment_factory = segment_factory
+        self.segment_frames = segment_frames
+        self.serial = serial
+        self.position = 0  # Samples on the call timeline, silence included
+        self.padded = 0  # Samples of silence inserted for gaps and dropped batches
+        self.frames = 0
+        self.segment: Optional[Any] = None
+        self.segments: List[Dict[str, Any]] = []
+        self._partial = bytearray()
+
+    def write(self, start_sample: int, chunks: List[bytes]) -> None:
+        gap = start_sample - self.position
+        if gap > GAP_SECONDS * SAMPLE_RATE:
+            self.padded += gap
+            self._silence(gap)
+        for chunk in chunks:
+            self._feed(chunk)
+
+    def _silence(self, samples: int) -> None:
+        block = MULAW_SILENCE * SAMPLE_RATE
+        while samples > 0:
+            self._feed(block[:samples])
+            samples -= SAMPLE_RATE
+
+    def _feed(self, data) -> None:
+        self.position += len(data)
+        view = memoryview(data)
+        if self._partial:
+            needed = FRAME_SAMPLES - len(self._partial)
+            self._partial += view[:needed]
+            view = view[needed:]
+            if len(self._partial) < FRAME_SAMPLES:
+                return
+            self._frame(bytes(self._partial))
+            self._partial.clear()
+        full = len(view) - len(view) % FRAME_SAMPLES
+        for offset in range(0, full, FRAME_SAMPLES):
+            self._frame(view[offset:offset + FRAME_SAMPLES])
+        self._partial += view[full:]
+
+    def _frame(self, frame) -> None:
+        if self.segment is None:
+            name = f"{self.name}-{len(self.segments):04d}.{self.segment_factory.extension}"
+            self.segment = self.segment_factory(os.path.join(self.directory, name), self.serial + len(self.segments))
+            self.segments.append({"file": name, "start_ms": self.frames * FRAME_SAMPLES * 1000 // SAMPLE_RATE})
+        self.segment.write_frame(frame)
+        self.frames += 1
+        if self.segment.frames >= self.segment_frames:
+            self._close_segment()
+
+    def _close_segment(self) -> None:
+        self.segment.close()
+        self._describe(self.segments[-1], self.segment)
+        self.segment = None
+
+    @staticmethod
+    def _describe(entry: Dict[str, Any], segment: Any) -> None:
+        entry["duration_ms"] = segment.frames * FRAME_SAMPLES * 1000 // SAMPLE_RATE
+        entry["bytes"] = segment.bytes
+
+    def sync(self) -> None:
+        """Scrive su disco il segmento aperto (pagina parziale inclusa)"""
+        if self.segment is None:
+            return
+        self.segment.flush()
+        self.segment.file.flush()
+        os.fsync(self.segment.file.fileno())
+        self._describe(self.segments[-1], self.segment)
+
+    def close(self) -> None:
+        if self._partial:
+            self._feed(MULAW_SILENCE * (FRAME_SAMPLES - len(self._partial)))
+        if self.segment is not None:
+            self._close_segment()
+
+
+class CallRecording:
+    """
+    Registrazione di una chiamata
+
+    attach() avvolge sull'istanza receive_audio della conversazione e
+    consume_nonblocking dell'output device, come gli altri hook; i metodi
+    senza underscore girano sull'event loop, gli altri nel thread di
+    scrittura assegnato (writer).
+
+    Args:
+        recorder: CallRecorder del pod
+        call_id: Id della chiamata (CallSid Twilio o Call-ID SIP)
+        writer: Indice del thread di scrittura della chiamata
+    """
+
+    def __init__(self, recorder: "CallRecorder", call_id: str, writer: int):
+        self.recorder = recorder
+        self.call_id = call_id
+        self.writer = writer
+        self.started_at = datetime.now(timezone.utc)
+        self.loop_seconds = 0.0
+        self.dropped = [0, 0]  # Bytes per track
+        self._clock_start = time.monotonic()
+        self._pending: List[List[bytes]] = [[], []]
+        self._pending_bytes = [0, 0]
+        self._pending_start = [0.0, 0.0]
+        self._closed = False
+        # Writer thread state
+        self.directory: Optional[str] = None
+        self.tracks: List[TrackWriter] = []
+        self.writer_seconds = 0.0
+        self.failed = False
+        self._last_sync = 0.0
+
+    def attach(self, conversation: Any) -> None:
+        receive_audio = conversation.receive_audio
+
+        def receive_audio_recorded(chunk: bytes):
+            receive_audio(chunk)
+            self.tap(CALLER, chunk)
+
+        conversation.receive_audio = receive_audio_recorded
+
+        output_device = conversation.output_device
+        consume_nonblocking = output_device.consume_nonblocking
+
+        def consume_recorded(chunk: bytes):
+            consume_nonblocking(chunk)
+            self.tap(ASSISTANT, chunk)
+
+        output_device.consume_nonblocking = consume_recorded
+
+    def tap(self, track: int, chunk: bytes) -> None:
+        if self._closed:
+            return
+        started = time.perf_counter()
+        if type(chunk) is not bytes:
+            # Only immutable chunks can be queued by reference
+            chunk = bytes(chunk)
+        now = time.monotonic() - self._clock_start
+        pending = self._pending[track]
+        if pending and now - self._pending_start[track] - self._pending_bytes[track] / SAMPLE_RATE > GAP_SECONDS:
+            self._flush(track)
+        if not self._pending[track]:
+            self._pending_start[track] = now
+        self._pending[track].append(chunk)
+        self._pending_bytes[track] += len(chunk)
+        if self._pending_bytes[track] >= self.recorder.batch_bytes:
+            self._flush(track)
+        self.loop_seconds += time.perf_counter() - started
+
+    def _flush(self, track: int) -> None:
+        chunks, size = self._pending[track], self._pending_bytes[track]
+        self._pending[track] = []
+        self._pending_bytes[track] = 0
+        start_sample = int(self._pending_start[track] * SAMPLE_RATE)
+        if not self.recorder.submit(self, (self, track, start_sample, chunks)):
+            self.dropped[track] += size
+            RECORDING_BYTES_TOTAL.labels(track=TRACKS[track], result="dropped").inc(size)
+        else:
+            RECORDING_BYTES_TOTAL.labels(track=TRACKS[track], result="queued").inc(size)
+
+    def close(self) -> None:
+        """Fine chiamata: consegna l'audio rimasto e chiude i file nel thread"""
+        if self._closed:
+            return
+        started = time.perf_counter()
+        for track in (CALLER, ASSISTANT):
+            if self._pending[track]:
+                self._flush(track)
+        self._closed = True
+        self.loop_seconds += time.perf_counter() - started
+        RECORDING_LOOP_SECONDS.observe(self.loop_seconds)
+        self.recorder.submit(self, (self, _CLOSE, 0, None), force=True)
+
+    # --- Writer thread --------------------------------------------------
+
+    def _open(self) -> None:
+        day_dir = os.path.join(self.recorder.directory, self.started_at.date().isoformat())
+        base = re.sub(r"[^A-Za-z0-9._-]", "_", self.call_id)[:128] or "call"
+        directory = os.path.join(day_dir, base)
+        for attempt in count(1):
+            try:
+                os.makedirs(directory)
+                break
+            except FileExistsError:
+                directory = os.path.join(day_dir, f"{base}-{attempt}")
+        self.directory = directory
+        serial = zlib.crc32(directory.encode()) << 1
+        self.tracks = [
+            TrackWriter(directory, name, self.recorder.segment_factory, self.recorder.segment_frames, serial + index * 100003)
+            for index, name in enumerate(TRACKS)
+        ]
+
+    def _write(self, track: int, start_sample: int, chunks: List[bytes]) -> None:
+        if self.directory is None:
+            self._open()
+            self._write_index(complete=False)
+        writer = self.tracks[track]
+        segments = len(writer.segments)
+        writer.write(start_sample, chunks)
+        if len(writer.segments) != segments:
+            self._write_index(complete=False)
+
+    def _sync(self) -> None:
+        started = time.perf_counter()
+        for writer in self.tracks:
+            writer.sync()
+        RECORDING_FSYNC_SECONDS.observe(time.perf_counter() - started)
+        self._write_index(complete=False)
+
+    def _finish(self, complete: bool) -> None:
+        if self.directory is not None:
+            for writer in self.tracks:
+                writer.close()
+            self._write_index(complete=complete)
+
+    def _write_index(self, complete: bool) -> None:
+        index = {
+            "call_id": self.call_id,
+            "started_at": self.started_at.isoformat(),
+            "codec": self.recorder.codec,
+            "sample_rate": SAMPLE_RATE,
+            "complete": complete,
+            "tracks": {
+                writer.name: {
+                    "segments": writer.segments,
+                    "duration_ms": writer.position * 1000 // SAMPLE_RATE,
+                    "silence_ms": writer.padded * 1000 // SAMPLE_RATE,
+                    "dropped_ms": self.dropped[index] * 1000 // SAMPLE_RATE,
+                }
+                for index, writer in enumerate(self.tracks)
+            },
+        }
+        path = os.path.join(self.directory, INDEX_FILE)
+        tmp_path = f"{path}.tmp"
+        with open(tmp_path, "w") as f:
+            json.dump(index, f, separators=(",", ":"))
+        os.replace(tmp_path, path)
+
+
+class CallRecorder:
+    """
+    Registratore delle chiamate del pod: thread di scrittura e coda limitata
+
+    Args:
+        directory: Cartella delle registrazioni
+        retention_days: Giorni di registrazioni conservati (0 = per sempre)
+        codec: "opus" (Ogg Opus, WAV mu-law se l'encoder non è disponibile) o "pcmu"
+        segment_seconds: Durata di un segmento
+        batch_ms: Audio accumulato per traccia prima di passarlo al thread
+        max_queue_batches: Batch in attesa per thread oltre i quali si scarta
+        fsync_interval: Secondi tra due fsync dei segmenti aperti
+        threads: Thread di scrittura (ogni chiamata resta su uno solo)
+    """
+
+    def __init__(
+        self,
+        directory: str,
+        retention_days: int = 90,
+        codec: str = "opus",
+        segment_seconds: float = 30.0,
+        batch_ms: int = 500,
+        max_queue_batches: int = 200,
+        fsync_interval: float = 5.0,
+        threads: int = 2,
+    ):
+        self.directory = directory
+        self.retention_days = retention_days
+        if codec == "opus" and not opus_encoder_available():
+            logger.warning("Opus encoder not available (aiortc missing), recording calls as mu-law WAV")
+            codec = "pcmu"
+        self.codec = codec
+        self.segment_factory = OggOpusSegment if codec == "opus" else MulawWavSegment
+        self.segment_frames = max(1, int(segment_seconds * SAMPLE_RATE) // FRAME_SAMPLES)
+        self.batch_bytes = max(FRAME_SAMPLES, batch_ms * SAMPLE_RATE // 1000)
+        self.max_queue_batches = max_queue_batches
+        self.fsync_interval = fsync_interval
+        self._queues = [queue.Queue() for _ in range(max(1, threads))]
+        self._threads: List[threading.Thread] = []
+        self._next_writer = 0
+
+    async def start(self) -> None:
+        await asyncio.to_thread(self._prepare)
+        for index, writer_queue in enumerate(self._queues):
+            thread = threading.Thread(
+                target=self._run, args=(writer_queue,), name=f"call-recorder-{index}", daemon=True
+            )
+            thread.start()
+            self._threads.append(thread)
+        logger.info(f"Call recording enabled: {self.directory} ({self.codec}, {len(self._threads)} writer threads)")
+
+    def _prepare(self) -> None:
+        os.makedirs(self.directory, exist_ok=True)
+        if self.retention_days <= 0:
+            return
+        oldest = datetime.now(timezone.utc).date() - timedelta(days=self.retention_days)
+        for name in os.listdir(self.directory):
+            try:
+                day = date.fromisoformat(name)
+            except ValueError:
+                continue
+            if day < oldest:
+                shutil.rmtree(os.path.join(self.directory, name), ignore_errors=True)
+                logger.info(f"Deleted recordings of {name} (retention {self.retention_days} days)")
+
+    def attach(self, conversation: Any, call_id: Optional[str] = None) -> Optional[CallRecording]:
+        """
+        Inizia a registrare una conversazione
+
+        Returns:
+            La CallRecording (da chiudere a fine chiamata) o None se il
+            formato audio non è mu-law 8 kHz o il registratore è fermo
+        """
+        if not self._threads:
+            return None
+        output_device = conversation.output_device
+        if output_device.audio_encoding != AudioEncoding.MULAW or output_device.sampling_rate != SAMPLE_RATE:
+            logger.warning(f"Conversation {conversation.id} not recorded: output audio is not mu-law 8 kHz")
+            return None
+        writer = self._next_writer
+        self._next_writer = (writer + 1) % len(self._queues)
+        recording = CallRecording(self, call_id or conversation.id, writer)
+        recording.attach(conversation)
+        return recording
+
+    def submit(self, recording: CallRecording, item: tuple, force: bool = False) -> bool:
+        """Accoda un batch senza attendere; False se la coda del thread è piena"""
+        writer_queue = self._queues[recording.writer]
+        if not force and writer_queue.qsize() >= self.max_queue_batches:
+            return False
+        writer_queue.put_nowait(item)
+        RECORDING_QUEUE_DEPTH.inc()
+        return True
+
+    async def close(self) -> None:
+        """Chiude le registrazioni aperte e ferma i thread dopo aver scritto la coda"""
+        for writer_queue in self._queues:
+            writer_queue.put_nowait(_STOP)
+        for thread in self._threads:
+            await asyncio.to_thread(thread.join, 10.0)
+        self._threads.clear()
+
+    def _run(self, writer_queue: queue.Queue) -> None:
+        open_recordings: Dict[int, CallRecording] = {}
+        while True:
+            try:
+                item = writer_queue.get(timeout=self.fsync_interval)
+            except queue.Empty:
+                item = None
+            if item is _STOP:
+                for recording in open_recordings.values():
+                    self._handle(recording, lambda r=recording: r._finish(complete=False))
+                return
+            if item is not None:
+                RECORDING_QUEUE_DEPTH.dec()
+                recording, track, start_sample, chunks = item
+                if track is _CLOSE:
+                    open_recordings.pop(id(recording), None)
+                    self._close_recording(recording)
+                elif not recording.failed:
+                    open_recordings[id(recording)] = recording
+                    started = time.perf_counter()
+                    self._handle(recording, lambda: recording._write(track, start_sample, chunks))
+                    RECORDING_WRITE_SECONDS.observe(time.perf_counter() - started)
+            now = time.monotonic()
+            for recording in list(open_recordings.values()):
+                if recording.failed:
+                    open_recordings.pop(id(recording), None)
+                elif recording.directory is not None and now - recording._last_sync >= self.fsync_interval:
+                    recording._last_sync = now
+                    self._handle(recording, recording._sync)
+
+    def _handle(self, recording: CallRecording, action: Callable[[], None]) -> None:
+        if recording.failed:
+            return
+        started = time.perf_counter()
+        try:
+            action()
+        except Exception as e:
+            recording.failed = True
+            logger.error(f"Recording of call {recording.call_id} stopped: {e}")
+            for writer in recording.tracks:
+                if writer.segment is not None:
+                    try:
+                        writer.segment.file.close()
+                    except OSError:
+                        pass
+        finally:
+            recording.writer_seconds += time.perf_counter() - started
+
+    def _close_recording(self, recording: CallRecording) -> None:
+        self._handle(recording, lambda: recording._finish(complete=True))
+        RECORDING_WRITER_SECONDS.observe(recording.writer_seconds)
+        if recording.failed:
+            result = "failed"
+        elif any(recording.dropped):
+            result = "partial"
+        else:
+            result = "complete"
+        RECORDINGS_TOTAL.labels(result=result).inc()
+        if recording.directory is not None:
+            logger.info(
+                f"Call {recording.call_id} recorded in {recording.directory} ({result}, "
+                f"loop {recording.loop_seconds * 1000:.1f}ms, writer {recording.writer_seconds * 1000:.1f}ms)"
+            )
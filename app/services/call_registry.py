@@ -0,0 +1,300 @@
+"""
+Call Registry - Stato delle chiamate attive condiviso tra le repliche
+
+Ogni chiamata è un hash Redis con TTL (`voice-assistant:<namespace>:call:<id>`)
+più un sorted set per namespace, con punteggio = scadenza, per elencare
+le chiamate attive senza SCAN. Le scritture sono pipelined (un solo
+round-trip) e le letture passano da una cache locale a TTL breve.
+
+Senza Redis il registro resta in memoria nel processo, come prima; con
+più worker per pod (services/workers.py) ogni worker pubblica le sue
+chiamate in un file della directory condivisa e list_active/count
+riportano il totale del pod.
+Se Redis non risponde le operazioni degradano sulla copia locale invece di
+far fallire la chiamata.
+"""
+
+import glob
+import json
+import logging
+import os
+import time
+from datetime import datetime
+from typing import Any, Dict, Optional, Tuple
+
+from prometheus_client import Counter, Histogram
+
+logger = logging.getLogger(__name__)
+
+KEY_PREFIX = "voice-assistant"
+DATETIME_TAG = "dt:"
+
+CALL_REGISTRY_OPERATION_SECONDS = Histogram(
+    'voice_assistant_call_registry_operation_seconds',
+    'Latency of call registry operations',
+    ['operation'],
+    buckets=(0.0001, 0.00025, 0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1),
+)
+CALL_REGISTRY_READS = Counter(
+    'voice_assistant_call_registry_reads_total',
+    'Call registry reads by source',
+    ['source'],  # local, redis, miss
+)
+CALL_REGISTRY_ERRORS = Counter(
+    'voice_assistant_call_registry_errors_total',
+    'Redis errors in the call registry (served from the local copy instead)',
+    ['operation'],
+)
+
+
+def _encode_value(value: Any) -> str:
+    if isinstance(value, datetime):
+        return DATETIME_TAG + value.isoformat()
+    return json.dumps(value, default=str)
+
+
+def _decode_value(raw: str) -> Any:
+    # JSON never starts with "dt:", so the tag cannot collide with a JSON value
+    if raw.startswith(DATETIME_TAG):
+        return datetime.fromisoformat(raw[len(DATETIME_TAG):])
+    return json.loads(raw)
+
+
+class CallRegistry:
+    """
+    Registro delle chiamate attive di un tipo (es. "twilio", "sip")
+
+    Args:
+        redis_client: Client redis.asyncio con decode_responses=True
+            (None = solo memoria locale)
+        namespace: Tipo di chiamate, separa le chiavi dei diversi handler
+        ttl_seconds: Scadenza di una chiamata mai chiusa (pod morto, callback perso)
+        local_cache_ttl: Per quanto una lettura locale è considerata fresca;
+            limita quanto può essere vecchia una modifica fatta da un'altra replica
+        shared_dir: Senza Redis, directory in cui ogni worker del pod pubblica
+            le sue chiamate (None = solo questo processo)
+    """
+
+    def __init__(
+        self,
+        redis_client=None,
+        namespace: str = "calls",
+        ttl_seconds: int = 4 * 3600,
+        local_cache_ttl: float = 1.0,
+        shared_dir: Optional[str] = None,
+    ):
+        self.redis = redis_client
+        self.namespace = namespace
+        self.ttl_seconds = ttl_seconds
+        self.local_cache_ttl = local_cache_ttl
+        self.shared_dir = shared_dir if redis_client is None else None
+        self._index_key = f"{KEY_PREFIX}:{namespace}:calls"
+        # call_id -> (fresh_until, call_info)
+        self._local: Dict[str, Tuple[float, Dict[str, Any]]] = {}
+
+    def _call_key(self, call_id: str) -> str:
+        return f"{KEY_PREFIX}:{self.namespace}:call:{call_id}"
+
+    def _remember(self, call_id: str, call_info: Dict[str, Any]) -> None:
+        fresh_until = float("inf") if self.redis is None else time.monotonic() + self.local_cache_ttl
+        self._local[call_id] = (fresh_until, call_info)
+
+    def _table_path(self, pid: int) -> str:
+        return os.path.join(self.shared_dir, f"{self.namespace}.{pid}.json")
+
+    def _publish(self) -> None:
+        # Small file on the pod's local disk, replaced atomically: readers never see half a table
+        if self.shared_dir is None:
+            return
+        path = self._table_path(os.getpid())
+        table = {
+            call_id: {field: _encode_value(value) for field, value in info.items()}
+            for call_id, (_, info) in self._local.items()
+        }
+        try:
+            with open(f"{path}.tmp", "w") as f:
+                json.dump(table, f)
+            os.replace(f"{path}.tmp", path)
+        except OSError as e:
+            CALL_REGISTRY_ERRORS.labels(operation="publish").inc()
+            logger.warning(f"Call registry publish to {path} failed: {e}")
+
+    def _pod_calls(self) -> Dict[str, Dict[str, Any]]:
+        """Chiamate di questo processo più quelle pubblicate dagli altri worker del pod"""
+        calls = {call_id: dict(info) for call_id, (_, info) in self._local.items()}
+        if self.shared_dir is None:
+            return calls
+        own_table = self._table_path(os.getpid())
+        # The supervisor deletes the tables of dead workers
+        for path in glob.glob(os.path.join(self.shared_dir, f"{self.namespace}.*.json")):
+            if path == own_table:
+                continue
+            try:
+                with open(path) as f:
+                    table = json.load(f)
+            except (OSError, ValueError):
+                continue
+            for call_id, raw in table.items():
+                calls[call_id] = {field: _decode_value(value) for field, value in raw.items()}
+        return calls
+
+    def _prune_local(self) -> None:
+        # Calls ended by another replica are never removed here; drop their copies once Redis expired them too
+        expired_before = time.monotonic() - self.ttl_seconds
+        for call_id in [cid for cid, (fresh_until, _) in self._local.items() if fresh_until < expired_before]:
+            del self._local[call_id]
+
+    async def put(self, call_id: str, call_info: Dict[str, Any]) -> None:
+        """Registra (o sovrascrive) una chiamata"""
+        self._remember(call_id, dict(call_info))
+        if self.redis is None:
+            self._publish()
+            return
+        self._prune_local()
+        start = time.perf_counter()
+        try:
+            key = self._call_key(call_id)
+            pipe = self.redis.pipeline(transaction=False)
+            pipe.delete(key)
+            pipe.hset(key, mapping={field: _encode_value(value) for field, value in call_info.items()})
+            pipe.expire(key, self.ttl_seconds)
+            pipe.zadd(self._index_key, {call_id: time.time() + self.ttl_seconds})
+            await pipe.execute()
+        except Exception as e:
+            CALL_REGISTRY_ERRORS.labels(operation="put").inc()
+            logger.warning(f"Call registry put failed for {call_id}: {e}")
+        finally:
+            CALL_REGISTRY_OPERATION_SECONDS.labels(operation="put").observe(time.perf_counter() - start)
+
+    async def update(self, call_id: str, **fields: Any) -> Optional[Dict[str, Any]]:
+        """
+        Aggiorna alcuni campi di una chiamata e ne rinnova il TTL
+
+        Returns:
+            Dict aggiornato della chiamata, o None se non registrata
+        """
+        call_info = await self.get(call_id)
+        if call_info is None:
+            return None
+        call_info.update(fields)
+        self._remember(call_id, call_info)
+        if self.redis is None:
+            self._publish()
+            return dict(call_info)
+        start = time.perf_counter()
+        try:
+            key = self._call_key(call_id)
+            pipe = self.redis.pipeline(transaction=False)
+            pipe.hset(key, mapping={field: _encode_value(value) for field, value in fields.items()})
+            pipe.expire(key, self.ttl_seconds)
+            pipe.zadd(self._index_key, {call_id: time.time() + self.ttl_seconds})
+            await pipe.execute()
+        except Exception as e:
+            CALL_REGISTRY_ERRORS.labels(operation="update").inc()
+            logger.warning(f"Call registry update failed for {call_id}: {e}")
+        finally:
+            CALL_REGISTRY_OPERATION_SECONDS.labels(operation="update").observe(time.perf_counter() - start)
+        return dict(call_info)
+
+    async def get(self, call_id: str) -> Optional[Dict[str, Any]]:
+        """Legge una chiamata (cache locale, poi Redis)"""
+        cached = self._local.get(call_id)
+        if cached is not None and cached[0] > time.monotonic():
+            CALL_REGISTRY_READS.labels(source="local").inc()
+            return dict(cached[1])
+        if self.redis is None:
+            CALL_REGISTRY_READS.labels(source="miss").inc()
+            return None
+
+        start = time.perf_counter()
+        try:
+            raw = await self.redis.hgetall(self._call_key(call_id))
+        except Exception as e:
+            CALL_REGISTRY_ERRORS.labels(operation="get").inc()
+            logger.warning(f"Call registry get failed for {call_id}: {e}")
+            return dict(cached[1]) if cached is not None else None
+        finally:
+            CALL_REGISTRY_OPERATION_SECONDS.labels(operation="get").observe(time.perf_counter() - start)
+
+        if not raw:
+            CALL_REGISTRY_READS.labels(source="miss").inc()
+            self._local.pop(call_id, None)
+            return None
+        CALL_REGISTRY_READS.labels(source="redis").inc()
+        call_info = {field: _decode_value(value) for field, value in raw.items()}
+        self._remember(call_id, call_info)
+        return dict(call_info)
+
+    async def remove(self, call_id: str) -> Optional[Dict[str, Any]]:
+        """
+        Rimuove una chiamata
+
+        Returns:
+            Ultimo stato noto della chiamata, o None se non registrata
+        """
+        cached = self._local.pop(call_id, None)
+        local_info = dict(cached[1]) if cached is not None else None
+        if self.redis is None:
+            if cached is not None:
+                self._publish()
+            return local_info
+
+        start = time.perf_counter()
+        try:
+            key = self._call_key(call_id)
+            pipe = self.redis.pipeline(transaction=False)
+            pipe.hgetall(key)
+            pipe.delete(key)
+            pipe.zrem(self._index_key, call_id)
+            raw, _, _ = await pipe.execute()
+        except Exception as e:
+            CALL_REGISTRY_ERRORS.labels(operation="remove").inc()
+            logger.warning(f"Call registry remove failed for {call_id}: {e}")
+            return local_info
+        finally:
+            CALL_REGISTRY_OPERATION_SECONDS.labels(operation="remove").observe(time.perf_counter() - start)
+
+        if not raw:
+            return local_info
+        return {field: _decode_value(value) for field, value in raw.items()}
+
+    async def list_active(self) -> Dict[str, Dict[str, Any]]:
+        """Tutte le chiamate attive del namespace, su tutte le repliche"""
+        if self.redis is None:
+            return self._pod_calls()
+
+        start = time.perf_counter()
+        try:
+            await self.redis.zremrangebyscore(self._index_key, "-inf", time.time())
+            call_ids = await self.redis.zrange(self._index_key, 0, -1)
+            pipe = self.redis.pipeline(transaction=False)
+            for call_id in call_ids:
+                pipe.hgetall(self._call_key(call_id))
+            raws = await pipe.execute() if call_ids else []
+        except Exception as e:
+            CALL_REGISTRY_ERRORS.labels(operation="list").inc()
+            logger.warning(f"Call registry list failed, returning local calls only: {e}")
+            return {call_id: dict(info) for call_id, (_, info) in self._local.items()}
+        finally:
+            CALL_REGISTRY_OPERATION_SECONDS.labels(operation="list").observe(time.perf_counter() - start)
+
+        return {
+            call_id: {field: _decode_value(value) for field, value in raw.items()}
+            for call_id, raw in zip(call_ids, raws)
+            if raw
+        }
+
+    async def count(self) -> int:
+        """Numero di chiamate attive del namespace, su tutte le repliche"""
+        if self.redis is None:
+            return len(self._pod_calls())
+        try:
+            pipe = self.redis.pipeline(transaction=False)
+            pipe.zremrangebyscore(self._index_key, "-inf", time.time())
+            pipe.zcard(self._index_key)
+            _, total = await pipe.execute()
+            return int(total)
+        except Exception as e:
+            CALL_REGISTRY_ERRORS.labels(operation="count").inc()
+            logger.warning(f"Call registry count failed, returning local count: {e}")
+            return len(self._local)
@@ -0,0 +1,336 @@
+"""
+Call Store - Salvataggio asincrono a batch di chiamate e trascrizioni su PostgreSQL
+
+Gli handler non scrivono mai direttamente sul database: record_call() e
+record_turns() accodano i record in memoria (coda limitata, senza await) e
+un task in background li scrive a batch con COPY su un pool asyncpg, ogni
+flush_interval secondi o appena un batch è pieno. Se il database è lento o
+giù la coda si riempie e i record in eccesso vengono scartati e contati,
+senza rallentare le chiamate.
+
+Le tabelle sono partizionate per giorno (UTC): le partizioni vengono create
+al bisogno e quelle più vecchie di retention_days eliminate con DROP TABLE,
+senza DELETE massivi.
+"""
+
+import asyncio
+import json
+import logging
+import time
+from datetime import date, datetime, timedelta, timezone
+from typing import TYPE_CHECKING, Any, Dict, Iterable, List, Optional, Set, Tuple
+
+from prometheus_client import Counter, Gauge, Histogram
+
+if TYPE_CHECKING:
+    # Imported in start(): pods that do not store calls never load the driver
+    import asyncpg
+
+logger = logging.getLogger(__name__)
+
+DB_RECORDS_TOTAL = Counter(
+    'voice_assistant_db_records_total',
+    'Records handled by the database writer',
+    ['table', 'result'],  # written, dropped (queue full), failed
+)
+DB_FLUSH_SECONDS = Histogram(
+    'voice_assistant_db_flush_seconds',
+    'Duration of a batch write to PostgreSQL',
+    ['table'],
+    buckets=(0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5),
+)
+DB_QUEUE_DEPTH = Gauge(
+    'voice_assistant_db_queue_depth',
+    'Records waiting to be written to PostgreSQL',
+    multiprocess_mode='livesum',
+)
+
+CALLS_TABLE = "calls"
+TRANSCRIPTS_TABLE = "call_transcripts"
+
+CALL_COLUMNS = (
+    "call_id", "provider", "from_number", "to_number", "status",
+    "start_time", "end_time", "duration_seconds", "metadata",
+)
+TRANSCRIPT_COLUMNS = ("call_id", "conversation_id", "turn_index", "speaker", "text", "spoken_at")
+
+# Partition key of each table
+PARTITION_COLUMNS = {CALLS_TABLE: "end_time", TRANSCRIPTS_TABLE: "spoken_at"}
+
+SCHEMA = f"""
+CREATE TABLE IF NOT EXISTS {CALLS_TABLE} (
+    call_id text NOT NULL,
+    provider text NOT NULL,
+    from_number text,
+    to_number text,
+    status text,
+    start_time timestamptz,
+    end_time timestamptz NOT NULL,
+    duration_seconds double precision,
+    metadata jsonb
+) PARTITION BY RANGE (end_time);
+CREATE INDEX IF NOT EXISTS {CALLS_TABLE}_call_id_idx ON {CALLS_TABLE} (call_id);
+
+CREATE TABLE IF NOT EXISTS {TRANSCRIPTS_TABLE} (
+    call_id text,
+    conversation_id text NOT NULL,
+    turn_index integer NOT NULL,
+    speaker text NOT NULL,
+    text text NOT NULL,
+    spoken_at timestamptz NOT NULL
+) PARTITION BY RANGE (spoken_at);
+CREATE INDEX IF NOT EXISTS {TRANSCRIPTS_TABLE}_call_id_idx ON {TRANSCRIPTS_TABLE} (call_id);
+"""
+
+PARTITION_SUFFIX_FORMAT = "%Y%m%d"
+MAINTENANCE_INTERVAL = 3600.0  # Seconds between retention runs
+
+
+def asyncpg_dsn(url: str) -> str:
+    """Converte l'URL SQLAlchemy di Settings.postgres_url (postgresql+asyncpg://) in DSN asyncpg"""
+    return url.replace("postgresql+asyncpg://", "postgresql://", 1)
+
+
+def _utc(value: Optional[datetime]) -> Optional[datetime]:
+    # The call registry stores naive UTC datetimes (datetime.utcnow)
+    if value is None or value.tzinfo is not None:
+        return value
+    return value.replace(tzinfo=timezone.utc)
+
+
+def partition_name(table: str, day: date) -> str:
+    return f"{table}_p{day.strftime(PARTITION_SUFFIX_FORMAT)}"
+
+
+class CallStore:
+    """
+    Writer a batch di chiamate e turni di trascrizione
+
+    Args:
+        dsn: DSN PostgreSQL (asyncpg)
+        retention_days: Giorni di dati conservati (0 = nessuna eliminazione)
+        batch_size: Record massimi per COPY
+        flush_interval: Secondi massimi di attesa di un record in coda
+        max_queue: Record massimi in memoria, oltre vengono scartati
+        pool_size: Connessioni del pool asyncpg
+    """
+
+    def __init__(
+        self,
+        dsn: str,
+        retention_days: int = 90,
+        batch_size: int = 500,
+        flush_interval: float = 1.0,
+        max_queue: int = 10000,
+        pool_size: int = 2,
+    ):
+        self.dsn = dsn
+        self.retention_days = retention_days
+        self.batch_size = batch_size
+        self.flush_interval = flush_interval
+        self.max_queue = max_queue
+        self.pool_size = pool_size
+        self.pool: Optional["asyncpg.Pool"] = None
+        # Errors that leave the batch queued for the next flush (driver errors added in start())
+        self._write_errors: Tuple[type, ...] = (OSError, asyncio.TimeoutError)
+        self._pending: Dict[str, List[Tuple]] = {CALLS_TABLE: [], TRANSCRIPTS_TABLE: []}
+        self._partitions: Dict[str, Set[date]] = {CALLS_TABLE: set(), TRANSCRIPTS_TABLE: set()}
+        self._wakeup = asyncio.Event()
+        self._task: Optional[asyncio.Task] = None
+        self._closing = False
+        self._last_maintenance = 0.0
+
+    # --- Producers (called from the call handlers, never await) ---------
+
+    def record_call(self, call_info: Dict[str, Any], provider: str) -> bool:
+        """
+        Accoda il record di una chiamata conclusa
+
+        Args:
+            call_info: Dizionario di CallHandler.end_call / SIPHandler.end_call
+            provider: "twilio" o "sip"
+
+        Returns:
+            False se la coda è piena e il record è stato scartato
+        """
+        known = {"call_sid", "call_id", "from_number", "to_number", "from_uri", "to_uri",
+                 "status", "start_time", "end_time", "duration"}
+        end_time = _utc(call_info.get("end_time")) or datetime.now(timezone.utc)
+        duration = call_info.get("duration")
+        row = (
+            str(call_info.get("call_sid") or call_info.get("call_id")),
+            provider,
+            call_info.get("from_number") or call_info.get("from_uri"),
+            call_info.get("to_number") or call_info.get("to_uri"),
+            call_info.get("status"),
+            _utc(call_info.get("start_time")),
+            end_time,
+            float(duration) if duration is not None else None,
+            json.dumps({k: v for k, v in call_info.items() if k not in known}, default=str),
+        )
+        return self._enqueue(CALLS_TABLE, [row])
+
+    def record_turns(
+        self,
+        conversation_id: str,
+        call_id: Optional[str],
+        turns: Iterable[Tuple[str, str, float]],
+    ) -> bool:
+        """
+        Accoda i turni di una conversazione
+
+        Args:
+            conversation_id: ID della conversazione Vocode
+            call_id: CallSid Twilio o Call-ID SIP, se noto
+            turns: Tuple (speaker, testo, timestamp unix)
+        """
+        rows = [
+            (call_id, conversation_id, index, speaker, text, datetime.fromtimestamp(timestamp, timezone.utc))
+            for index, (speaker, text, timestamp) in enumerate(turns)
+        ]
+        return self._enqueue(TRANSCRIPTS_TABLE, rows) if rows else True
+
+    def _enqueue(self, table: str, rows: List[Tuple]) -> bool:
+        if self.pending + len(rows) > self.max_queue:
+            DB_RECORDS_TOTAL.labels(table=table, result="dropped").inc(len(rows))
+            return False
+        pending = self._pending[table]
+        pending.extend(rows)
+        DB_QUEUE_DEPTH.set(self.pending)
+        if len(pending) >= self.batch_size:
+            self._wakeup.set()
+        return True
+
+    @property
+    def pending(self) -> int:
+        return sum(len(rows) for rows in self._pending.values())
+
+    # --- Writer -----------------------------------------------------------
+
+    async def start(self) -> None:
+        """Apre il pool, crea lo schema e avvia il writer"""
+        import asyncpg
+
+        self._write_errors = (OSError, asyncio.TimeoutError, asyncpg.PostgresError, asyncpg.InterfaceError)
+        self.pool = await asyncpg.create_pool(self.dsn, min_size=1, max_size=self.pool_size)
+        async with self.pool.acquire() as conn:
+            await conn.execute(SCHEMA)
+        await self.maintain()
+        self._task = asyncio.create_task(self._run())
+        logger.info(f"Call store started (retention {self.retention_days} days)")
+
+    async def _run(self) -> None:
+        while True:
+            try:
+                await asyncio.wait_for(self._wakeup.wait(), timeout=self.flush_interval)
+            except asyncio.TimeoutError:
+                pass
+            self._wakeup.clear()
+            try:
+                await self.flush()
+                if self._closing:
+                    return
+                if time.monotonic() - self._last_maintenance >= MAINTENANCE_INTERVAL:
+                    await self.maintain()
+            except Exception as e:
+                logger.error(f"Call store writer failed: {e}", exc_info=True)
+                if self._closing:
+                    return
+
+    async def flush(self) -> None:
+        """Scrive tutto ciò che è in coda, un batch alla volta"""
+        for table, columns in ((CALLS_TABLE, CALL_COLUMNS), (TRANSCRIPTS_TABLE, TRANSCRIPT_COLUMNS)):
+            while self._pending[table]:
+                pending = self._pending[table]
+                batch = pending[:self.batch_size]
+                del pending[:self.batch_size]
+                DB_QUEUE_DEPTH.set(self.pending)
+                if not await self._write(table, columns, batch):
+                    break
+
+    async def _write(self, table: str, columns: Tuple[str, ...], rows: List[Tuple]) -> bool:
+        partition_index = columns.index(PARTITION_COLUMNS[table])
+        start = time.perf_counter()
+        try:
+            async with self.pool.acquire() as conn:
+                days = {row[partition_index].astimezone(timezone.utc).date() for row in rows}
+                await self._ensure_partitions(conn, table, days)
+                await conn.copy_records_to_table(table, records=rows, columns=columns)
+        except self._write_errors as e:
+            logger.warning(f"Could not write {len(rows)} rows to {table}: {e}")
+            # Retry on the next flush if there is room, the queue bound still holds
+            if self.pending + len(rows) <= self.max_queue:
+                self._pending[table][:0] = rows
+            else:
+                DB_RECORDS_TOTAL.labels(table=table, result="failed").inc(len(rows))
+            DB_QUEUE_DEPTH.set(self.pending)
+            return False
+        DB_FLUSH_SECONDS.labels(table=table).observe(time.perf_counter() - start)
+        DB_RECORDS_TOTAL.labels(table=table, result="written").inc(len(rows))
+        return True
+
+    # --- Partitions -------------------------------------------------------
+
+    async def _ensure_partitions(self, conn: "asyncpg.Connection", table: str, days: Iterable[date]) -> None:
+        known = self._partitions[table]
+        for day in sorted(set(days) - known):
+            lower = datetime(day.year, day.month, day.day, tzinfo=timezone.utc)
+            upper = lower + timedelta(days=1)
+            await conn.execute(
+                f"CREATE TABLE IF NOT EXISTS {partition_name(table, day)} PARTITION OF {table} "
+                f"FOR VALUES FROM ('{lower.isoformat()}') TO ('{upper.isoformat()}')"
+            )
+            known.add(day)
+
+    async def maintain(self) -> List[str]:
+        """
+        Crea le partizioni di oggi e domani ed elimina quelle oltre la retention
+
+        Returns:
+            Nomi delle partizioni eliminate
+        """
+        self._last_maintenance = time.monotonic()
+        today = datetime.now(timezone.utc).date()
+        dropped = []
+        async with self.pool.acquire() as conn:
+            for table in PARTITION_COLUMNS:
+                await self._ensure_partitions(conn, table, (today, today + timedelta(days=1)))
+                if not self.retention_days:
+                    continue
+                cutoff = today - timedelta(days=self.retention_days)
+                for name in await self._list_partitions(conn, table):
+                    day = datetime.strptime(name.rsplit("_p", 1)[1], PARTITION_SUFFIX_FORMAT).date()
+                    if day < cutoff:
+                        await conn.execute(f"DROP TABLE IF EXISTS {name}")
+                        self._partitions[table].discard(day)
+                        dropped.append(name)
+        if dropped:
+            logger.info(f"Dropped {len(dropped)} partitions older than {self.retention_days} days: {dropped}")
+        return dropped
+
+    @staticmethod
+    async def _list_partitions(conn: "asyncpg.Connection", table: str) -> List[str]:
+        rows = await conn.fetch(
+            """
+            SELECT child.relname
+            FROM pg_inherits
+            JOIN pg_class parent ON parent.oid = pg_inherits.inhparent
+            JOIN pg_class child ON child.oid = pg_inherits.inhrelid
+            WHERE parent.relname = $1 AND child.relname LIKE $1 || '\\_p%'
+            """,
+            table,
+        )
+        return [row["relname"] for row in rows]
+
+    async def close(self) -> None:
+        """Ferma il writer dopo aver scritto i record ancora in coda"""
+        self._closing = True
+        self._wakeup.set()
+        if self._task is not None:
+            # The last loop iteration flushes what is queued, a batch is never cut in half
+            await self._task
+            self._task = None
+        if self.pool is not None:
+            await self.pool.close()
+        if self.pending:
+            logger.warning(f"Call store closed with {self.pending} unwritten records")
@@ -0,0 +1,243 @@
+"""
+Conversation Context - History della conversazione a budget di token
+
+Vocode rimanda al LLM l'intera trascrizione a ogni turno e la ritokenizza
+da capo: nelle chiamate lunghe il prompt (e quindi il tempo al primo token
+e il costo) cresce a ogni turno.
+
+Qui il prompt resta piatto:
+
+- gli ultimi keep_turns turni del chiamante (con le risposte) vanno al LLM
+  alla lettera;
+- i turni più vecchi vengono riassunti da un modello economico in un task
+  in background, fuori dal percorso critico del turno; finché il riassunto
+  non è pronto i messaggi vecchi continuano ad andare alla lettera, poi il
+  riassunto li sostituisce in un solo passo;
+- il riassunto va in coda al system prompt;
+- se la history supera comunque max_history_tokens si tolgono i messaggi
+  più vecchi (restano nella trascrizione e finiranno nel riassunto).
+
+I token sono contati per messaggio e memoizzati: a ogni turno si contano
+solo i messaggi nuovi.
+"""
+
+import asyncio
+import logging
+import time
+from dataclasses import dataclass
+from functools import lru_cache
+from typing import Any, Awaitable, Callable, Dict, List, Optional, Tuple
+
+from prometheus_client import Counter, Histogram
+from vocode.streaming.agent.token_utils import num_tokens_from_messages
+
+logger = logging.getLogger(__name__)
+
+LLM_PROMPT_TOKENS = Histogram(
+    'voice_assistant_llm_prompt_tokens',
+    'Conversation tokens sent to the LLM per turn (system prompt and summary included)',
+    buckets=(250, 500, 750, 1000, 1500, 2000, 3000, 4000, 6000, 8000, 16000),
+)
+HISTORY_SUMMARIES = Counter(
+    'voice_assistant_history_summaries_total',
+    'Background summaries of older conversation turns',
+    ['result'],  # ok, failed
+)
+HISTORY_SUMMARY_SECONDS = Histogram(
+    'voice_assistant_history_summary_seconds',
+    'Duration of a background history summary',
+    buckets=(0.25, 0.5, 1.0, 2.0, 4.0, 8.0, 16.0),
+)
+HISTORY_DROPPED_MESSAGES = Counter(
+    'voice_assistant_history_dropped_messages_total',
+    'Messages left out of the prompt to stay within the history token budget',
+)
+
+SUMMARY_HEADER = "\n\nRiassunto della parte precedente della chiamata:\n"
+SUMMARY_INSTRUCTIONS = (
+    "Riassumi in italiano la conversazione telefonica tra il cliente e l'assistente. "
+    "Conserva nomi, numeri, dati forniti dal cliente, richieste ancora aperte e "
+    "impegni presi dall'assistente. Scrivi solo il riassunto, in forma sintetica."
+)
+SUMMARY_RETRY_SECONDS = 30.0
+
+Summarizer = Callable[[Optional[str], List[Dict[str, Any]]], Awaitable[str]]
+
+
+@dataclass
+class HistoryConfig:
+    """Parametri della history a budget di token"""
+
+    keep_turns: int = 6  # Caller turns (with the replies) always sent verbatim
+    max_history_tokens: int = 1500  # Summary and messages, system prompt excluded
+    summary_trigger_tokens: int = 400  # Older messages folded into the summary past this size
+    summary_model: str = "gpt-4o-mini"
+    summary_max_tokens: int = 200
+
+
+@lru_cache(maxsize=16384)
+def _cached_tokens(model: str, role: str, content: Optional[str], name: Optional[str], function_call: Optional[Tuple]) -> int:
+    message: Dict[str, Any] = {"role": role, "content": content}
+    if name is not None:
+        message["name"] = name
+    if function_call is not None:
+        message["function_call"] = dict(function_call)
+    try:
+        tokens = num_tokens_from_messages([message], model=model)
+    except NotImplementedError:
+        tokens = num_tokens_from_messages([message], model="gpt-4")
+    return tokens - 3  # num_tokens_from_messages adds the reply priming once per list
+
+
+def message_tokens(message: Dict[str, Any], model: str) -> int:
+    """Token di un messaggio chat OpenAI (memoizzato: il prompt di sistema è uguale in ogni chiamata)"""
+    function_call = message.get("function_call")
+    return _cached_tokens(
+        model,
+        message["role"],
+        message.get("content"),
+        message.get("name"),
+        tuple(sorted(function_call.items())) if function_call else None,
+    )
+
+
+def summary_request(previous_summary: Optional[str], messages: List[Dict[str, Any]]) -> List[Dict[str, str]]:
+    """Messaggi della richiesta di riassunto: riassunto precedente + nuovi turni"""
+    lines = []
+    for message in messages:
+        role = message["role"]
+        if role == "user":
+            lines.append(f"Cliente: {message['content']}")
+        elif role == "assistant" and message.get("function_call"):
+            call = message["function_call"]
+            lines.append(f"Assistente (azione {call.get('name')}): {call.get('arguments')}")
+        elif role == "assistant":
+            lines.append(f"Assistente: {message['content']}")
+        elif role == "function":
+            lines.append(f"Esito azione {message.get('name')}: {message['content']}")
+    text = "\n".join(lines)
+    if previous_summary:
+        text = f"Riassunto finora:\n{previous_summary}\n\nSeguito della conversazione:\n{text}"
+    return [
+        {"role": "system", "content": SUMMARY_INSTRUCTIONS},
+        {"role": "user", "content": text},
+    ]
+
+
+def openai_summarizer(openai_client: Any, model: str, max_tokens: int = 200) -> Summarizer:
+    """Summarizer che usa un modello OpenAI (chiamata non in streaming)"""
+
+    async def summarize(previous_summary: Optional[str], messages: List[Dict[str, Any]]) -> str:
+        response = await openai_client.chat.completions.create(
+            model=model,
+            messages=summary_request(previous_summary, messages),
+            max_tokens=max_tokens,
+            temperature=0,
+        )
+        return (response.choices[0].message.content or "").strip()
+
+    return summarize
+
+
+class ConversationContext:
+    """
+    History di una conversazione: finestra recente + riassunto in background
+
+    Args:
+        model: Modello usato per contare i token
+        summarize: Coroutine (riassunto precedente, messaggi) -> nuovo riassunto
+        config: Budget e finestra della history
+    """
+
+    def __init__(self, model: str, summarize: Summarizer, config: Optional[HistoryConfig] = None):
+        self.model = model
+        self.summarize = summarize
+        self.config = config or HistoryConfig()
+        self.summary: Optional[str] = None
+        # History messages (system prompt excluded) already folded into the summary
+        self.summarized_count = 0
+        self._summary_task: Optional[asyncio.Task] = None
+        self._retry_at = 0.0
+
+    def build(self, messages: List[Dict[str, Any]]) -> List[Dict[str, Any]]:
+        """
+        Riduce i messaggi della trascrizione al prompt da inviare
+
+        Args:
+            messages: Messaggi chat della trascrizione completa, system prompt in testa
+
+        Returns:
+            System prompt (con il riassunto), messaggi non ancora riassunti e finestra recente
+        """
+        system, history = messages[0], messages[1:]
+        recent_start = self._recent_start(history)
+        # The transcript only grows: messages before the window never change again
+        older = history[min(self.summarized_count, recent_start):recent_start]
+        recent = history[recent_start:]
+
+        older_tokens = sum(message_tokens(m, self.model) for m in older)
+        if older_tokens >= self.config.summary_trigger_tokens:
+            self._start_summary(older, recent_start)
+
+        if self.summary:
+            system = {**system, "content": f"{system['content'] or ''}{SUMMARY_HEADER}{self.summary}"}
+        body = older + recent
+        tokens = [message_tokens(m, self.model) for m in body]
+        budget = self.config.max_history_tokens - (
+            message_tokens({"role": "system", "content": self.summary}, self.model) if self.summary else 0
+        )
+        dropped = 0
+        while len(body) > 1 and (sum(tokens) > budget or body[0]["role"] == "function"):
+            # A function result without its call is rejected by the API: it goes together with it
+            body.pop(0)
+            tokens.pop(0)
+            dropped += 1
+        if dropped:
+            HISTORY_DROPPED_MESSAGES.inc(dropped)
+
+        LLM_PROMPT_TOKENS.observe(message_tokens(system, self.model) + sum(tokens))
+        return [system] + body
+
+    def close(self) -> None:
+        """Annulla il riassunto in corso (la chiamata è finita)"""
+        if self._summary_task is not None and not self._summary_task.done():
+            self._summary_task.cancel()
+        self._summary_task = None
+
+    def _recent_start(self, history: List[Dict[str, Any]]) -> int:
+        turns = 0
+        for index in range(len(history) - 1, -1, -1):
+            if history[index]["role"] == "user":
+                turns += 1
+                if turns == self.config.keep_turns:
+                    return index
+        return 0
+
+    def _start_summary(self, older: List[Dict[str, Any]], end: int) -> None:
+        if self._summary_task is not None and not self._summary_task.done():
+            return
+        if time.monotonic() < self._retry_at:
+            return
+        self._summary_task = asyncio.create_task(self._fold(list(older), end))
+
+    async def _fold(self, older: List[Dict[str, Any]], end: int) -> None:
+        started = time.perf_counter()
+        try:
+            summary = await self.summarize(self.summary, older)
+        except asyncio.CancelledError:
+            raise
+        except Exception as e:
+            HISTORY_SUMMARIES.labels(result="failed").inc()
+            self._retry_at = time.monotonic() + SUMMARY_RETRY_SECONDS
+            logger.warning(f"History summary failed, older turns stay verbatim: {e}")
+            return
+        HISTORY_SUMMARY_SECONDS.observe(time.perf_counter() - started)
+        if not summary:
+            HISTORY_SUMMARIES.labels(result="failed").inc()
+            self._retry_at = time.monotonic() + SUMMARY_RETRY_SECONDS
+            return
+        HISTORY_SUMMARIES.labels(result="ok").inc()
+        # Swapped in one step on the event loop: a turn sees either the old or the new state
+        self.summary = summary
+        self.summarized_count = end
+        logger.debug(f"Folded {len(older)} messages into the history summary ({len(summary)} chars)")
@@ -0,0 +1,196 @@
+"""
+Drain - Chiusura graduale del pod senza tagliare le chiamate in corso
+
+Quando parte il drain (SIGTERM da Kubernetes durante un rollout o uno
+scale-down, oppure POST /admin/drain):
+
+- /ready risponde 503 e il pod esce dagli endpoint del Service;
+- le nuove chiamate vengono rifiutate (Twilio viene rimandato a un'altra
+  replica, SIP riceve 486/503);
+- le chiamate già in corso su questo pod continuano fino alla fine, o fino
+  a drain_timeout secondi (da tenere sotto terminationGracePeriodSeconds).
+
+Solo dopo il drain il processo esegue lo shutdown normale di uvicorn.
+"""
+
+import asyncio
+import logging
+import os
+import signal
+import time
+from typing import Any, Callable, Dict, Optional, Set
+
+from prometheus_client import Counter, Gauge
+
+logger = logging.getLogger(__name__)
+
+DRAINING = Gauge(
+    'voice_assistant_draining',
+    '1 while the pod is draining and refuses new calls',
+    multiprocess_mode='livemax',
+)
+DRAIN_REMAINING_CALLS = Gauge(
+    'voice_assistant_drain_remaining_calls',
+    'Calls still running on this pod (the drain waits for them)',
+    multiprocess_mode='livesum',
+)
+DRAIN_ELAPSED_SECONDS = Gauge(
+    'voice_assistant_drain_elapsed_seconds',
+    'Seconds since the drain started',
+    multiprocess_mode='livemax',
+)
+DRAIN_REJECTED_CALLS = Counter(
+    'voice_assistant_drain_rejected_calls_total',
+    'New calls turned away because the pod is draining',
+    ['provider'],
+)
+DRAIN_CALLS_TOTAL = Counter(
+    'voice_assistant_drain_calls_total',
+    'Calls that were running when the drain started, by outcome',
+    ['result'],  # completed, cut (still running at the deadline)
+)
+
+
+class DrainController:
+    """
+    Stato di drain del pod e chiamate che vi sono in corso
+
+    Args:
+        timeout: Secondi massimi di attesa delle chiamate in corso
+    """
+
+    def __init__(self, timeout: float = 25.0):
+        self.timeout = timeout
+        self.draining = False
+        self.reason: Optional[str] = None
+        self.started_at: Optional[float] = None
+        # Conversations whose media runs on this pod (Twilio stream or SIP RTP)
+        self._calls: Set[str] = set()
+        self._drained_calls: Set[str] = set()
+        self._changed = asyncio.Event()
+        self._exit_task: Optional[asyncio.Task] = None
+
+    @property
+    def active_calls(self) -> int:
+        return len(self._calls)
+
+    def call_started(self, call_id: str) -> None:
+        self._calls.add(call_id)
+        self._update_gauges()
+
+    def call_ended(self, call_id: str) -> None:
+        if call_id not in self._calls:
+            return
+        self._calls.discard(call_id)
+        if call_id in self._drained_calls:
+            self._drained_calls.discard(call_id)
+            DRAIN_CALLS_TOTAL.labels(result="completed").inc()
+        self._update_gauges()
+        self._changed.set()
+
+    def reject(self, provider: str) -> None:
+        """Conta una nuova chiamata rifiutata durante il drain"""
+        DRAIN_REJECTED_CALLS.labels(provider=provider).inc()
+
+    def start(self, reason: str) -> bool:
+        """
+        Entra in drain (idempotente)
+
+        Args:
+            reason: Origine del drain, per i log (es. "SIGTERM", "admin")
+
+        Returns:
+            True se il drain è partito ora, False se era già in corso
+        """
+        if self.draining:
+            return False
+        self.draining = True
+        self.reason = reason
+        self.started_at = time.monotonic()
+        self._drained_calls = set(self._calls)
+        DRAINING.set(1)
+        self._update_gauges()
+        logger.warning(
+            f"Draining ({reason}): refusing new calls, waiting up to {self.timeout:.0f}s "
+            f"for {len(self._calls)} active calls"
+        )
+        return True
+
+    def resume(self) -> bool:
+        """Annulla un drain avviato dall'endpoint admin (non quello di SIGTERM)"""
+        if not self.draining or self._exit_task is not None:
+            return False
+        self.draining = False
+        self.reason = None
+        self.started_at = None
+        self._drained_calls = set()
+        DRAINING.set(0)
+        DRAIN_ELAPSED_SECONDS.set(0)
+        logger.info("Drain cancelled, accepting calls again")
+        return True
+
+    async def wait(self) -> bool:
+        """
+        Attende la fine delle chiamate in corso, al massimo fino alla scadenza del drain
+
+        Returns:
+            True se tutte le chiamate sono finite, False se la scadenza è arrivata prima
+        """
+        deadline = (self.started_at or time.monotonic()) + self.timeout
+        while self._calls:
+            remaining = deadline - time.monotonic()
+            if remaining <= 0:
+                break
+            self._changed.clear()
+            try:
+                await asyncio.wait_for(self._changed.wait(), timeout=min(remaining, 5.0))
+            except asyncio.TimeoutError:
+                pass
+            self._update_gauges()
+        if self._calls:
+            DRAIN_CALLS_TOTAL.labels(result="cut").inc(len(self._calls & self._drained_calls))
+            logger.warning(f"Drain deadline reached with {len(self._calls)} calls still running")
+            return False
+        logger.info(f"Drain complete in {time.monotonic() - (self.started_at or time.monotonic()):.1f}s")
+        return True
+
+    def install_signal_handler(self, on_drained: Optional[Callable[[], None]] = None) -> None:
+        """
+        Sostituisce la gestione di SIGTERM di uvicorn: prima il drain, poi lo shutdown
+
+        Args:
+            on_drained: Chiamata a drain finito (default: SIGINT al processo, che uvicorn
+                gestisce con il suo shutdown normale)
+        """
+        loop = asyncio.get_running_loop()
+        loop.add_signal_handler(signal.SIGTERM, self._on_sigterm, on_drained or _interrupt_self)
+
+    def status(self) -> Dict[str, Any]:
+        return {
+            "draining": self.draining,
+            "reason": self.reason,
+            "active_calls": self.active_calls,
+            "elapsed_seconds": round(time.monotonic() - self.started_at, 1) if self.started_at else 0.0,
+            "timeout_seconds": self.timeout,
+        }
+
+    def _on_sigterm(self, on_drained: Callable[[], None]) -> None:
+        if self._exit_task is not None:
+            logger.info("SIGTERM received again, drain already in progress")
+            return
+        self.start("SIGTERM")
+        self._exit_task = asyncio.create_task(self._drain_and_exit(on_drained))
+
+    async def _drain_and_exit(self, on_drained: Callable[[], None]) -> None:
+        await self.wait()
+        on_drained()
+
+    def _update_gauges(self) -> None:
+        DRAIN_REMAINING_CALLS.set(len(self._calls) if self.draining else 0)
+        if self.started_at is not None:
+            DRAIN_ELAPSED_SECONDS.set(time.monotonic() - self.started_at)
+
+
+def _interrupt_self() -> None:
+    # Uvicorn still handles SIGINT: this starts its usual graceful shutdown
+    os.kill(os.getpid(), signal.SIGINT)
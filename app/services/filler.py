@@ -0,0 +1,241 @@
+"""
+Filler - Riempitivi audio quando la risposta tarda
+
+Se dalla fine del parlato del chiamante passano più di first_ms senza
+audio di risposta, il chiamante sente silenzio e spesso dice "pronto?",
+che apre un nuovo turno e rallenta ancora. Il FillerScheduler di ogni
+chiamata segue le fasi del turno (TurnLatencyTracker) e, oltre le soglie,
+invia una clip breve ("Un attimo...", "Certo, verifico.") presa dalla
+FillerClipBank.
+
+Le clip sono frasi fisse (call_handling.filler_phrases), quindi già
+pre-sintetizzate dalla PhraseAudioCache con la voce di ogni tenant. Non
+passano da Vocode né dal transcript: i frame vengono inviati all'output
+device al ritmo di riproduzione, e il primo frame della risposta vera
+interrompe la clip (resta in coda al massimo un frame), così la risposta
+non aspetta mai il riempitivo. La clip si interrompe anche se il
+chiamante riprende a parlare.
+"""
+
+import asyncio
+import logging
+import time
+from dataclasses import dataclass
+from typing import TYPE_CHECKING, Any, Callable, Dict, List, Optional, Sequence
+
+from prometheus_client import Counter
+from vocode.streaming.models.audio import AudioEncoding
+from vocode.streaming.models.synthesizer import ElevenLabsSynthesizerConfig, SynthesizerConfig
+from vocode.streaming.models.transcriber import Transcription
+
+from monitoring.latency import TurnLatencyTracker
+
+if TYPE_CHECKING:
+    # Imported in clips(): tts_cache loads the ElevenLabs SDK, which "import main" should not pay for
+    from services.tts_cache import PhraseAudioCache
+
+logger = logging.getLogger(__name__)
+
+FILLER_CLIPS_TOTAL = Counter(
+    'voice_assistant_filler_clips_total',
+    'Filler clips played to mask a late reply, by the turn stage that was late',
+    ['stage'],  # endpointing, llm_first_token, tts_first_byte, audio_first_frame
+)
+FILLER_CUT_TOTAL = Counter(
+    'voice_assistant_filler_cut_total',
+    'Filler clips stopped before their end',
+    ['reason'],  # reply, caller
+)
+
+
+@dataclass
+class FillerConfig:
+    """Soglie dei riempitivi, in millisecondi dalla fine del parlato del chiamante"""
+
+    first_ms: int = 800
+    repeat_ms: int = 2500  # Silence after a clip before the next one
+    max_per_turn: int = 2
+    frame_ms: int = 100  # Pacing of the clip frames: also the most a reply can wait behind a clip
+
+
+class FillerClipBank:
+    """
+    Audio delle frasi di riempitivo, per voce, letto dalla PhraseAudioCache
+
+    Args:
+        phrase_cache: Cache in cui il warm-up ha sintetizzato le frasi fisse
+        phrases: Frasi dei riempitivi, nell'ordine in cui vengono usate
+    """
+
+    def __init__(self, phrase_cache: "PhraseAudioCache", phrases: Sequence[str] = ()):
+        self.phrase_cache = phrase_cache
+        self.phrases = list(phrases)
+        self._audio: Dict[str, bytes] = {}  # phrase_cache_key -> audio
+
+    def set_phrases(self, phrases: Sequence[str]) -> None:
+        """Sostituisce le frasi (ricaricamento della config)"""
+        self.phrases = list(phrases)
+        self._audio.clear()
+
+    async def clips(self, synthesizer_config: SynthesizerConfig) -> List[bytes]:
+        """
+        Clip disponibili per la voce e il formato di uscita di una chiamata
+
+        Le frasi non ancora sintetizzate (warm-up in corso) mancano dalla lista:
+        le chiamate successive le trovano.
+        """
+        if not isinstance(synthesizer_config, ElevenLabsSynthesizerConfig):
+            return []
+        from services.tts_cache import phrase_cache_key
+
+        clips = []
+        for text in self.phrases:
+            key = phrase_cache_key(text, synthesizer_config)
+            audio = self._audio.get(key)
+            if audio is None:
+                audio = await self.phrase_cache.get(key, synthesizer_config.audio_encoding)
+                if audio is None:
+                    continue
+                self._audio[key] = audio
+            clips.append(audio)
+        return clips
+
+
+class FillerScheduler:
+    """
+    Riempitivi di una conversazione
+
+    Come instrument_conversation, avvolge sull'istanza la coda di output del
+    transcriber (apre il turno alla trascrizione finale) e consume_nonblocking
+    dell'output device (il primo frame della risposta chiude il turno). Va
+    agganciato prima di instrument_conversation: l'audio delle clip esce dal
+    consume_nonblocking originale e non conta come risposta nelle latenze.
+
+    Args:
+        conversation: StreamingConversation (Twilio o SIP)
+        config: Soglie
+        clip_bank: Audio delle frasi
+        tracker: Tracker delle fasi del turno
+        caller_speaking: Restituisce True mentre il chiamante parla (VAD locale)
+    """
+
+    def __init__(
+        self,
+        conversation: Any,
+        config: FillerConfig,
+        clip_bank: FillerClipBank,
+        tracker: TurnLatencyTracker,
+        caller_speaking: Optional[Callable[[], bool]] = None,
+    ):
+        self.conversation = conversation
+        self.config = config
+        self.clip_bank = clip_bank
+        self.tracker = tracker
+        self.caller_speaking = caller_speaking
+        self.clips: List[bytes] = []
+        self._next_clip = 0
+        self._turn_open = False
+        self._played = 0
+        self._endpointing_late = False
+        self._timer: Optional[asyncio.TimerHandle] = None
+        self._playback: Optional[asyncio.Task] = None
+        self._load_task: Optional[asyncio.Task] = None
+
+    def attach(self) -> None:
+        conversation = self.conversation
+        output_device = conversation.output_device
+        self._send = output_device.consume_nonblocking
+
+        def consume_reply(chunk: bytes):
+            if self._turn_open:
+                self._close_turn("reply")
+            self._send(chunk)
+
+        output_device.consume_nonblocking = consume_reply
+
+        transcription_queue = conversation.transcriber.output_queue
+        put_transcription = transcription_queue.put_nowait
+
+        def put_nowait(transcription):
+            if isinstance(transcription, Transcription) and transcription.is_final:
+                self._open_turn()
+            return put_transcription(transcription)
+
+        transcription_queue.put_nowait = put_nowait
+
+        bytes_per_sample = 2 if output_device.audio_encoding == AudioEncoding.LINEAR16 else 1
+        self._frame_bytes = max(1, int(output_device.sampling_rate * self.config.frame_ms / 1000) * bytes_per_sample)
+        self._load_task = asyncio.create_task(self._load_clips())
+
+    def close(self) -> None:
+        self._close_turn(None)
+        if self._load_task is not None:
+            self._load_task.cancel()
+
+    async def _load_clips(self) -> None:
+        synthesizer_config = self.conversation.synthesizer.get_synthesizer_config()
+        try:
+            self.clips = await self.clip_bank.clips(synthesizer_config)
+        except Exception as e:
+            logger.warning(f"Filler clips not available for conversation {self.conversation.id}: {e}")
+
+    def _open_turn(self) -> None:
+        # The latency hooks wrap this one: the tracker already saw the final transcript
+        self._close_turn(None)
+        if not self.clips:
+            return
+        speech_end = self.tracker.turn_speech_end or time.monotonic()
+        delay = speech_end + self.config.first_ms / 1000 - time.monotonic()
+        self._turn_open = True
+        self._played = 0
+        self._endpointing_late = delay <= 0
+        self._timer = asyncio.get_running_loop().call_later(max(0.0, delay), self._fire)
+
+    def _close_turn(self, cut_reason: Optional[str]) -> None:
+        self._turn_open = False
+        if self._timer is not None:
+            self._timer.cancel()
+            self._timer = None
+        if self._playback is not None and not self._playback.done():
+            self._playback.cancel()
+            if cut_reason is not None:
+                FILLER_CUT_TOTAL.labels(reason=cut_reason).inc()
+        self._playback = None
+
+    def _busy(self) -> bool:
+        conversation = self.conversation
+        if self.caller_speaking is not None and self.caller_speaking():
+            return True
+        if not conversation.initial_message_tracker.is_set():
+            return True
+        return conversation.transcriptions_worker.is_bot_still_speaking()
+
+    def _fire(self) -> None:
+        self._timer = None
+        if not self._turn_open:
+            return
+        stage = self.tracker.pending_stage()
+        if stage is None or self._busy():
+            # Reply already audible, caller talking again or bot still speaking: nothing to mask
+            self._turn_open = False
+            return
+        if self._played == 0 and self._endpointing_late:
+            stage = "endpointing"
+        clip = self.clips[self._next_clip % len(self.clips)]
+        self._next_clip += 1
+        self._played += 1
+        FILLER_CLIPS_TOTAL.labels(stage=stage).inc()
+        logger.debug(f"Filler clip on conversation {self.conversation.id} (late stage: {stage})")
+        self._playback = asyncio.create_task(self._play(clip))
+
+    async def _play(self, clip: bytes) -> None:
+        frame_seconds = self.config.frame_ms / 1000
+        for offset in range(0, len(clip), self._frame_bytes):
+            if self.caller_speaking is not None and self.caller_speaking():
+                FILLER_CUT_TOTAL.labels(reason="caller").inc()
+                self._turn_open = False
+                return
+            self._send(clip[offset:offset + self._frame_bytes])
+            await asyncio.sleep(frame_seconds)
+        if self._turn_open and self._played < self.config.max_per_turn:
+            self._timer = asyncio.get_running_loop().call_later(self.config.repeat_ms / 1000, self._fire)
@@ -0,0 +1,476 @@
+"""
+LLM Dispatch - Richieste al LLM con hedging tra provider e circuit breaker
+
+La coda lunga del tempo al primo token di OpenAI diventa silenzio in
+chiamata. Il dispatcher manda la richiesta al backend primario e, se il
+primo token non arriva entro una scadenza (un percentile del tempo al
+primo token recente del primario, limitato tra un minimo e un massimo),
+lancia una seconda richiesta sul backend successivo: stesso provider con
+un altro modello, oppure Anthropic. Vince chi produce per primo un token,
+l'altra richiesta viene cancellata e la sua connessione chiusa. Un errore
+prima del primo token fa partire subito la seconda richiesta.
+
+Ogni backend ha un circuit breaker: dopo alcuni errori consecutivi resta
+escluso per un cooldown, poi una sola richiesta di prova decide se
+riammetterlo. Il routing tiene conto della latenza: un backend il cui
+tempo al primo token mediano supera la scadenza massima di hedging passa
+in fondo alla lista finché non torna veloce.
+
+Gli stream restituiti producono ChatCompletionChunk come quelli di
+OpenAI, quindi l'agente li consuma con openai_get_tokens senza sapere
+quale provider ha risposto.
+"""
+
+import asyncio
+import logging
+import time
+import uuid
+from collections import deque
+from typing import Any, AsyncGenerator, AsyncIterator, Deque, Dict, List, Optional, Set, Tuple
+
+from openai import AsyncOpenAI
+from openai.types.chat.chat_completion_chunk import ChatCompletionChunk, Choice, ChoiceDelta
+from prometheus_client import Counter, Gauge, Histogram
+
+logger = logging.getLogger(__name__)
+
+LLM_DISPATCH_TOTAL = Counter(
+    'voice_assistant_llm_dispatch_total',
+    'LLM requests through the dispatcher, by the request that produced the first token',
+    ['winner'],  # primary, hedge, failed
+)
+LLM_HEDGES_TOTAL = Counter(
+    'voice_assistant_llm_hedges_total',
+    'Second LLM requests started by the dispatcher',
+    ['reason'],  # deadline (no first token in time), error (primary failed)
+)
+LLM_DISPATCH_FIRST_TOKEN_SECONDS = Histogram(
+    'voice_assistant_llm_dispatch_first_token_seconds',
+    'Time to first token seen by the agent, after hedging',
+    buckets=(0.1, 0.2, 0.3, 0.5, 0.75, 1.0, 1.5, 2.0, 3.0, 5.0, 10.0),
+)
+LLM_BACKEND_FIRST_TOKEN_SECONDS = Histogram(
+    'voice_assistant_llm_backend_first_token_seconds',
+    'Time to first token of each backend (requests that got one)',
+    ['backend'],
+    buckets=(0.1, 0.2, 0.3, 0.5, 0.75, 1.0, 1.5, 2.0, 3.0, 5.0, 10.0),
+)
+LLM_BACKEND_ERRORS_TOTAL = Counter(
+    'voice_assistant_llm_backend_errors_total',
+    'LLM requests that failed before the first token',
+    ['backend'],
+)
+LLM_CIRCUIT_STATE = Gauge(
+    'voice_assistant_llm_circuit_state',
+    'Circuit breaker of each LLM backend (0 closed, 1 half-open, 2 open)',
+    ['backend'],
+    multiprocess_mode='livemax',
+)
+
+CIRCUIT_CLOSED = "closed"
+CIRCUIT_HALF_OPEN = "half_open"
+CIRCUIT_OPEN = "open"
+_CIRCUIT_GAUGE = {CIRCUIT_CLOSED: 0, CIRCUIT_HALF_OPEN: 1, CIRCUIT_OPEN: 2}
+
+
+class CircuitBreaker:
+    """
+    Circuit breaker di un backend
+
+    Args:
+        name: Nome del backend (label delle metriche)
+        failure_threshold: Errori consecutivi che aprono il circuito
+        cooldown: Secondi di esclusione prima della richiesta di prova
+    """
+
+    def __init__(self, name: str, failure_threshold: int = 3, cooldown: float = 30.0):
+        self.name = name
+        self.failure_threshold = max(1, failure_threshold)
+        self.cooldown = cooldown
+        self.state = CIRCUIT_CLOSED
+        self.failures = 0
+        self.opened_at = 0.0
+        self._probing = False
+        LLM_CIRCUIT_STATE.labels(backend=name).set(0)
+
+    def available(self) -> bool:
+        """True se il backend può ricevere una richiesta adesso"""
+        if self.state == CIRCUIT_CLOSED:
+            return True
+        if self.state == CIRCUIT_OPEN and time.monotonic() - self.opened_at >= self.cooldown:
+            self._set_state(CIRCUIT_HALF_OPEN)
+        # Half-open lets a single probe through
+        return self.state == CIRCUIT_HALF_OPEN and not self._probing
+
+    def attempt(self) -> None:
+        if self.state == CIRCUIT_HALF_OPEN:
+            self._probing = True
+
+    def record_success(self) -> None:
+        self.failures = 0
+        self._probing = False
+        if self.state != CIRCUIT_CLOSED:
+            logger.info(f"LLM backend {self.name} recovered, circuit closed")
+            self._set_state(CIRCUIT_CLOSED)
+
+    def record_failure(self) -> None:
+        self.failures += 1
+        self._probing = False
+        if self.state == CIRCUIT_HALF_OPEN or self.failures >= self.failure_threshold:
+            if self.state != CIRCUIT_OPEN:
+                logger.warning(f"LLM backend {self.name} failing, circuit open for {self.cooldown:.0f}s")
+            self.opened_at = time.monotonic()
+            self._set_state(CIRCUIT_OPEN)
+
+    def record_cancelled(self) -> None:
+        # A probe that lost the race proved nothing: the next request probes again
+        self._probing = False
+
+    def _set_state(self, state: str) -> None:
+        self.state = state
+        LLM_CIRCUIT_STATE.labels(backend=self.name).set(_CIRCUIT_GAUGE[state])
+
+
+class LatencyWindow:
+    """Tempi al primo token recenti di un backend, per percentili"""
+
+    def __init__(self, size: int = 200):
+        self._samples: Deque[float] = deque(maxlen=size)
+
+    def __len__(self) -> int:
+        return len(self._samples)
+
+    def add(self, seconds: float) -> None:
+        self._samples.append(seconds)
+
+    def percentile(self, fraction: float) -> Optional[float]:
+        if not self._samples:
+            return None
+        ordered = sorted(self._samples)
+        return ordered[min(len(ordered) - 1, int(len(ordered) * fraction))]
+
+
+def _chunk(model: str, completion_id: str, content: Optional[str] = None, finish_reason: Optional[str] = None) -> ChatCompletionChunk:
+    return ChatCompletionChunk(
+        id=completion_id,
+        object="chat.completion.chunk",
+        created=int(time.time()),
+        model=model,
+        choices=[Choice(index=0, delta=ChoiceDelta(content=content), finish_reason=finish_reason)],
+    )
+
+
+class LlmBackend:
+    """
+    Un provider/modello a cui il dispatcher può mandare la richiesta
+
+    Args:
+        name: Nome del backend (label delle metriche, log)
+        provider: Provider (openai, anthropic)
+        model: Modello da usare (None = quello della richiesta)
+        breaker_failures: Errori consecutivi che aprono il circuito
+        breaker_cooldown: Secondi di esclusione dopo l'apertura
+    """
+
+    def __init__(
+        self,
+        name: str,
+        provider: str,
+        model: Optional[str] = None,
+        breaker_failures: int = 3,
+        breaker_cooldown: float = 30.0,
+    ):
+        self.name = name
+        self.provider = provider
+        self.model = model
+        self.breaker = CircuitBreaker(name, breaker_failures, breaker_cooldown)
+        self.latency = LatencyWindow()
+
+    def accepts(self, chat_parameters: Dict[str, Any]) -> bool:
+        """True se il backend sa servire la richiesta (es. function calling)"""
+        return True
+
+    def model_for(self, chat_parameters: Dict[str, Any]) -> str:
+        return self.model or chat_parameters.get("model", "")
+
+    def stream(self, chat_parameters: Dict[str, Any]) -> AsyncGenerator[ChatCompletionChunk, None]:
+        raise NotImplementedError
+
+
+class OpenAIBackend(LlmBackend):
+    """Chat completions OpenAI in streaming (anche endpoint compatibili)"""
+
+    def __init__(self, name: str, client: AsyncOpenAI, model: Optional[str] = None, **kwargs):
+        super().__init__(name, "openai", model, **kwargs)
+        # Failover is the dispatcher's job: the SDK's own retries would only delay it
+        self.client = client.with_options(max_retries=0)
+
+    async def stream(self, chat_parameters: Dict[str, Any]) -> AsyncGenerator[ChatCompletionChunk, None]:
+        stream = await self.client.chat.completions.create(
+            **dict(chat_parameters, model=self.model_for(chat_parameters), stream=True)
+        )
+        try:
+            async for chunk in stream:
+                yield chunk
+        finally:
+            await stream.response.aclose()
+
+
+class AnthropicBackend(LlmBackend):
+    """
+    Messages API di Anthropic in streaming, tradotta in chunk OpenAI
+
+    Il system prompt va nel campo system, i messaggi consecutivi dello
+    stesso ruolo vengono uniti. Le richieste con function calling restano
+    agli altri backend.
+    """
+
+    def __init__(self, name: str, api_key: str, model: str, base_url: Optional[str] = None, **kwargs):
+        super().__init__(name, "anthropic", model, **kwargs)
+        from anthropic import AsyncAnthropic
+
+        self.client = AsyncAnthropic(api_key=api_key, base_url=base_url, max_retries=0)
+
+    def accepts(self, chat_parameters: Dict[str, Any]) -> bool:
+        return not chat_parameters.get("functions") and not chat_parameters.get("tools")
+
+    async def stream(self, chat_parameters: Dict[str, Any]) -> AsyncGenerator[ChatCompletionChunk, None]:
+        system, messages = anthropic_messages(chat_parameters.get("messages", []))
+        request: Dict[str, Any] = {
+            "model": self.model,
+            "messages": messages,
+            "max_tokens": chat_parameters.get("max_tokens") or 1024,
+            "stream": True,
+        }
+        if system:
+            request["system"] = system
+        if chat_parameters.get("temperature") is not None:
+            request["temperature"] = min(1.0, chat_parameters["temperature"])
+        stream = await self.client.messages.create(**request)
+        completion_id = f"msg-{uuid.uuid4().hex[:12]}"
+        try:
+            async for event in stream:
+                if event.type == "content_block_delta" and getattr(event.delta, "text", None):
+                    yield _chunk(self.model, completion_id, content=event.delta.text)
+                elif event.type == "message_stop":
+                    yield _chunk(self.model, completion_id, finish_reason="stop")
+        finally:
+            await stream.response.aclose()
+
+
+def anthropic_messages(messages: List[Dict[str, Any]]) -> Tuple[str, List[Dict[str, str]]]:
+    """
+    Converte i messaggi OpenAI nel formato della Messages API
+
+    Returns:
+        (system prompt, messaggi user/assistant alternati che iniziano con user)
+    """
+    system_parts = []
+    converted: List[Dict[str, str]] = []
+    for message in messages:
+        role = message.get("role")
+        content = message.get("content") or ""
+        if role == "system":
+            system_parts.append(content)
+            continue
+        # Function results are read back to the model as caller-side context
+        role = "assistant" if role == "assistant" else "user"
+        if not content:
+            continue
+        if converted and converted[-1]["role"] == role:
+            converted[-1]["content"] += "\n" + content
+        else:
+            converted.append({"role": role, "content": content})
+    # The greeting is the bot's first message; the API wants the user to speak first
+    if not converted or converted[0]["role"] != "user":
+        converted.insert(0, {"role": "user", "content": "(inizio chiamata)"})
+    return "\n\n".join(system_parts), converted
+
+
+class DispatchedStream:
+    """Stream del backend che ha vinto, a partire dal primo chunk già ricevuto"""
+
+    def __init__(self, backend: LlmBackend, model: str, first: ChatCompletionChunk, rest: AsyncGenerator):
+        self.backend = backend
+        self.model = model
+        self._first: Optional[ChatCompletionChunk] = first
+        self._rest = rest
+
+    def __aiter__(self) -> AsyncIterator[ChatCompletionChunk]:
+        return self._iterate()
+
+    async def _iterate(self) -> AsyncGenerator[ChatCompletionChunk, None]:
+        try:
+            if self._first is not None:
+                first, self._first = self._first, None
+                yield first
+            async for chunk in self._rest:
+                yield chunk
+        finally:
+            await self._rest.aclose()
+
+    async def close(self) -> None:
+        await self._rest.aclose()
+
+
+class LlmDispatcher:
+    """
+    Instradamento delle richieste LLM con hedging e circuit breaker
+
+    Args:
+        backends: Backend in ordine di preferenza; il primo è il primario
+        hedge_percentile: Percentile del tempo al primo token del primario
+            usato come scadenza per la seconda richiesta
+        min_hedge_delay: Scadenza minima (secondi)
+        max_hedge_delay: Scadenza massima, usata anche finché non ci sono
+            abbastanza campioni
+        min_samples: Campioni necessari prima di usare il percentile
+    """
+
+    def __init__(
+        self,
+        backends: List[LlmBackend],
+        hedge_percentile: float = 0.9,
+        min_hedge_delay: float = 0.3,
+        max_hedge_delay: float = 2.0,
+        min_samples: int = 20,
+    ):
+        if not backends:
+            raise ValueError("LlmDispatcher needs at least one backend")
+        self.backends = backends
+        self.hedge_percentile = hedge_percentile
+        self.min_hedge_delay = min_hedge_delay
+        self.max_hedge_delay = max(min_hedge_delay, max_hedge_delay)
+        self.min_samples = min_samples
+
+    def route(self, chat_parameters: Dict[str, Any]) -> List[LlmBackend]:
+        """
+        Backend per la richiesta: primario e candidato per l'hedge
+
+        Returns:
+            Backend disponibili, il più adatto per primo
+        """
+        accepting = [backend for backend in self.backends if backend.accepts(chat_parameters)]
+        available = [backend for backend in accepting if backend.breaker.available()]
+        if not available:
+            # Every circuit is open: a slow or failing answer still beats none
+            logger.warning("All LLM backends have an open circuit, trying the preferred one")
+            return accepting[:1]
+
+        def degraded(backend: LlmBackend) -> bool:
+            median = backend.latency.percentile(0.5)
+            return len(backend.latency) >= self.min_samples and median is not None and median > self.max_hedge_delay
+
+        # Stable sort: preference order holds among backends that are fast enough
+        return sorted(available, key=degraded)
+
+    def hedge_delay(self, backend: LlmBackend) -> float:
+        """Secondi di attesa del primo token prima di lanciare l'hedge"""
+        if len(backend.latency) < self.min_samples:
+            return self.max_hedge_delay
+        return min(self.max_hedge_delay, max(self.min_hedge_delay, backend.latency.percentile(self.hedge_percentile)))
+
+    async def stream(self, chat_parameters: Dict[str, Any]) -> DispatchedStream:
+        """
+        Esegue la richiesta e restituisce lo stream di chi risponde per primo
+
+        Raises:
+            L'ultimo errore dei backend se nessuno produce un token
+        """
+        candidates = self.route(chat_parameters)
+        primary = candidates[0]
+        fallback = candidates[1] if len(candidates) > 1 else None
+        loop = asyncio.get_running_loop()
+        started = loop.time()
+        deadline = started + self.hedge_delay(primary)
+        attempts: Dict[asyncio.Task, Tuple[LlmBackend, float]] = {}
+        pending: Set[asyncio.Task] = set()
+
+        def launch(backend: LlmBackend) -> None:
+            backend.breaker.attempt()
+            task = asyncio.create_task(self._first_chunk(backend, chat_parameters))
+            attempts[task] = (backend, loop.time())
+            pending.add(task)
+
+        launch(primary)
+        last_error: Optional[BaseException] = None
+        try:
+            while pending:
+                hedge_possible = fallback is not None and len(attempts) == 1
+                timeout = max(0.0, deadline - loop.time()) if hedge_possible else None
+                done, _ = await asyncio.wait(pending, timeout=timeout, return_when=asyncio.FIRST_COMPLETED)
+                if not done:
+                    logger.info(f"No first token from {primary.name} after {loop.time() - started:.2f}s, hedging on {fallback.name}")
+                    LLM_HEDGES_TOTAL.labels(reason="deadline").inc()
+                    launch(fallback)
+                    continue
+                pending.difference_update(done)
+                winner = None
+                for task in done:
+                    backend, launched = attempts[task]
+                    if task.exception() is not None:
+                        last_error = task.exception()
+                        logger.warning(f"LLM backend {backend.name} failed before the first token: {last_error}")
+                        LLM_BACKEND_ERRORS_TOTAL.labels(backend=backend.name).inc()
+                        backend.breaker.record_failure()
+                        continue
+                    elapsed = loop.time() - launched
+                    backend.latency.add(elapsed)
+                    LLM_BACKEND_FIRST_TOKEN_SECONDS.labels(backend=backend.name).observe(elapsed)
+                    backend.breaker.record_success()
+                    if winner is None:
+                        winner = (backend, task.result())
+                    else:
+                        # Both answered in the same tick: the preferred one wins, the other is closed
+                        await task.result()[1].aclose()
+                if winner is not None:
+                    backend, (first, rest) = winner
+                    LLM_DISPATCH_TOTAL.labels(winner="primary" if backend is primary else "hedge").inc()
+                    LLM_DISPATCH_FIRST_TOKEN_SECONDS.observe(loop.time() - started)
+                    return DispatchedStream(backend, backend.model_for(chat_parameters), first, rest)
+                if fallback is not None and len(attempts) == 1:
+                    LLM_HEDGES_TOTAL.labels(reason="error").inc()
+                    launch(fallback)
+        finally:
+            losers = list(pending)
+            now = loop.time()
+            for task in losers:
+                task.cancel()
+                backend, launched = attempts[task]
+                if backend is primary and now >= deadline:
+                    # The primary's wait past its hedge deadline is a lower bound of its latency: it keeps the tail
+                    # in the window. A hedge that lost shortly after launch says nothing about its backend.
+                    backend.latency.add(now - launched)
+                backend.breaker.record_cancelled()
+            for result in await asyncio.gather(*losers, return_exceptions=True):
+                # A loser that got its first chunk before the cancel still holds a connection
+                if isinstance(result, tuple):
+                    await result[1].aclose()
+        LLM_DISPATCH_TOTAL.labels(winner="failed").inc()
+        raise last_error
+
+    async def _first_chunk(
+        self, backend: LlmBackend, chat_parameters: Dict[str, Any]
+    ) -> Tuple[ChatCompletionChunk, AsyncGenerator]:
+        stream = backend.stream(chat_parameters)
+        try:
+            first = await stream.__anext__()
+        except StopAsyncIteration:
+            raise RuntimeError(f"{backend.name} returned an empty stream")
+        except BaseException:
+            await stream.aclose()
+            raise
+        return first, stream
+
+    def status(self) -> Dict[str, Any]:
+        return {
+            backend.name: {
+                "provider": backend.provider,
+                "model": backend.model,
+                "circuit": backend.breaker.state,
+                "first_token_p50": backend.latency.percentile(0.5),
+                "first_token_p90": backend.latency.percentile(0.9),
+                "hedge_delay": round(self.hedge_delay(backend), 3),
+            }
+            for backend in self.backends
+        }
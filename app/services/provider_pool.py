@@ -0,0 +1,378 @@
+"""
+Provider Pool - Connessioni ai provider aperte all'avvio e tenute calde
+
+Invece di aprire connessioni nuove a ogni chiamata (DNS + TCP + TLS sul
+primo turno), il pod crea all'avvio:
+
+- un client httpx condiviso (HTTP/2 se è installato h2) per OpenAI e uno
+  per ElevenLabs, con keepalive lunghi e una richiesta leggera periodica
+  che tiene viva la connessione e ne misura lo stato;
+- un piccolo pool di WebSocket Deepgram già aperti (tenuti vivi con
+  KeepAlive) che vengono consegnati alle nuove chiamate al posto di una
+  connessione nuova, e subito rimpiazzati in background.
+
+Vocode apre da sé le connessioni: il client ElevenLabs viene installato
+nel suo AsyncRequestor (singleton di processo) e la connect del modulo
+deepgram_transcriber viene sostituita, come già fatto in main.py per
+ELEVEN_LABS_BASE_URL. Lo stato del pool è riportato da /ready.
+"""
+
+import asyncio
+import json
+import logging
+import time
+from typing import Any, Dict, List, Optional, Tuple
+
+import httpx
+import websockets
+from openai import AsyncOpenAI
+from prometheus_client import Counter, Gauge, Histogram
+from vocode.streaming.transcriber import deepgram_transcriber
+from vocode.streaming.utils.async_requester import AsyncRequestor
+
+logger = logging.getLogger(__name__)
+
+PROVIDER_POOL_HEALTHY = Gauge(
+    'voice_assistant_provider_pool_healthy',
+    'Whether the last keepalive probe of a provider connection succeeded',
+    ['provider'],
+    multiprocess_mode='livemin',
+)
+PROVIDER_PROBE_SECONDS = Histogram(
+    'voice_assistant_provider_probe_seconds',
+    'Round trip of provider keepalive probes over the pooled connection',
+    ['provider'],
+    buckets=(0.01, 0.025, 0.05, 0.1, 0.2, 0.3, 0.5, 1.0, 2.0, 5.0),
+)
+STT_POOL_READY_SOCKETS = Gauge(
+    'voice_assistant_stt_pool_ready_sockets',
+    'Pre-opened Deepgram sockets waiting for a call',
+    multiprocess_mode='livesum',
+)
+STT_SOCKET_HANDOFFS = Counter(
+    'voice_assistant_stt_socket_handoffs_total',
+    'Deepgram connections requested by calls',
+    ['result'],  # warm (pre-opened socket), cold (new connection)
+)
+
+OPENAI_API_BASE_URL = "https://api.openai.com/v1"
+DEEPGRAM_KEEPALIVE_INTERVAL = 5.0  # Deepgram closes a stream after ~10 s without data
+DEEPGRAM_KEEPALIVE = json.dumps({"type": "KeepAlive"})
+
+
+def http2_available() -> bool:
+    try:
+        import h2  # noqa: F401
+    except ImportError:
+        return False
+    return True
+
+
+class PooledHttpProvider:
+    """
+    Client httpx condiviso verso un provider, con probe di keepalive
+
+    Args:
+        name: Nome del provider (label delle metriche)
+        base_url: URL base delle API
+        probe_path: Path di una GET leggera usata come keepalive
+        headers: Header di autenticazione della probe
+        max_connections: Connessioni massime verso il provider
+    """
+
+    def __init__(
+        self,
+        name: str,
+        base_url: str,
+        probe_path: str,
+        headers: Dict[str, str],
+        max_connections: int = 100,
+        keepalive_expiry: float = 120.0,
+    ):
+        self.name = name
+        self.probe_url = base_url.rstrip("/") + "/" + probe_path.lstrip("/")
+        self.headers = headers
+        self.http2 = http2_available()
+        self.client = httpx.AsyncClient(
+            http2=self.http2,
+            limits=httpx.Limits(
+                max_connections=max_connections,
+                max_keepalive_connections=max_connections,
+                keepalive_expiry=keepalive_expiry,
+            ),
+            timeout=httpx.Timeout(30.0, connect=5.0),
+        )
+        self.healthy = False
+        self.last_probe_ms: Optional[float] = None
+        self.last_error: Optional[str] = None
+
+    async def probe(self) -> bool:
+        start = time.perf_counter()
+        try:
+            response = await self.client.get(self.probe_url, headers=self.headers, timeout=5.0)
+        except httpx.HTTPError as e:
+            self.healthy = False
+            self.last_error = f"{type(e).__name__}: {e}"
+        else:
+            seconds = time.perf_counter() - start
+            PROVIDER_PROBE_SECONDS.labels(provider=self.name).observe(seconds)
+            self.last_probe_ms = round(seconds * 1000, 1)
+            # Any answer proves the connection is up; auth and server errors do not
+            self.healthy = response.status_code < 500 and response.status_code not in (401, 403)
+            self.last_error = None if self.healthy else f"HTTP {response.status_code}"
+        PROVIDER_POOL_HEALTHY.labels(provider=self.name).set(1 if self.healthy else 0)
+        return self.healthy
+
+    def status(self) -> Dict[str, Any]:
+        return {
+            "healthy": self.healthy,
+            "http_version": "HTTP/2" if self.http2 else "HTTP/1.1",
+            "probe_ms": self.last_probe_ms,
+            "error": self.last_error,
+        }
+
+    async def close(self) -> None:
+        await self.client.aclose()
+
+
+class _PooledDeepgramConnection:
+    """Context manager con la stessa interfaccia di websockets.connect"""
+
+    def __init__(self, pool: "DeepgramSocketPool", uri: str, kwargs: Dict[str, Any]):
+        self.pool = pool
+        self.uri = uri
+        self.kwargs = kwargs
+        self._ws = None
+        self._connect = None
+
+    async def __aenter__(self):
+        self._ws = self.pool.take(self.uri, self.kwargs.get("extra_headers"))
+        if self._ws is not None:
+            STT_SOCKET_HANDOFFS.labels(result="warm").inc()
+            return self._ws
+        STT_SOCKET_HANDOFFS.labels(result="cold").inc()
+        self._connect = websockets.connect(self.uri, **self.kwargs)
+        return await self._connect.__aenter__()
+
+    async def __aexit__(self, exc_type, exc, tb):
+        if self._connect is not None:
+            return await self._connect.__aexit__(exc_type, exc, tb)
+        await self._ws.close()
+        return None
+
+
+class _DeepgramWebsockets:
+    """Sostituisce il modulo websockets dentro deepgram_transcriber: solo connect passa dal pool"""
+
+    def __init__(self, pool: "DeepgramSocketPool"):
+        self._pool = pool
+
+    def connect(self, uri: str, **kwargs):
+        return _PooledDeepgramConnection(self._pool, uri, kwargs)
+
+    def __getattr__(self, name: str):
+        return getattr(websockets, name)
+
+
+class DeepgramSocketPool:
+    """
+    WebSocket Deepgram pre-aperti da consegnare alle nuove chiamate
+
+    Un socket viene consegnato solo se la chiamata chiede lo stesso URL
+    (stessi parametri di trascrizione) e le stesse credenziali; altrimenti
+    la chiamata apre una connessione nuova come farebbe Vocode.
+
+    Args:
+        url: URL di streaming Deepgram con i parametri delle chiamate
+        api_key: API key Deepgram
+        size: Socket da tenere pronti
+        max_idle: Secondi dopo i quali un socket mai usato viene rinnovato
+    """
+
+    def __init__(self, url: str, api_key: str, size: int = 2, max_idle: float = 300.0):
+        self.url = url
+        self.extra_headers = {"Authorization": f"Token {api_key}"}
+        self.size = size
+        self.max_idle = max_idle
+        self.last_error: Optional[str] = None
+        self._ready: List[Tuple[Any, float]] = []  # (socket, opened at)
+        self._opening = 0
+        self._opened = 0
+        self._tasks = set()
+
+    @classmethod
+    def for_transcriber_config(cls, transcriber_config, size: int = 2) -> "DeepgramSocketPool":
+        # Same URL builder Vocode uses for each call (speed coefficient 1.0 at call start)
+        transcriber = deepgram_transcriber.DeepgramTranscriber(transcriber_config)
+        return cls(transcriber.get_deepgram_url(), transcriber.api_key, size=size)
+
+    @property
+    def ready_sockets(self) -> int:
+        return len(self._ready)
+
+    def take(self, uri: str, extra_headers: Optional[Dict[str, str]]):
+        """Ritorna un socket pronto per uri/header, o None"""
+        if uri != self.url or dict(extra_headers or {}) != self.extra_headers:
+            return None
+        ws = None
+        while self._ready and ws is None:
+            candidate, _ = self._ready.pop(0)
+            if candidate.open:
+                ws = candidate
+        STT_POOL_READY_SOCKETS.set(len(self._ready))
+        self.refill()
+        return ws
+
+    def refill(self) -> None:
+        for _ in range(self.size - len(self._ready) - self._opening):
+            self._opening += 1
+            self._spawn(self._open())
+
+    async def wait_ready(self) -> None:
+        while self._tasks:
+            await asyncio.gather(*list(self._tasks), return_exceptions=True)
+
+    async def keepalive(self) -> None:
+        now = time.monotonic()
+        for entry in list(self._ready):
+            ws, opened_at = entry
+            expired = now - opened_at > self.max_idle
+            if ws.open and not expired:
+                try:
+                    await ws.send(DEEPGRAM_KEEPALIVE)
+                    continue
+                except websockets.ConnectionClosed:
+                    pass
+            if entry in self._ready:
+                self._ready.remove(entry)
+                self._spawn(ws.close())
+        STT_POOL_READY_SOCKETS.set(len(self._ready))
+        self.refill()
+
+    async def _open(self) -> None:
+        try:
+            ws = await websockets.connect(self.url, extra_headers=self.extra_headers)
+        except (OSError, asyncio.TimeoutError, websockets.WebSocketException) as e:
+            self.last_error = f"{type(e).__name__}: {e}"
+            logger.warning(f"Could not pre-open Deepgram socket: {self.last_error}")
+        else:
+            self.last_error = None
+            self._opened += 1
+            self._ready.append((ws, time.monotonic()))
+        finally:
+            self._opening -= 1
+            STT_POOL_READY_SOCKETS.set(len(self._ready))
+
+    def _spawn(self, coro) -> asyncio.Task:
+        task = asyncio.create_task(coro)
+        self._tasks.add(task)
+        task.add_done_callback(self._tasks.discard)
+        return task
+
+    def install(self) -> None:
+        deepgram_transcriber.websockets = _DeepgramWebsockets(self)
+
+    def uninstall(self) -> None:
+        deepgram_transcriber.websockets = websockets
+
+    def status(self) -> Dict[str, Any]:
+        return {
+            # An empty pool right after a burst of calls is refilling, not unhealthy
+            "healthy": not self.size or (self._opened > 0 and self.last_error is None),
+            "ready_sockets": len(self._ready),
+            "target": self.size,
+            "error": self.last_error,
+        }
+
+    async def close(self) -> None:
+        self.uninstall()
+        for task in list(self._tasks):
+            task.cancel()
+        ready, self._ready = self._ready, []
+        await asyncio.gather(*(ws.close() for ws, _ in ready), return_exceptions=True)
+        STT_POOL_READY_SOCKETS.set(0)
+
+
+class ProviderPool:
+    """
+    Connessioni condivise verso OpenAI, ElevenLabs e Deepgram per tutto il pod
+
+    Args:
+        openai: Client condiviso per le chat completions
+        elevenlabs: Client condiviso per la sintesi (installato nell'AsyncRequestor di Vocode)
+        deepgram: Pool di socket STT (None per non pre-aprirne)
+        keepalive_interval: Secondi tra le probe HTTP
+    """
+
+    def __init__(
+        self,
+        openai: PooledHttpProvider,
+        elevenlabs: PooledHttpProvider,
+        deepgram: Optional[DeepgramSocketPool] = None,
+        keepalive_interval: float = 20.0,
+    ):
+        self.openai = openai
+        self.elevenlabs = elevenlabs
+        self.deepgram = deepgram
+        self.keepalive_interval = keepalive_interval
+        self._task: Optional[asyncio.Task] = None
+        self._requestor_client = None
+
+    def create_openai_client(self, api_key: str, base_url: Optional[str] = None) -> AsyncOpenAI:
+        return AsyncOpenAI(api_key=api_key, base_url=base_url, http_client=self.openai.client)
+
+    async def start(self) -> None:
+        """Installa i client in Vocode e apre/verifica tutte le connessioni"""
+        requestor = AsyncRequestor()
+        self._requestor_client = requestor.async_client
+        requestor.async_client = self.elevenlabs.client
+        if self.deepgram is not None:
+            self.deepgram.install()
+            self.deepgram.refill()
+        # Keepalives start first: if the caller times out the warm-up, the pool keeps retrying
+        if self._task is None:
+            self._task = asyncio.create_task(self._run())
+        await asyncio.gather(
+            self.openai.probe(),
+            self.elevenlabs.probe(),
+            self.deepgram.wait_ready() if self.deepgram is not None else asyncio.sleep(0),
+        )
+        logger.info(f"Provider pool warm: {self.status()}")
+
+    async def _run(self) -> None:
+        # Deepgram sockets need a KeepAlive every few seconds, HTTP probes run less often
+        last_probe = time.monotonic()
+        while True:
+            await asyncio.sleep(DEEPGRAM_KEEPALIVE_INTERVAL)
+            try:
+                if self.deepgram is not None:
+                    await self.deepgram.keepalive()
+                if time.monotonic() - last_probe >= self.keepalive_interval:
+                    last_probe = time.monotonic()
+                    await asyncio.gather(self.openai.probe(), self.elevenlabs.probe())
+            except Exception as e:
+                logger.error(f"Provider pool keepalive failed: {e}", exc_info=True)
+
+    @property
+    def ready(self) -> bool:
+        return all(status["healthy"] for status in self.status().values())
+
+    def status(self) -> Dict[str, Dict[str, Any]]:
+        status = {"openai": self.openai.status(), "elevenlabs": self.elevenlabs.status()}
+        if self.deepgram is not None:
+            status["deepgram"] = self.deepgram.status()
+        return status
+
+    async def close(self) -> None:
+        if self._task is not None:
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+            self._task = None
+        if self._requestor_client is not None:
+            AsyncRequestor().async_client = self._requestor_client
+        if self.deepgram is not None:
+            await self.deepgram.close()
+        await asyncio.gather(self.openai.close(), self.elevenlabs.close())
@@ -0,0 +1,207 @@
+"""
+Response Cache - Cache delle risposte LLM per le domande ricorrenti
+
+Molte chiamate fanno le stesse poche domande (orari, email del supporto,
+cos'è Netmon): la risposta generata la prima volta viene riusata, già
+divisa nei chunk inviati al TTS, per le domande equivalenti successive.
+
+La chiave combina hash del system prompt, modello, ultima frase del
+chiamante normalizzata (accenti, punteggiatura e formule di cortesia non
+contano) e un'impronta del contesto (l'ultima risposta dell'assistente),
+così "sì" dopo due domande diverse non condivide la risposta.
+
+I turni che dipendono da dati del chiamante (numeri, email, "il mio
+ordine", pattern della config) non vengono mai letti né scritti in cache.
+
+Due livelli: LRU locale con TTL e, se configurato, Redis condiviso tra le
+repliche. Se Redis non risponde entro pochi millisecondi si procede come
+per un miss.
+"""
+
+import asyncio
+import hashlib
+import json
+import logging
+import re
+import time
+from collections import OrderedDict
+from dataclasses import dataclass
+from typing import Any, Iterable, List, Mapping, Optional, Tuple
+
+from prometheus_client import Counter
+
+from services.scenario_matcher import normalize_text
+
+logger = logging.getLogger(__name__)
+
+LLM_CACHE_LOOKUPS = Counter(
+    'voice_assistant_llm_cache_lookups_total',
+    'LLM response cache lookups',
+    ['result'],  # local, redis, miss, excluded
+)
+LLM_CACHE_LATENCY_SAVED = Counter(
+    'voice_assistant_llm_cache_latency_saved_seconds_total',
+    'LLM generation time avoided by serving cached responses',
+)
+LLM_CACHE_ERRORS = Counter(
+    'voice_assistant_llm_cache_errors_total',
+    'Redis errors in the LLM response cache (treated as a miss)',
+    ['operation'],
+)
+
+KEY_PREFIX = "voice-assistant:llm-cache:"
+
+# Courtesy and hesitation words that do not change the question
+_FILLERS = frozenset(
+    "allora beh buongiorno buonasera ciao ehm ecco grazie mah ok okay "
+    "salve scusa scusi senta senti si volevo vorrei sapere chiedere".split()
+)
+_POLITE_PHRASES = re.compile(r" per (favore|cortesia|piacere) ")
+
+# Turns about the caller's own data are never cached
+DEFAULT_EXCLUDE_PATTERNS = (
+    r"\d",  # order numbers, phone numbers, dates, amounts
+    r"@|\bchiocciola\b",  # e-mail addresses
+    r"\b(mio|mia|miei|mie)\b",  # "il mio ordine", "la mia SIM"
+    r"\b(mi chiamo|il mio nome|sono il|sono la)\b",
+)
+
+
+@dataclass
+class CachedResponse:
+    """Risposta in cache: chunk inviati al TTS e tempo impiegato dal LLM"""
+
+    chunks: List[str]
+    generation_seconds: float
+
+
+class ResponseCache:
+    """
+    Cache a due livelli (locale + Redis opzionale) delle risposte LLM
+
+    Args:
+        ttl: Secondi di validità di una risposta
+        max_entries: Risposte massime nella LRU locale
+        redis_client: Client redis.asyncio per il livello condiviso (None = solo locale)
+        exclude_patterns: Regex aggiuntive (sul testo normalizzato) dei turni da non cacheare
+        max_words: Frasi più lunghe non vengono cacheate (non si ripetono)
+        redis_timeout: Secondi massimi di attesa di Redis
+    """
+
+    def __init__(
+        self,
+        ttl: float = 3600.0,
+        max_entries: int = 1000,
+        redis_client: Optional[Any] = None,
+        exclude_patterns: Iterable[str] = (),
+        max_words: int = 30,
+        redis_timeout: float = 0.05,
+    ):
+        self.ttl = ttl
+        self.max_entries = max_entries
+        self.redis = redis_client
+        self.max_words = max_words
+        self.redis_timeout = redis_timeout
+        self.exclude = self._compile_exclusions(exclude_patterns)
+        self._local: "OrderedDict[str, Tuple[float, CachedResponse]]" = OrderedDict()
+
+    @classmethod
+    def from_assistant_config(cls, config: Mapping[str, Any], **kwargs) -> "ResponseCache":
+        cache_config = config.get("response_cache") or {}
+        return cls(
+            exclude_patterns=cache_config.get("exclude_patterns") or (),
+            max_words=cache_config.get("max_words", 30),
+            **kwargs,
+        )
+
+    def apply_assistant_config(self, config: Mapping[str, Any]) -> None:
+        """Aggiorna le regole di esclusione dopo un ricaricamento della config"""
+        cache_config = config.get("response_cache") or {}
+        self.exclude = self._compile_exclusions(cache_config.get("exclude_patterns") or ())
+        self.max_words = cache_config.get("max_words", 30)
+
+    @staticmethod
+    def _compile_exclusions(exclude_patterns: Iterable[str]) -> "re.Pattern":
+        patterns = list(DEFAULT_EXCLUDE_PATTERNS) + list(exclude_patterns)
+        return re.compile("|".join(f"(?:{p})" for p in patterns))
+
+    def key(self, system_prompt: str, model: str, utterance: str, context: Optional[str] = None) -> Optional[str]:
+        """
+        Calcola la chiave di un turno
+
+        Args:
+            system_prompt: Prompt di sistema dell'agente
+            model: Modello LLM
+            utterance: Ultima frase del chiamante
+            context: Ultima risposta dell'assistente (None all'inizio della chiamata)
+
+        Returns:
+            Chiave di cache, o None se il turno non va cacheato
+        """
+        # Exclusion rules see the raw text too: normalization turns "@" and "." into spaces
+        if self.exclude.search(utterance.casefold()):
+            LLM_CACHE_LOOKUPS.labels(result="excluded").inc()
+            return None
+        words = _POLITE_PHRASES.sub(" ", normalize_text(utterance)).split()
+        if self.exclude.search(" ".join(words)) or len(words) > self.max_words:
+            LLM_CACHE_LOOKUPS.labels(result="excluded").inc()
+            return None
+        question = " ".join(w for w in words if w not in _FILLERS)
+        if not question:
+            LLM_CACHE_LOOKUPS.labels(result="excluded").inc()
+            return None
+        context_fingerprint = " ".join(normalize_text(context or "").split()[-20:])
+        identity = "\x1f".join((hashlib.sha256(system_prompt.encode()).hexdigest(), model, question, context_fingerprint))
+        return hashlib.sha256(identity.encode()).hexdigest()
+
+    async def get(self, key: str) -> Optional[CachedResponse]:
+        entry = self._local.get(key)
+        if entry is not None:
+            expires_at, response = entry
+            if expires_at > time.monotonic():
+                self._local.move_to_end(key)
+                self._hit("local", response)
+                return response
+            del self._local[key]
+
+        if self.redis is not None:
+            try:
+                raw = await asyncio.wait_for(self.redis.get(KEY_PREFIX + key), timeout=self.redis_timeout)
+            except Exception as e:
+                LLM_CACHE_ERRORS.labels(operation="get").inc()
+                logger.debug(f"LLM cache Redis get failed: {e}")
+                raw = None
+            if raw is not None:
+                data = json.loads(raw)
+                response = CachedResponse(chunks=data["chunks"], generation_seconds=data["generation_seconds"])
+                self._store_local(key, response)
+                self._hit("redis", response)
+                return response
+
+        LLM_CACHE_LOOKUPS.labels(result="miss").inc()
+        return None
+
+    async def put(self, key: str, response: CachedResponse) -> None:
+        self._store_local(key, response)
+        if self.redis is None:
+            return
+        value = json.dumps({"chunks": response.chunks, "generation_seconds": response.generation_seconds})
+        try:
+            await asyncio.wait_for(
+                self.redis.set(KEY_PREFIX + key, value, ex=int(self.ttl)),
+                timeout=self.redis_timeout,
+            )
+        except Exception as e:
+            LLM_CACHE_ERRORS.labels(operation="put").inc()
+            logger.debug(f"LLM cache Redis set failed: {e}")
+
+    def _store_local(self, key: str, response: CachedResponse) -> None:
+        self._local[key] = (time.monotonic() + self.ttl, response)
+        self._local.move_to_end(key)
+        while len(self._local) > self.max_entries:
+            self._local.popitem(last=False)
+
+    @staticmethod
+    def _hit(source: str, response: CachedResponse) -> None:
+        LLM_CACHE_LOOKUPS.labels(result=source).inc()
+        LLM_CACHE_LATENCY_SAVED.inc(response.generation_seconds)
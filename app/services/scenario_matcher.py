@@ -0,0 +1,184 @@
+"""
+Scenario Matcher - Riconoscimento veloce degli scenari tramite parole chiave
+
+Le trigger_keywords degli scenari vengono compilate una sola volta in un
+automa Aho-Corasick, così ogni trascrizione finale viene analizzata in un
+solo passaggio indipendentemente dal numero di parole chiave.
+"""
+
+import re
+import unicodedata
+from collections import deque
+from dataclasses import dataclass
+from typing import Any, Dict, Iterable, List, Optional, Tuple
+
+_NON_WORD = re.compile(r"[^0-9a-z]+")
+
+# Function words ignored when measuring how much of an utterance the keywords cover
+_STOPWORDS = frozenset(
+    "a ad al alla allo ai agli alle c che chi ci con da dal dalla dei del della delle di e ed "
+    "gli ha hai ho i il in l la le lo ma mi ne nei nel nella o per piu se si su sul sulla ti "
+    "tu un una uno vi vorrei volevo sono buongiorno buonasera ciao salve per favore grazie".split()
+)
+
+
+def normalize_text(text: str) -> str:
+    """
+    Normalizza un testo per il matching
+
+    Rimuove accenti ("perché" -> "perche"), porta in minuscolo, sostituisce
+    apostrofi e punteggiatura con spazi ("l'ordine" -> "l ordine") e
+    aggiunge uno spazio ai bordi per permettere il match a parola intera.
+    """
+    decomposed = unicodedata.normalize("NFKD", text)
+    stripped = "".join(c for c in decomposed if not unicodedata.combining(c))
+    words = _NON_WORD.sub(" ", stripped.casefold()).split()
+    return f" {' '.join(words)} "
+
+
+def _keyword_pattern(keyword: str) -> Optional[str]:
+    # "problem*" matches any word starting with "problem" (problema, problemi, ...)
+    prefix = keyword.rstrip().endswith("*")
+    normalized = normalize_text(keyword.rstrip().rstrip("*"))
+    if not normalized.strip():
+        return None
+    return normalized.rstrip() if prefix else normalized
+
+
+class KeywordMatcher:
+    """Automa Aho-Corasick su parole chiave normalizzate"""
+
+    def __init__(self, keywords: Iterable[Tuple[str, str]]):
+        """
+        Args:
+            keywords: Coppie (label, keyword); la keyword può terminare con
+                "*" per il match per prefisso
+        """
+        self._goto: List[Dict[str, int]] = [{}]
+        self._fail: List[int] = [0]
+        self._output: List[List[int]] = [[]]
+        self.patterns: List[Tuple[str, str, int]] = []  # (label, keyword, number of words)
+
+        seen = set()
+        for label, keyword in keywords:
+            pattern = _keyword_pattern(keyword)
+            if pattern is None or (label, pattern) in seen:
+                continue
+            seen.add((label, pattern))
+            self._add(pattern, len(self.patterns))
+            self.patterns.append((label, keyword, len(pattern.split())))
+
+        self._build_failure_links()
+
+    def _add(self, pattern: str, pattern_id: int) -> None:
+        node = 0
+        for char in pattern:
+            next_node = self._goto[node].get(char)
+            if next_node is None:
+                next_node = len(self._goto)
+                self._goto[node][char] = next_node
+                self._goto.append({})
+                self._fail.append(0)
+                self._output.append([])
+            node = next_node
+        self._output[node].append(pattern_id)
+
+    def _build_failure_links(self) -> None:
+        queue = deque(self._goto[0].values())
+        while queue:
+            node = queue.popleft()
+            for char, child in self._goto[node].items():
+                queue.append(child)
+                fallback = self._fail[node]
+                while fallback and char not in self._goto[fallback]:
+                    fallback = self._fail[fallback]
+                self._fail[child] = self._goto[fallback].get(char, 0)
+                # Inherit the matches of the longest proper suffix
+                self._output[child] = self._output[child] + self._output[self._fail[child]]
+
+    def find_normalized(self, normalized: str) -> List[int]:
+        """Ritorna gli id dei pattern trovati in un testo già normalizzato"""
+        goto = self._goto
+        fail = self._fail
+        output = self._output
+        found: List[int] = []
+        node = 0
+        for char in normalized:
+            while node and char not in goto[node]:
+                node = fail[node]
+            node = goto[node].get(char, 0)
+            if output[node]:
+                found.extend(output[node])
+        return found
+
+    def find(self, text: str) -> List[Tuple[str, str]]:
+        """Ritorna le coppie (label, keyword) trovate nel testo"""
+        return [self.patterns[i][:2] for i in self.find_normalized(normalize_text(text))]
+
+
+@dataclass(frozen=True)
+class ScenarioMatch:
+    """Risultato del matching di una trascrizione"""
+
+    name: str
+    response: str
+    confidence: float
+    keywords: Tuple[str, ...]
+
+
+class ScenarioMatcher:
+    """Abbina le trascrizioni agli scenari di config/assistant-config.yaml"""
+
+    def __init__(self, scenarios: List[Dict[str, Any]]):
+        self.responses: Dict[str, str] = {}
+        keywords: List[Tuple[str, str]] = []
+        for scenario in scenarios:
+            name = scenario.get("name")
+            response = scenario.get("response")
+            if not name or not response:
+                continue
+            self.responses[name] = response
+            keywords.extend((name, kw) for kw in scenario.get("trigger_keywords") or [] if kw)
+        self.matcher = KeywordMatcher(keywords)
+
+    @classmethod
+    def from_assistant_config(cls, config: Dict[str, Any]) -> "ScenarioMatcher":
+        return cls(config.get("scenarios") or [])
+
+    def match(self, utterance: str) -> Optional[ScenarioMatch]:
+        """
+        Cerca lo scenario più adatto per una trascrizione
+
+        La confidenza cresce con la parte dell'enunciato coperta dalle parole
+        chiave e si riduce se più scenari diversi sono stati attivati.
+
+        Args:
+            utterance: Trascrizione finale del chiamante
+
+        Returns:
+            ScenarioMatch o None se nessuna parola chiave è presente
+        """
+        normalized = normalize_text(utterance)
+        pattern_ids = set(self.matcher.find_normalized(normalized))
+        if not pattern_ids:
+            return None
+
+        covered: Dict[str, int] = {}
+        matched: Dict[str, List[str]] = {}
+        for pattern_id in pattern_ids:
+            label, keyword, n_words = self.matcher.patterns[pattern_id]
+            covered[label] = covered.get(label, 0) + n_words
+            matched.setdefault(label, []).append(keyword)
+
+        best = max(covered, key=covered.get)
+        total_words = max(1, sum(1 for w in normalized.split() if w not in _STOPWORDS))
+        coverage = min(1.0, covered[best] / total_words)
+        dominance = covered[best] / sum(covered.values())
+        confidence = dominance * (0.6 + 0.4 * coverage)
+
+        return ScenarioMatch(
+            name=best,
+            response=self.responses[best],
+            confidence=round(confidence, 3),
+            keywords=tuple(sorted(matched[best])),
+        )
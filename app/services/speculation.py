@@ -0,0 +1,305 @@
+"""
+Speculation - Risposta del LLM generata sui parziali dello STT
+
+Vocode passa il turno all'agente solo con la trascrizione finale, quindi
+l'attesa dell'endpointing di Deepgram e il tempo al primo token del LLM si
+sommano. Quando un parziale resta invariato per stable_ms, la risposta
+viene generata in anticipo sul testo del parziale (e, se richiesto, il
+primo chunk viene già sintetizzato dal TTS).
+
+All'arrivo della trascrizione finale:
+- se è abbastanza simile al parziale (similarità a livello di parole,
+  sul testo normalizzato) la risposta speculativa viene usata: i chunk già
+  pronti partono subito, gli altri man mano che il LLM li produce;
+- altrimenti viene cancellata e il turno procede come sempre.
+
+Un parziale stabile che cambia di nuovo sostituisce la speculazione in
+corso (al massimo max_per_turn per turno). I token generati per risposte
+scartate sono contati come sprecati, per tenant, per tarare soglia e
+tempo di stabilità sul rapporto tra hit rate e costo.
+"""
+
+import asyncio
+import logging
+import time
+from dataclasses import dataclass, fields, replace
+from difflib import SequenceMatcher
+from typing import Any, AsyncGenerator, Awaitable, Callable, List, Mapping, Optional
+
+from prometheus_client import Counter, Histogram
+from vocode.streaming.models.transcriber import Transcription
+
+from config.assistant_config import DEFAULT_TENANT
+from services.scenario_matcher import normalize_text
+
+logger = logging.getLogger(__name__)
+
+SPECULATIONS_TOTAL = Counter(
+    'voice_assistant_speculations_total',
+    'Speculative LLM responses started on stable interim transcripts, by outcome',
+    ['tenant', 'result'],  # hit, miss, superseded, stale, unused
+)
+SPECULATION_TOKENS_TOTAL = Counter(
+    'voice_assistant_speculation_tokens_total',
+    'LLM tokens generated by speculative responses',
+    ['tenant', 'result'],  # used, wasted
+)
+SPECULATION_LEAD_SECONDS = Histogram(
+    'voice_assistant_speculation_lead_seconds',
+    'Head start of a used speculative response: from its start to the final transcript',
+    ['tenant'],
+    buckets=(0.05, 0.1, 0.2, 0.3, 0.5, 0.75, 1.0, 1.5, 2.5),
+)
+
+
+@dataclass(frozen=True)
+class SpeculationConfig:
+    """
+    Parametri della generazione speculativa
+
+    Quelli della sezione speculation di un tenant (assistant-config.yaml)
+    sostituiscono i valori dei Settings per le sue chiamate.
+    """
+
+    enabled: bool = False
+    stable_ms: int = 250  # Interim unchanged this long starts a speculative response
+    min_words: int = 3  # Shorter interims are too ambiguous to answer
+    similarity_threshold: float = 0.85  # Word-level similarity between interim and final to keep the response
+    prefetch_tts: bool = True  # Also synthesize the first chunk before the final transcript
+    max_per_turn: int = 2  # Restarts allowed while the caller keeps talking
+
+    def with_overrides(self, overrides: Optional[Mapping[str, Any]]) -> "SpeculationConfig":
+        """Copia con i campi indicati (tipicamente la sezione speculation del tenant)"""
+        if not overrides:
+            return self
+        names = {f.name for f in fields(self)}
+        return replace(self, **{k: v for k, v in overrides.items() if k in names})
+
+
+def transcript_similarity(first: str, second: str) -> float:
+    """
+    Similarità tra due trascrizioni, da 0 a 1
+
+    Confronta le sequenze di parole normalizzate (accenti, maiuscole e
+    punteggiatura non contano): "vorrei sapere gli orari" e "Vorrei sapere
+    gli orari." valgono 1, una parola diversa su cinque circa 0.8.
+    """
+    first_words = normalize_text(first).split()
+    second_words = normalize_text(second).split()
+    if not first_words and not second_words:
+        return 1.0
+    return SequenceMatcher(None, first_words, second_words, autojunk=False).ratio()
+
+
+class Speculation:
+    """
+    Risposta generata in anticipo su un parziale
+
+    Gli elementi prodotti dal LLM (chunk per il TTS o FunctionCall) vengono
+    accumulati: replay() restituisce quelli già pronti e poi attende i
+    successivi, quindi la risposta può essere usata mentre è ancora in corso.
+    """
+
+    def __init__(self, text: str):
+        self.text = text
+        self.started_at = time.perf_counter()
+        self.items: List[Any] = []
+        self.tokens = 0
+        self.done = False
+        self.error: Optional[BaseException] = None
+        self.prefetched_text: Optional[str] = None  # First chunk handed to the TTS in advance
+        self.task: Optional[asyncio.Task] = None
+        self._updated = asyncio.Event()
+
+    def append(self, item: Any) -> None:
+        self.items.append(item)
+        self._updated.set()
+
+    def finish(self, error: Optional[BaseException] = None) -> None:
+        self.error = error
+        self.done = True
+        self._updated.set()
+
+    @property
+    def failed(self) -> bool:
+        # Nothing usable was produced: the turn is generated again from scratch
+        return self.done and self.error is not None and not self.items
+
+    async def count_tokens(self, tokens: AsyncGenerator) -> AsyncGenerator:
+        async for token in tokens:
+            if isinstance(token, str):
+                self.tokens += 1
+            yield token
+
+    async def replay(self) -> AsyncGenerator[Any, None]:
+        index = 0
+        while True:
+            while index < len(self.items):
+                yield self.items[index]
+                index += 1
+            if self.done:
+                if self.error is not None:
+                    raise self.error
+                return
+            self._updated.clear()
+            await self._updated.wait()
+
+    def cancel(self) -> None:
+        if self.task is not None and not self.task.done():
+            self.task.cancel()
+
+
+SpeculationRunner = Callable[[Speculation], Awaitable[None]]
+
+
+class SpeculativeTurns:
+    """
+    Speculazione sui parziali di una conversazione
+
+    Si aggancia alla coda di uscita del transcriber come LocalTurnDetector:
+    i parziali riavviano il timer di stabilità, allo scadere del timer
+    parte run(speculation) in un task. L'agente chiede la speculazione con
+    take() quando riceve il turno finale, e la scarta con discard() quando
+    il turno viene risposto altrimenti (scenario, cache).
+
+    Args:
+        config: Parametri (già risolti per il tenant della chiamata)
+        run: Coroutine che genera la risposta e la accumula nella Speculation
+        tenant: Nome del tenant, per le metriche
+        allowed: Se restituisce False il parziale non viene speculato
+            (es. bot che sta parlando)
+        on_discard: Chiamata per ogni speculazione scartata (es. per liberare
+            l'audio pre-sintetizzato)
+    """
+
+    def __init__(
+        self,
+        config: SpeculationConfig,
+        run: SpeculationRunner,
+        tenant: str = DEFAULT_TENANT,
+        allowed: Optional[Callable[[], bool]] = None,
+        on_discard: Optional[Callable[[Speculation], None]] = None,
+    ):
+        self.config = config
+        self.run = run
+        self.tenant = tenant
+        self.allowed = allowed
+        self.on_discard = on_discard
+        self.current: Optional[Speculation] = None
+        self._timer: Optional[asyncio.TimerHandle] = None
+        self._last_interim = ""
+        self._turn_speculations = 0
+
+    def attach(self, conversation) -> None:
+        """Intercetta le trascrizioni della conversazione (parziali inclusi)"""
+        queue = conversation.transcriber.output_queue
+        original_put = queue.put_nowait
+
+        def put_nowait(transcription):
+            if isinstance(transcription, Transcription):
+                self.on_transcription(transcription)
+            return original_put(transcription)
+
+        queue.put_nowait = put_nowait
+
+    def on_transcription(self, transcription: Transcription) -> None:
+        if transcription.is_final:
+            # The agent takes the speculation when Vocode hands it the turn
+            self._cancel_timer()
+            self._last_interim = ""
+            self._turn_speculations = 0
+            return
+        text = transcription.message.strip()
+        if text == self._last_interim:
+            return
+        self._last_interim = text
+        self._cancel_timer()
+        if len(text.split()) >= self.config.min_words:
+            loop = asyncio.get_running_loop()
+            self._timer = loop.call_later(self.config.stable_ms / 1000, self._on_stable, text)
+
+    def take(self, final_text: str) -> Optional[Speculation]:
+        """
+        Speculazione da usare per il turno finale, se ce n'è una compatibile
+
+        Args:
+            final_text: Trascrizione finale del chiamante
+
+        Returns:
+            La Speculation (eventualmente ancora in corso) o None
+        """
+        self._cancel_timer()
+        self._last_interim = ""
+        self._turn_speculations = 0
+        speculation, self.current = self.current, None
+        if speculation is None:
+            return None
+        if speculation.failed:
+            self._discard(speculation, "miss")
+            return None
+        similarity = transcript_similarity(speculation.text, final_text)
+        if similarity < self.config.similarity_threshold:
+            logger.debug(f"Speculation miss (similarity {similarity:.2f}): {speculation.text!r} vs {final_text!r}")
+            self._discard(speculation, "miss")
+            return None
+        SPECULATIONS_TOTAL.labels(tenant=self.tenant, result="hit").inc()
+        SPECULATION_LEAD_SECONDS.labels(tenant=self.tenant).observe(time.perf_counter() - speculation.started_at)
+        return speculation
+
+    def used(self, speculation: Speculation) -> None:
+        """Conta i token della speculazione usata (a risposta conclusa o interrotta)"""
+        speculation.cancel()
+        SPECULATION_TOKENS_TOTAL.labels(tenant=self.tenant, result="used").inc(speculation.tokens)
+
+    def discard(self, result: str = "unused") -> None:
+        """Scarta la speculazione in corso (turno risposto senza LLM, fine chiamata)"""
+        self._cancel_timer()
+        self._last_interim = ""
+        self._turn_speculations = 0
+        speculation, self.current = self.current, None
+        if speculation is not None:
+            self._discard(speculation, result)
+
+    def close(self) -> None:
+        self.discard("unused")
+
+    def _on_stable(self, text: str) -> None:
+        self._timer = None
+        if self.allowed is not None and not self.allowed():
+            return
+        current = self.current
+        if current is not None:
+            if transcript_similarity(current.text, text) >= self.config.similarity_threshold:
+                return  # The running speculation still fits the interim
+            self.current = None
+            self._discard(current, "superseded")
+        if self._turn_speculations >= self.config.max_per_turn:
+            return
+        self._turn_speculations += 1
+        speculation = Speculation(text)
+        speculation.task = asyncio.create_task(self._run(speculation))
+        self.current = speculation
+
+    async def _run(self, speculation: Speculation) -> None:
+        try:
+            await self.run(speculation)
+        except asyncio.CancelledError:
+            speculation.finish(asyncio.CancelledError())
+            raise
+        except Exception as e:
+            logger.warning(f"Speculative response failed: {e}")
+            speculation.finish(e)
+        else:
+            speculation.finish()
+
+    def _discard(self, speculation: Speculation, result: str) -> None:
+        speculation.cancel()
+        SPECULATIONS_TOTAL.labels(tenant=self.tenant, result=result).inc()
+        SPECULATION_TOKENS_TOTAL.labels(tenant=self.tenant, result="wasted").inc(speculation.tokens)
+        if self.on_discard is not None:
+            self.on_discard(speculation)
+
+    def _cancel_timer(self) -> None:
+        if self._timer is not None:
+            self._timer.cancel()
+            self._timer = None
@@ -0,0 +1,196 @@
+"""
+Tenants - Più aziende sullo stesso deployment, scelte dal numero chiamato
+
+Il numero chiamato (To di Twilio, to_uri SIP) seleziona un profilo della
+sezione tenants di assistant-config.yaml: prompt, saluti, orari, scenari,
+voce, modello e lingua. I numeri senza profilo vanno al tenant di default
+(la sezione assistant).
+
+Le config Vocode di agente, STT e TTS e lo ScenarioMatcher di ogni tenant
+vengono compilati una volta e tenuti in una LRU limitata: il setup di una
+chiamata costa un lookup nel dizionario dei numeri e uno nella LRU, anche
+con centinaia di numeri, e la memoria non cresce oltre max_pipelines
+tenant. Un ricaricamento della config svuota la LRU.
+
+La config dell'agente porta il nome del tenant (TenantAgentConfig), così
+l'agent factory ritrova lo ScenarioMatcher giusto anche quando la call
+config arriva da Redis su un'altra replica.
+"""
+
+import asyncio
+import logging
+import time
+from collections import OrderedDict
+from dataclasses import dataclass, field
+from datetime import datetime
+from typing import Any, Awaitable, Callable, Dict, Optional, Set, Tuple
+
+from prometheus_client import Counter, Gauge, Histogram
+from vocode.streaming.models.agent import ChatGPTAgentConfig
+from vocode.streaming.models.message import BaseMessage
+from vocode.streaming.models.synthesizer import SynthesizerConfig
+from vocode.streaming.models.transcriber import TranscriberConfig
+
+from config.assistant_config import DEFAULT_TENANT, AssistantConfigStore, CompiledAssistantConfig, TenantProfile
+from services.scenario_matcher import ScenarioMatcher
+
+logger = logging.getLogger(__name__)
+
+TENANT_CALLS_TOTAL = Counter(
+    'voice_assistant_tenant_calls_total',
+    'Calls routed to each tenant by the called number',
+    ['tenant'],
+)
+TENANT_PIPELINE_LOOKUPS = Counter(
+    'voice_assistant_tenant_pipeline_lookups_total',
+    'Tenant pipeline cache lookups',
+    ['result'],  # hit, miss
+)
+TENANT_PIPELINE_EVICTIONS = Counter(
+    'voice_assistant_tenant_pipeline_evictions_total',
+    'Tenant pipelines dropped from the LRU to stay within its size',
+)
+TENANT_PIPELINES = Gauge(
+    'voice_assistant_tenant_pipelines',
+    'Tenant pipelines currently compiled',
+    multiprocess_mode='livemax',
+)
+TENANT_PIPELINE_BUILD_SECONDS = Histogram(
+    'voice_assistant_tenant_pipeline_build_seconds',
+    'Time to compile the agent, transcriber and synthesizer configs of a tenant',
+    buckets=(0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1),
+)
+
+
+class TenantAgentConfig(ChatGPTAgentConfig, type="agent_tenant_chat_gpt"):  # type: ignore
+    """ChatGPTAgentConfig che ricorda il tenant della chiamata (viaggia con la call config)"""
+
+    tenant: str = DEFAULT_TENANT
+
+
+@dataclass
+class TenantPipeline:
+    """Config Vocode compilate di un tenant, condivise dalle sue chiamate"""
+
+    tenant: TenantProfile
+    agent_config: TenantAgentConfig
+    transcriber_config: TranscriberConfig
+    synthesizer_config: SynthesizerConfig
+    scenario_matcher: Optional[ScenarioMatcher] = None
+    # One agent config per greeting (opening hours / after hours), built on first use
+    _by_greeting: Dict[Optional[str], TenantAgentConfig] = field(default_factory=dict, init=False, repr=False)
+
+    def call_configs(
+        self, when: Optional[datetime] = None
+    ) -> Tuple[TenantAgentConfig, TranscriberConfig, SynthesizerConfig]:
+        """
+        Config della chiamata con il saluto per l'ora della chiamata
+
+        Args:
+            when: Ora della chiamata (default: adesso)
+
+        Returns:
+            (agent_config, transcriber_config, synthesizer_config)
+        """
+        greeting = self.tenant.greeting(when)
+        agent_config = self._by_greeting.get(greeting)
+        if agent_config is None:
+            agent_config = self.agent_config
+            if greeting:
+                agent_config = agent_config.copy(update={"initial_message": BaseMessage(text=greeting)})
+            self._by_greeting[greeting] = agent_config
+        return agent_config, self.transcriber_config, self.synthesizer_config
+
+
+PipelineBuilder = Callable[[TenantProfile], TenantPipeline]
+PipelineWarmUp = Callable[[TenantPipeline], Awaitable[Any]]
+
+
+class TenantRouter:
+    """
+    Instradamento numero chiamato -> tenant, con LRU delle pipeline compilate
+
+    Args:
+        config_store: Store della config dell'assistente (tenant e tabella dei numeri)
+        build: Funzione che compila la pipeline di un tenant
+        max_pipelines: Numero massimo di tenant con la pipeline in memoria
+        warm_up: Coroutine lanciata in background per ogni pipeline compilata
+            (es. pre-sintesi delle frasi fisse con la voce del tenant)
+    """
+
+    def __init__(
+        self,
+        config_store: AssistantConfigStore,
+        build: PipelineBuilder,
+        max_pipelines: int = 32,
+        warm_up: Optional[PipelineWarmUp] = None,
+    ):
+        self.config_store = config_store
+        self.build = build
+        self.max_pipelines = max(1, max_pipelines)
+        self.warm_up = warm_up
+        self._pipelines: "OrderedDict[str, TenantPipeline]" = OrderedDict()
+        self._warm_ups: Set[asyncio.Task] = set()
+        config_store.subscribe(self._on_reload)
+
+    def route(self, number: Optional[str]) -> TenantPipeline:
+        """
+        Pipeline del tenant a cui appartiene il numero chiamato
+
+        Args:
+            number: To di Twilio o to_uri SIP
+
+        Returns:
+            TenantPipeline del tenant (quello di default per i numeri non assegnati)
+        """
+        config = self.config_store.current
+        tenant = config.tenant_for(number)
+        TENANT_CALLS_TOTAL.labels(tenant=tenant.name).inc()
+        return self._pipeline(config, tenant)
+
+    def pipeline(self, tenant_name: str) -> TenantPipeline:
+        """Pipeline di un tenant per nome (quello di default se non esiste più)"""
+        config = self.config_store.current
+        return self._pipeline(config, config.tenants.get(tenant_name, config.default_tenant))
+
+    def status(self) -> Dict[str, Any]:
+        return {
+            "pipelines": len(self._pipelines),
+            "max_pipelines": self.max_pipelines,
+            "cached_tenants": list(self._pipelines),
+        }
+
+    def _pipeline(self, config: CompiledAssistantConfig, tenant: TenantProfile) -> TenantPipeline:
+        pipeline = self._pipelines.get(tenant.name)
+        if pipeline is not None:
+            self._pipelines.move_to_end(tenant.name)
+            TENANT_PIPELINE_LOOKUPS.labels(result="hit").inc()
+            return pipeline
+
+        TENANT_PIPELINE_LOOKUPS.labels(result="miss").inc()
+        started = time.perf_counter()
+        pipeline = self.build(tenant)
+        TENANT_PIPELINE_BUILD_SECONDS.observe(time.perf_counter() - started)
+        self._pipelines[tenant.name] = pipeline
+        while len(self._pipelines) > self.max_pipelines:
+            evicted, _ = self._pipelines.popitem(last=False)
+            TENANT_PIPELINE_EVICTIONS.inc()
+            logger.debug(f"Tenant pipeline {evicted} evicted")
+        TENANT_PIPELINES.set(len(self._pipelines))
+        logger.info(f"Tenant pipeline {tenant.name} compiled for config version {config.version}")
+        if self.warm_up is not None:
+            task = asyncio.create_task(self.warm_up(pipeline))
+            self._warm_ups.add(task)
+            task.add_done_callback(self._warm_up_done)
+        return pipeline
+
+    def _warm_up_done(self, task: asyncio.Task) -> None:
+        self._warm_ups.discard(task)
+        if not task.cancelled() and task.exception() is not None:
+            logger.warning(f"Tenant pipeline warm-up failed: {task.exception()}")
+
+    def _on_reload(self, config: CompiledAssistantConfig) -> None:
+        # Calls already set up keep their configs; new calls compile against the new version
+        self._pipelines.clear()
+        TENANT_PIPELINES.set(0)
+        self.pipeline(DEFAULT_TENANT)
@@ -0,0 +1,230 @@
+"""
+Text Chunker - Suddivisione dello stream del LLM in frasi e proposizioni
+
+I token del LLM vengono accumulati e inviati al TTS appena si chiude una
+frase (. ! ? …) o, quando conviene, una proposizione (, ; : —), invece di
+attendere la fine della risposta. Il primo chunk viene emesso al primo
+confine utile per ridurre il time-to-first-audio; i successivi restano a
+livello di frase finché non diventano lunghi, per non spezzare la prosodia.
+
+Non sono considerati confini: abbreviazioni italiane ("Sig. Rossi",
+"ecc." seguito da minuscola), iniziali ("G. Verdi"), sigle puntate
+("S.p.A."), decimali e orari ("3,5", "10.30", "10:30") e i gruppi di cifre
+dei numeri di telefono ("+39 02 1234 5678"), che non vengono mai divisi.
+"""
+
+from dataclasses import dataclass
+from typing import AsyncGenerator, AsyncIterable, List, Optional, Tuple, Union
+
+from vocode.streaming.models.actions import FunctionCall, FunctionFragment
+
+SENTENCE = "sentence"
+CLAUSE = "clause"
+FORCED = "forced"
+FINAL = "final"
+
+SENTENCE_PUNCTUATION = ".!?…"
+CLAUSE_PUNCTUATION = ",;:—–"
+CLOSING_CHARACTERS = "\"'»”’)]"
+
+# Abbreviations never followed by a sentence break ("Sig. Rossi", "n. 5", "tel. 02 ...")
+ITALIAN_ABBREVIATIONS = frozenset(
+    "sig sigg sig.ra sig.na dott dott.ssa dr prof prof.ssa ing avv geom arch rag on sen gent egr spett "
+    "gent.mo gent.ma egr.io spett.le p.za v.le c.so n nr num tel cell fax int art pag pagg cap vol fig "
+    "es ca cfr rif all ord pos doc mod tab sez lett cod prot fatt".split()
+)
+# Abbreviations that can also end a sentence: a break only before an uppercase word
+SENTENCE_FINAL_ABBREVIATIONS = frozenset("ecc etc ss segg".split())
+
+
+@dataclass(frozen=True)
+class TextChunk:
+    """Porzione di risposta pronta per il TTS"""
+
+    text: str
+    boundary: str  # sentence, clause, forced (too long, split at a space), final
+
+
+def _is_digit_group(word: str) -> bool:
+    return bool(word) and (word[0].isdigit() or (word[0] == "+" and word[1:2].isdigit()))
+
+
+class ClauseChunker:
+    """
+    Chunker incrementale: feed() con ogni token, flush() a fine risposta
+
+    Args:
+        first_chunk_min_words: Parole minime perché il primo chunk si chiuda
+            a una virgola (a fine frase basta una parola)
+        clause_split_chars: Dopo il primo chunk, lunghezza oltre la quale si
+            chiude anche alle virgole invece di attendere la fine della frase
+        min_sentence_words: Parole minime di un chunk chiuso a fine frase
+            (le frasi più corte vengono unite alla successiva)
+        max_chars: Oltre questa lunghezza senza confini si taglia a uno spazio
+    """
+
+    def __init__(
+        self,
+        first_chunk_min_words: int = 4,
+        clause_split_chars: int = 80,
+        min_sentence_words: int = 2,
+        max_chars: int = 200,
+    ):
+        self.first_chunk_min_words = first_chunk_min_words
+        self.clause_split_chars = clause_split_chars
+        self.min_sentence_words = min_sentence_words
+        self.max_chars = max_chars
+        self.reset()
+
+    def reset(self) -> None:
+        self._buffer = ""
+        self._scan = 0  # everything before this index has been ruled out as a boundary
+        self._emitted = 0
+
+    def feed(self, token: str) -> List[TextChunk]:
+        """Aggiunge un token e ritorna i chunk che si sono chiusi"""
+        self._buffer += token
+        chunks = []
+        while True:
+            end, boundary = self._find_boundary()
+            if end is None:
+                break
+            chunks.append(self._emit(end, boundary))
+        if len(self._buffer) > self.max_chars:
+            end = self._forced_split()
+            if end is not None:
+                chunks.append(self._emit(end, FORCED))
+        return chunks
+
+    def flush(self) -> Optional[TextChunk]:
+        """Ritorna il testo rimasto a fine risposta"""
+        text = self._buffer.strip()
+        self.reset()
+        if not text:
+            return None
+        return TextChunk(text, FINAL)
+
+    def _emit(self, end: int, boundary: str) -> TextChunk:
+        text = self._buffer[:end].strip()
+        self._buffer = self._buffer[end:]
+        self._scan = 0
+        self._emitted += 1
+        return TextChunk(text, boundary)
+
+    def _find_boundary(self) -> Tuple[Optional[int], Optional[str]]:
+        buffer = self._buffer
+        index = self._scan
+        while index < len(buffer):
+            char = buffer[index]
+            if char in SENTENCE_PUNCTUATION or char == "\n":
+                kind = SENTENCE
+            elif char in CLAUSE_PUNCTUATION:
+                kind = CLAUSE
+            else:
+                index += 1
+                self._scan = index
+                continue
+
+            # Punctuation runs ("?!", "...") and closing quotes belong to the chunk
+            end = index + 1
+            while end < len(buffer) and (buffer[end] in SENTENCE_PUNCTUATION or buffer[end] in CLOSING_CHARACTERS):
+                end += 1
+            if char == "\n":
+                end = index + 1
+            decision = self._is_boundary(buffer, index, end, kind)
+            if decision is None:
+                return None, None  # need more text to decide
+            if decision and self._accept(buffer[:end], kind):
+                return end, kind
+            index = end
+            self._scan = index
+        return None, None
+
+    def _is_boundary(self, buffer: str, index: int, end: int, kind: str) -> Optional[bool]:
+        """True/False se la punteggiatura in `index` chiude un chunk, None se serve altro testo"""
+        if buffer[index] == "\n":
+            return True
+        if end >= len(buffer):
+            return None
+        if not buffer[end].isspace():
+            return False  # "3,5", "10.30", "10:30", "S.p.A", "www.sito.it"
+        if kind == CLAUSE or buffer[index] != ".":
+            return True
+        if index + 1 < end:
+            return True  # ellipsis or "?." style runs
+
+        word = buffer[:index].rsplit(None, 1)[-1] if buffer[:index].strip() else ""
+        bare = word.lstrip("\"'«“(").lower()
+        if len(bare) == 1 and bare.isalpha():
+            return False  # initial: "G. Verdi"
+        if bare in ITALIAN_ABBREVIATIONS:
+            return False
+        if "." in bare and bare.replace(".", "").isalpha():
+            return False  # dotted acronym: "S.p.A.", "s.r.l."
+
+        next_word = buffer[end:].lstrip()
+        if not next_word:
+            return None
+        if bare in SENTENCE_FINAL_ABBREVIATIONS:
+            return next_word[0].isupper()
+        if bare.isdigit():
+            if next_word[0].isdigit():
+                return False  # "02. 1234" in a dictated number
+            previous = buffer[:index].rstrip()[:-len(word)].rstrip()
+            if len(bare) <= 2 and (not previous or previous[-1] in CLAUSE_PUNCTUATION):
+                return False  # list marker: "le opzioni sono: 1. SIM dati, 2. eSIM"
+        return True
+
+    def _accept(self, text: str, kind: str) -> bool:
+        words = len(text.split())
+        if kind == SENTENCE:
+            return words >= (1 if self._emitted == 0 else self.min_sentence_words)
+        if self._emitted == 0:
+            return words >= self.first_chunk_min_words
+        return len(text.strip()) >= self.clause_split_chars
+
+    def _forced_split(self) -> Optional[int]:
+        # Last space before max_chars that does not separate two digit groups
+        buffer = self._buffer
+        position = buffer.rfind(" ", 0, self.max_chars)
+        while position > 0:
+            before = buffer[:position].rsplit(None, 1)
+            after = buffer[position + 1:].split(None, 1)
+            if not (before and after and _is_digit_group(before[-1]) and _is_digit_group(after[0])):
+                return position
+            position = buffer.rfind(" ", 0, position)
+        return None
+
+
+async def collate_clauses_async(
+    gen: AsyncIterable[Union[str, FunctionFragment]],
+    chunker: ClauseChunker,
+    get_functions: bool = False,
+) -> AsyncGenerator[Union[TextChunk, FunctionCall], None]:
+    """
+    Equivalente di collate_response_async di Vocode con confini di proposizione
+
+    Args:
+        gen: Token del LLM (openai_get_tokens)
+        chunker: Chunker da usare per questa risposta
+        get_functions: Se emettere la FunctionCall accumulata a fine stream
+
+    Yields:
+        TextChunk pronti per il TTS, poi l'eventuale FunctionCall
+    """
+    function_name = ""
+    function_arguments = ""
+    async for token in gen:
+        if not token:
+            continue
+        if isinstance(token, FunctionFragment):
+            function_name += token.name
+            function_arguments += token.arguments
+            continue
+        for chunk in chunker.feed(token):
+            yield chunk
+    last = chunker.flush()
+    if last is not None:
+        yield last
+    if function_name and get_functions:
+        yield FunctionCall(name=function_name, arguments=function_arguments)
@@ -0,0 +1,447 @@
+"""
+TTS Cache - Cache audio delle frasi fisse pre-sintetizzate
+
+Le frasi fisse (messaggio iniziale, saluti, risposte degli scenari, fallback)
+vengono sintetizzate una sola volta e conservate già nel formato di uscita
+della telefonia (mu-law 8 kHz o PCM), in memoria (LRU) e su disco.
+
+Il primo chunk di una risposta speculativa (services/speculation.py) può
+essere sintetizzato prima della trascrizione finale: se la risposta viene
+usata l'audio è già pronto, altrimenti viene scartato.
+
+Quando la risposta del LLM arriva a frasi, ogni richiesta a ElevenLabs
+riceve anche il testo già detto nel turno (previous_text), così i chunk
+successivi mantengono l'intonazione della frase invece di ripartire da capo.
+"""
+
+import asyncio
+import hashlib
+import logging
+import os
+from collections import OrderedDict
+from pathlib import Path
+from typing import AsyncGenerator, Awaitable, Dict, Iterable, Optional, Set, Tuple
+
+from prometheus_client import Counter
+from vocode.streaming.models.audio import AudioEncoding
+from vocode.streaming.models.message import BaseMessage
+from vocode.streaming.models.synthesizer import ElevenLabsSynthesizerConfig, SynthesizerConfig
+from vocode.streaming.synthesizer.abstract_factory import AbstractSynthesizerFactory
+from vocode.streaming.synthesizer.base_synthesizer import CachedAudio, SynthesisResult
+from vocode.streaming.synthesizer.eleven_labs_synthesizer import ElevenLabsSynthesizer
+from vocode.streaming.utils import get_chunk_size_per_second
+
+logger = logging.getLogger(__name__)
+
+TTS_CACHE_LOOKUPS = Counter(
+    'voice_assistant_tts_cache_lookups_total',
+    'TTS phrase cache lookups',
+    ['result'],  # memory, disk, miss
+)
+TTS_CACHE_CHARS_SAVED = Counter(
+    'voice_assistant_tts_cache_chars_saved_total',
+    'Characters served from the TTS phrase cache instead of being synthesized',
+)
+TTS_PREFETCH_TOTAL = Counter(
+    'voice_assistant_tts_prefetch_total',
+    'First chunks of speculative responses synthesized before the final transcript',
+    ['result'],  # used, discarded, failed
+)
+
+# ElevenLabs only needs the tail of the turn to continue the intonation
+PREVIOUS_TEXT_MAX_CHARS = 500
+
+
+def phrase_cache_key(text: str, synthesizer_config: ElevenLabsSynthesizerConfig) -> str:
+    """
+    Calcola la chiave di cache di una frase
+
+    La chiave copre testo, voice_id, model_id, voice settings e formato di
+    uscita (encoding + sampling rate), quindi cambiare uno di questi
+    parametri invalida automaticamente le frasi già sintetizzate.
+    """
+    identity = "\x1f".join(
+        (
+            ElevenLabsSynthesizer.get_voice_identifier(synthesizer_config),
+            str(synthesizer_config.sampling_rate),
+            text.strip(),
+        )
+    )
+    return hashlib.sha256(identity.encode("utf-8")).hexdigest()
+
+
+class PhraseAudioCache:
+    """Cache a due livelli (LRU in memoria + disco) dell'audio delle frasi fisse"""
+
+    def __init__(self, cache_dir: Optional[str], max_memory_bytes: int = 64 * 1024 * 1024):
+        self.cache_dir = Path(cache_dir) if cache_dir else None
+        self.max_memory_bytes = max_memory_bytes
+        self.memory_bytes = 0
+        self._memory: "OrderedDict[str, bytes]" = OrderedDict()
+        # Only fixed phrases are cached; LLM output is not worth storing
+        self._cacheable_texts: Set[str] = set()
+
+        if self.cache_dir:
+            try:
+                self.cache_dir.mkdir(parents=True, exist_ok=True)
+            except OSError as e:
+                logger.warning(f"TTS cache dir {self.cache_dir} not usable, disk tier disabled: {e}")
+                self.cache_dir = None
+
+    def register_phrases(self, phrases: Iterable[str]) -> None:
+        """Registra le frasi che possono essere messe in cache"""
+        self._cacheable_texts.update(p.strip() for p in phrases if p and p.strip())
+
+    def is_cacheable(self, text: str) -> bool:
+        return text.strip() in self._cacheable_texts
+
+    def _disk_path(self, key: str, encoding: AudioEncoding) -> Optional[Path]:
+        if not self.cache_dir:
+            return None
+        suffix = "ulaw" if encoding == AudioEncoding.MULAW else "pcm"
+        return self.cache_dir / f"{key}.{suffix}"
+
+    def _remember(self, key: str, audio: bytes) -> None:
+        if len(audio) > self.max_memory_bytes:
+            return
+        previous = self._memory.pop(key, None)
+        if previous is not None:
+            self.memory_bytes -= len(previous)
+        self._memory[key] = audio
+        self.memory_bytes += len(audio)
+        while self.memory_bytes > self.max_memory_bytes:
+            _, evicted = self._memory.popitem(last=False)
+            self.memory_bytes -= len(evicted)
+
+    async def get(self, key: str, encoding: AudioEncoding) -> Optional[bytes]:
+        """
+        Cerca l'audio di una frase, prima in memoria poi su disco
+
+        Args:
+            key: Chiave calcolata con phrase_cache_key
+            encoding: Encoding di uscita (determina l'estensione su disco)
+
+        Returns:
+            Audio pronto per lo streaming o None
+        """
+        audio = self._memory.get(key)
+        if audio is not None:
+            self._memory.move_to_end(key)
+            TTS_CACHE_LOOKUPS.labels(result="memory").inc()
+            return audio
+
+        path = self._disk_path(key, encoding)
+        if path is not None:
+            try:
+                audio = await asyncio.to_thread(path.read_bytes)
+            except FileNotFoundError:
+                audio = None
+            except OSError as e:
+                logger.warning(f"Failed reading TTS cache entry {path}: {e}")
+                audio = None
+            if audio:
+                self._remember(key, audio)
+                TTS_CACHE_LOOKUPS.labels(result="disk").inc()
+                return audio
+
+        TTS_CACHE_LOOKUPS.labels(result="miss").inc()
+        return None
+
+    def contains(self, key: str, encoding: AudioEncoding) -> bool:
+        """True se la frase è in memoria o su disco (senza leggerla né contarla nelle metriche)"""
+        if key in self._memory:
+            return True
+        path = self._disk_path(key, encoding)
+        return path is not None and path.exists()
+
+    async def put(self, key: str, encoding: AudioEncoding, audio: bytes) -> None:
+        """Salva l'audio di una frase in memoria e su disco"""
+        if not audio:
+            return
+        self._remember(key, audio)
+
+        path = self._disk_path(key, encoding)
+        if path is not None:
+            try:
+                await asyncio.to_thread(self._write_atomic, path, audio)
+            except OSError as e:
+                logger.warning(f"Failed writing TTS cache entry {path}: {e}")
+
+    @staticmethod
+    def _write_atomic(path: Path, audio: bytes) -> None:
+        tmp_path = path.with_suffix(path.suffix + f".tmp{os.getpid()}")
+        with open(tmp_path, "wb") as f:
+            f.write(audio)
+        os.replace(tmp_path, path)
+
+
+class CachedElevenLabsSynthesizer(ElevenLabsSynthesizer):
+    """ElevenLabsSynthesizer che serve le frasi fisse dalla PhraseAudioCache"""
+
+    def __init__(
+        self,
+        synthesizer_config: ElevenLabsSynthesizerConfig,
+        phrase_cache: PhraseAudioCache,
+        context_stitching: bool = True,
+    ):
+        super().__init__(synthesizer_config)
+        self.phrase_cache = phrase_cache
+        self.context_stitching = context_stitching
+        self._turn_text = ""  # text already sent for synthesis in the current turn
+        self._previous_text: Optional[str] = None  # previous_text of the request being built
+        self._prefetched: Dict[str, asyncio.Task] = {}  # text -> task synthesizing its whole audio
+        self._fetch_complete: Optional[asyncio.Future] = None  # outcome of the request being built
+
+    async def create_speech(
+        self,
+        message: BaseMessage,
+        chunk_size: int,
+        is_first_text_chunk: bool = False,
+        is_sole_text_chunk: bool = False,
+    ) -> SynthesisResult:
+        # Chunks of a turn are synthesized in order by the agent responses worker
+        if is_first_text_chunk:
+            self._turn_text = ""
+        if self.context_stitching and self._turn_text and not self.phrase_cache.is_cacheable(message.text):
+            self._previous_text = self._turn_text[-PREVIOUS_TEXT_MAX_CHARS:]
+        try:
+            result = await super().create_speech(
+                message,
+                chunk_size,
+                is_first_text_chunk=is_first_text_chunk,
+                is_sole_text_chunk=is_sole_text_chunk,
+            )
+        finally:
+            self._previous_text = None
+        text = getattr(message, "text", "")
+        if text:
+            self._turn_text = f"{self._turn_text} {text}" if self._turn_text else text
+        return result
+
+    async def tear_down(self):
+        self.discard_prefetch()
+        await super().tear_down()
+
+    def get_chunks(self, url: str, headers: dict, body: dict, chunk_size: int, chunk_queue: asyncio.Queue):
+        # Plain def: called synchronously by create_speech_uncached while building the request
+        if self._previous_text:
+            body["previous_text"] = self._previous_text
+        fetch = super().get_chunks(url, headers, body, chunk_size, chunk_queue)
+        if self._fetch_complete is None:
+            return fetch
+        return self._report_fetch(fetch, self._fetch_complete)
+
+    @staticmethod
+    async def _report_fetch(fetch: Awaitable[None], complete: asyncio.Future) -> None:
+        """
+        Esegue la richiesta di Vocode e registra se l'audio è arrivato intero
+
+        Vocode chiude la coda dei chunk anche quando la richiesta fallisce o
+        viene cancellata, quindi la fine del chunk generator non basta a dire
+        che la frase è completa.
+        """
+        try:
+            await fetch
+        except BaseException:
+            if not complete.done():
+                complete.set_result(False)
+            raise
+        # get_chunks swallows the cancellation of an interrupted synthesis: the audio is cut short
+        task = asyncio.current_task()
+        if not complete.done():
+            complete.set_result(task is None or not task.cancelling())
+
+    async def _create_speech_checked(
+        self,
+        message: BaseMessage,
+        chunk_size: int,
+        is_first_text_chunk: bool = False,
+        is_sole_text_chunk: bool = False,
+    ) -> Tuple[SynthesisResult, asyncio.Future]:
+        """create_speech_uncached di ElevenLabs, più un future che dice se la richiesta è finita senza errori"""
+        complete = asyncio.get_running_loop().create_future()
+        # get_chunks is called synchronously while the request is built, like _previous_text
+        self._fetch_complete = complete
+        try:
+            result = await super().create_speech_uncached(
+                message,
+                chunk_size,
+                is_first_text_chunk=is_first_text_chunk,
+                is_sole_text_chunk=is_sole_text_chunk,
+            )
+        finally:
+            self._fetch_complete = None
+        return result, complete
+
+    def prefetch(self, text: str) -> None:
+        """
+        Sintetizza in anticipo il primo chunk di una risposta speculativa
+
+        Se poi il chunk viene detto, create_speech usa questo audio (attendendo
+        la fine della sintesi se è ancora in corso) invece di una nuova richiesta.
+        """
+        key = text.strip()
+        if not key or key in self._prefetched or self.phrase_cache.is_cacheable(key):
+            return
+        self._prefetched[key] = asyncio.create_task(self._synthesize_whole(key))
+
+    def discard_prefetch(self, text: Optional[str] = None) -> None:
+        """Scarta l'audio pre-sintetizzato di un testo (o di tutti se text è None)"""
+        keys = list(self._prefetched) if text is None else [text.strip()]
+        for key in keys:
+            task = self._prefetched.pop(key, None)
+            if task is not None:
+                task.cancel()
+                TTS_PREFETCH_TOTAL.labels(result="discarded").inc()
+
+    async def _synthesize_whole(self, text: str) -> bytes:
+        chunk_size = get_chunk_size_per_second(
+            self.synthesizer_config.audio_encoding, self.synthesizer_config.sampling_rate
+        )
+        result, complete = await self._create_speech_checked(BaseMessage(text=text), chunk_size, is_first_text_chunk=True)
+        audio = bytearray()
+        async for chunk_result in result.chunk_generator:
+            audio.extend(chunk_result.chunk)
+        if not (complete.done() and complete.result()):
+            # Truncated by a failed request: get_cached_audio synthesizes the chunk again
+            return b""
+        return bytes(audio)
+
+    async def get_cached_audio(self, message: BaseMessage) -> Optional[CachedAudio]:
+        task = self._prefetched.pop(message.text.strip(), None) if self._prefetched else None
+        if task is not None:
+            try:
+                audio = await task
+            except Exception as e:
+                logger.warning(f"TTS prefetch failed for '{message.text[:40]}', synthesizing again: {e}")
+                audio = b""
+            if audio:
+                TTS_PREFETCH_TOTAL.labels(result="used").inc()
+                return CachedAudio(message, audio, self.synthesizer_config)
+            TTS_PREFETCH_TOTAL.labels(result="failed").inc()
+        if self.phrase_cache.is_cacheable(message.text):
+            key = phrase_cache_key(message.text, self.synthesizer_config)
+            audio = await self.phrase_cache.get(key, self.synthesizer_config.audio_encoding)
+            if audio is not None:
+                TTS_CACHE_CHARS_SAVED.inc(len(message.text))
+                return CachedAudio(message, audio, self.synthesizer_config)
+        return await super().get_cached_audio(message)
+
+    async def create_speech_uncached(
+        self,
+        message: BaseMessage,
+        chunk_size: int,
+        is_first_text_chunk: bool = False,
+        is_sole_text_chunk: bool = False,
+    ) -> SynthesisResult:
+        if not self.phrase_cache.is_cacheable(message.text):
+            return await super().create_speech_uncached(
+                message,
+                chunk_size,
+                is_first_text_chunk=is_first_text_chunk,
+                is_sole_text_chunk=is_sole_text_chunk,
+            )
+        result, complete = await self._create_speech_checked(
+            message,
+            chunk_size,
+            is_first_text_chunk=is_first_text_chunk,
+            is_sole_text_chunk=is_sole_text_chunk,
+        )
+        result.chunk_generator = self._tee_into_cache(message.text, result.chunk_generator, complete)
+        return result
+
+    async def _tee_into_cache(
+        self,
+        text: str,
+        chunk_generator: AsyncGenerator[SynthesisResult.ChunkResult, None],
+        complete: asyncio.Future,
+    ) -> AsyncGenerator[SynthesisResult.ChunkResult, None]:
+        audio = bytearray()
+        async for chunk_result in chunk_generator:
+            audio.extend(chunk_result.chunk)
+            yield chunk_result
+        # The generator also ends normally after a failed or cancelled request: cache only whole phrases
+        if not (complete.done() and complete.result()):
+            logger.warning(f"TTS request for phrase '{text[:40]}' did not complete, not caching it")
+            return
+        key = phrase_cache_key(text, self.synthesizer_config)
+        await self.phrase_cache.put(key, self.synthesizer_config.audio_encoding, bytes(audio))
+
+
+class CachingSynthesizerFactory(AbstractSynthesizerFactory):
+    """
+    Synthesizer factory che aggancia la PhraseAudioCache ai synthesizer ElevenLabs
+
+    Gli altri provider passano alla DefaultSynthesizerFactory di Vocode,
+    importata solo allora (carica gli SDK di Azure, Cartesia, PlayHT...).
+    """
+
+    def __init__(self, phrase_cache: PhraseAudioCache, context_stitching: bool = True):
+        self.phrase_cache = phrase_cache
+        self.context_stitching = context_stitching
+
+    def create_synthesizer(self, synthesizer_config: SynthesizerConfig):
+        if isinstance(synthesizer_config, ElevenLabsSynthesizerConfig) and not synthesizer_config.experimental_websocket:
+            return CachedElevenLabsSynthesizer(
+                synthesizer_config,
+                self.phrase_cache,
+                context_stitching=self.context_stitching,
+            )
+        from vocode.streaming.synthesizer.default_factory import DefaultSynthesizerFactory
+
+        return DefaultSynthesizerFactory().create_synthesizer(synthesizer_config)
+
+
+async def warm_up_phrase_cache(
+    phrase_cache: PhraseAudioCache,
+    synthesizer_config: ElevenLabsSynthesizerConfig,
+    phrases: Iterable[str],
+    concurrency: int = 4,
+) -> int:
+    """
+    Pre-sintetizza le frasi fisse non ancora presenti in cache
+
+    Args:
+        phrase_cache: Cache da popolare
+        synthesizer_config: Config con il formato di uscita della telefonia
+        phrases: Frasi da pre-sintetizzare
+        concurrency: Numero massimo di richieste TTS in parallelo
+
+    Returns:
+        Numero di frasi sintetizzate
+    """
+    phrases = [p.strip() for p in phrases if p and p.strip()]
+    phrase_cache.register_phrases(phrases)
+
+    synthesizer = CachedElevenLabsSynthesizer(synthesizer_config, phrase_cache)
+    chunk_size = get_chunk_size_per_second(
+        synthesizer_config.audio_encoding, synthesizer_config.sampling_rate
+    )
+    semaphore = asyncio.Semaphore(concurrency)
+
+    async def synthesize(text: str) -> Optional[bool]:
+        # None: already cached, True: synthesized and stored, False: failed
+        key = phrase_cache_key(text, synthesizer_config)
+        if await phrase_cache.get(key, synthesizer_config.audio_encoding) is not None:
+            return None
+        async with semaphore:
+            try:
+                result = await synthesizer.create_speech_uncached(BaseMessage(text=text), chunk_size)
+                async for _ in result.chunk_generator:
+                    pass
+                # A failed request also ends the generator: only stored audio counts
+                return phrase_cache.contains(key, synthesizer_config.audio_encoding)
+            except Exception as e:
+                logger.warning(f"TTS warm-up failed for phrase '{text[:40]}': {e}")
+                return False
+
+    try:
+        results = await asyncio.gather(*(synthesize(text) for text in phrases))
+    finally:
+        await synthesizer.tear_down()
+
+    synthesized = sum(result is True for result in results)
+    cached = sum(result is None for result in results)
+    failed = len(phrases) - synthesized - cached
+    logger.info(f"TTS phrase cache warm-up: {synthesized} synthesized, {cached} already cached, {failed} failed")
+    return synthesized
@@ -0,0 +1,256 @@
+"""
+Turn Detection - VAD locale su audio in ingresso: barge-in, fine turno, silenzio
+
+Il VoiceActivityDetector gira su ogni frame ricevuto dal chiamante, prima
+del transcriber, e serve tre cose che il transcriber remoto fa in ritardo
+o non fa affatto:
+
+- barge-in: se il chiamante parla sopra l'assistente, la risposta in corso
+  viene interrotta e l'audio già accodato verso la telefonia scartato subito,
+  senza attendere la trascrizione;
+- fine turno: quando il VAD vede la fine del parlato e il transcriber ha già
+  un parziale aggiornato, il parziale viene promosso a trascrizione finale e
+  la finale del transcriber per le stesse parole viene scartata;
+- silenzio: dopo call_handling.silence_timeout secondi senza voce
+  l'assistente ripete una domanda, poi chiude la chiamata.
+
+Come instrument_conversation, gli hook vengono applicati sull'istanza della
+StreamingConversation (receive_audio e coda di output del transcriber).
+"""
+
+import asyncio
+import logging
+import time
+from dataclasses import dataclass
+from typing import Any, Dict, Optional
+
+from prometheus_client import Counter
+from vocode.streaming.models.message import BaseMessage
+from vocode.streaming.models.transcriber import Transcription
+
+from audio.vad import SPEECH_END, SPEECH_START, VoiceActivityDetector
+from monitoring.latency import TurnLatencyTracker
+
+logger = logging.getLogger(__name__)
+
+BARGE_INS_TOTAL = Counter(
+    'voice_assistant_barge_ins_total',
+    'Bot responses interrupted by caller speech detected by the local VAD',
+)
+LOCAL_ENDPOINTS_TOTAL = Counter(
+    'voice_assistant_local_endpoints_total',
+    'Turns committed by the local VAD before the transcriber endpoint',
+)
+SILENCE_TIMEOUTS_TOTAL = Counter(
+    'voice_assistant_silence_timeouts_total',
+    'Silence timeouts of the caller',
+    ['action'],  # reprompt, hangup
+)
+
+SILENCE_CHECK_INTERVAL = 0.5  # Seconds of audio between silence timeout checks
+COMMIT_TTL = 3.0  # Seconds a local commit waits for the transcriber's own final
+
+
+@dataclass
+class TurnDetectionConfig:
+    """Parametri del VAD locale e delle azioni collegate"""
+
+    vad_mode: int = 2
+    end_of_speech_ms: int = 500
+    barge_in_enabled: bool = True
+    barge_in_min_speech_ms: int = 400  # Shorter sounds ("sì", "ok") do not cut the assistant off
+    local_endpointing_enabled: bool = True
+    transcriber_lag: float = 0.3  # Seconds an interim may trail the audio and still be complete
+    silence_timeout: Optional[float] = None
+    silence_message: Optional[str] = None
+    max_silence_prompts: int = 2
+
+    @classmethod
+    def from_assistant_config(cls, config: Dict[str, Any], **kwargs) -> "TurnDetectionConfig":
+        call_handling = (config.get("assistant") or {}).get("call_handling") or {}
+        return cls(
+            silence_timeout=call_handling.get("silence_timeout"),
+            silence_message=call_handling.get("silence_message") or call_handling.get("fallback_message"),
+            max_silence_prompts=call_handling.get("max_silence_prompts", 2),
+            **kwargs,
+        )
+
+
+class LocalTurnDetector:
+    """
+    Collega un VoiceActivityDetector a una StreamingConversation
+
+    Args:
+        conversation: StreamingConversation (Twilio o SIP) con audio mu-law 8 kHz
+        config: Parametri del rilevamento
+        latency_tracker: Tracker del turno, riceve la fine del parlato misurata dal VAD
+    """
+
+    def __init__(
+        self,
+        conversation: Any,
+        config: TurnDetectionConfig,
+        latency_tracker: Optional[TurnLatencyTracker] = None,
+    ):
+        self.conversation = conversation
+        self.config = config
+        self.latency_tracker = latency_tracker
+        self.vad = VoiceActivityDetector(mode=config.vad_mode, end_ms=config.end_of_speech_ms)
+
+        self._barged_in = False
+        self._interim = ""
+        self._interim_confidence = 0.0
+        self._interim_at = 0.0
+        self._awaiting_commit = False
+        self._committed_words: Optional[int] = None
+        self._committed_at = 0.0
+
+        self._audio_since_check = 0.0
+        self._silence_since = time.monotonic()
+        self._silence_prompts = 0
+        self._prompt_task: Optional[asyncio.Task] = None
+
+    def attach(self) -> None:
+        conversation = self.conversation
+        receive_audio = conversation.receive_audio
+
+        def receive_audio_with_vad(chunk: bytes):
+            self.process_audio(chunk)
+            receive_audio(chunk)
+
+        conversation.receive_audio = receive_audio_with_vad
+
+        transcription_queue = conversation.transcriber.output_queue
+        self._put_transcription = transcription_queue.put_nowait
+        transcription_queue.put_nowait = self.on_transcription
+
+        if self.latency_tracker is not None:
+            self.latency_tracker.uses_local_vad = True
+
+    # --- Audio ----------------------------------------------------------
+
+    def process_audio(self, chunk: bytes) -> None:
+        event = self.vad.process(chunk)
+        now = time.monotonic()
+        if event == SPEECH_START:
+            self._on_speech_start()
+        elif event == SPEECH_END:
+            self._on_speech_end(now)
+
+        if self.vad.is_speech:
+            self._silence_since = now
+            if (
+                self.config.barge_in_enabled
+                and not self._barged_in
+                and self.vad.speech_ms >= self.config.barge_in_min_speech_ms
+            ):
+                self._barged_in = True
+                self._maybe_barge_in()
+
+        self._audio_since_check += len(chunk) / self.vad.sample_rate
+        if self._audio_since_check >= SILENCE_CHECK_INTERVAL:
+            self._audio_since_check = 0.0
+            self._check_silence(now)
+
+    def _on_speech_start(self) -> None:
+        self._barged_in = False
+        self._awaiting_commit = False
+        self._silence_prompts = 0
+
+    def _on_speech_end(self, now: float) -> None:
+        speech_end_at = now - self.vad.end_ms / 1000
+        if self.latency_tracker is not None:
+            self.latency_tracker.mark_end_of_speech(at=speech_end_at)
+        if not self.config.local_endpointing_enabled or not self._interim:
+            return
+        if self._interim_at >= speech_end_at + self.config.transcriber_lag:
+            self._commit(now)
+        else:
+            # The transcript may still miss the last words: commit on the next interim
+            self._awaiting_commit = True
+
+    def _bot_is_speaking(self) -> bool:
+        conversation = self.conversation
+        if not conversation.initial_message_tracker.is_set():
+            return False  # The initial message is not interruptible
+        return conversation.transcriptions_worker.is_bot_still_speaking()
+
+    def _maybe_barge_in(self) -> None:
+        if not self._bot_is_speaking():
+            return
+        if not self.conversation.broadcast_interrupt():
+            return
+        # Drop audio already queued towards the caller instead of waiting for the next chunk boundary
+        clear = getattr(self.conversation.output_device, "send_clear_message", None)
+        if clear is not None:
+            clear()
+        BARGE_INS_TOTAL.inc()
+        logger.info(f"Barge-in on conversation {self.conversation.id}")
+
+    # --- Transcriptions -------------------------------------------------
+
+    def on_transcription(self, transcription: Transcription) -> None:
+        now = time.monotonic()
+        if self._committed_words is not None:
+            if now - self._committed_at > COMMIT_TTL:
+                self._committed_words = None
+            else:
+                # Transcripts after a local commit still contain the committed words
+                words = transcription.message.split()
+                remainder = " ".join(words[self._committed_words:])
+                if transcription.is_final:
+                    self._committed_words = None
+                if not remainder:
+                    return
+                transcription.message = remainder
+
+        if transcription.is_final:
+            self._interim = ""
+            self._awaiting_commit = False
+        elif transcription.message.strip():
+            self._interim = transcription.message
+            self._interim_confidence = transcription.confidence
+            self._interim_at = now
+            if self._awaiting_commit and not self.vad.is_speech:
+                self._put_transcription(transcription)
+                self._commit(now)
+                return
+        self._put_transcription(transcription)
+
+    def _commit(self, now: float) -> None:
+        text = self._interim
+        self._interim = ""
+        self._awaiting_commit = False
+        self._committed_words = len(text.split())
+        self._committed_at = now
+        LOCAL_ENDPOINTS_TOTAL.inc()
+        logger.debug(f"Local endpoint on conversation {self.conversation.id}: {text}")
+        self._put_transcription(Transcription(message=text, confidence=self._interim_confidence, is_final=True))
+
+    # --- Silence --------------------------------------------------------
+
+    def _check_silence(self, now: float) -> None:
+        timeout = self.config.silence_timeout
+        conversation = self.conversation
+        if not timeout or not conversation.is_active():
+            return
+        busy = not conversation.initial_message_tracker.is_set() or self._bot_is_speaking()
+        if busy or (self._prompt_task is not None and not self._prompt_task.done()):
+            self._silence_since = now
+            return
+        # last_action_timestamp moves with every transcription and every audio chunk sent
+        silent_for = min(now - self._silence_since, time.time() - conversation.last_action_timestamp)
+        if silent_for < timeout:
+            return
+
+        self._silence_since = now
+        if self._silence_prompts >= self.config.max_silence_prompts or not self.config.silence_message:
+            SILENCE_TIMEOUTS_TOTAL.labels(action="hangup").inc()
+            logger.info(f"Caller silent for {silent_for:.0f}s, ending conversation {conversation.id}")
+            conversation.mark_terminated(bot_disconnect=True)
+            return
+        self._silence_prompts += 1
+        SILENCE_TIMEOUTS_TOTAL.labels(action="reprompt").inc()
+        self._prompt_task = asyncio.create_task(
+            conversation.send_single_message(message=BaseMessage(text=self.config.silence_message))
+        )
@@ -0,0 +1,257 @@
+"""
+Twilio Webhooks - Firma, TwiML pre-renderizzato e dedup delle callback di stato
+
+I webhook Twilio sono pubblici: senza verifica chiunque può aprire
+chiamate finte e consumare la capacità del pod. TwilioWebhookGuard legge
+il corpo (form urlencoded, al massimo MAX_BODY_BYTES) con parse_qsl,
+senza il parser multipart di Starlette, e verifica X-Twilio-Signature:
+HMAC-SHA1 con l'auth token di URL + parametri ordinati. Lo stato HMAC con
+la chiave viene preparato una volta per token (anche il secondario, per
+la rotazione) e copiato per ogni richiesta. La firma viene provata
+sull'URL pubblico (BASE_URL) e su quello ricevuto, come fa la libreria
+Twilio con le varianti di porta.
+
+Le risposte fisse (errore, servizio non disponibile, overflow, redirect
+del drain) sono byte renderizzati all'avvio da TwimlReplies.
+
+Twilio ripete una callback di stato quando non riceve risposta in tempo:
+StatusCallbackDedup scarta le ripetizioni per CallSid e stato, in
+memoria e, con Redis, tra le repliche.
+"""
+
+import base64
+import hashlib
+import hmac
+import logging
+import time
+from collections import OrderedDict
+from dataclasses import dataclass
+from typing import TYPE_CHECKING, Dict, List, Optional, Sequence, Tuple
+from urllib.parse import parse_qsl
+from xml.sax.saxutils import escape, quoteattr
+
+from prometheus_client import Counter, Histogram
+
+if TYPE_CHECKING:
+    from redis.asyncio import Redis
+    from starlette.requests import Request
+
+logger = logging.getLogger(__name__)
+
+TWILIO_WEBHOOKS_TOTAL = Counter(
+    'voice_assistant_twilio_webhooks_total',
+    'Twilio webhook requests, by outcome',
+    ['endpoint', 'result'],  # accepted, invalid_signature, too_large, duplicate
+)
+TWILIO_WEBHOOK_SECONDS = Histogram(
+    'voice_assistant_twilio_webhook_seconds',
+    'Time to answer a Twilio webhook',
+    ['endpoint'],  # voice, status
+    buckets=(0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0),
+)
+
+MAX_BODY_BYTES = 16384  # Twilio forms are a few hundred bytes
+SIGNATURE_HEADER = "X-Twilio-Signature"
+XML_DECLARATION = '<?xml version="1.0" encoding="UTF-8"?>'
+
+
+# --- Pre-rendered TwiML ------------------------------------------------------
+
+def render_twiml(*verbs: str) -> bytes:
+    return f"{XML_DECLARATION}<Response>{''.join(verbs)}</Response>".encode()
+
+
+def say_verb(text: str, language: str = "it-IT") -> str:
+    return f"<Say language={quoteattr(language)}>{escape(text)}</Say>"
+
+
+def redirect_verb(url: str, method: str = "POST") -> str:
+    return f"<Redirect method={quoteattr(method)}>{escape(url)}</Redirect>"
+
+
+@dataclass(frozen=True)
+class TwimlReplies:
+    """Risposte TwiML fisse, renderizzate una volta all'avvio"""
+
+    unavailable: bytes
+    error: bytes
+    overflow: bytes
+    drain_redirect: bytes
+
+    @classmethod
+    def render(
+        cls,
+        base_url: str,
+        overflow_message: str,
+        overflow_redirect_url: Optional[str] = None,
+        unavailable_message: str = "Mi dispiace, il servizio non è al momento disponibile. Riprova più tardi.",
+        error_message: str = "Si è verificato un errore. Per favore riprova più tardi.",
+    ) -> "TwimlReplies":
+        if overflow_redirect_url:
+            overflow = render_twiml(redirect_verb(overflow_redirect_url))
+        else:
+            overflow = render_twiml(say_verb(overflow_message), "<Hangup/>")
+        return cls(
+            unavailable=render_twiml(say_verb(unavailable_message)),
+            error=render_twiml(say_verb(error_message)),
+            overflow=overflow,
+            # A draining pod sends Twilio back to the webhook, which the load balancer routes to another replica
+            drain_redirect=render_twiml(redirect_verb(f"{base_url}/webhooks/twilio/voice?drain_redirect=1")),
+        )
+
+
+# --- Signature ---------------------------------------------------------------
+
+def public_base_url(base_url: str) -> str:
+    """BASE_URL con lo schema (https se manca) e senza / finale"""
+    base_url = base_url.rstrip("/")
+    return base_url if "://" in base_url else f"https://{base_url}"
+
+
+class TwilioSignatureValidator:
+    """
+    Verifica di X-Twilio-Signature
+
+    Args:
+        auth_tokens: Auth token dell'account (il secondo durante una rotazione)
+    """
+
+    def __init__(self, auth_tokens: Sequence[str]):
+        # Keyed HMAC states: each request only copies them instead of hashing the key again
+        self._macs = [hmac.new(token.encode(), digestmod=hashlib.sha1) for token in auth_tokens if token]
+
+    @property
+    def enabled(self) -> bool:
+        return bool(self._macs)
+
+    def signatures(self, url: str, params: Sequence[Tuple[str, str]]) -> List[bytes]:
+        """Firme attese (una per token) per l'URL e i parametri POST"""
+        payload = url + "".join(name + value for name, value in sorted(params))
+        payload_bytes = payload.encode()
+        result = []
+        for base in self._macs:
+            mac = base.copy()
+            mac.update(payload_bytes)
+            result.append(base64.b64encode(mac.digest()))
+        return result
+
+    def is_valid(self, signature: str, urls: Sequence[str], params: Sequence[Tuple[str, str]]) -> bool:
+        supplied = signature.encode()
+        for url in urls:
+            for expected in self.signatures(url, params):
+                if hmac.compare_digest(expected, supplied):
+                    return True
+        return False
+
+
+class TwilioWebhookGuard:
+    """
+    Lettura e verifica di una richiesta webhook di Twilio
+
+    Args:
+        validator: Verifica della firma (None o senza token = richieste non verificate)
+        base_url: URL pubblico del pod (BASE_URL), quello configurato su Twilio
+    """
+
+    def __init__(self, validator: Optional[TwilioSignatureValidator], base_url: str):
+        self.validator = validator if validator is not None and validator.enabled else None
+        self.base_url = public_base_url(base_url)
+
+    def _urls(self, request: "Request") -> List[str]:
+        path = request.url.path
+        query = request.url.query
+        path_qs = f"{path}?{query}" if query else path
+        urls = [self.base_url + path_qs]
+        # As received, with the scheme the ingress saw (TLS is terminated before the pod)
+        scheme = request.headers.get("x-forwarded-proto", request.url.scheme)
+        host = request.headers.get("host", request.url.netloc)
+        received = f"{scheme}://{host}{path_qs}"
+        if received != urls[0]:
+            urls.append(received)
+        return urls
+
+    async def read(self, request: "Request", endpoint: str) -> Tuple[Optional[Dict[str, str]], Optional[int]]:
+        """
+        Legge il form della richiesta e ne verifica la firma
+
+        Returns:
+            (parametri, None) se la richiesta è valida, altrimenti (None, status HTTP da rispondere)
+        """
+        length = request.headers.get("content-length")
+        if length is not None and length.isdigit() and int(length) > MAX_BODY_BYTES:
+            TWILIO_WEBHOOKS_TOTAL.labels(endpoint=endpoint, result="too_large").inc()
+            return None, 413
+        body = await request.body()
+        if len(body) > MAX_BODY_BYTES:
+            TWILIO_WEBHOOKS_TOTAL.labels(endpoint=endpoint, result="too_large").inc()
+            return None, 413
+        params = parse_qsl(body.decode("utf-8", "replace"), keep_blank_values=True)
+        if self.validator is not None:
+            signature = request.headers.get(SIGNATURE_HEADER, "")
+            if not signature or not self.validator.is_valid(signature, self._urls(request), params):
+                TWILIO_WEBHOOKS_TOTAL.labels(endpoint=endpoint, result="invalid_signature").inc()
+                return None, 403
+        return dict(params), None
+
+
+# --- Status callback dedup ---------------------------------------------------
+
+class StatusCallbackDedup:
+    """
+    Riconosce le callback di stato già ricevute (stesso CallSid e stato)
+
+    Args:
+        ttl_seconds: Per quanto una callback viene ricordata
+        max_entries: Callback ricordate in memoria (le più vecchie escono per prime)
+        redis_client: Se presente, le callback viste da una replica valgono per tutte
+        namespace: Prefisso delle chiavi Redis
+    """
+
+    def __init__(
+        self,
+        ttl_seconds: float = 3600,
+        max_entries: int = 50000,
+        redis_client: Optional["Redis"] = None,
+        namespace: str = "twilio",
+    ):
+        self.ttl_seconds = ttl_seconds
+        self.max_entries = max_entries
+        self.redis = redis_client
+        self.namespace = namespace
+        self._seen: "OrderedDict[str, float]" = OrderedDict()  # key -> expiry (monotonic)
+
+    def _remember(self, key: str, now: float) -> None:
+        self._seen[key] = now + self.ttl_seconds
+        self._seen.move_to_end(key)
+        while len(self._seen) > self.max_entries:
+            self._seen.popitem(last=False)
+
+    async def first_delivery(self, call_sid: str, status: str) -> bool:
+        """True la prima volta che arriva la callback, False per le ripetizioni"""
+        key = f"{call_sid}:{status}"
+        now = time.monotonic()
+        expiry = self._seen.get(key)
+        if expiry is not None and expiry > now:
+            return False
+        self._remember(key, now)
+        if self.redis is None:
+            return True
+        try:
+            first = await self.redis.set(
+                f"{self.namespace}:status:{key}", 1, nx=True, ex=max(1, int(self.ttl_seconds))
+            )
+        except Exception as e:
+            # Better a repeated status update than a lost one
+            logger.debug(f"Status callback dedup without Redis: {e}")
+            return True
+        return bool(first)
+
+    async def forget(self, call_sid: str, status: str) -> None:
+        """Dimentica una callback non elaborata, così la ripetizione di Twilio viene accettata"""
+        key = f"{call_sid}:{status}"
+        self._seen.pop(key, None)
+        if self.redis is not None:
+            try:
+                await self.redis.delete(f"{self.namespace}:status:{key}")
+            except Exception as e:
+                logger.debug(f"Status callback dedup without Redis: {e}")
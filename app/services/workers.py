@@ -0,0 +1,675 @@
+"""
+Workers - Più processi per pod, con ogni chiamata legata al suo worker
+
+Un processo Python usa un solo core, qualunque sia il limite di CPU del
+pod. Con WORKERS > 1 `python main.py` avvia un supervisore che:
+
+- apre la porta HTTP e avvia N worker, ognuno con uvicorn e il suo event loop;
+- per ogni connessione legge la testa della richiesta senza consumarla
+  (MSG_PEEK) e passa il socket al worker scelto (SCM_RIGHTS): il worker la
+  serve come se l'avesse accettata lui, senza un proxy sui frame audio;
+- manda il webhook voice di Twilio al worker con meno chiamate, che ne
+  diventa il proprietario: l'id della conversazione porta il suo indice
+  (w2-...), quindi il WebSocket /connect_call/{id} arriva allo stesso
+  worker, e le callback di stato lo ritrovano dal CallSid;
+- per SIP la porta di segnalazione è una sola: registrazione, INVITE e
+  /sip/status restano al worker 0, le chiamate del webhook WebRTC vanno al
+  worker con meno chiamate (ognuno ha la sua parte dell'intervallo RTP);
+- inoltra SIGTERM ai worker (ognuno fa il suo drain) e riavvia un worker
+  che termina da solo.
+
+I worker chiudono le connessioni HTTP dopo ogni risposta, così ogni
+richiesta passa dal supervisore e viene instradata da capo. Le metriche
+Prometheus usano la modalità multiprocesso (PROMETHEUS_MULTIPROC_DIR,
+impostata prima che i worker importino prometheus_client) e senza Redis
+ogni worker pubblica le sue chiamate nella directory di stato
+(CallRegistry): /metrics e /sip/status riportano i totali del pod.
+"""
+
+import asyncio
+import functools
+import glob
+import json
+import logging
+import os
+import shutil
+import signal
+import socket
+import subprocess
+import sys
+import tempfile
+from collections import OrderedDict
+from dataclasses import dataclass
+from typing import Any, Callable, Dict, List, Optional, Set, Tuple
+from urllib.parse import parse_qs, urlsplit
+
+from prometheus_client import Counter
+
+logger = logging.getLogger(__name__)
+
+WORKER_CONNECTIONS_TOTAL = Counter(
+    'voice_assistant_worker_connections_total',
+    'Connections handed to a worker by the supervisor, by routing rule',
+    ['worker', 'route'],  # call, least_loaded, signaling, any
+)
+
+WORKER_ENV = "VOICE_ASSISTANT_WORKER"  # JSON with the worker's parameters, set by the supervisor
+APP_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+HEAD_LIMIT = 16384  # Request head (plus the small form body of the Twilio webhooks) peeked before routing
+HEAD_TIMEOUT = 2.0  # Seconds to wait for it; slower clients go to any worker
+LOAD_REPORT_INTERVAL = 1.0
+RESTART_DELAY = 1.0
+MAX_TRACKED_CALLS = 100_000  # Twilio CallSid -> owner worker
+
+# Routes of main.py (and of the Vocode telephony server) that decide the worker
+TWILIO_VOICE_PATH = "/webhooks/twilio/voice"
+TWILIO_STATUS_PATH = "/webhooks/twilio/status"
+CONNECT_CALL_PREFIX = "/connect_call/"
+SIP_WEBRTC_PATH = "/webhooks/sip/webrtc"
+SIGNALING_PREFIX = "/sip/"
+FINAL_CALL_STATUSES = frozenset(("completed", "failed", "busy", "no-answer"))
+
+# Supervisor <-> worker messages, one per SOCK_SEQPACKET packet
+MSG_CONNECTION = b"C"  # + routing rule, with the connection's fd
+MSG_READY = b"U"
+MSG_LOAD = b"L"  # + live calls of the worker
+MSG_DRAIN = b"D"
+MSG_RESUME = b"R"
+
+
+def owner_from_conversation_id(conversation_id: str) -> Optional[int]:
+    """Indice del worker da un id di conversazione creato con tag_conversation_id (None se non ne ha)"""
+    tag, separator, _ = conversation_id.partition("-")
+    if not separator or not tag.startswith("w") or not tag[1:].isdigit():
+        return None
+    return int(tag[1:])
+
+
+def collect_metrics() -> bytes:
+    """Metriche di tutti i worker del pod (da eseguire fuori dall'event loop: legge un file per processo)"""
+    from prometheus_client import CollectorRegistry, generate_latest, multiprocess
+
+    registry = CollectorRegistry()
+    multiprocess.MultiProcessCollector(registry)
+    return generate_latest(registry)
+
+
+class CloseAfterResponse:
+    """
+    Middleware ASGI dei worker: ogni risposta HTTP chiude la connessione
+
+    Una connessione keep-alive resterebbe sul worker che l'ha ricevuta anche
+    per le richieste successive, di altre chiamate. I WebSocket non cambiano.
+    """
+
+    def __init__(self, app):
+        self.app = app
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            return await self.app(scope, receive, send)
+
+        async def send_closing(message):
+            if message["type"] == "http.response.start":
+                message = dict(message)
+                message["headers"] = [*message.get("headers", []), (b"connection", b"close")]
+            await send(message)
+
+        return await self.app(scope, receive, send_closing)
+
+
+class WorkerContext:
+    """
+    Worker corrente, nel processo avviato dal supervisore
+
+    Args:
+        index: Indice del worker (lo 0 gestisce la segnalazione SIP)
+        count: Worker del pod
+        state_dir: Directory condivisa dai worker (metriche, tabelle delle chiamate)
+        channel_fd: Socket verso il supervisore
+        app: Applicazione ASGI ("modulo:attributo")
+        uvicorn_options: Opzioni di uvicorn.Config
+    """
+
+    def __init__(
+        self,
+        index: int,
+        count: int,
+        state_dir: str,
+        channel_fd: int,
+        app: str = "main:app",
+        uvicorn_options: Optional[Dict[str, Any]] = None,
+    ):
+        self.index = index
+        self.count = count
+        self.state_dir = state_dir
+        self.channel_fd = channel_fd
+        self.app = app
+        self.uvicorn_options = uvicorn_options or {}
+        self.load: Optional[Callable[[], int]] = None  # Live calls, reported to the supervisor for routing
+        self.on_drain: Optional[Callable[[bool], None]] = None  # Admin drain started/cancelled on another worker
+        self._channel: Optional[socket.socket] = None
+        self._tasks: Set[asyncio.Task] = set()
+
+    @property
+    def calls_dir(self) -> str:
+        return os.path.join(self.state_dir, "calls")
+
+    @property
+    def signaling(self) -> bool:
+        """True sul worker che apre la porta SIP e si registra"""
+        return self.index == 0
+
+    def share(self, total: int) -> int:
+        """Parte di un limite del pod che spetta a questo worker (almeno 1 se il limite è attivo)"""
+        if total <= 0:
+            return total
+        return max(1, total // self.count + (1 if self.index < total % self.count else 0))
+
+    def port_range(self, port_min: int, port_max: int) -> Tuple[int, int]:
+        """Parte di un intervallo di porte (RTP) riservata a questo worker"""
+        size = (port_max - port_min + 1) // self.count
+        start = port_min + self.index * size
+        end = port_max if self.index == self.count - 1 else start + size - 1
+        return start, end
+
+    def tag_conversation_id(self, conversation_id: str) -> str:
+        """Id di conversazione che il supervisore riconduce a questo worker"""
+        return f"w{self.index}-{conversation_id}"
+
+    def broadcast_drain(self, draining: bool) -> None:
+        """Propaga agli altri worker un drain admin, o il suo annullamento"""
+        self._send(MSG_DRAIN if draining else MSG_RESUME)
+
+    async def serve(self, server) -> None:
+        """
+        Esegue uvicorn sulle connessioni passate dal supervisore
+
+        Args:
+            server: uvicorn.Server; non apre socket propri (sockets=[])
+        """
+        loop = asyncio.get_running_loop()
+        self._channel = socket.socket(fileno=self.channel_fd)
+        self._channel.setblocking(False)
+        serving = asyncio.create_task(server.serve(sockets=[]))
+        while not server.started:
+            if serving.done():
+                return await serving  # Startup failed: the supervisor sees the exit
+            await asyncio.sleep(0.05)
+
+        # The same protocol uvicorn builds for its own listening sockets
+        config = server.config
+        protocol_factory = functools.partial(
+            config.http_protocol_class,
+            config=config,
+            server_state=server.server_state,
+            app_state=server.lifespan.state,
+        )
+        loop.add_reader(self._channel.fileno(), self._receive, protocol_factory)
+        self._send(MSG_READY)
+        reporter = asyncio.create_task(self._report_load())
+        try:
+            await serving
+        finally:
+            reporter.cancel()
+            loop.remove_reader(self._channel.fileno())
+
+    def _receive(self, protocol_factory) -> None:
+        loop = asyncio.get_running_loop()
+        while True:
+            try:
+                message, fds, _, _ = socket.recv_fds(self._channel, 64, 1)
+            except BlockingIOError:
+                return
+            except OSError:
+                message, fds = b"", []
+            if not message:
+                # Supervisor gone: drain and stop like on a SIGTERM from Kubernetes
+                logger.error(f"Worker {self.index}: supervisor channel closed, shutting down")
+                loop.remove_reader(self._channel.fileno())
+                os.kill(os.getpid(), signal.SIGTERM)
+                return
+            kind, payload = message[:1], message[1:]
+            if kind == MSG_CONNECTION:
+                for fd in fds:
+                    WORKER_CONNECTIONS_TOTAL.labels(worker=str(self.index), route=payload.decode()).inc()
+                    task = loop.create_task(self._connect(protocol_factory, socket.socket(fileno=fd)))
+                    self._tasks.add(task)
+                    task.add_done_callback(self._tasks.discard)
+            elif kind in (MSG_DRAIN, MSG_RESUME) and self.on_drain is not None:
+                self.on_drain(kind == MSG_DRAIN)
+
+    async def _connect(self, protocol_factory, connection: socket.socket) -> None:
+        connection.setblocking(False)
+        try:
+            await asyncio.get_running_loop().connect_accepted_socket(protocol_factory, connection)
+        except OSError as e:
+            logger.debug(f"Worker {self.index}: connection lost before serving it: {e}")
+            connection.close()
+
+    async def _report_load(self) -> None:
+        reported = None
+        while True:
+            load = self.load() if self.load is not None else 0
+            if load != reported:
+                self._send(MSG_LOAD + str(load).encode())
+                reported = load
+            await asyncio.sleep(LOAD_REPORT_INTERVAL)
+
+    def _send(self, message: bytes) -> None:
+        if self._channel is None:
+            return
+        try:
+            self._channel.send(message)
+        except OSError as e:
+            logger.warning(f"Worker {self.index}: message to the supervisor lost: {e}")
+
+
+_worker: Optional[WorkerContext] = None
+_worker_loaded = False
+
+
+def get_worker() -> Optional[WorkerContext]:
+    """Worker del processo corrente (None con un solo processo, senza supervisore)"""
+    global _worker, _worker_loaded
+    if not _worker_loaded:
+        _worker_loaded = True
+        raw = os.environ.get(WORKER_ENV)
+        if raw:
+            _worker = WorkerContext(**json.loads(raw))
+    return _worker
+
+
+def run_worker() -> None:
+    """Entry point del processo worker avviato dal supervisore"""
+    import uvicorn
+
+    worker = get_worker()
+    if worker is None:
+        raise RuntimeError(f"{WORKER_ENV} not set: workers are started by serve_workers")
+    config = uvicorn.Config(worker.app, **worker.uvicorn_options)
+    config.setup_event_loop()
+    try:
+        asyncio.run(worker.serve(uvicorn.Server(config)))
+    except KeyboardInterrupt:
+        # The drain ends with a SIGINT that uvicorn re-raises after its shutdown, like uvicorn.run
+        pass
+
+
+@dataclass
+class PeekedRequest:
+    """Testa di una richiesta HTTP letta dal supervisore (il body solo se già arrivato)"""
+
+    method: str
+    path: str
+    headers: Dict[str, str]
+    body: bytes
+
+    @property
+    def form(self) -> Dict[str, str]:
+        if not self.headers.get("content-type", "").startswith("application/x-www-form-urlencoded"):
+            return {}
+        return {name: values[0] for name, values in parse_qs(self.body.decode("latin-1")).items()}
+
+
+def parse_request_head(data: bytes) -> Optional[PeekedRequest]:
+    """Interpreta la testa di una richiesta HTTP/1.x (None se non è ancora completa)"""
+    end = data.find(b"\r\n\r\n")
+    if end < 0:
+        return None
+    lines = data[:end].decode("latin-1").split("\r\n")
+    request_line = lines[0].split(" ")
+    if len(request_line) != 3:
+        return None
+    headers = {}
+    for line in lines[1:]:
+        name, _, value = line.partition(":")
+        headers[name.strip().lower()] = value.strip()
+    return PeekedRequest(request_line[0], urlsplit(request_line[1]).path, headers, data[end + 4:])
+
+
+def _request_complete(data: bytes) -> bool:
+    request = parse_request_head(data)
+    if request is None:
+        return False
+    if request.path not in (TWILIO_VOICE_PATH, TWILIO_STATUS_PATH):
+        return True
+    # The Twilio webhooks are routed by the CallSid in their form body
+    length = request.headers.get("content-length", "0")
+    return not length.isdigit() or len(request.body) >= int(length)
+
+
+async def _wait_readable(sock: socket.socket, timeout: float) -> None:
+    loop = asyncio.get_running_loop()
+    readable = loop.create_future()
+    loop.add_reader(sock.fileno(), lambda: readable.done() or readable.set_result(None))
+    try:
+        await asyncio.wait_for(readable, timeout)
+    except asyncio.TimeoutError:
+        pass
+    finally:
+        loop.remove_reader(sock.fileno())
+
+
+@dataclass
+class _WorkerProcess:
+    index: int
+    channel: socket.socket
+    process: subprocess.Popen
+    ready: bool = False
+    exited: bool = False
+    load: int = 0  # Live calls last reported by the worker
+    routed: int = 0  # New calls handed to it since that report
+
+
+class Supervisor:
+    """
+    Processo padre dei worker: accetta le connessioni e le instrada
+
+    Args:
+        app: Applicazione ASGI dei worker ("modulo:attributo")
+        host: Indirizzo di ascolto
+        port: Porta di ascolto
+        workers: Numero di worker
+        state_dir: Directory condivisa, svuotata all'avvio (default: una directory temporanea)
+        uvicorn_options: Opzioni di uvicorn.Config dei worker (log_level, access_log...)
+    """
+
+    def __init__(
+        self,
+        app: str,
+        host: str,
+        port: int,
+        workers: int,
+        state_dir: Optional[str] = None,
+        uvicorn_options: Optional[Dict[str, Any]] = None,
+    ):
+        self.app = app
+        self.host = host
+        self.port = port
+        self.count = workers
+        self.state_dir = state_dir or tempfile.mkdtemp(prefix="voice-assistant-workers-")
+        self.uvicorn_options = uvicorn_options or {}
+        self.workers: List[_WorkerProcess] = []
+        self.calls: "OrderedDict[str, int]" = OrderedDict()  # Twilio CallSid -> owner worker
+        self.failed = False
+        self._up = False  # Some worker completed its startup
+        self._next = 0
+        self._stopping = False
+        self._tasks: Set[asyncio.Task] = set()
+
+    @property
+    def metrics_dir(self) -> str:
+        return os.path.join(self.state_dir, "metrics")
+
+    @property
+    def calls_dir(self) -> str:
+        return os.path.join(self.state_dir, "calls")
+
+    async def run(self) -> None:
+        loop = asyncio.get_running_loop()
+        for path in (self.metrics_dir, self.calls_dir):
+            shutil.rmtree(path, ignore_errors=True)
+            os.makedirs(path)
+        listener = socket.create_server((self.host, self.port), backlog=2048)
+        listener.setblocking(False)
+        for sig in (signal.SIGTERM, signal.SIGINT):
+            loop.add_signal_handler(sig, self._stop, sig)
+        self.workers = [self._spawn(index) for index in range(self.count)]
+        logger.info(f"Supervisor listening on {self.host}:{self.port} with {self.count} workers (state in {self.state_dir})")
+        accepting = asyncio.create_task(self._accept(listener))
+        try:
+            await self._monitor()
+        finally:
+            accepting.cancel()
+            listener.close()
+            for worker in self.workers:
+                self._close_channel(worker)
+
+    def _spawn(self, index: int) -> _WorkerProcess:
+        parent, child = socket.socketpair(socket.AF_UNIX, socket.SOCK_SEQPACKET)
+        env = dict(os.environ, PROMETHEUS_MULTIPROC_DIR=self.metrics_dir)
+        env[WORKER_ENV] = json.dumps({
+            "index": index,
+            "count": self.count,
+            "state_dir": self.state_dir,
+            "channel_fd": child.fileno(),
+            "app": self.app,
+            "uvicorn_options": self.uvicorn_options,
+        })
+        env["PYTHONPATH"] = os.pathsep.join(filter(None, [APP_DIR, os.environ.get("PYTHONPATH")]))
+        process = subprocess.Popen(
+            [sys.executable, "-c", "from services.workers import run_worker; run_worker()"],
+            env=env,
+            pass_fds=(child.fileno(),),
+        )
+        child.close()
+        parent.setblocking(False)
+        worker = _WorkerProcess(index=index, channel=parent, process=process)
+        asyncio.get_running_loop().add_reader(parent.fileno(), self._receive, worker)
+        logger.info(f"Worker {index} started (pid {process.pid})")
+        return worker
+
+    def _receive(self, worker: _WorkerProcess) -> None:
+        while True:
+            try:
+                message = worker.channel.recv(64)
+            except BlockingIOError:
+                return
+            except OSError:
+                message = b""
+            if not message:
+                worker.ready = False
+                self._close_channel(worker)
+                return
+            kind, payload = message[:1], message[1:]
+            if kind == MSG_READY:
+                worker.ready = True
+                self._up = True
+                logger.info(f"Worker {worker.index} ready")
+            elif kind == MSG_LOAD:
+                worker.load = int(payload)
+                worker.routed = 0
+            elif kind in (MSG_DRAIN, MSG_RESUME):
+                for other in self.workers:
+                    if other is not worker and other.ready:
+                        self._send(other, kind)
+
+    def _send(self, worker: _WorkerProcess, message: bytes, fds: Tuple[int, ...] = ()) -> bool:
+        try:
+            socket.send_fds(worker.channel, [message], list(fds))
+            return True
+        except OSError as e:
+            logger.warning(f"Message to worker {worker.index} lost: {e}")
+            return False
+
+    def _close_channel(self, worker: _WorkerProcess) -> None:
+        if worker.channel.fileno() < 0:
+            return
+        asyncio.get_running_loop().remove_reader(worker.channel.fileno())
+        worker.channel.close()
+
+    async def _monitor(self) -> None:
+        restarts: Dict[int, float] = {}  # index -> loop time of the restart
+        loop = asyncio.get_running_loop()
+        while True:
+            for worker in self.workers:
+                if worker.exited or worker.process.poll() is None:
+                    continue
+                worker.exited = True
+                worker.ready = False
+                self._close_channel(worker)
+                self._forget(worker.process.pid)
+                if self._stopping:
+                    logger.info(f"Worker {worker.index} stopped")
+                elif not self._up:
+                    # Died before any worker came up: a configuration error, restarting would only loop
+                    logger.error(f"Worker {worker.index} exited during startup (code {worker.process.returncode})")
+                    self.failed = True
+                    self._stop(signal.SIGTERM)
+                else:
+                    logger.error(f"Worker {worker.index} exited with code {worker.process.returncode}, restarting")
+                    restarts[worker.index] = loop.time() + RESTART_DELAY
+            for index, restart_at in list(restarts.items()):
+                if self._stopping:
+                    restarts.clear()
+                elif loop.time() >= restart_at:
+                    del restarts[index]
+                    self.workers[index] = self._spawn(index)
+            if self._stopping and all(worker.exited for worker in self.workers):
+                return
+            await asyncio.sleep(0.2)
+
+    def _forget(self, pid: int) -> None:
+        # Live gauges and the call table of a dead worker must not count in the pod totals
+        from prometheus_client import multiprocess
+
+        multiprocess.mark_process_dead(pid, self.metrics_dir)
+        for path in glob.glob(os.path.join(self.calls_dir, f"*.{pid}.json*")):
+            os.remove(path)
+
+    def _stop(self, sig: signal.Signals) -> None:
+        if not self._stopping:
+            logger.info(f"{sig.name} received, stopping {self.count} workers")
+        self._stopping = True
+        for worker in self.workers:
+            if worker.process.poll() is None:
+                worker.process.send_signal(sig)
+
+    async def _accept(self, listener: socket.socket) -> None:
+        loop = asyncio.get_running_loop()
+        while True:
+            connection, _ = await loop.sock_accept(listener)
+            task = asyncio.create_task(self._dispatch(connection))
+            self._tasks.add(task)
+            task.add_done_callback(self._tasks.discard)
+
+    async def _dispatch(self, connection: socket.socket) -> None:
+        try:
+            data = await self._peek(connection)
+            if data is None:
+                return
+            request = parse_request_head(data)
+            worker, route = self._route(request)
+            deadline = asyncio.get_running_loop().time() + HEAD_TIMEOUT
+            while worker is None and not self._stopping and asyncio.get_running_loop().time() < deadline:
+                # Workers still starting (or restarting)
+                await asyncio.sleep(0.1)
+                worker, route = self._route(request)
+            if worker is not None:
+                self._send(worker, MSG_CONNECTION + route.encode(), (connection.fileno(),))
+        except Exception as e:
+            logger.warning(f"Dispatch of a connection failed: {e}")
+        finally:
+            # The worker holds its own copy of the descriptor
+            connection.close()
+
+    async def _peek(self, connection: socket.socket) -> Optional[bytes]:
+        """Legge senza consumarla la testa della richiesta (None se il client ha chiuso)"""
+        loop = asyncio.get_running_loop()
+        deadline = loop.time() + HEAD_TIMEOUT
+        data = b""
+        while True:
+            try:
+                data = connection.recv(HEAD_LIMIT, socket.MSG_PEEK)
+                if not data:
+                    return None
+            except BlockingIOError:
+                pass
+            except OSError:
+                return None
+            if len(data) >= HEAD_LIMIT or _request_complete(data):
+                return data
+            remaining = deadline - loop.time()
+            if remaining <= 0:
+                return data
+            if data:
+                # Part of the request waits in the buffer, so the socket stays readable: poll instead
+                await asyncio.sleep(min(remaining, 0.005))
+            else:
+                await _wait_readable(connection, remaining)
+
+    def _route(self, request: Optional[PeekedRequest]) -> Tuple[Optional[_WorkerProcess], str]:
+        if request is not None:
+            path = request.path
+            if path.startswith(CONNECT_CALL_PREFIX):
+                owner = self._alive(owner_from_conversation_id(path[len(CONNECT_CALL_PREFIX):]))
+                if owner is not None:
+                    return owner, "call"
+            elif path == TWILIO_VOICE_PATH:
+                call_sid = request.form.get("CallSid")
+                owner = self._alive(self.calls.get(call_sid))
+                if owner is not None:
+                    return owner, "call"  # Retried webhook: the call is already set up there
+                worker = self._least_loaded()
+                if worker is not None:
+                    worker.routed += 1
+                    if call_sid:
+                        self._track(call_sid, worker.index)
+                    return worker, "least_loaded"
+            elif path == TWILIO_STATUS_PATH:
+                form = request.form
+                owner = self._alive(self.calls.get(form.get("CallSid")))
+                if form.get("CallStatus") in FINAL_CALL_STATUSES:
+                    self.calls.pop(form.get("CallSid"), None)
+                if owner is not None:
+                    return owner, "call"
+            elif path == SIP_WEBRTC_PATH:
+                worker = self._least_loaded()
+                if worker is not None:
+                    worker.routed += 1
+                    return worker, "least_loaded"
+            elif path.startswith(SIGNALING_PREFIX):
+                owner = self._alive(0)
+                if owner is not None:
+                    return owner, "signaling"
+        candidates = self._rotated()
+        return (candidates[0] if candidates else None), "any"
+
+    def _alive(self, index: Optional[int]) -> Optional[_WorkerProcess]:
+        if index is None or not 0 <= index < len(self.workers):
+            return None
+        worker = self.workers[index]
+        return worker if worker.ready else None
+
+    def _rotated(self) -> List[_WorkerProcess]:
+        # Ready workers starting from the next one in turn, so ties rotate
+        candidates = [worker for worker in self.workers if worker.ready]
+        if not candidates:
+            return []
+        self._next += 1
+        start = self._next % len(candidates)
+        return candidates[start:] + candidates[:start]
+
+    def _least_loaded(self) -> Optional[_WorkerProcess]:
+        candidates = self._rotated()
+        if not candidates:
+            return None
+        return min(candidates, key=lambda worker: worker.load + worker.routed)
+
+    def _track(self, call_sid: str, index: int) -> None:
+        self.calls[call_sid] = index
+        self.calls.move_to_end(call_sid)
+        while len(self.calls) > MAX_TRACKED_CALLS:
+            self.calls.popitem(last=False)
+
+
+def serve_workers(
+    app: str,
+    host: str,
+    port: int,
+    workers: int,
+    state_dir: Optional[str] = None,
+    **uvicorn_options: Any,
+) -> None:
+    """
+    Avvia il supervisore e i worker (ritorna quando l'ultimo worker è uscito)
+
+    Raises:
+        SystemExit: se un worker non riesce ad avviarsi
+    """
+    supervisor = Supervisor(app, host, port, workers, state_dir=state_dir, uvicorn_options=uvicorn_options)
+    asyncio.run(supervisor.run())
+    if supervisor.failed:
+        raise SystemExit(1)
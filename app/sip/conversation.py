@@ -0,0 +1,116 @@
+"""
+SIP Conversation - Collega una sessione RTP alla pipeline Vocode
+
+L'audio ricevuto via RTP (già convertito in mu-law 8 kHz) entra nella
+StreamingConversation come per Twilio; l'audio del bot esce dall'output
+device direttamente sulla sessione RTP, senza hop intermedi.
+"""
+
+import asyncio
+from dataclasses import dataclass, field
+from typing import Optional
+
+from vocode.streaming.agent.abstract_factory import AbstractAgentFactory
+from vocode.streaming.models.agent import AgentConfig
+from vocode.streaming.models.audio import AudioEncoding
+from vocode.streaming.models.synthesizer import SynthesizerConfig
+from vocode.streaming.models.transcriber import DeepgramTranscriberConfig, TranscriberConfig
+from vocode.streaming.output_device.base_output_device import BaseOutputDevice
+from vocode.streaming.streaming_conversation import StreamingConversation
+from vocode.streaming.synthesizer.abstract_factory import AbstractSynthesizerFactory
+from vocode.streaming.transcriber.abstract_factory import AbstractTranscriberFactory
+from vocode.streaming.transcriber.deepgram_transcriber import DeepgramTranscriber
+from vocode.streaming.utils.events_manager import EventsManager
+
+from services.tenants import TenantRouter
+from sip.rtp import PIPELINE_SAMPLE_RATE, RtpSession
+
+
+class DeepgramTranscriberFactory(AbstractTranscriberFactory):
+    """
+    Transcriber factory che crea direttamente il DeepgramTranscriber
+
+    Gli altri provider passano alla DefaultTranscriberFactory di Vocode,
+    importata solo allora (carica gli SDK di Google, Azure, AssemblyAI...).
+    """
+
+    def create_transcriber(self, transcriber_config: TranscriberConfig):
+        if isinstance(transcriber_config, DeepgramTranscriberConfig):
+            return DeepgramTranscriber(transcriber_config)
+        from vocode.streaming.transcriber.default_factory import DefaultTranscriberFactory
+
+        return DefaultTranscriberFactory().create_transcriber(transcriber_config)
+
+
+@dataclass
+class SipPipelineConfig:
+    """
+    Configurazione STT / agente / TTS delle chiamate SIP
+
+    Con tenants le config di agente, STT e TTS vengono da quelle del tenant
+    del numero chiamato; quelle qui sotto restano per le chiamate senza router.
+    """
+
+    agent_config: AgentConfig
+    transcriber_config: TranscriberConfig
+    synthesizer_config: SynthesizerConfig
+    agent_factory: AbstractAgentFactory
+    synthesizer_factory: AbstractSynthesizerFactory
+    transcriber_factory: AbstractTranscriberFactory = field(default_factory=DeepgramTranscriberFactory)
+    events_manager: Optional[EventsManager] = None
+    tenants: Optional[TenantRouter] = None
+
+
+class RtpOutputDevice(BaseOutputDevice):
+    """Output device Vocode che accoda l'audio del bot sulla sessione RTP"""
+
+    def __init__(self, rtp_session: RtpSession):
+        super().__init__(sampling_rate=PIPELINE_SAMPLE_RATE, audio_encoding=AudioEncoding.MULAW)
+        self.rtp_session = rtp_session
+
+    def consume_nonblocking(self, chunk: bytes):
+        self.rtp_session.send_audio(chunk)
+
+    def send_clear_message(self):
+        # Same name as TwilioOutputDevice: drops the audio queued for the caller (barge-in)
+        self.rtp_session.clear_audio()
+
+    def terminate(self):
+        self.rtp_session.clear_audio()
+
+
+class SipPhoneConversation(StreamingConversation[RtpOutputDevice]):
+    """StreamingConversation alimentata da una sessione RTP"""
+
+    telephony_provider = "sip"
+
+    def __init__(
+        self,
+        pipeline: SipPipelineConfig,
+        rtp_session: RtpSession,
+        conversation_id: Optional[str] = None,
+        call_id: Optional[str] = None,
+        to_uri: Optional[str] = None,
+    ):
+        agent_config = pipeline.agent_config
+        transcriber_config = pipeline.transcriber_config
+        synthesizer_config = pipeline.synthesizer_config
+        if pipeline.tenants is not None:
+            agent_config, transcriber_config, synthesizer_config = pipeline.tenants.route(to_uri).call_configs()
+        super().__init__(
+            RtpOutputDevice(rtp_session),
+            pipeline.transcriber_factory.create_transcriber(transcriber_config),
+            pipeline.agent_factory.create_agent(agent_config),
+            pipeline.synthesizer_factory.create_synthesizer(synthesizer_config),
+            conversation_id=conversation_id,
+            events_manager=pipeline.events_manager,
+        )
+        self.call_id = call_id  # SIP Call-ID, links the stored transcript to the call record
+        # Set when the conversation ends on its own (agent hangs up, idle timeout)
+        self.ended = asyncio.Event()
+        self.ended_by_bot = False
+
+    def mark_terminated(self, bot_disconnect: bool = False):
+        super().mark_terminated(bot_disconnect)
+        self.ended_by_bot = self.ended_by_bot or bot_disconnect
+        self.ended.set()
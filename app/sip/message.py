@@ -0,0 +1,302 @@
+"""
+SIP Message - Parsing e costruzione dei messaggi SIP (RFC 3261)
+
+Include il calcolo della risposta digest (RFC 2617 / RFC 8760) usata da
+REGISTER e dalle richieste sfidate con 401/407.
+"""
+
+import hashlib
+import re
+import uuid
+from typing import Dict, Iterable, List, Optional, Tuple
+
+SIP_VERSION = "SIP/2.0"
+BRANCH_MAGIC_COOKIE = "z9hG4bK"
+
+# Compact header forms (RFC 3261 section 7.3.3)
+COMPACT_HEADERS = {
+    "v": "Via",
+    "f": "From",
+    "t": "To",
+    "i": "Call-ID",
+    "m": "Contact",
+    "l": "Content-Length",
+    "c": "Content-Type",
+    "k": "Supported",
+    "s": "Subject",
+}
+
+DIGEST_HASHES = {
+    "MD5": hashlib.md5,
+    "MD5-SESS": hashlib.md5,
+    "SHA-256": hashlib.sha256,
+    "SHA-256-SESS": hashlib.sha256,
+}
+
+_AUTH_PARAM_PATTERN = re.compile(r'(\w+)\s*=\s*(?:"([^"]*)"|([^\s,]+))')
+
+
+class SipParseError(ValueError):
+    """Messaggio SIP malformato"""
+
+
+def new_branch() -> str:
+    return BRANCH_MAGIC_COOKIE + uuid.uuid4().hex[:16]
+
+
+def new_tag() -> str:
+    return uuid.uuid4().hex[:10]
+
+
+def header_params(value: str) -> Dict[str, str]:
+    """Parametri ";nome=valore" di un header (tag, branch, expires, ...)"""
+    # Parameters inside <...> belong to the URI, not to the header
+    tail = value.rsplit(">", 1)[-1] if ">" in value else value
+    params = {}
+    for part in tail.split(";")[1:]:
+        name, _, param_value = part.strip().partition("=")
+        if name:
+            params[name.lower()] = param_value.strip()
+    return params
+
+
+def header_uri(value: str) -> str:
+    """URI di un header From/To/Contact, con o senza <...>"""
+    if "<" in value:
+        return value[value.index("<") + 1:value.index(">")]
+    return value.split(";", 1)[0].strip()
+
+
+def uri_host_port(uri: str, default_port: int = 5060) -> Tuple[str, int]:
+    """Host e porta di un SIP URI (sip:user@host:port;params)"""
+    hostport = uri.split(":", 1)[-1].split(";", 1)[0].split("?", 1)[0]
+    hostport = hostport.rsplit("@", 1)[-1]
+    host, _, port = hostport.partition(":")
+    return host, int(port) if port else default_port
+
+
+class SipMessage:
+    """
+    Richiesta o risposta SIP
+
+    Gli header sono conservati in ordine come lista di (nome, valore), così
+    Via e Record-Route multipli restano nell'ordine ricevuto.
+    """
+
+    def __init__(self, start_line: str, headers: Optional[List[Tuple[str, str]]] = None, body: bytes = b""):
+        self.start_line = start_line
+        self.headers: List[Tuple[str, str]] = list(headers or [])
+        self.body = body
+
+    @classmethod
+    def request(cls, method: str, uri: str, headers: Iterable[Tuple[str, str]] = (), body: bytes = b"") -> "SipMessage":
+        return cls(f"{method} {uri} {SIP_VERSION}", list(headers), body)
+
+    @classmethod
+    def response(cls, status_code: int, reason: str, headers: Iterable[Tuple[str, str]] = (), body: bytes = b"") -> "SipMessage":
+        return cls(f"{SIP_VERSION} {status_code} {reason}", list(headers), body)
+
+    @classmethod
+    def parse(cls, data: bytes) -> "SipMessage":
+        head, separator, body = data.partition(b"\r\n\r\n")
+        if not separator:
+            raise SipParseError("missing header terminator")
+        lines = head.decode("utf-8", errors="replace").split("\r\n")
+        start_line = lines[0].strip()
+        if not (start_line.endswith(SIP_VERSION) or start_line.startswith(SIP_VERSION)):
+            raise SipParseError(f"not a SIP message: {start_line!r}")
+
+        headers: List[Tuple[str, str]] = []
+        for line in lines[1:]:
+            if line[:1] in (" ", "\t") and headers:
+                # Header folding
+                name, value = headers[-1]
+                headers[-1] = (name, value + " " + line.strip())
+                continue
+            name, colon, value = line.partition(":")
+            if not colon:
+                raise SipParseError(f"malformed header line: {line!r}")
+            name = name.strip()
+            headers.append((COMPACT_HEADERS.get(name.lower(), name), value.strip()))
+
+        message = cls(start_line, headers, body)
+        length = message.get("Content-Length")
+        if length is not None and length.isdigit():
+            message.body = body[:int(length)]
+        return message
+
+    # --- Start line -----------------------------------------------------
+
+    @property
+    def is_request(self) -> bool:
+        return not self.start_line.startswith(SIP_VERSION)
+
+    @property
+    def method(self) -> Optional[str]:
+        return self.start_line.split(" ", 1)[0] if self.is_request else None
+
+    @property
+    def uri(self) -> Optional[str]:
+        return self.start_line.split(" ")[1] if self.is_request else None
+
+    @property
+    def status_code(self) -> Optional[int]:
+        return None if self.is_request else int(self.start_line.split(" ")[1])
+
+    @property
+    def reason(self) -> Optional[str]:
+        return None if self.is_request else self.start_line.split(" ", 2)[2]
+
+    # --- Headers --------------------------------------------------------
+
+    def get(self, name: str) -> Optional[str]:
+        name = name.lower()
+        for header, value in self.headers:
+            if header.lower() == name:
+                return value
+        return None
+
+    def get_all(self, name: str) -> List[str]:
+        name = name.lower()
+        values = []
+        for header, value in self.headers:
+            if header.lower() != name:
+                continue
+            if name in ("via", "record-route", "route"):
+                # Comma-separated values count as separate entries
+                values.extend(v.strip() for v in value.split(",") if v.strip())
+            else:
+                values.append(value)
+        return values
+
+    def set(self, name: str, value: str) -> None:
+        self.remove(name)
+        self.headers.append((name, value))
+
+    def remove(self, name: str) -> None:
+        self.headers = [(h, v) for h, v in self.headers if h.lower() != name.lower()]
+
+    @property
+    def call_id(self) -> str:
+        return self.get("Call-ID") or ""
+
+    @property
+    def cseq(self) -> Tuple[int, str]:
+        number, _, method = (self.get("CSeq") or "0 ").partition(" ")
+        return int(number), method.strip()
+
+    @property
+    def branch(self) -> str:
+        via = self.get_all("Via")
+        return header_params(via[0]).get("branch", "") if via else ""
+
+    def to_bytes(self) -> bytes:
+        self.set("Content-Length", str(len(self.body)))
+        head = "\r\n".join([self.start_line] + [f"{name}: {value}" for name, value in self.headers])
+        return head.encode("utf-8") + b"\r\n\r\n" + self.body
+
+    def __repr__(self) -> str:
+        return f"<SipMessage {self.start_line!r} call_id={self.call_id!r}>"
+
+
+def make_response(
+    request: SipMessage,
+    status_code: int,
+    reason: str,
+    to_tag: Optional[str] = None,
+    headers: Iterable[Tuple[str, str]] = (),
+    body: bytes = b"",
+) -> SipMessage:
+    """
+    Costruisce la risposta a una richiesta (Via, From, To, Call-ID, CSeq copiati)
+
+    Args:
+        request: Richiesta a cui rispondere
+        status_code: Codice di stato SIP
+        reason: Reason phrase
+        to_tag: Tag locale da aggiungere al To se la richiesta non lo ha
+        headers: Header aggiuntivi (Contact, Content-Type, ...)
+        body: Corpo (es. SDP)
+    """
+    copied = [(name, value) for name, value in request.headers if name.lower() in ("via", "record-route")]
+    to_value = request.get("To") or ""
+    if to_tag and "tag" not in header_params(to_value):
+        to_value = f"{to_value};tag={to_tag}"
+    copied += [
+        ("From", request.get("From") or ""),
+        ("To", to_value),
+        ("Call-ID", request.call_id),
+        ("CSeq", request.get("CSeq") or ""),
+    ]
+    return SipMessage.response(status_code, reason, copied + list(headers), body)
+
+
+def parse_digest_challenge(value: str) -> Dict[str, str]:
+    """Parametri di un header WWW-Authenticate / Proxy-Authenticate Digest"""
+    scheme, _, params = value.strip().partition(" ")
+    if scheme.lower() != "digest":
+        raise SipParseError(f"unsupported auth scheme {scheme!r}")
+    return {name.lower(): quoted if quoted else bare for name, quoted, bare in _AUTH_PARAM_PATTERN.findall(params)}
+
+
+def build_digest_authorization(
+    challenge: Dict[str, str],
+    method: str,
+    uri: str,
+    username: str,
+    password: str,
+    nonce_count: int = 1,
+    cnonce: Optional[str] = None,
+) -> str:
+    """
+    Calcola il valore dell'header Authorization / Proxy-Authorization
+
+    Args:
+        challenge: Parametri della sfida (da parse_digest_challenge)
+        method: Metodo della richiesta sfidata
+        uri: Request-URI della richiesta sfidata
+        username: Utente SIP
+        password: Password SIP
+        nonce_count: Contatore nc per lo stesso nonce
+        cnonce: Client nonce (generato se None)
+
+    Returns:
+        Valore dell'header, es. 'Digest username="100", realm=..., response=...'
+    """
+    algorithm = challenge.get("algorithm", "MD5").upper()
+    hash_function = DIGEST_HASHES.get(algorithm)
+    if hash_function is None:
+        raise SipParseError(f"unsupported digest algorithm {algorithm!r}")
+
+    def digest(text: str) -> str:
+        return hash_function(text.encode("utf-8")).hexdigest()
+
+    realm = challenge.get("realm", "")
+    nonce = challenge.get("nonce", "")
+    cnonce = cnonce or uuid.uuid4().hex[:16]
+    qop_options = [q.strip() for q in challenge.get("qop", "").split(",") if q.strip()]
+    qop = "auth" if "auth" in qop_options else None
+    nc = f"{nonce_count:08x}"
+
+    ha1 = digest(f"{username}:{realm}:{password}")
+    if algorithm.endswith("-SESS"):
+        ha1 = digest(f"{ha1}:{nonce}:{cnonce}")
+    ha2 = digest(f"{method}:{uri}")
+    if qop:
+        response = digest(f"{ha1}:{nonce}:{nc}:{cnonce}:{qop}:{ha2}")
+    else:
+        response = digest(f"{ha1}:{nonce}:{ha2}")
+
+    parts = [
+        f'username="{username}"',
+        f'realm="{realm}"',
+        f'nonce="{nonce}"',
+        f'uri="{uri}"',
+        f'response="{response}"',
+        f"algorithm={challenge.get('algorithm', 'MD5')}",
+    ]
+    if qop:
+        parts += [f"qop={qop}", f"nc={nc}", f'cnonce="{cnonce}"']
+    if "opaque" in challenge:
+        parts.append(f'opaque="{challenge["opaque"]}"')
+    return "Digest " + ", ".join(parts)
@@ -0,0 +1,523 @@
+"""
+RTP - Media path audio delle chiamate SIP (RFC 3550)
+
+Ogni chiamata ha una RtpSession su una porta UDP dedicata:
+    ricezione  -> jitter buffer adattivo -> decodifica -> mu-law 8 kHz verso Vocode
+    Vocode     -> mu-law 8 kHz -> codifica -> pacchetti RTP ogni ptime
+
+Un solo task per chiamata scandisce sia la riproduzione dal jitter buffer
+sia l'invio, così il costo per chiamata è un timer ogni 20 ms.
+"""
+
+import asyncio
+import logging
+import random
+import struct
+from dataclasses import dataclass
+from typing import Callable, Dict, Optional, Tuple
+
+import numpy as np
+from prometheus_client import Counter, Histogram
+
+from audio.buffers import AudioRingBuffer
+from audio.g711 import alaw_to_ulaw, ulaw_decode, ulaw_encode, ulaw_gain_table, ulaw_to_alaw
+from sip.sdp import Codec
+
+logger = logging.getLogger(__name__)
+
+RTP_VERSION = 2
+RTP_HEADER = struct.Struct("!BBHII")
+PIPELINE_SAMPLE_RATE = 8000  # Vocode telephone devices: mu-law 8 kHz
+MULAW_SILENCE = b"\xff"
+MAX_OUTBOUND_SECONDS = 30  # Bot audio queued ahead of the RTP clock
+# Packet loss concealment: the last frame repeated at -6, -12, -18 dB, then silence
+CONCEALMENT_GAINS = [ulaw_gain_table(0.5 ** attempt) for attempt in (1, 2, 3)]
+
+RTP_PACKETS = Counter(
+    'voice_assistant_rtp_packets_total',
+    'RTP packets by direction and outcome',
+    ['direction', 'result'],  # in: played, late, duplicate, lost; out: sent
+)
+JITTER_BUFFER_DELAY_SECONDS = Histogram(
+    'voice_assistant_rtp_jitter_buffer_delay_seconds',
+    'Jitter buffer playout delay chosen when playout (re)starts',
+    buckets=(0.02, 0.04, 0.06, 0.08, 0.1, 0.12, 0.16, 0.2, 0.3),
+)
+
+
+@dataclass
+class RtpPacket:
+    """Pacchetto RTP (header fisso, CSRC ed estensioni ignorate in uscita)"""
+
+    payload_type: int
+    sequence: int
+    timestamp: int
+    ssrc: int
+    payload: bytes
+    marker: bool = False
+
+    @classmethod
+    def parse(cls, data: bytes) -> "RtpPacket":
+        if len(data) < RTP_HEADER.size:
+            raise ValueError("packet shorter than RTP header")
+        first, second, sequence, timestamp, ssrc = RTP_HEADER.unpack_from(data)
+        if first >> 6 != RTP_VERSION:
+            raise ValueError("not an RTP v2 packet")
+        offset = RTP_HEADER.size + 4 * (first & 0x0F)
+        if first & 0x10:
+            if len(data) < offset + 4:
+                raise ValueError("truncated RTP header extension")
+            (extension_words,) = struct.unpack_from("!H", data, offset + 2)
+            offset += 4 + 4 * extension_words
+        end = len(data)
+        if first & 0x20:
+            end -= data[-1]
+        if offset > end:
+            raise ValueError("truncated RTP packet")
+        return cls(
+            payload_type=second & 0x7F,
+            sequence=sequence,
+            timestamp=timestamp,
+            ssrc=ssrc,
+            payload=data[offset:end],
+            marker=bool(second & 0x80),
+        )
+
+    def serialize(self) -> bytes:
+        second = (0x80 if self.marker else 0) | (self.payload_type & 0x7F)
+        return RTP_HEADER.pack(RTP_VERSION << 6, second, self.sequence & 0xFFFF, self.timestamp & 0xFFFFFFFF, self.ssrc) + self.payload
+
+
+# --- Codecs -----------------------------------------------------------------
+
+
+class G711Codec:
+    """PCMU / PCMA <-> mu-law 8 kHz della pipeline"""
+
+    def __init__(self, name: str):
+        self.is_alaw = name.upper() == "PCMA"
+        self._last_frame: Optional[bytes] = None
+        self._concealed = 0
+
+    def decode(self, payload: bytes) -> bytes:
+        if self.is_alaw:
+            payload = alaw_to_ulaw(payload)
+        self._last_frame = payload
+        self._concealed = 0
+        return payload
+
+    def encode(self, mulaw: bytes) -> bytes:
+        if self.is_alaw:
+            return ulaw_to_alaw(mulaw)
+        return bytes(mulaw)
+
+    def conceal(self, frame_bytes: int) -> bytes:
+        # Repeat the last frame at decreasing volume, then fall back to silence
+        self._concealed += 1
+        if self._last_frame is None or self._concealed > len(CONCEALMENT_GAINS):
+            return MULAW_SILENCE * frame_bytes
+        faded = self._last_frame.translate(CONCEALMENT_GAINS[self._concealed - 1])
+        return faded[:frame_bytes].ljust(frame_bytes, MULAW_SILENCE)
+
+
+class OpusCodec:
+    """Opus (RTP clock 48 kHz) decodificato/codificato direttamente a 8 kHz mono"""
+
+    def __init__(self):
+        # libopus binding shipped with aiortc; only needed when Opus is negotiated
+        from aiortc.codecs._opus import ffi, lib
+
+        self._ffi = ffi
+        self._lib = lib
+        error = ffi.new("int *")
+        self._decoder = lib.opus_decoder_create(PIPELINE_SAMPLE_RATE, 1, error)
+        if error[0] != lib.OPUS_OK:
+            raise RuntimeError(f"opus_decoder_create failed ({error[0]})")
+        self._encoder = lib.opus_encoder_create(PIPELINE_SAMPLE_RATE, 1, lib.OPUS_APPLICATION_VOIP, error)
+        if error[0] != lib.OPUS_OK:
+            raise RuntimeError(f"opus_encoder_create failed ({error[0]})")
+        max_samples = PIPELINE_SAMPLE_RATE // 10  # up to 100 ms per packet
+        self._pcm = ffi.new("int16_t[]", max_samples)
+        self._pcm_samples = np.frombuffer(ffi.buffer(self._pcm), dtype=np.int16)
+        self._mulaw = np.empty(max_samples, dtype=np.uint8)
+        self._linear = np.empty(max_samples, dtype=np.int16)
+        self._linear_buffer = ffi.from_buffer(self._linear)
+        self._encoded = ffi.new("unsigned char[]", 1500)
+
+    def __del__(self):
+        lib = getattr(self, "_lib", None)
+        if lib is not None:
+            lib.opus_decoder_destroy(self._decoder)
+            lib.opus_encoder_destroy(self._encoder)
+
+    def _pcm_to_mulaw(self, samples: int) -> bytes:
+        return ulaw_encode(self._pcm_samples[:samples], out=self._mulaw[:samples]).tobytes()
+
+    def decode(self, payload: bytes) -> bytes:
+        samples = self._lib.opus_decode(self._decoder, payload, len(payload), self._pcm, PIPELINE_SAMPLE_RATE // 10, 0)
+        if samples < 0:
+            raise ValueError(f"opus_decode failed ({samples})")
+        return self._pcm_to_mulaw(samples)
+
+    def encode(self, mulaw: bytes) -> bytes:
+        ulaw_decode(mulaw, out=self._linear[:len(mulaw)])
+        length = self._lib.opus_encode(
+            self._encoder,
+            self._ffi.cast("int16_t *", self._linear_buffer),
+            len(mulaw),
+            self._encoded,
+            1500,
+        )
+        if length < 0:
+            raise ValueError(f"opus_encode failed ({length})")
+        return bytes(self._ffi.buffer(self._encoded, length))
+
+    def conceal(self, frame_bytes: int) -> bytes:
+        # Opus packet loss concealment: decode with no payload
+        samples = self._lib.opus_decode(self._decoder, self._ffi.NULL, 0, self._pcm, frame_bytes, 0)
+        if samples <= 0:
+            return MULAW_SILENCE * frame_bytes
+        return self._pcm_to_mulaw(samples)
+
+
+def opus_available() -> bool:
+    try:
+        from aiortc.codecs._opus import lib  # noqa: F401
+    except ImportError:
+        return False
+    return True
+
+
+def create_audio_codec(codec: Codec):
+    if codec.name.upper() in ("PCMU", "PCMA"):
+        return G711Codec(codec.name)
+    if codec.name.lower() == "opus":
+        return OpusCodec()
+    raise ValueError(f"unsupported codec {codec.name}")
+
+
+# --- Jitter buffer ----------------------------------------------------------
+
+
+class JitterBuffer:
+    """
+    Jitter buffer adattivo
+
+    Il ritardo di riproduzione segue il jitter di interarrivo stimato come in
+    RFC 3550 (A.8): target = ptime + 4 * jitter, limitato a [min_delay, max_delay].
+    Se il buffer si svuota la riproduzione si ferma e riparte quando è stato
+    accumulato di nuovo il target (il ritardo cresce); se il buffer supera il
+    target di oltre due frame viene scartato un frame (il ritardo cala).
+
+    Args:
+        clock_rate: Clock RTP del codec
+        frame_duration: Durata di un pacchetto (ptime) in secondi
+        min_delay: Ritardo minimo di riproduzione in secondi
+        max_delay: Ritardo massimo di riproduzione in secondi
+    """
+
+    OK = "ok"
+    LOST = "lost"
+    EMPTY = "empty"
+
+    def __init__(self, clock_rate: int, frame_duration: float = 0.02, min_delay: float = 0.02, max_delay: float = 0.2):
+        self.clock_rate = clock_rate
+        self.frame_duration = frame_duration
+        self.min_delay = min_delay
+        self.max_delay = max_delay
+        self.capacity = max(4, int(2 * max_delay / frame_duration))
+        self.jitter = 0.0
+        self.target_delay = min_delay
+        self.stats = {"played": 0, "lost": 0, "late": 0, "duplicate": 0, "dropped": 0, "underruns": 0}
+        self.reset()
+
+    def reset(self) -> None:
+        self._packets: Dict[int, bytes] = {}
+        self._next: Optional[int] = None
+        self._highest: Optional[int] = None
+        self._last_transit: Optional[float] = None
+        self._playing = False
+
+    def _extend(self, sequence: int) -> int:
+        if self._highest is None:
+            return sequence
+        delta = (sequence - self._highest) & 0xFFFF
+        if delta >= 0x8000:
+            delta -= 0x10000
+        return self._highest + delta
+
+    @property
+    def depth(self) -> float:
+        """Audio bufferizzato in secondi"""
+        if not self._packets:
+            return 0.0
+        start = self._next if self._playing else min(self._packets)
+        return (self._highest - start + 1) * self.frame_duration
+
+    def push(self, sequence: int, timestamp: int, payload: bytes, arrival: float) -> bool:
+        transit = arrival - timestamp / self.clock_rate
+        if self._last_transit is not None:
+            self.jitter += (abs(transit - self._last_transit) - self.jitter) / 16
+        self._last_transit = transit
+        self.target_delay = min(self.max_delay, max(self.min_delay, self.frame_duration + 4 * self.jitter))
+
+        extended = self._extend(sequence)
+        if self._next is not None and extended < self._next:
+            self.stats["late"] += 1
+            return False
+        if extended in self._packets:
+            self.stats["duplicate"] += 1
+            return False
+        self._packets[extended] = payload
+        if self._highest is None or extended > self._highest:
+            self._highest = extended
+        while len(self._packets) > self.capacity:
+            oldest = min(self._packets)
+            del self._packets[oldest]
+            self.stats["dropped"] += 1
+            if self._next is not None and oldest >= self._next:
+                self._next = oldest + 1
+        return True
+
+    def pop(self) -> Tuple[str, Optional[bytes]]:
+        """Prossimo frame da riprodurre: (OK, payload), (LOST, None) o (EMPTY, None)"""
+        if not self._playing:
+            if not self._packets or self.depth < self.target_delay:
+                return self.EMPTY, None
+            self._playing = True
+            self._next = min(self._packets) if self._next is None else max(self._next, min(self._packets))
+            JITTER_BUFFER_DELAY_SECONDS.observe(self.target_delay)
+
+        if not self._packets:
+            self._playing = False
+            self.stats["underruns"] += 1
+            return self.EMPTY, None
+
+        payload = self._packets.pop(self._next, None)
+        self._next += 1
+        if payload is None:
+            self.stats["lost"] += 1
+            return self.LOST, None
+
+        # Shrink the delay when the network calmed down
+        if self._packets and self.depth > self.target_delay + 2 * self.frame_duration:
+            self._packets.pop(self._next, None)
+            self._next += 1
+            self.stats["dropped"] += 1
+        self.stats["played"] += 1
+        return self.OK, payload
+
+
+# --- Session ----------------------------------------------------------------
+
+
+class RtpSession(asyncio.DatagramProtocol):
+    """
+    Sessione RTP di una chiamata
+
+    Args:
+        codec: Codec negoziato via SDP
+        remote_addr: Indirizzo RTP annunciato dal chiamante
+        on_audio: Callback con l'audio ricevuto (mu-law 8 kHz, un frame per ptime)
+        telephone_event: Payload type DTMF (RFC 4733) negoziato, se presente
+        on_dtmf: Callback con la cifra DTMF ricevuta
+        ptime_ms: Durata dei pacchetti
+        jitter_min_delay / jitter_max_delay: Limiti del jitter buffer in secondi
+    """
+
+    def __init__(
+        self,
+        codec: Codec,
+        remote_addr: Tuple[str, int],
+        on_audio: Callable[[bytes], None],
+        telephone_event: Optional[Codec] = None,
+        on_dtmf: Optional[Callable[[str], None]] = None,
+        ptime_ms: int = 20,
+        jitter_min_delay: float = 0.02,
+        jitter_max_delay: float = 0.2,
+    ):
+        self.codec = codec
+        self.remote_addr = remote_addr
+        self.on_audio = on_audio
+        self.telephone_event = telephone_event
+        self.on_dtmf = on_dtmf
+        self.frame_duration = ptime_ms / 1000
+        self.frame_bytes = int(PIPELINE_SAMPLE_RATE * self.frame_duration)
+        self.timestamp_step = int(codec.clock_rate * self.frame_duration)
+        self.audio_codec = create_audio_codec(codec)
+        self.jitter_buffer = JitterBuffer(codec.clock_rate, self.frame_duration, jitter_min_delay, jitter_max_delay)
+
+        self.transport: Optional[asyncio.DatagramTransport] = None
+        self.local_port: Optional[int] = None
+        self._remote_latched = False
+        self._remote_ssrc: Optional[int] = None
+        self._last_dtmf_timestamp: Optional[int] = None
+
+        self.ssrc = random.getrandbits(32)
+        self._sequence = random.getrandbits(16)
+        self._timestamp = random.getrandbits(32)
+        self._outbound = AudioRingBuffer(PIPELINE_SAMPLE_RATE * MAX_OUTBOUND_SECONDS)
+        self._frame = bytearray(self.frame_bytes)
+        self._talking = False
+        self._partial_ticks = 0
+        self._task: Optional[asyncio.Task] = None
+
+    # --- asyncio protocol -----------------------------------------------
+
+    def connection_made(self, transport):
+        self.transport = transport
+
+    def datagram_received(self, data: bytes, addr):
+        try:
+            packet = RtpPacket.parse(data)
+        except ValueError:
+            return  # RTCP or garbage on the RTP port
+
+        if not self._remote_latched:
+            # Symmetric RTP: answer where the media really comes from (NAT)
+            self.remote_addr = addr
+            self._remote_latched = True
+        if packet.ssrc != self._remote_ssrc:
+            if self._remote_ssrc is not None:
+                logger.debug(f"RTP SSRC changed on port {self.local_port}, resetting jitter buffer")
+            self._remote_ssrc = packet.ssrc
+            self.jitter_buffer.reset()
+
+        if self.telephone_event and packet.payload_type == self.telephone_event.payload_type:
+            self._handle_dtmf(packet)
+            return
+        if packet.payload_type != self.codec.payload_type:
+            return
+        self.jitter_buffer.push(packet.sequence, packet.timestamp, packet.payload, asyncio.get_running_loop().time())
+
+    def error_received(self, exc):
+        logger.debug(f"RTP socket error on port {self.local_port}: {exc}")
+
+    def _handle_dtmf(self, packet: RtpPacket) -> None:
+        # RFC 4733: the end bit is repeated up to three times for the same event timestamp
+        if len(packet.payload) < 4 or not packet.payload[1] & 0x80:
+            return
+        if packet.timestamp == self._last_dtmf_timestamp:
+            return
+        self._last_dtmf_timestamp = packet.timestamp
+        event = packet.payload[0]
+        digit = "0123456789*#ABCD"[event] if event < 16 else None
+        if digit and self.on_dtmf:
+            self.on_dtmf(digit)
+
+    # --- Lifecycle ------------------------------------------------------
+
+    def start(self) -> None:
+        if self._task is None:
+            self._task = asyncio.create_task(self._run())
+
+    async def close(self) -> None:
+        if self._task is not None:
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+            self._task = None
+        if self.transport is not None:
+            self.transport.close()
+        stats = self.jitter_buffer.stats
+        for result in ("played", "lost", "late", "duplicate"):
+            RTP_PACKETS.labels(direction="in", result=result).inc(stats[result])
+        logger.info(f"RTP session on port {self.local_port} closed: {stats}, jitter {self.jitter_buffer.jitter * 1000:.1f}ms")
+
+    # --- Audio ----------------------------------------------------------
+
+    def send_audio(self, mulaw: bytes) -> None:
+        """Accoda audio mu-law 8 kHz da inviare"""
+        if self._outbound.write(mulaw):
+            logger.warning(f"RTP outbound queue full on port {self.local_port}, dropping oldest audio")
+
+    def clear_audio(self) -> None:
+        """Scarta l'audio non ancora inviato (interruzione del bot)"""
+        self._outbound.clear()
+
+    async def _run(self) -> None:
+        loop = asyncio.get_running_loop()
+        next_tick = loop.time()
+        while True:
+            try:
+                self._play_frame()
+                self._send_frame()
+            except Exception as e:
+                logger.error(f"RTP tick failed on port {self.local_port}: {e}", exc_info=True)
+            next_tick += self.frame_duration
+            delay = next_tick - loop.time()
+            if delay < -5 * self.frame_duration:
+                next_tick = loop.time()  # event loop stalled, do not burst to catch up
+                delay = 0
+            await asyncio.sleep(max(0.0, delay))
+
+    def _play_frame(self) -> None:
+        status, payload = self.jitter_buffer.pop()
+        if status == JitterBuffer.OK:
+            try:
+                audio = self.audio_codec.decode(payload)
+            except ValueError:
+                audio = self.audio_codec.conceal(self.frame_bytes)
+        elif status == JitterBuffer.LOST:
+            audio = self.audio_codec.conceal(self.frame_bytes)
+        else:
+            return
+        self.on_audio(audio)
+
+    def _send_frame(self) -> None:
+        # The timestamp follows the sampling clock, also across silence
+        self._timestamp += self.timestamp_step
+        pending = len(self._outbound)
+        if pending == 0:
+            self._talking = False
+            self._partial_ticks = 0
+            return
+        if pending < self.frame_bytes:
+            # Give a partial frame one tick to be completed before padding it
+            if self._partial_ticks == 0:
+                self._partial_ticks = 1
+                return
+        self._partial_ticks = 0
+
+        frame = self._frame
+        filled = self._outbound.read_into(frame)
+        if filled < self.frame_bytes:
+            frame[filled:] = MULAW_SILENCE * (self.frame_bytes - filled)
+        packet = RtpPacket(
+            payload_type=self.codec.payload_type,
+            sequence=self._sequence,
+            timestamp=self._timestamp,
+            ssrc=self.ssrc,
+            payload=self.audio_codec.encode(frame),
+            marker=not self._talking,  # first packet of a talkspurt
+        )
+        self._sequence = (self._sequence + 1) & 0xFFFF
+        self._talking = True
+        if self.transport is not None:
+            self.transport.sendto(packet.serialize(), self.remote_addr)
+            RTP_PACKETS.labels(direction="out", result="sent").inc()
+
+
+class RtpPortAllocator:
+    """Assegna porte RTP pari da un intervallo (la dispari resta per RTCP)"""
+
+    def __init__(self, port_min: int = 10000, port_max: int = 20000):
+        self.port_min = port_min + port_min % 2
+        self.port_max = port_max
+        self._next = self.port_min
+
+    async def open(self, session: RtpSession, host: str = "0.0.0.0") -> int:
+        loop = asyncio.get_running_loop()
+        attempts = (self.port_max - self.port_min) // 2 + 1
+        for _ in range(attempts):
+            port = self._next
+            self._next = self._next + 2 if self._next + 2 <= self.port_max else self.port_min
+            try:
+                await loop.create_datagram_endpoint(lambda: session, local_addr=(host, port))
+            except OSError:
+                continue
+            session.local_port = port
+            return port
+        raise RuntimeError(f"no free RTP port in {self.port_min}-{self.port_max}")
@@ -0,0 +1,208 @@
+"""
+SDP - Negoziazione offer/answer (RFC 3264) per la sessione audio
+
+Dall'offerta del chiamante viene scelto il primo codec supportato tra
+PCMU, PCMA e Opus (nell'ordine di preferenza dell'offerente, come
+raccomandato da RFC 3264) e, se offerto, telephone-event per i DTMF.
+"""
+
+import time
+from dataclasses import dataclass, field
+from typing import List, Optional, Sequence
+
+# Static payload types (RFC 3551) used when an offer omits the rtpmap line
+STATIC_PAYLOAD_TYPES = {
+    0: ("PCMU", 8000, 1),
+    8: ("PCMA", 8000, 1),
+}
+DEFAULT_PTIME_MS = 20
+
+
+class SdpNegotiationError(Exception):
+    """Nessun codec in comune o offerta non valida (risposta SIP 488)"""
+
+
+@dataclass(frozen=True)
+class Codec:
+    """Codec audio negoziato"""
+
+    name: str
+    payload_type: int
+    clock_rate: int
+    channels: int = 1
+    fmtp: Optional[str] = None
+
+    @property
+    def rtpmap(self) -> str:
+        suffix = f"/{self.channels}" if self.channels > 1 else ""
+        return f"{self.name}/{self.clock_rate}{suffix}"
+
+
+@dataclass
+class SessionDescription:
+    """Parte audio di una descrizione SDP"""
+
+    address: str
+    port: int
+    codecs: List[Codec] = field(default_factory=list)
+    ptime_ms: int = DEFAULT_PTIME_MS
+    direction: str = "sendrecv"
+    protocol: str = "RTP/AVP"
+
+
+@dataclass(frozen=True)
+class NegotiatedMedia:
+    """Esito della negoziazione: dove inviare l'RTP e con quale codec"""
+
+    remote_address: str
+    remote_port: int
+    codec: Codec
+    telephone_event: Optional[Codec]
+    ptime_ms: int
+
+
+def parse_sdp(text: str) -> SessionDescription:
+    """
+    Estrae la prima sezione audio di un SDP
+
+    Raises:
+        SdpNegotiationError: se manca la linea m=audio o l'indirizzo
+    """
+    session_address = None
+    media: Optional[SessionDescription] = None
+    payload_types: List[int] = []
+    rtpmaps = {}
+    fmtps = {}
+    in_other_media = False
+
+    for raw_line in text.replace("\r\n", "\n").split("\n"):
+        line = raw_line.strip()
+        if len(line) < 2 or line[1] != "=":
+            continue
+        kind, value = line[0], line[2:]
+
+        if kind == "m":
+            if media is not None:
+                break  # only the first audio stream is used
+            parts = value.split()
+            in_other_media = parts[0] != "audio"
+            if not in_other_media:
+                media = SessionDescription(address=session_address or "", port=int(parts[1]), protocol=parts[2])
+                payload_types = [int(pt) for pt in parts[3:] if pt.isdigit()]
+            continue
+        if in_other_media:
+            continue
+
+        if kind == "c":
+            address = value.split()[-1].split("/")[0]
+            if media is None:
+                session_address = address
+            else:
+                media.address = address
+        elif kind == "a" and media is not None:
+            name, _, attribute = value.partition(":")
+            if name == "rtpmap":
+                pt, _, encoding = attribute.partition(" ")
+                rtpmaps[int(pt)] = encoding.strip()
+            elif name == "fmtp":
+                pt, _, params = attribute.partition(" ")
+                if pt.isdigit():
+                    fmtps[int(pt)] = params.strip()
+            elif name == "ptime" and attribute.strip().isdigit():
+                media.ptime_ms = int(attribute)
+            elif name in ("sendrecv", "sendonly", "recvonly", "inactive"):
+                media.direction = name
+
+    if media is None:
+        raise SdpNegotiationError("offer has no audio stream")
+    if not media.address:
+        raise SdpNegotiationError("offer has no connection address")
+
+    for pt in payload_types:
+        if pt in rtpmaps:
+            encoding = rtpmaps[pt].split("/")
+            name = encoding[0]
+            clock_rate = int(encoding[1]) if len(encoding) > 1 else 8000
+            channels = int(encoding[2]) if len(encoding) > 2 else 1
+        elif pt in STATIC_PAYLOAD_TYPES:
+            name, clock_rate, channels = STATIC_PAYLOAD_TYPES[pt]
+        else:
+            continue
+        media.codecs.append(Codec(name, pt, clock_rate, channels, fmtps.get(pt)))
+    return media
+
+
+def negotiate(offer: SessionDescription, supported: Sequence[str]) -> NegotiatedMedia:
+    """
+    Sceglie codec e telephone-event dall'offerta
+
+    Args:
+        offer: SDP dell'offerente
+        supported: Nomi dei codec accettati (es. ["PCMU", "PCMA", "opus"])
+
+    Raises:
+        SdpNegotiationError: se l'offerta non contiene codec supportati
+    """
+    if offer.protocol.upper() not in ("RTP/AVP", "RTP/AVPF"):
+        raise SdpNegotiationError(f"unsupported media protocol {offer.protocol} (plain RTP only)")
+    accepted = {name.lower() for name in supported}
+    codec = next((c for c in offer.codecs if c.name.lower() in accepted), None)
+    if codec is None:
+        offered = ", ".join(c.rtpmap for c in offer.codecs) or "none"
+        raise SdpNegotiationError(f"no common codec (offered: {offered})")
+    telephone_event = next(
+        (c for c in offer.codecs if c.name.lower() == "telephone-event" and c.clock_rate == codec.clock_rate),
+        None,
+    )
+    return NegotiatedMedia(
+        remote_address=offer.address,
+        remote_port=offer.port,
+        codec=codec,
+        telephone_event=telephone_event,
+        ptime_ms=offer.ptime_ms,
+    )
+
+
+def build_answer(
+    media: NegotiatedMedia,
+    local_address: str,
+    local_port: int,
+    direction: str = "sendrecv",
+    session_id: Optional[int] = None,
+) -> str:
+    """SDP di risposta con il solo codec scelto (più telephone-event se offerto)"""
+    session_id = session_id or int(time.time())
+    codecs = [media.codec] + ([media.telephone_event] if media.telephone_event else [])
+    lines = [
+        "v=0",
+        f"o=voice-assistant {session_id} {session_id} IN IP4 {local_address}",
+        "s=AI Voice Assistant",
+        f"c=IN IP4 {local_address}",
+        "t=0 0",
+        f"m=audio {local_port} RTP/AVP {' '.join(str(c.payload_type) for c in codecs)}",
+    ]
+    for codec in codecs:
+        lines.append(f"a=rtpmap:{codec.payload_type} {codec.rtpmap}")
+        if codec.fmtp:
+            lines.append(f"a=fmtp:{codec.payload_type} {codec.fmtp}")
+    lines += [f"a=ptime:{DEFAULT_PTIME_MS}", f"a={direction}"]
+    return "\r\n".join(lines) + "\r\n"
+
+
+def build_offer(local_address: str, local_port: int, codecs: Sequence[Codec], session_id: Optional[int] = None) -> str:
+    """SDP di offerta (usato dai chiamanti di prova in loopback)"""
+    session_id = session_id or int(time.time())
+    lines = [
+        "v=0",
+        f"o=caller {session_id} {session_id} IN IP4 {local_address}",
+        "s=call",
+        f"c=IN IP4 {local_address}",
+        "t=0 0",
+        f"m=audio {local_port} RTP/AVP {' '.join(str(c.payload_type) for c in codecs)}",
+    ]
+    for codec in codecs:
+        lines.append(f"a=rtpmap:{codec.payload_type} {codec.rtpmap}")
+        if codec.fmtp:
+            lines.append(f"a=fmtp:{codec.payload_type} {codec.fmtp}")
+    lines += [f"a=ptime:{DEFAULT_PTIME_MS}", "a=sendrecv"]
+    return "\r\n".join(lines) + "\r\n"
@@ -0,0 +1,543 @@
+"""
+SIP User Agent - Registrazione e gestione dialoghi su UDP (RFC 3261)
+
+Funzioni coperte:
+    - REGISTER con digest auth, rinnovo all'80% della scadenza concessa e
+      keepalive CRLF per mantenere aperto il binding NAT
+    - INVITE in ingresso: 100 Trying, offer/answer SDP tramite callback,
+      200 OK ritrasmesso finché non arriva l'ACK (Timer G/H)
+    - ACK, BYE e CANCEL in ingresso, BYE in uscita per riagganciare
+    - OPTIONS (ping dei provider) e ritrasmissioni UDP (Timer A/E)
+
+Il trasporto è solo UDP; TCP/TLS richiederebbero un framing a stream.
+"""
+
+import asyncio
+import logging
+import socket
+import time
+from dataclasses import dataclass, field
+from typing import Awaitable, Callable, Dict, List, Optional, Tuple
+
+from prometheus_client import Counter
+
+from sip.message import (
+    SipMessage,
+    SipParseError,
+    build_digest_authorization,
+    header_params,
+    header_uri,
+    make_response,
+    new_branch,
+    new_tag,
+    parse_digest_challenge,
+)
+from sip.sdp import SdpNegotiationError
+
+logger = logging.getLogger(__name__)
+
+T1 = 0.5  # RTT estimate (RFC 3261 section 17)
+T2 = 4.0  # Maximum retransmit interval for non-INVITE requests and INVITE responses
+TRANSACTION_TIMEOUT = 64 * T1
+ALLOWED_METHODS = "INVITE, ACK, BYE, CANCEL, OPTIONS"
+
+SIP_REQUESTS = Counter(
+    'voice_assistant_sip_requests_total',
+    'SIP requests received',
+    ['method'],
+)
+SIP_REGISTRATIONS = Counter(
+    'voice_assistant_sip_registrations_total',
+    'SIP REGISTER outcomes',
+    ['result'],  # ok, auth_failed, rejected, timeout
+)
+
+Address = Tuple[str, int]
+
+
+@dataclass
+class SipDialog:
+    """Dialogo SIP creato da un INVITE in ingresso (lato UAS)"""
+
+    call_id: str
+    local_tag: str
+    remote_from: str  # From header of the INVITE (with the caller's tag)
+    local_to: str  # To header of the INVITE plus our tag
+    remote_target: str  # Contact URI of the caller
+    route_set: List[str]
+    peer_addr: Address
+    invite: SipMessage
+    local_cseq: int = 1
+    state: str = "early"  # early, confirmed, terminated
+    answer: Optional[SipMessage] = None
+    acked: asyncio.Event = field(default_factory=asyncio.Event)
+
+    @property
+    def from_uri(self) -> str:
+        return header_uri(self.remote_from)
+
+    @property
+    def to_uri(self) -> str:
+        return header_uri(self.local_to)
+
+
+# SDP answer for an INVITE; None declines it with 486 Busy Here (no slot, node draining)
+InviteHandler = Callable[[SipDialog, str], Awaitable[Optional[str]]]
+
+
+class SipUserAgent(asyncio.DatagramProtocol):
+    """
+    User agent SIP che si registra presso il server e risponde alle chiamate
+
+    Args:
+        server: Registrar / proxy SIP
+        username: Utente SIP (anche user part del Contact)
+        password: Password per il digest
+        domain: Dominio / realm (default: server)
+        port: Porta del server
+        local_ip: IP annunciato in Contact/Via (default: interfaccia verso il server)
+        local_port: Porta UDP locale
+        expires: Scadenza richiesta per la registrazione in secondi
+        keepalive_interval: Intervallo dei keepalive CRLF (0 = disabilitati)
+        on_invite: async (dialog, sdp_offer) -> sdp_answer (InviteHandler); None
+            rifiuta con 486 (o non risponde se nel frattempo è arrivato un CANCEL),
+            SdpNegotiationError rifiuta con 488
+        on_established: async (dialog) chiamato all'arrivo dell'ACK
+        on_terminated: async (dialog, reason) chiamato quando il chiamante chiude
+            (BYE, CANCEL) o l'ACK non arriva; non per i riagganci locali
+    """
+
+    def __init__(
+        self,
+        server: str,
+        username: str,
+        password: str,
+        domain: Optional[str] = None,
+        port: int = 5060,
+        local_ip: Optional[str] = None,
+        local_port: int = 5060,
+        expires: int = 300,
+        keepalive_interval: float = 25.0,
+        on_invite: Optional[InviteHandler] = None,
+        on_established: Optional[Callable[[SipDialog], Awaitable[None]]] = None,
+        on_terminated: Optional[Callable[[SipDialog, str], Awaitable[None]]] = None,
+        user_agent: str = "AI-Voice-Assistant",
+    ):
+        self.server = server
+        self.port = port
+        self.username = username
+        self.password = password
+        self.domain = domain or server
+        self.local_ip = local_ip
+        self.local_port = local_port
+        self.expires = expires
+        self.keepalive_interval = keepalive_interval
+        self.on_invite = on_invite
+        self.on_established = on_established
+        self.on_terminated = on_terminated
+        self.user_agent = user_agent
+
+        self.transport: Optional[asyncio.DatagramTransport] = None
+        self.server_addr: Optional[Address] = None
+        self.contact_addr: Optional[Address] = None
+        self.registered = False
+        self.dialogs: Dict[str, SipDialog] = {}
+
+        self._transactions: Dict[str, asyncio.Future] = {}
+        # (branch, method) -> (sent_at, response): answers replayed on retransmitted requests
+        self._responses: Dict[Tuple[str, str], Tuple[float, SipMessage]] = {}
+        self._register_call_id = f"{new_tag()}@{self.domain}"
+        self._register_tag = new_tag()
+        self._register_cseq = 0
+        self._refresh_handle: Optional[asyncio.TimerHandle] = None
+        self._tasks: set = set()
+
+    # --- Lifecycle ------------------------------------------------------
+
+    async def resolve(self) -> None:
+        """Risolve il server e l'IP locale verso di esso, senza aprire la porta SIP"""
+        loop = asyncio.get_running_loop()
+        infos = await loop.getaddrinfo(self.server, self.port, family=socket.AF_INET, type=socket.SOCK_DGRAM)
+        self.server_addr = infos[0][4][:2]
+        if not self.local_ip:
+            self.local_ip = self._outbound_ip(self.server_addr)
+
+    async def start(self) -> None:
+        loop = asyncio.get_running_loop()
+        await self.resolve()
+        await loop.create_datagram_endpoint(lambda: self, local_addr=("0.0.0.0", self.local_port))
+        self.local_port = self.transport.get_extra_info("sockname")[1]
+        self.contact_addr = (self.local_ip, self.local_port)
+        if self.keepalive_interval > 0:
+            self._spawn(self._keepalive())
+        logger.info(f"SIP user agent listening on {self.local_ip}:{self.local_port} (server {self.server_addr[0]}:{self.server_addr[1]})")
+
+    async def close(self) -> None:
+        if self._refresh_handle is not None:
+            self._refresh_handle.cancel()
+        for call_id in list(self.dialogs):
+            await self.hangup(call_id)
+        if self.registered:
+            try:
+                await asyncio.wait_for(self.register(expires=0), timeout=2.0)
+            except (asyncio.TimeoutError, OSError):
+                pass
+        for task in list(self._tasks):
+            task.cancel()
+        if self.transport is not None:
+            self.transport.close()
+
+    @staticmethod
+    def _outbound_ip(addr: Address) -> str:
+        # Connecting a UDP socket sends nothing but selects the outgoing interface
+        with socket.socket(socket.AF_INET, socket.SOCK_DGRAM) as probe:
+            probe.connect(addr)
+            return probe.getsockname()[0]
+
+    def _spawn(self, coro) -> asyncio.Task:
+        task = asyncio.create_task(coro)
+        self._tasks.add(task)
+        task.add_done_callback(self._tasks.discard)
+        return task
+
+    # --- Transport ------------------------------------------------------
+
+    def connection_made(self, transport):
+        self.transport = transport
+
+    def datagram_received(self, data: bytes, addr):
+        if not data.strip():
+            return  # CRLF keepalive
+        try:
+            message = SipMessage.parse(data)
+        except (SipParseError, ValueError) as e:
+            logger.debug(f"Dropping malformed SIP datagram from {addr}: {e}")
+            return
+        if message.is_request:
+            self._handle_request(message, addr)
+        else:
+            future = self._transactions.get(message.branch)
+            if future is not None and not future.done() and message.status_code >= 200:
+                future.set_result(message)
+
+    def error_received(self, exc):
+        logger.debug(f"SIP socket error: {exc}")
+
+    def _send(self, message: SipMessage, addr: Address) -> None:
+        if self.transport is not None:
+            self.transport.sendto(message.to_bytes(), addr)
+
+    def _via(self, branch: str) -> str:
+        host, port = self.contact_addr
+        return f"SIP/2.0/UDP {host}:{port};branch={branch};rport"
+
+    @property
+    def contact(self) -> str:
+        host, port = self.contact_addr
+        return f"<sip:{self.username}@{host}:{port};transport=udp>"
+
+    async def _request(self, message: SipMessage, addr: Address) -> SipMessage:
+        """Client transaction: invia con ritrasmissioni e attende la risposta finale"""
+        loop = asyncio.get_running_loop()
+        branch = message.branch
+        future = loop.create_future()
+        self._transactions[branch] = future
+        deadline = loop.time() + TRANSACTION_TIMEOUT
+        interval = T1
+        try:
+            while True:
+                self._send(message, addr)
+                try:
+                    return await asyncio.wait_for(asyncio.shield(future), min(interval, max(0.0, deadline - loop.time())))
+                except asyncio.TimeoutError:
+                    if loop.time() >= deadline:
+                        raise
+                    interval = min(interval * 2, T2)
+        finally:
+            self._transactions.pop(branch, None)
+            if not future.done():
+                future.cancel()
+
+    # --- Registration ---------------------------------------------------
+
+    def _register_request(self, expires: int, authorization: Optional[Tuple[str, str]] = None) -> SipMessage:
+        self._register_cseq += 1
+        headers = [
+            ("Via", self._via(new_branch())),
+            ("Max-Forwards", "70"),
+            ("From", f"<sip:{self.username}@{self.domain}>;tag={self._register_tag}"),
+            ("To", f"<sip:{self.username}@{self.domain}>"),
+            ("Call-ID", self._register_call_id),
+            ("CSeq", f"{self._register_cseq} REGISTER"),
+            ("Contact", self.contact),
+            ("Expires", str(expires)),
+            ("Allow", ALLOWED_METHODS),
+            ("User-Agent", self.user_agent),
+        ]
+        if authorization:
+            headers.append(authorization)
+        return SipMessage.request("REGISTER", f"sip:{self.domain}", headers)
+
+    async def register(self, expires: Optional[int] = None) -> bool:
+        """
+        Registra il Contact presso il server (expires=0 cancella la registrazione)
+
+        Returns:
+            True se il server ha risposto 200 OK
+        """
+        expires = self.expires if expires is None else expires
+        if self._refresh_handle is not None:
+            self._refresh_handle.cancel()
+            self._refresh_handle = None
+
+        try:
+            response = await self._request(self._register_request(expires), self.server_addr)
+            if response.status_code in (401, 407):
+                challenge_header = "WWW-Authenticate" if response.status_code == 401 else "Proxy-Authenticate"
+                auth_header = "Authorization" if response.status_code == 401 else "Proxy-Authorization"
+                challenge = parse_digest_challenge(response.get(challenge_header) or "")
+                authorization = build_digest_authorization(
+                    challenge, "REGISTER", f"sip:{self.domain}", self.username, self.password
+                )
+                response = await self._request(
+                    self._register_request(expires, (auth_header, authorization)), self.server_addr
+                )
+        except asyncio.TimeoutError:
+            SIP_REGISTRATIONS.labels(result="timeout").inc()
+            logger.error(f"SIP REGISTER to {self.server} timed out")
+            self._schedule_refresh(30)
+            return False
+
+        if response.status_code != 200:
+            result = "auth_failed" if response.status_code in (401, 403, 407) else "rejected"
+            SIP_REGISTRATIONS.labels(result=result).inc()
+            logger.error(f"SIP REGISTER rejected: {response.status_code} {response.reason}")
+            self.registered = False
+            self._schedule_refresh(60)
+            return False
+
+        SIP_REGISTRATIONS.labels(result="ok").inc()
+        if expires == 0:
+            self.registered = False
+            return True
+
+        # NAT: the registrar tells us our public address through received/rport
+        via_params = header_params(response.get_all("Via")[0]) if response.get_all("Via") else {}
+        public_host = via_params.get("received") or self.contact_addr[0]
+        public_port = int(via_params["rport"]) if via_params.get("rport", "").isdigit() else self.contact_addr[1]
+        if (public_host, public_port) != self.contact_addr:
+            logger.info(f"SIP contact behind NAT, re-registering as {public_host}:{public_port}")
+            self.contact_addr = (public_host, public_port)
+            return await self.register(expires)
+
+        granted = expires
+        for contact in response.get_all("Contact"):
+            params = header_params(contact)
+            if params.get("expires", "").isdigit() and self.contact_addr[0] in contact:
+                granted = int(params["expires"])
+        expires_header = response.get("Expires") or ""
+        if expires_header.isdigit() and granted == expires:
+            granted = int(expires_header)
+        self.registered = True
+        self._schedule_refresh(max(10, granted * 0.8))
+        logger.info(f"SIP registered as {self.username}@{self.domain} for {granted}s")
+        return True
+
+    def _schedule_refresh(self, delay: float) -> None:
+        loop = asyncio.get_running_loop()
+        self._refresh_handle = loop.call_later(delay, lambda: self._spawn(self.register()))
+
+    async def _keepalive(self) -> None:
+        while True:
+            await asyncio.sleep(self.keepalive_interval)
+            if self.transport is not None and self.server_addr is not None:
+                self.transport.sendto(b"\r\n\r\n", self.server_addr)
+
+    # --- Server side ----------------------------------------------------
+
+    def _reply(
+        self,
+        request: SipMessage,
+        addr: Address,
+        status_code: int,
+        reason: str,
+        to_tag: Optional[str] = None,
+        headers=(),
+        body: bytes = b"",
+    ) -> SipMessage:
+        response = make_response(request, status_code, reason, to_tag=to_tag, headers=list(headers) + [("User-Agent", self.user_agent)], body=body)
+        self._send(response, addr)
+        now = time.monotonic()
+        self._responses[(request.branch, request.method)] = (now, response)
+        # Requests are retransmitted for at most 64*T1; forget older answers
+        while self._responses:
+            key, (sent_at, _) = next(iter(self._responses.items()))
+            if now - sent_at < TRANSACTION_TIMEOUT:
+                break
+            del self._responses[key]
+        return response
+
+    def _handle_request(self, request: SipMessage, addr: Address) -> None:
+        method = request.method
+        SIP_REQUESTS.labels(method=method).inc()
+
+        cached = self._responses.get((request.branch, method))
+        if cached is not None and method != "ACK":
+            self._send(cached[1], addr)  # retransmitted request
+            return
+
+        dialog = self.dialogs.get(request.call_id)
+        if method == "INVITE":
+            if dialog is None:
+                self._spawn(self._handle_invite(request, addr))
+            elif dialog.answer is not None:
+                # Re-INVITE (session refresh, hold): keep the negotiated session
+                self._reply(request, addr, 200, "OK", headers=[("Contact", self.contact), ("Content-Type", "application/sdp")], body=dialog.answer.body)
+        elif method == "ACK":
+            if dialog is not None and dialog.answer is not None and not dialog.acked.is_set():
+                dialog.acked.set()
+                dialog.state = "confirmed"
+                if self.on_established:
+                    self._spawn(self.on_established(dialog))
+        elif method == "BYE":
+            if dialog is None:
+                self._reply(request, addr, 481, "Call/Transaction Does Not Exist")
+                return
+            self._reply(request, addr, 200, "OK")
+            self._spawn(self._terminate(dialog, "remote hangup"))
+        elif method == "CANCEL":
+            if dialog is None:
+                self._reply(request, addr, 481, "Call/Transaction Does Not Exist")
+                return
+            self._reply(request, addr, 200, "OK")
+            if dialog.answer is None:
+                self._reply(dialog.invite, dialog.peer_addr, 487, "Request Terminated", to_tag=dialog.local_tag)
+                self._spawn(self._terminate(dialog, "cancelled"))
+        elif method == "OPTIONS":
+            self._reply(request, addr, 200, "OK", headers=[("Allow", ALLOWED_METHODS), ("Accept", "application/sdp")])
+        else:
+            self._reply(request, addr, 405, "Method Not Allowed", headers=[("Allow", ALLOWED_METHODS)])
+
+    async def _handle_invite(self, request: SipMessage, addr: Address) -> None:
+        local_tag = new_tag()
+        self._reply(request, addr, 100, "Trying")
+        contact = request.get("Contact")
+        dialog = SipDialog(
+            call_id=request.call_id,
+            local_tag=local_tag,
+            remote_from=request.get("From") or "",
+            local_to=f"{request.get('To')};tag={local_tag}",
+            remote_target=header_uri(contact) if contact else header_uri(request.get("From") or ""),
+            route_set=request.get_all("Record-Route"),
+            peer_addr=addr,
+            invite=request,
+        )
+        self.dialogs[dialog.call_id] = dialog
+
+        try:
+            answer = await self.on_invite(dialog, request.body.decode("utf-8", errors="replace")) if self.on_invite else None
+        except SdpNegotiationError as e:
+            logger.warning(f"SIP call {dialog.call_id} rejected, SDP negotiation failed: {e}")
+            self.dialogs.pop(dialog.call_id, None)
+            self._reply(request, addr, 488, "Not Acceptable Here", to_tag=local_tag)
+            return
+        except Exception as e:
+            logger.error(f"SIP call {dialog.call_id} setup failed: {e}", exc_info=True)
+            self.dialogs.pop(dialog.call_id, None)
+            self._reply(request, addr, 500, "Server Internal Error", to_tag=local_tag)
+            return
+
+        if dialog.state == "terminated":
+            return  # cancelled while we were setting up the media
+        if answer is None:
+            self.dialogs.pop(dialog.call_id, None)
+            self._reply(request, addr, 486, "Busy Here", to_tag=local_tag)
+            return
+
+        dialog.answer = self._reply(
+            request,
+            addr,
+            200,
+            "OK",
+            to_tag=local_tag,
+            headers=[("Contact", self.contact), ("Allow", ALLOWED_METHODS), ("Content-Type", "application/sdp")],
+            body=answer.encode("utf-8"),
+        )
+        await self._retransmit_until_ack(dialog, addr)
+
+    async def _retransmit_until_ack(self, dialog: SipDialog, addr: Address) -> None:
+        # Timer G / H: the 2xx is retransmitted by the UAS core until the ACK arrives
+        loop = asyncio.get_running_loop()
+        deadline = loop.time() + TRANSACTION_TIMEOUT
+        interval = T1
+        while not dialog.acked.is_set():
+            try:
+                await asyncio.wait_for(dialog.acked.wait(), interval)
+            except asyncio.TimeoutError:
+                if loop.time() >= deadline or dialog.state == "terminated":
+                    break
+                self._send(dialog.answer, addr)
+                interval = min(interval * 2, T2)
+        if not dialog.acked.is_set() and dialog.state != "terminated":
+            logger.warning(f"SIP call {dialog.call_id}: no ACK for 200 OK, hanging up")
+            await self._send_bye(dialog)
+            await self._terminate(dialog, "no ack")
+
+    async def _terminate(self, dialog: SipDialog, reason: str) -> None:
+        if dialog.state == "terminated":
+            return
+        dialog.state = "terminated"
+        self.dialogs.pop(dialog.call_id, None)
+        logger.info(f"SIP call {dialog.call_id} terminated: {reason}")
+        if self.on_terminated:
+            await self.on_terminated(dialog, reason)
+
+    # --- Local hangup ---------------------------------------------------
+
+    async def hangup(self, call_id: str) -> bool:
+        """
+        Chiude una chiamata dal lato dell'assistente (BYE, o 603 se non ancora risposta)
+
+        Returns:
+            False se la chiamata non esiste
+        """
+        dialog = self.dialogs.pop(call_id, None)
+        if dialog is None or dialog.state == "terminated":
+            return False
+        if dialog.answer is None:
+            dialog.state = "terminated"
+            self._reply(dialog.invite, dialog.peer_addr, 603, "Decline", to_tag=dialog.local_tag)
+            return True
+        dialog.state = "terminated"
+        await self._send_bye(dialog)
+        return True
+
+    async def _send_bye(self, dialog: SipDialog) -> None:
+        dialog.local_cseq += 1
+        headers = [
+            ("Via", self._via(new_branch())),
+            ("Max-Forwards", "70"),
+            ("From", dialog.local_to),
+            ("To", dialog.remote_from),
+            ("Call-ID", dialog.call_id),
+            ("CSeq", f"{dialog.local_cseq} BYE"),
+            ("User-Agent", self.user_agent),
+        ]
+        headers += [("Route", route) for route in dialog.route_set]
+        bye = SipMessage.request("BYE", dialog.remote_target, headers)
+        try:
+            response = await self._request(bye, dialog.peer_addr)
+            if response.status_code in (401, 407):
+                challenge = parse_digest_challenge(
+                    response.get("WWW-Authenticate" if response.status_code == 401 else "Proxy-Authenticate") or ""
+                )
+                dialog.local_cseq += 1
+                bye.set("Via", self._via(new_branch()))
+                bye.set("CSeq", f"{dialog.local_cseq} BYE")
+                bye.set(
+                    "Authorization" if response.status_code == 401 else "Proxy-Authorization",
+                    build_digest_authorization(challenge, "BYE", dialog.remote_target, self.username, self.password),
+                )
+                await self._request(bye, dialog.peer_addr)
+        except asyncio.TimeoutError:
+            logger.warning(f"SIP BYE for {dialog.call_id} got no response")
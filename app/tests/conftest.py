@@ -0,0 +1,12 @@
+"""
+Configurazione pytest: i test importano i moduli dell'applicazione come fa
+main.py, dalla cartella app/.
+
+Uso (dalla cartella app/):
+    python -m pytest tests
+"""
+
+import os
+import sys
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
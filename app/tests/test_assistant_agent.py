@@ -0,0 +1,61 @@
+"""Test del fast-path degli scenari dell'AssistantAgent (LLM sostituito da una risposta fissa)"""
+
+import pytest
+from vocode.streaming.agent.base_agent import GeneratedResponse
+from vocode.streaming.models.agent import ChatGPTAgentConfig
+from vocode.streaming.models.message import BaseMessage
+
+from agents.assistant_agent import AssistantAgent
+from services.scenario_matcher import ScenarioMatcher
+
+SCENARIOS = [
+    {
+        "name": "supporto_tecnico",
+        "trigger_keywords": ["problema", "non funziona", "errore"],
+        "response": "Capisco che hai un problema tecnico. Puoi descrivermi brevemente il problema?",
+    },
+    {
+        "name": "richiesta_commerciale",
+        "trigger_keywords": ["preventivo", "prezzo"],
+        "response": "Per preventivi posso passarti all'ufficio vendite.",
+    },
+]
+LLM_REPLY = "Risposta del modello"
+
+
+@pytest.fixture
+def agent(monkeypatch):
+    agent = AssistantAgent(
+        ChatGPTAgentConfig(openai_api_key="sk-test", prompt_preamble="Sei un assistente vocale."),
+        scenario_matcher=ScenarioMatcher(SCENARIOS),
+        latency_metrics_enabled=False,
+    )
+
+    async def llm_response(conversation_id, cache_key, speculation):
+        yield GeneratedResponse(message=BaseMessage(text=LLM_REPLY), is_interruptible=True)
+
+    monkeypatch.setattr(agent, "_can_stream_clauses", lambda: True)
+    monkeypatch.setattr(agent, "_generate_clause_response", llm_response)
+    return agent
+
+
+async def reply(agent: AssistantAgent, human_input: str) -> str:
+    return " ".join([response.message.text async for response in agent.generate_response(human_input, "conv-1")])
+
+
+@pytest.mark.asyncio
+async def test_scenario_answers_the_first_matching_turn(agent):
+    assert await reply(agent, "Il problema è che la eSIM non funziona") == SCENARIOS[0]["response"]
+
+
+@pytest.mark.asyncio
+async def test_scenario_does_not_fire_again_on_the_callers_answer(agent):
+    await reply(agent, "Il problema è che la eSIM non funziona")
+    # Describing the problem, as the canned response asks, repeats its keywords
+    assert await reply(agent, "Il problema è un errore di attivazione, non funziona da ieri") == LLM_REPLY
+
+
+@pytest.mark.asyncio
+async def test_other_scenarios_still_fire(agent):
+    await reply(agent, "Il problema è che la eSIM non funziona")
+    assert await reply(agent, "Vorrei un preventivo") == SCENARIOS[1]["response"]
@@ -0,0 +1,76 @@
+"""Test del CallRegistry condiviso tra repliche (fakeredis al posto di Redis)"""
+
+import asyncio
+import uuid
+from datetime import datetime
+
+import pytest
+import pytest_asyncio
+
+from services.call_registry import CallRegistry
+
+fakeredis = pytest.importorskip("fakeredis")
+
+
+def call_info(call_id: str) -> dict:
+    return {
+        "call_sid": call_id,
+        "from_number": "+390212345678",
+        "start_time": datetime(2024, 5, 6, 10, 30),
+        "status": "in-progress",
+    }
+
+
+@pytest_asyncio.fixture
+async def replicas():
+    # Two replicas of the pod: separate clients on the same Redis server
+    server = fakeredis.FakeServer()
+    clients = [fakeredis.FakeAsyncRedis(server=server, decode_responses=True) for _ in range(2)]
+    namespace = f"test-{uuid.uuid4().hex[:8]}"
+    yield [CallRegistry(client, namespace=namespace, ttl_seconds=1, local_cache_ttl=0.05) for client in clients]
+    for client in clients:
+        await client.aclose()
+
+
+@pytest.mark.asyncio
+async def test_call_registered_on_one_replica_is_read_on_the_other(replicas):
+    replica_a, replica_b = replicas
+    await replica_a.put("CA1", call_info("CA1"))
+
+    assert await replica_b.get("CA1") == call_info("CA1")
+    updated = await replica_b.update("CA1", status="completed", duration=12.5)
+    assert updated == {**call_info("CA1"), "status": "completed", "duration": 12.5}
+
+    await asyncio.sleep(replica_a.local_cache_ttl)
+    assert (await replica_a.get("CA1"))["status"] == "completed"
+    assert (await replica_a.remove("CA1"))["duration"] == 12.5
+    await asyncio.sleep(replica_b.local_cache_ttl)
+    assert await replica_b.get("CA1") is None
+
+
+@pytest.mark.asyncio
+async def test_count_and_listing_cover_every_replica(replicas):
+    replica_a, replica_b = replicas
+    for call_id in ("CA1", "CA2", "CA3"):
+        await replica_a.put(call_id, call_info(call_id))
+    for call_id in ("CA4", "CA5"):
+        await replica_b.put(call_id, call_info(call_id))
+
+    assert await replica_a.count() == await replica_b.count() == 5
+    assert set(await replica_a.list_active()) == set(await replica_b.list_active()) == {"CA1", "CA2", "CA3", "CA4", "CA5"}
+
+    await replica_b.remove("CA1")
+    assert await replica_a.count() == 4
+
+
+@pytest.mark.asyncio
+async def test_never_closed_call_expires_after_ttl(replicas):
+    replica_a, replica_b = replicas
+    await replica_a.put("CA1", call_info("CA1"))
+    assert await replica_b.count() == 1
+
+    # The replica that registered the call died without removing it
+    await asyncio.sleep(replica_a.ttl_seconds + 0.5)
+    assert await replica_b.count() == 0
+    assert "CA1" not in await replica_b.list_active()
+    assert await replica_b.get("CA1") is None
@@ -0,0 +1,132 @@
+"""Test del CallStore: batch COPY, partizioni giornaliere, retry e limite della coda (pool asyncpg finto)"""
+
+import asyncio
+from contextlib import asynccontextmanager
+from datetime import datetime, timedelta, timezone
+
+import pytest
+
+from services.call_store import CALLS_TABLE, TRANSCRIPTS_TABLE, CallStore, partition_name
+
+
+class FakeConnection:
+    """Connessione asyncpg finta: registra COPY ed execute, fallisce a comando"""
+
+    def __init__(self):
+        self.copies = []
+        self.statements = []
+        self.partitions = {CALLS_TABLE: [], TRANSCRIPTS_TABLE: []}
+        self.failures = 0
+        self.on_copy = None  # runs while the COPY is in flight
+
+    async def copy_records_to_table(self, table, records, columns):
+        if self.on_copy is not None:
+            self.on_copy()
+        if self.failures:
+            self.failures -= 1
+            raise ConnectionResetError("connection lost")
+        self.copies.append((table, list(records)))
+
+    async def execute(self, statement):
+        self.statements.append(statement)
+
+    async def fetch(self, query, table):
+        return [{"relname": name} for name in self.partitions[table]]
+
+
+class FakePool:
+    def __init__(self, conn: FakeConnection):
+        self.conn = conn
+
+    @asynccontextmanager
+    async def acquire(self):
+        yield self.conn
+
+    async def close(self):
+        pass
+
+
+@pytest.fixture
+def conn():
+    return FakeConnection()
+
+
+@pytest.fixture
+def store(conn):
+    store = CallStore("postgresql://unused", retention_days=7, batch_size=3, max_queue=10)
+    store.pool = FakePool(conn)
+    return store
+
+
+def turns(count: int):
+    now = datetime.now(timezone.utc).timestamp()
+    return [("human" if i % 2 == 0 else "bot", f"turn {i}", now + i) for i in range(count)]
+
+
+@pytest.mark.asyncio
+async def test_flush_writes_batches_and_creates_partitions_once(store, conn):
+    assert store.record_turns("conv-1", "CA1", turns(7))
+    assert store.record_call({"call_sid": "CA1", "status": "completed", "duration": 12}, "twilio")
+
+    await store.flush()
+
+    assert store.pending == 0
+    assert [(table, len(rows)) for table, rows in conn.copies] == [
+        (CALLS_TABLE, 1), (TRANSCRIPTS_TABLE, 3), (TRANSCRIPTS_TABLE, 3), (TRANSCRIPTS_TABLE, 1),
+    ]
+    assert [row[2] for _, rows in conn.copies[1:] for row in rows] == list(range(7))
+    today = datetime.now(timezone.utc).date()
+    creates = [s for s in conn.statements if s.startswith("CREATE TABLE")]
+    assert len(creates) == 2
+    assert partition_name(TRANSCRIPTS_TABLE, today) in creates[1]
+
+
+@pytest.mark.asyncio
+async def test_failed_write_is_retried_in_order(store, conn):
+    store.record_turns("conv-1", "CA1", turns(5))
+    conn.failures = 1
+
+    await store.flush()
+    assert conn.copies == []
+    assert store.pending == 5  # the failed batch is back at the head of the queue
+
+    store.record_turns("conv-2", "CA2", turns(1))
+    await store.flush()
+    written = [(row[1], row[2]) for _, rows in conn.copies for row in rows]
+    assert written == [("conv-1", i) for i in range(5)] + [("conv-2", 0)]
+    assert store.pending == 0
+
+
+@pytest.mark.asyncio
+async def test_queue_bound(store, conn):
+    assert store.record_turns("conv-1", "CA1", turns(9))
+    assert not store.record_turns("conv-2", "CA2", turns(2))  # would exceed max_queue
+    assert store.pending == 9
+
+    # A failed batch that no longer fits is dropped instead of growing the queue past max_queue
+    conn.failures = 1
+    conn.on_copy = lambda: store.record_turns("conv-3", "CA3", turns(4))
+    await store.flush()
+    assert store.pending == 10
+    assert [row[1] for row in store._pending[TRANSCRIPTS_TABLE]] == ["conv-1"] * 6 + ["conv-3"] * 4
+
+
+@pytest.mark.asyncio
+async def test_maintain_drops_partitions_past_retention(store, conn):
+    today = datetime.now(timezone.utc).date()
+    old = partition_name(CALLS_TABLE, today - timedelta(days=30))
+    recent = partition_name(CALLS_TABLE, today - timedelta(days=1))
+    conn.partitions[CALLS_TABLE] = [old, recent]
+
+    assert await store.maintain() == [old]
+    assert f"DROP TABLE IF EXISTS {old}" in conn.statements
+    assert not any(recent in s for s in conn.statements if s.startswith("DROP"))
+
+
+@pytest.mark.asyncio
+async def test_close_flushes_what_is_queued(store, conn):
+    store._task = asyncio.create_task(store._run())
+    store.record_turns("conv-1", "CA1", turns(2))
+    await store.close()
+    assert store.pending == 0
+    assert sum(len(rows) for _, rows in conn.copies) == 2
@@ -0,0 +1,112 @@
+"""Test del LlmDispatcher: hedging sul secondo backend, failover e circuit breaker"""
+
+import asyncio
+import uuid
+from typing import Any, Dict, List, Optional
+
+import pytest
+
+from services.llm_dispatch import CIRCUIT_CLOSED, CIRCUIT_HALF_OPEN, CIRCUIT_OPEN, LlmBackend, LlmDispatcher, _chunk
+
+REQUEST = {"model": "gpt-4o-mini", "messages": [{"role": "user", "content": "ciao"}], "stream": True}
+
+
+class ScriptedBackend(LlmBackend):
+    """Backend che risponde dopo first_token_delay secondi, o fallisce se fail è True"""
+
+    def __init__(self, name: str, first_token_delay: float = 0.0, fail: bool = False, **kwargs):
+        super().__init__(name, "test", **kwargs)
+        self.first_token_delay = first_token_delay
+        self.fail = fail
+        self.calls = 0
+        self.closed = 0
+
+    async def stream(self, chat_parameters: Dict[str, Any]):
+        self.calls += 1
+        completion_id = uuid.uuid4().hex
+        try:
+            await asyncio.sleep(self.first_token_delay)
+            if self.fail:
+                raise ConnectionError(f"{self.name} unavailable")
+            for word in ("Buongiorno", " da ", self.name):
+                yield _chunk(self.model_for(chat_parameters), completion_id, word)
+            yield _chunk(self.model_for(chat_parameters), completion_id, finish_reason="stop")
+        finally:
+            self.closed += 1
+
+
+def dispatcher(backends: List[LlmBackend], max_hedge_delay: float = 0.05, min_samples: int = 3) -> LlmDispatcher:
+    return LlmDispatcher(backends, min_hedge_delay=0.01, max_hedge_delay=max_hedge_delay, min_samples=min_samples)
+
+
+async def text_of(stream) -> str:
+    return "".join([chunk.choices[0].delta.content or "" async for chunk in stream])
+
+
+@pytest.mark.asyncio
+async def test_fast_primary_is_not_hedged():
+    primary, hedge = ScriptedBackend("primary"), ScriptedBackend("hedge")
+    stream = await dispatcher([primary, hedge]).stream(REQUEST)
+    assert stream.backend is primary
+    assert await text_of(stream) == "Buongiorno da primary"
+    assert hedge.calls == 0
+
+
+@pytest.mark.asyncio
+async def test_slow_primary_is_hedged_and_cancelled():
+    primary, hedge = ScriptedBackend("primary", first_token_delay=1.0), ScriptedBackend("hedge")
+    loop = asyncio.get_running_loop()
+    started = loop.time()
+    stream = await dispatcher([primary, hedge]).stream(REQUEST)
+    assert stream.backend is hedge
+    assert loop.time() - started < 0.5
+    assert await text_of(stream) == "Buongiorno da hedge"
+    # The losing request is cancelled and its stream closed
+    assert primary.closed == 1
+    assert primary.breaker.state == CIRCUIT_CLOSED
+
+
+@pytest.mark.asyncio
+async def test_error_before_first_token_fails_over_immediately():
+    primary, hedge = ScriptedBackend("primary", fail=True), ScriptedBackend("hedge")
+    stream = await dispatcher([primary, hedge], max_hedge_delay=5.0).stream(REQUEST)
+    assert stream.backend is hedge
+    assert primary.breaker.failures == 1
+
+
+@pytest.mark.asyncio
+async def test_all_backends_failing_raises_the_last_error():
+    primary, hedge = ScriptedBackend("primary", fail=True), ScriptedBackend("hedge", fail=True)
+    with pytest.raises(ConnectionError, match="hedge unavailable"):
+        await dispatcher([primary, hedge]).stream(REQUEST)
+
+
+@pytest.mark.asyncio
+async def test_circuit_opens_then_probes_after_cooldown():
+    primary = ScriptedBackend("primary", fail=True, breaker_failures=2, breaker_cooldown=0.1)
+    hedge = ScriptedBackend("hedge")
+    llm = dispatcher([primary, hedge])
+    for _ in range(2):
+        await llm.stream(REQUEST)
+    assert primary.breaker.state == CIRCUIT_OPEN
+
+    # Open circuit: the request goes straight to the hedge backend
+    stream = await llm.stream(REQUEST)
+    assert stream.backend is hedge and primary.calls == 2
+
+    await asyncio.sleep(0.15)
+    assert primary.breaker.available() and primary.breaker.state == CIRCUIT_HALF_OPEN
+    primary.fail = False
+    stream = await llm.stream(REQUEST)
+    assert stream.backend is primary
+    assert primary.breaker.state == CIRCUIT_CLOSED
+
+
+@pytest.mark.asyncio
+async def test_hedge_delay_follows_the_primary_latency():
+    primary, hedge = ScriptedBackend("primary", first_token_delay=0.02), ScriptedBackend("hedge")
+    llm = dispatcher([primary, hedge], max_hedge_delay=1.0)
+    assert llm.hedge_delay(primary) == 1.0  # not enough samples yet
+    for _ in range(3):
+        await text_of(await llm.stream(REQUEST))
+    assert 0.02 <= llm.hedge_delay(primary) < 0.2
@@ -0,0 +1,184 @@
+"""Test del SIPHandler: INVITE, ACK, BYE e CANCEL su UDP locale, con admission control"""
+
+import asyncio
+import uuid
+
+import pytest
+import pytest_asyncio
+
+from handlers.sip_handler import SIPHandler
+from services.admission import AdmissionController
+from sip.message import SipMessage, new_branch, new_tag
+
+SDP_OFFER = (
+    "v=0\r\n"
+    "o=- 1 1 IN IP4 127.0.0.1\r\n"
+    "s=-\r\n"
+    "c=IN IP4 127.0.0.1\r\n"
+    "t=0 0\r\n"
+    "m=audio 4000 RTP/AVP 0\r\n"
+    "a=rtpmap:0 PCMU/8000\r\n"
+)
+
+
+class Phone(asyncio.DatagramProtocol):
+    """Telefono SIP minimale: invia richieste e raccoglie le risposte"""
+
+    def __init__(self):
+        self.transport = None
+        self.messages: asyncio.Queue = asyncio.Queue()
+
+    def connection_made(self, transport):
+        self.transport = transport
+
+    def datagram_received(self, data, addr):
+        self.messages.put_nowait(SipMessage.parse(data))
+
+    @property
+    def address(self):
+        return self.transport.get_extra_info("sockname")[:2]
+
+    def send(self, message: SipMessage, addr) -> None:
+        self.transport.sendto(message.to_bytes(), addr)
+
+    async def response(self, method: str, timeout: float = 2.0) -> SipMessage:
+        """Prossima risposta finale (>= 200) a una richiesta method"""
+        while True:
+            message = await asyncio.wait_for(self.messages.get(), timeout)
+            if not message.is_request and message.status_code >= 200 and message.cseq[1] == method:
+                return message
+
+
+class Dialog:
+    """Lato chiamante di una chiamata: costruisce INVITE, ACK, BYE e CANCEL coerenti"""
+
+    def __init__(self, phone: Phone, server):
+        self.phone = phone
+        self.server = server
+        self.call_id = uuid.uuid4().hex
+        self.from_header = f"<sip:caller@127.0.0.1>;tag={new_tag()}"
+        self.to_header = "<sip:assistant@127.0.0.1>"
+        self.invite_branch = new_branch()
+        self.cseq = 1
+
+    def _headers(self, branch: str, method: str, cseq: int, to_header: str):
+        host, port = self.phone.address
+        return [
+            ("Via", f"SIP/2.0/UDP {host}:{port};branch={branch}"),
+            ("Max-Forwards", "70"),
+            ("From", self.from_header),
+            ("To", to_header),
+            ("Call-ID", self.call_id),
+            ("CSeq", f"{cseq} {method}"),
+            ("Contact", f"<sip:caller@{host}:{port}>"),
+        ]
+
+    def invite(self) -> None:
+        headers = self._headers(self.invite_branch, "INVITE", 1, self.to_header) + [("Content-Type", "application/sdp")]
+        self.phone.send(SipMessage.request("INVITE", "sip:assistant@127.0.0.1", headers, SDP_OFFER.encode()), self.server)
+
+    def ack(self, answer: SipMessage) -> None:
+        self.to_header = answer.get("To")
+        headers = self._headers(new_branch(), "ACK", 1, self.to_header)
+        self.phone.send(SipMessage.request("ACK", "sip:assistant@127.0.0.1", headers), self.server)
+
+    def bye(self) -> None:
+        self.cseq += 1
+        headers = self._headers(new_branch(), "BYE", self.cseq, self.to_header)
+        self.phone.send(SipMessage.request("BYE", "sip:assistant@127.0.0.1", headers), self.server)
+
+    def cancel(self) -> None:
+        # CANCEL reuses the INVITE's branch and CSeq number
+        headers = self._headers(self.invite_branch, "CANCEL", 1, self.to_header)
+        self.phone.send(SipMessage.request("CANCEL", "sip:assistant@127.0.0.1", headers), self.server)
+
+
+@pytest_asyncio.fixture
+async def admission():
+    return AdmissionController(max_live_calls=1, max_queue=1, queue_timeout=5.0)
+
+
+@pytest_asyncio.fixture
+async def handler(admission):
+    # No conversation pipeline: the call is media only (RTP session, registry, slot)
+    sip = SIPHandler(
+        "127.0.0.1", "assistant", "secret", "127.0.0.1",
+        local_ip="127.0.0.1", local_port=0, rtp_port_min=41000, rtp_port_max=41100,
+        codecs=("PCMU",), admission=admission,
+    )
+    await sip.user_agent.start()
+    yield sip
+    await sip.close()
+
+
+@pytest_asyncio.fixture
+async def phone():
+    loop = asyncio.get_running_loop()
+    transport, protocol = await loop.create_datagram_endpoint(Phone, local_addr=("127.0.0.1", 0))
+    yield protocol
+    transport.close()
+
+
+def server_of(handler: SIPHandler):
+    return ("127.0.0.1", handler.user_agent.local_port)
+
+
+async def wait_until(condition, timeout: float = 2.0) -> None:
+    loop = asyncio.get_running_loop()
+    deadline = loop.time() + timeout
+    while not condition():
+        assert loop.time() < deadline, "condition not met in time"
+        await asyncio.sleep(0.01)
+
+
+@pytest.mark.asyncio
+async def test_invite_ack_bye(handler, admission, phone):
+    dialog = Dialog(phone, server_of(handler))
+    dialog.invite()
+    answer = await phone.response("INVITE")
+    assert answer.status_code == 200
+    assert b"m=audio" in answer.body and b"PCMU/8000" in answer.body
+    assert admission.live_calls == 1
+    assert dialog.call_id in await handler.get_active_calls()
+
+    dialog.ack(answer)
+    await wait_until(lambda: handler.calls[dialog.call_id].started)
+
+    dialog.bye()
+    assert (await phone.response("BYE")).status_code == 200
+    await wait_until(lambda: dialog.call_id not in handler.calls)
+    assert await handler.get_active_calls() == {}
+    assert admission.live_calls == 0
+
+
+@pytest.mark.asyncio
+async def test_invite_refused_with_486_when_no_slot_is_free(handler, admission, phone):
+    await admission.acquire("busy-1")
+    queued = asyncio.create_task(admission.acquire("busy-2"))  # the queue is full too
+    await wait_until(lambda: admission.queue_depth == 1)
+
+    dialog = Dialog(phone, server_of(handler))
+    dialog.invite()
+    assert (await phone.response("INVITE")).status_code == 486
+    assert dialog.call_id not in handler.calls
+    assert await handler.get_active_calls() == {}
+    queued.cancel()
+
+
+@pytest.mark.asyncio
+async def test_cancel_while_queued_for_a_slot(handler, admission, phone):
+    await admission.acquire("busy")
+
+    dialog = Dialog(phone, server_of(handler))
+    dialog.invite()
+    await wait_until(lambda: dialog.call_id in handler.user_agent.dialogs)
+    dialog.cancel()
+    assert (await phone.response("CANCEL")).status_code == 200
+    assert (await phone.response("INVITE")).status_code == 487
+
+    # The slot freed later must not be taken by the cancelled call
+    admission.release("busy")
+    await asyncio.sleep(0.1)
+    assert dialog.call_id not in handler.calls
+    assert admission.live_calls == 0
+    assert await handler.get_active_calls() == {}